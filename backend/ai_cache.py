@@ -0,0 +1,211 @@
+"""
+Cache des réponses IA pour SkyApp
+LRU borné en mémoire + TTL, adossé à un fichier SQLite (mode WAL) partagé par les workers
+et conservé entre les redémarrages. Les métriques (hits mémoire/disque, miss, évictions)
+sont exposées sur /api/ai/stats.
+Chaque entreprise a une génération de données (même fichier SQLite): incrémentée à chaque
+écriture de ses données, elle entre dans la clé des réponses, qui ne sont plus relues ensuite.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".cache" / "ai_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))  # par worker, en mémoire
+DEFAULT_MAX_DISK_ENTRIES = int(os.getenv("AI_CACHE_MAX_DISK_ENTRIES", "20000"))
+DEFAULT_TTL = int(os.getenv("AI_CACHE_TTL", "3600"))
+
+
+class AIResponseCache:
+    """LRU + TTL; la couche SQLite est facultative (désactivée si le fichier est inaccessible)"""
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: int = DEFAULT_TTL, max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # clé -> (créé à, réponse)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self._generations: Dict[str, int] = {}  # sans SQLite
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "writes": 0}
+
+        path = path if path is not None else os.getenv("AI_CACHE_PATH", str(DEFAULT_CACHE_PATH))
+        if path:
+            try:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS ai_cache (
+                        key TEXT PRIMARY KEY,
+                        company_id TEXT,
+                        response TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_accessed ON ai_cache(accessed_at)")
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS ai_cache_generations (
+                        company_id TEXT PRIMARY KEY,
+                        generation INTEGER NOT NULL
+                    )
+                """)
+                self.path = path
+                logger.info(f"💾 Cache IA persistant: {path}")
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Cache IA persistant indisponible ({path}): {e} - cache mémoire uniquement")
+                self._db = None
+        if self._db is None:
+            self.path = None
+
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.metrics["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+                self.metrics["expired"] += 1
+
+            row = self._disk_get(key)
+            if row is not None:
+                created_at, response = row
+                if now - created_at < self.ttl:
+                    self._remember(key, created_at, response)
+                    self.metrics["disk_hits"] += 1
+                    return response
+                self.metrics["expired"] += 1
+                self._disk_execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+
+            self.metrics["misses"] += 1
+            return None
+
+    def set(self, key: str, response: Any, company_id: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+            self.metrics["writes"] += 1
+            try:
+                payload = json.dumps(response, default=str)
+            except (TypeError, ValueError) as e:
+                logger.debug(f"Réponse IA non sérialisable, cache mémoire uniquement: {e}")
+                return
+            self._disk_execute(
+                "INSERT OR REPLACE INTO ai_cache (key, company_id, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, company_id, payload, now, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune(now)
+
+    def generation(self, company_id: Optional[str]) -> int:
+        """Génération des données de l'entreprise (partagée par les workers, conservée au redémarrage)"""
+        if not company_id:
+            return 0
+        with self._lock:
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT generation FROM ai_cache_generations WHERE company_id = ?",
+                                           (company_id,)).fetchone()
+                    return row[0] if row else 0
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Lecture génération cache IA impossible: {e}")
+            return self._generations.get(company_id, 0)
+
+    def data_changed(self, company_id: Optional[str]):
+        """Écriture de données de l'entreprise: les réponses des générations précédentes ne sont plus servies"""
+        if not company_id:
+            return
+        with self._lock:
+            self._generations[company_id] = self._generations.get(company_id, 0) + 1
+            self._disk_execute(
+                "INSERT INTO ai_cache_generations (company_id, generation) VALUES (?, 1) "
+                "ON CONFLICT(company_id) DO UPDATE SET generation = generation + 1",
+                (company_id,),
+            )
+
+    def clear(self, company_id: Optional[str] = None):
+        with self._lock:
+            if company_id:
+                # Les clés mémoire ne portent pas l'entreprise: vidage complet de la couche mémoire
+                self._memory.clear()
+                self._disk_execute("DELETE FROM ai_cache WHERE company_id = ?", (company_id,))
+            else:
+                self._memory.clear()
+                self._disk_execute("DELETE FROM ai_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+        lookups = hits + self.metrics["misses"]
+        disk_entries = None
+        with self._lock:
+            if self._db is not None:
+                try:
+                    disk_entries = self._db.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            memory_entries = len(self._memory)
+        return {
+            **self.metrics,
+            "hits": hits,
+            "hit_rate": f"{(hits / max(1, lookups)) * 100:.1f}%",
+            "memory_entries": memory_entries,
+            "max_entries": self.max_entries,
+            "disk_entries": disk_entries,
+            "ttl_seconds": self.ttl,
+            "backend": "sqlite" if self._db is not None else "memory",
+        }
+
+    # ------------------------------------------------------------------
+    def _remember(self, key: str, created_at: float, response: Any):
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT created_at, response FROM ai_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE ai_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row[0], json.loads(row[1])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"⚠️ Lecture cache IA impossible: {e}")
+            return None
+
+    def _disk_execute(self, sql: str, params: tuple = ()):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(sql, params)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Écriture cache IA impossible: {e}")
+
+    def _prune(self, now: float):
+        """Supprime les entrées expirées puis les moins récemment lues au-delà de max_disk_entries"""
+        self._disk_execute("DELETE FROM ai_cache WHERE created_at < ?", (now - self.ttl,))
+        self._disk_execute(
+            "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
@@ -0,0 +1,190 @@
+"""
+Compactage de l'historique de conversation IA pour SkyApp
+L'historique envoyé par le client (AIQueryModel.conversation_history) est borné en tokens:
+les messages les plus récents sont conservés tels quels, les plus anciens sont repliés dans un
+résumé glissant. Le découpage se fait par blocs de messages, si bien que le même préfixe est
+résumé une seule fois puis relu depuis le cache pendant plusieurs tours.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "4000"))  # prompt complet par requête
+MIN_HISTORY_BUDGET = 300
+SUMMARY_MAX_TOKENS = 250
+FOLD_BLOCK = 6  # messages repliés par blocs: le résumé d'un préfixe sert plusieurs tours
+MESSAGE_OVERHEAD = 4  # tokens de structure par message (rôle, séparateurs)
+MAX_TRANSCRIPT_TOKENS = 3000  # texte envoyé au résumeur en une fois
+SUMMARY_PREFIX = "Résumé de la conversation précédente:\n"
+
+# Mots découpés en morceaux de 4 caractères au plus, ponctuation = 1 token (approximation BPE, sans tiktoken)
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+# (entreprise, résumé précédent, messages à ajouter) -> nouveau résumé
+Summarizer = Callable[[str, Optional[str], List[Dict[str, str]]], Awaitable[str]]
+
+
+def estimate_tokens(text: Any) -> int:
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False, default=str)
+    return len(_TOKEN_RE.findall(text))
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    return MESSAGE_OVERHEAD + estimate_tokens(message.get("content"))
+
+
+# Place du message de résumé (+1: "…" de troncature)
+SUMMARY_RESERVE = MESSAGE_OVERHEAD + estimate_tokens(SUMMARY_PREFIX) + SUMMARY_MAX_TOKENS + 1
+
+
+def truncate_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Coupe `text` à environ max_tokens (début conservé, ou fin si keep_end)"""
+    matches = list(_TOKEN_RE.finditer(text))
+    if len(matches) <= max_tokens:
+        return text
+    if keep_end:
+        return "…" + text[matches[-max_tokens].start():]
+    return text[:matches[max_tokens - 1].end()] + "…"
+
+
+def sanitize(history: Optional[List[Dict[str, Any]]]) -> List[Dict[str, str]]:
+    """Messages utilisateur / assistant avec contenu texte (le reste ne peut pas être renvoyé tel quel)"""
+    messages = []
+    for message in history or []:
+        if not isinstance(message, dict) or message.get("role") not in ("user", "assistant"):
+            continue
+        content = message.get("content")
+        if isinstance(content, str) and content.strip():
+            messages.append({"role": message["role"], "content": content})
+    return messages
+
+
+def extractive_summary(previous: Optional[str], messages: List[Dict[str, str]]) -> str:
+    """Résumé local (sans appel IA): début de chaque message, les plus anciens tronqués d'abord"""
+    lines = [previous] if previous else []
+    for message in messages:
+        speaker = "Utilisateur" if message["role"] == "user" else "Assistant"
+        lines.append(f"- {speaker}: {truncate_tokens(' '.join(message['content'].split()), 40)}")
+    return truncate_tokens("\n".join(lines), SUMMARY_MAX_TOKENS, keep_end=True)
+
+
+def _prefix_hashes(messages: List[Dict[str, str]]) -> List[str]:
+    """hashes[i] identifie messages[:i]"""
+    digest = hashlib.sha256()
+    hashes = [digest.hexdigest()]
+    for message in messages:
+        digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode())
+        hashes.append(digest.copy().hexdigest())
+    return hashes
+
+
+class HistoryCompactor:
+    """Historique borné: messages récents intacts + résumé glissant des anciens (mis en cache)"""
+
+    def __init__(self, summarizer: Optional[Summarizer] = None, fold_block: int = FOLD_BLOCK,
+                 max_entries: int = 1000):
+        self.summarizer = summarizer
+        self.fold_block = fold_block
+        self.max_entries = max_entries
+        self._summaries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.metrics = {"compactions": 0, "summaries_generated": 0, "summaries_extractive": 0,
+                        "summary_cache_hits": 0, "tokens_in": 0, "tokens_sent": 0, "tokens_saved": 0}
+
+    async def compact(self, company_id: str, history: Optional[List[Dict[str, Any]]],
+                      budget: int) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """(messages à insérer avant la question, rapport) avec un total estimé <= budget tokens"""
+        messages = sanitize(history)
+        tokens_in = sum(message_tokens(m) for m in messages)
+        report = {"messages": len(messages), "budget": budget, "tokens_in": tokens_in, "summarized": 0,
+                  "summary": None}
+        if tokens_in <= budget:
+            return messages, self._finish(report, tokens_in)
+
+        # Messages récents conservés tant qu'ils tiennent (place réservée pour le résumé)
+        available = budget - SUMMARY_RESERVE
+        cut, used = len(messages), 0
+        while cut > 0 and used + message_tokens(messages[cut - 1]) <= available:
+            cut -= 1
+            used += message_tokens(messages[cut])
+        hashes = _prefix_hashes(messages[:-1])
+        # Un préfixe déjà résumé qui laisse assez de place est réutilisé tel quel; sinon coupure
+        # arrondie au bloc supérieur (jamais le dernier message)
+        cached_cut = next((length for length in range(cut, len(messages))
+                           if (company_id, hashes[length]) in self._summaries), None)
+        cut = cached_cut or min(-(-cut // self.fold_block) * self.fold_block, len(messages) - 1)
+        recent = messages[cut:]
+        if not recent or sum(message_tokens(m) for m in recent) > available:
+            # Dernier message trop long à lui seul: tronqué
+            last = messages[-1]
+            recent = [{"role": last["role"],
+                       "content": truncate_tokens(last["content"], max(50, available - MESSAGE_OVERHEAD - 1), keep_end=True)}]
+            cut = len(messages) - 1
+
+        summary, origin = await self._summary(company_id, messages, cut, hashes)
+        compacted = [{"role": "system", "content": SUMMARY_PREFIX + summary}] + recent
+        report.update(summarized=cut, summary=origin)
+        return compacted, self._finish(report, sum(message_tokens(m) for m in compacted))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.metrics, "cached_summaries": len(self._summaries)}
+
+    # ------------------------------------------------------------------
+    def _finish(self, report: Dict[str, Any], tokens_sent: int) -> Dict[str, Any]:
+        report["tokens_sent"] = tokens_sent
+        report["tokens_saved"] = report["tokens_in"] - tokens_sent
+        self.metrics["compactions"] += 1
+        self.metrics["tokens_in"] += report["tokens_in"]
+        self.metrics["tokens_sent"] += tokens_sent
+        self.metrics["tokens_saved"] += report["tokens_saved"]
+        return report
+
+    async def _summary(self, company_id: str, messages: List[Dict[str, str]], cut: int,
+                       hashes: List[str]) -> Tuple[str, str]:
+        """Résumé de messages[:cut], à partir du plus long préfixe déjà résumé"""
+        cached = self._summaries.get((company_id, hashes[cut]))
+        if cached is not None:
+            self._summaries.move_to_end((company_id, hashes[cut]))
+            self.metrics["summary_cache_hits"] += 1
+            return cached, "cached"
+
+        start, previous = 0, None
+        for length in range(cut - 1, 0, -1):
+            previous = self._summaries.get((company_id, hashes[length]))
+            if previous is not None:
+                start = length
+                break
+
+        # Texte à résumer borné: les messages les plus récents du segment en priorité
+        segment, size = [], 0
+        for message in reversed(messages[start:cut]):
+            size += message_tokens(message)
+            if size > MAX_TRANSCRIPT_TOKENS:
+                break
+            segment.insert(0, message)
+        segment = segment or [messages[cut - 1]]
+
+        summary, origin = None, "generated"
+        if self.summarizer is not None:
+            try:
+                summary = truncate_tokens((await self.summarizer(company_id, previous, segment)).strip(), SUMMARY_MAX_TOKENS)
+                self.metrics["summaries_generated"] += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Résumé de l'historique IA impossible: {e} - résumé local")
+        if not summary:
+            summary, origin = extractive_summary(previous, segment), "extractive"
+            self.metrics["summaries_extractive"] += 1
+
+        self._summaries[(company_id, hashes[cut])] = summary
+        while len(self._summaries) > self.max_entries:
+            self._summaries.popitem(last=False)
+        return summary, origin
@@ -0,0 +1,186 @@
+"""
+Limiteur des appels OpenAI pour SkyApp
+- Regroupement: des requêtes identiques simultanées partagent un seul appel
+- Quota par entreprise: seau à jetons (unités par minute, rafale bornée)
+- Plafond global de concurrence, file d'attente courte: au-delà, 429 immédiat
+- Métriques: temps d'attente (p50/p95/max), appels regroupés, refus
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "16"))
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "5"))  # secondes
+AI_COMPANY_RATE = float(os.getenv("AI_COMPANY_RATE", "30"))  # unités / minute / entreprise
+AI_COMPANY_BURST = float(os.getenv("AI_COMPANY_BURST", "10"))
+
+
+class RateLimitExceeded(HTTPException):
+    """429 avec Retry-After: laissé remonter tel quel jusqu'à FastAPI"""
+
+    def __init__(self, message: str, retry_after: float, scope: str):
+        self.retry_after = max(1, int(retry_after + 0.999))
+        self.scope = scope
+        super().__init__(
+            status_code=429,
+            detail={"message": message, "scope": scope, "retry_after": self.retry_after},
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float) -> float:
+        """0 si `cost` unités sont disponibles, sinon secondes d'attente (sans rien consommer)"""
+        self._refill()
+        if self.tokens >= cost:
+            return 0.0
+        return (min(cost, self.capacity) - self.tokens) / self.rate if self.rate else 60.0
+
+    def take(self, cost: float) -> float:
+        """0 si accordé, sinon secondes avant que `cost` unités soient disponibles"""
+        wait = self.wait_time(cost)
+        if not wait:
+            self.tokens -= cost
+        return wait
+
+
+def request_key(company_id: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{company_id}|{payload}".encode()).hexdigest()
+
+
+class OpenAILimiter:
+    def __init__(self, max_concurrency: int = AI_MAX_CONCURRENCY, max_queue: int = AI_MAX_QUEUE,
+                 queue_timeout: float = AI_QUEUE_TIMEOUT, company_rate: float = AI_COMPANY_RATE,
+                 company_burst: float = AI_COMPANY_BURST):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.company_rate = company_rate
+        self.company_burst = company_burst
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._active = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._queue_times = deque(maxlen=1000)
+        self.metrics = {"calls": 0, "coalesced": 0, "rejected_company": 0, "rejected_global": 0, "errors": 0}
+
+    def _bucket(self, company_id: str) -> TokenBucket:
+        bucket = self._buckets.get(company_id)
+        if bucket is None:
+            bucket = self._buckets[company_id] = TokenBucket(self.company_rate, self.company_burst)
+        return bucket
+
+    def _saturated(self) -> bool:
+        return self._active + self._waiting >= self.max_concurrency + self.max_queue
+
+    def precheck(self, company_id: Optional[str], cost: float = 1.0):
+        """429 immédiat si l'appel serait refusé (ne consomme rien): avant d'ouvrir un flux SSE"""
+        if self._saturated():
+            self.metrics["rejected_global"] += 1
+            raise RateLimitExceeded("Service IA saturé, réessayez dans quelques secondes", 1, "global")
+        wait = self._bucket(company_id or "global").wait_time(cost)
+        if wait:
+            self.metrics["rejected_company"] += 1
+            raise RateLimitExceeded("Quota IA de l'entreprise atteint, réessayez dans quelques secondes", wait, "company")
+
+    @asynccontextmanager
+    async def admit(self, company_id: Optional[str], cost: float = 1.0):
+        """Quota de l'entreprise + place dans le plafond global, sans regroupement (flux)"""
+        # Plafond global vérifié en premier: un refus ne consomme pas le quota de l'entreprise
+        if self._saturated():
+            self.metrics["rejected_global"] += 1
+            raise RateLimitExceeded("Service IA saturé, réessayez dans quelques secondes", 1, "global")
+        wait = self._bucket(company_id or "global").take(cost)
+        if wait:
+            self.metrics["rejected_company"] += 1
+            raise RateLimitExceeded("Quota IA de l'entreprise atteint, réessayez dans quelques secondes", wait, "company")
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.metrics["rejected_global"] += 1
+            raise RateLimitExceeded("Service IA saturé, réessayez dans quelques secondes", 1, "global")
+        finally:
+            self._waiting -= 1
+        self._queue_times.append((time.perf_counter() - queued_at) * 1000)
+
+        self._active += 1
+        self.metrics["calls"] += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    async def call(self, company_id: Optional[str], key: str, factory: Callable[[], Awaitable[Any]],
+                   cost: float = 1.0) -> Any:
+        """Exécute factory() sous quota; une clé déjà en cours renvoie le résultat de l'appel en cours"""
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.metrics["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            async with self.admit(company_id, cost):
+                result = await factory()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            if not isinstance(e, RateLimitExceeded):
+                self.metrics["errors"] += 1
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            elif not future.done():
+                future.set_exception(e)
+                # Évite "Future exception was never retrieved" quand personne n'attendait
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        times = sorted(self._queue_times)
+
+        def percentile(p: float) -> float:
+            return round(times[min(len(times) - 1, int(p * len(times)))], 2) if times else 0.0
+
+        return {
+            **self.metrics,
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "company_rate_per_minute": self.company_rate,
+            "company_burst": self.company_burst,
+            "queue_ms_p50": percentile(0.5),
+            "queue_ms_p95": percentile(0.95),
+            "queue_ms_max": round(times[-1], 2) if times else 0.0,
+        }
@@ -0,0 +1,155 @@
+"""
+Enregistrement / rejeu des échanges OpenAI pour SkyApp (mesures sans réseau)
+Transport httpx pour AsyncOpenAI:
+- "record": l'appel part vers OpenAI, requête + réponse + latence sont écrites dans un fichier
+  JSON par échange (clé = empreinte de la méthode, du chemin et du corps de la requête)
+- "replay": la réponse est relue depuis le fichier, après une latence simulée (celle enregistrée,
+  multipliée par `latency_scale`, ou une valeur fixe), flux SSE compris
+Usage serveur (capture en développement): OPENAI_REPLAY_MODE=record OPENAI_FIXTURES_DIR=...
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+REPLAY_MODES = ("record", "replay")
+# En-têtes qui décrivent le corps transmis, pas le corps décodé par aread()
+ENCODING_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class FixtureMissing(LookupError):
+    """Aucun échange enregistré pour cette requête (mode replay)"""
+
+
+def exchange_key(method: str, path: str, body: Any) -> str:
+    payload = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{method.upper()} {path}\n{payload}".encode()).hexdigest()
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """Corps SSE rejoué événement par événement, la durée restante répartie entre les événements"""
+
+    def __init__(self, body: bytes, delay: float):
+        self.events = [part + b"\n\n" for part in body.split(b"\n\n") if part.strip()]
+        self.delay = delay / max(1, len(self.events))
+
+    async def __aiter__(self):
+        for event in self.events:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield event
+
+
+class RecordReplayTransport(httpx.AsyncBaseTransport):
+    """
+    latency: "recorded" (latence enregistrée x latency_scale) ou secondes fixes par appel.
+    on_miss (replay): fonction(corps de la requête) -> corps de réponse JSON, utilisée quand aucun
+    échange n'est enregistré (fixtures synthétiques des benchmarks); l'échange est alors écrit.
+    """
+
+    def __init__(self, fixtures_dir: Union[str, Path], mode: str = "replay",
+                 latency: Union[str, float] = "recorded", latency_scale: float = 1.0,
+                 on_miss: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+                 inner: Optional[httpx.AsyncBaseTransport] = None):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"Mode inconnu: {mode} ({', '.join(REPLAY_MODES)})")
+        self.fixtures_dir = Path(fixtures_dir)
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.on_miss = on_miss
+        self.inner = inner or (httpx.AsyncHTTPTransport() if mode == "record" else None)
+        self.stats = {"requests": 0, "replayed": 0, "recorded": 0, "synthesized": 0, "model_wait_ms": 0.0}
+
+    def _path(self, key: str) -> Path:
+        return self.fixtures_dir / f"{key[:24]}.json"
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats["requests"] += 1
+        body = json.loads(request.content or b"null")
+        key = exchange_key(request.method, request.url.path, body)
+        if self.mode == "record":
+            return await self._record(request, body, key)
+        return await self._replay(request, body, key)
+
+    async def _record(self, request: httpx.Request, body: Any, key: str) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        first_byte_ms = (time.perf_counter() - started) * 1000
+        content = await response.aread()
+        latency_ms = (time.perf_counter() - started) * 1000
+        self._save(key, request, body, response.status_code, response.headers.get("content-type", ""),
+                   content.decode("utf-8"), latency_ms, first_byte_ms)
+        self.stats["recorded"] += 1
+        self.stats["model_wait_ms"] += latency_ms
+        # Corps déjà décompressé: sans ces en-têtes, httpx ne le décode pas une seconde fois
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name.lower() not in ENCODING_HEADERS]
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    async def _replay(self, request: httpx.Request, body: Any, key: str) -> httpx.Response:
+        path = self._path(key)
+        if not path.exists():
+            if self.on_miss is None:
+                raise FixtureMissing(f"Aucun échange enregistré pour {request.method} {request.url.path} ({path.name})")
+            payload = json.dumps(self.on_miss(body), ensure_ascii=False)
+            self._save(key, request, body, 200, "application/json", payload, 0.0, 0.0)
+            self.stats["synthesized"] += 1
+        fixture = json.loads(path.read_text(encoding="utf-8"))
+        response = fixture["response"]
+
+        if self.latency == "recorded":
+            total = fixture.get("latency_ms", 0.0) / 1000 * self.latency_scale
+            first_byte = fixture.get("first_byte_ms", 0.0) / 1000 * self.latency_scale
+        else:
+            total = first_byte = float(self.latency)
+        content = response["body"].encode("utf-8")
+        headers = {"content-type": response["content_type"]}
+        self.stats["replayed"] += 1
+        self.stats["model_wait_ms"] += total * 1000
+
+        if response["content_type"].startswith("text/event-stream"):
+            await asyncio.sleep(first_byte)
+            return httpx.Response(response["status_code"], headers=headers, request=request,
+                                  stream=_ReplayStream(content, max(0.0, total - first_byte)))
+        await asyncio.sleep(total)
+        return httpx.Response(response["status_code"], headers=headers, content=content, request=request)
+
+    def _save(self, key: str, request: httpx.Request, body: Any, status_code: int, content_type: str,
+              text: str, latency_ms: float, first_byte_ms: float):
+        self.fixtures_dir.mkdir(parents=True, exist_ok=True)
+        fixture = {
+            "request": {"method": request.method, "path": request.url.path, "body": body},
+            "response": {"status_code": status_code, "content_type": content_type, "body": text},
+            "latency_ms": round(latency_ms, 1),
+            "first_byte_ms": round(first_byte_ms, 1),
+        }
+        self._path(key).write_text(json.dumps(fixture, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    async def aclose(self):
+        if self.inner is not None:
+            await self.inner.aclose()
+
+
+def replay_http_client(fixtures_dir: Union[str, Path], mode: str = "replay", **options) -> httpx.AsyncClient:
+    """Client httpx à passer à AsyncOpenAI(http_client=...)"""
+    return httpx.AsyncClient(transport=RecordReplayTransport(fixtures_dir, mode, **options), timeout=60)
+
+
+def http_client_from_env() -> Optional[httpx.AsyncClient]:
+    """OPENAI_REPLAY_MODE=record|replay + OPENAI_FIXTURES_DIR; None (transport par défaut) sinon"""
+    mode = os.getenv("OPENAI_REPLAY_MODE")
+    if not mode:
+        return None
+    fixtures_dir = os.getenv("OPENAI_FIXTURES_DIR", str(Path(__file__).parent / ".cache" / "openai_fixtures"))
+    logger.warning(f"⚠️ Appels OpenAI en mode {mode}: {fixtures_dir}")
+    return replay_http_client(fixtures_dir, mode)
@@ -0,0 +1,187 @@
+"""
+Cache sémantique des requêtes IA pour SkyApp
+Les questions sont normalisées (casse, accents, ponctuation, mots vides) puis projetées en
+vecteurs de n-grammes hachés (hors ligne, sans modèle). Par entreprise, les vecteurs sont
+empilés dans une matrice NumPy: une question quasi identique à une question récente réutilise
+sa réponse si la similarité cosinus et la fraîcheur des données passent les seuils.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_DIM = 1024
+DEFAULT_THRESHOLD = float(os.getenv("AI_SEMANTIC_THRESHOLD", "0.92"))
+DEFAULT_MAX_AGE = int(os.getenv("AI_SEMANTIC_MAX_AGE", "900"))  # secondes
+DEFAULT_MAX_ENTRIES = int(os.getenv("AI_SEMANTIC_MAX_ENTRIES", "500"))  # par entreprise
+
+# Mots sans incidence sur la réponse
+STOPWORDS = {
+    "le", "la", "les", "l", "un", "une", "des", "de", "du", "d", "a", "au", "aux", "et", "ou",
+    "en", "pour", "par", "sur", "dans", "avec", "ce", "ces", "cet", "cette", "mes", "mon", "ma",
+    "nos", "notre", "vos", "votre", "moi", "me", "je", "j", "tu", "vous", "nous", "il", "elle",
+    "qui", "que", "qu", "quoi", "est", "sont", "y", "stp", "svp", "merci", "bonjour", "peux",
+    "pourrais", "voudrais", "veux", "montre", "montrer", "affiche", "afficher", "donne", "donner",
+    "liste", "lister", "voir", "quels", "quelles", "quel", "quelle", "tous", "toutes", "tout",
+}
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(text: str) -> str:
+    """'Les devis de Dupont ?' -> 'devis dupont'"""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        if token in STOPWORDS:
+            continue
+        # Pluriels simples
+        if len(token) > 4 and token[-1] in "sx" and not token.isdigit():
+            token = token[:-1]
+        tokens.append(token)
+    return " ".join(tokens)
+
+
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, (1.0 if (value >> 63) & 1 else -1.0)
+
+
+def embed(normalized: str, dim: int = SEMANTIC_DIM) -> np.ndarray:
+    """Vecteur L2-normalisé: mots entiers (poids fort) + trigrammes de caractères (fautes de frappe)"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in normalized.split():
+        index, sign = _bucket(f"w:{token}", dim)
+        vector[index] += 2.0 * sign
+        padded = f"<{token}>"
+        for i in range(len(padded) - 2):
+            index, sign = _bucket(f"c:{padded[i:i + 3]}", dim)
+            vector[index] += 0.5 * sign
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+@dataclass
+class _Entry:
+    normalized: str
+    response: Any
+    created_at: float
+    numbers: frozenset
+    tokens_used: int = 0
+    cost: float = 0.0
+
+
+class _CompanyIndex:
+    def __init__(self, dim: int):
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.entries: List[_Entry] = []
+        self.data_changed_at = 0.0
+
+
+class SemanticCache:
+    """Matrice de vecteurs par entreprise; recherche par produit scalaire (vecteurs normalisés)"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_age: int = DEFAULT_MAX_AGE,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, dim: int = SEMANTIC_DIM):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.dim = dim
+        self._companies: Dict[str, _CompanyIndex] = {}
+        self._lock = threading.Lock()
+        self.metrics = {"lookups": 0, "hits": 0, "misses": 0, "stale": 0, "tokens_saved": 0, "cost_saved": 0.0}
+
+    def _index(self, company_id: str) -> _CompanyIndex:
+        index = self._companies.get(company_id)
+        if index is None:
+            index = self._companies[company_id] = _CompanyIndex(self.dim)
+        return index
+
+    def lookup(self, company_id: str, query: str) -> Optional[Tuple[Any, float]]:
+        """(réponse, similarité) d'une question quasi identique et encore fraîche, sinon None"""
+        normalized = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self.metrics["lookups"] += 1
+            index = self._companies.get(company_id)
+            if not normalized or index is None or not index.entries:
+                self.metrics["misses"] += 1
+                return None
+            similarities = index.matrix @ embed(normalized, self.dim)
+            numbers = frozenset(t for t in normalized.split() if t.isdigit())
+            # Meilleur candidat dont les nombres (montants, années, n° de devis) sont identiques
+            for position in np.argsort(similarities)[::-1][:5]:
+                similarity = float(similarities[position])
+                if similarity < self.threshold:
+                    break
+                entry = index.entries[position]
+                if entry.numbers != numbers:
+                    continue
+                if now - entry.created_at > self.max_age or entry.created_at < index.data_changed_at:
+                    self.metrics["stale"] += 1
+                    continue
+                self.metrics["hits"] += 1
+                self.metrics["tokens_saved"] += entry.tokens_used
+                self.metrics["cost_saved"] += entry.cost
+                return entry.response, similarity
+            self.metrics["misses"] += 1
+            return None
+
+    def store(self, company_id: str, query: str, response: Any, tokens_used: int = 0, cost: float = 0.0):
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        entry = _Entry(normalized, response, time.time(),
+                       frozenset(t for t in normalized.split() if t.isdigit()), tokens_used, cost)
+        vector = embed(normalized, self.dim)
+        with self._lock:
+            index = self._index(company_id)
+            # Même question normalisée: remplacement
+            for position, existing in enumerate(index.entries):
+                if existing.normalized == normalized:
+                    index.entries[position] = entry
+                    return
+            index.entries.append(entry)
+            index.matrix = np.vstack([index.matrix, vector[None, :]])
+            if len(index.entries) > self.max_entries:
+                drop = len(index.entries) - self.max_entries
+                index.entries = index.entries[drop:]
+                index.matrix = index.matrix[drop:]
+
+    def data_changed(self, company_id: Optional[str]):
+        """Les réponses antérieures à une écriture de données de l'entreprise ne sont plus servies"""
+        if not company_id:
+            return
+        with self._lock:
+            self._index(company_id).data_changed_at = time.time()
+
+    def clear(self, company_id: Optional[str] = None):
+        with self._lock:
+            if company_id:
+                self._companies.pop(company_id, None)
+            else:
+                self._companies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = sum(len(index.entries) for index in self._companies.values())
+        return {
+            **self.metrics,
+            "cost_saved": round(self.metrics["cost_saved"], 6),
+            "hit_rate": f"{(self.metrics['hits'] / max(1, self.metrics['lookups'])) * 100:.1f}%",
+            "entries": entries,
+            "companies": len(self._companies),
+            "threshold": self.threshold,
+            "max_age_seconds": self.max_age,
+        }
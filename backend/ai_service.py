@@ -5,23 +5,62 @@ Coût estimé : ~150-300€/mois pour 100 utilisateurs actifs
 """
 
 import os
+import re
 import json
+import asyncio
+import contextvars
+import functools
+import inspect
 import logging
-from typing import Dict, List, Any, Optional, Callable
-from datetime import datetime, timedelta
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Callable, AsyncIterator, Tuple
 from decimal import Decimal
 import hashlib
 from openai import AsyncOpenAI
 from supabase import Client
 
+from ai_cache import AIResponseCache
+from ai_semantic_cache import SemanticCache
+from ai_limiter import OpenAILimiter, RateLimitExceeded, request_key
+from quote_index import QuoteSearchIndex
+from period_stats import PeriodStatistics
+from ai_telemetry import AITelemetry, usage_cost
+from ai_replay import http_client_from_env
+from ai_history import (AI_PROMPT_TOKEN_BUDGET, MIN_HISTORY_BUDGET, SUMMARY_MAX_TOKENS, HistoryCompactor,
+                        estimate_tokens, message_tokens)
+
 # Configuration
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SIMULATION_TOKEN_DELAY = 0.03  # secondes entre deux fragments simulés
+AI_TOOL_TIMEOUT = float(os.getenv("AI_TOOL_TIMEOUT", "10"))  # secondes par function appelée
+
+# Événement de télémétrie de la requête IA en cours (partagé avec les functions qu'elle appelle)
+_usage_event: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("ai_usage_event", default=None)
+
+
+def _tracked(function_name: str):
+    """Un événement de télémétrie par appel; appelée depuis universal_query, la function y est rattachée"""
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, company_id, *args, **kwargs):
+            nested = _usage_event.get() is not None
+            with self._usage_scope(company_id, function_name) as event:
+                result = await method(self, company_id, *args, **kwargs)
+                # L'échec d'une function appelée par GPT n'est pas celui de la requête
+                if not nested and isinstance(result, dict) and (result.get("error") or result.get("success") is False):
+                    event["success"] = False
+                return result
+        return wrapper
+    return decorate
+
 class AIService:
     """Service IA central pour SkyApp avec architecture économique"""
     
-    def __init__(self, supabase_client: Client, api_key: Optional[str] = None):
+    def __init__(self, supabase_client: Client, api_key: Optional[str] = None,
+                 cache: Optional[AIResponseCache] = None, telemetry: Optional[AITelemetry] = None):
         self.supabase = supabase_client
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         
@@ -31,15 +70,33 @@ class AIService:
             self.simulation_mode = True
             logger.warning("⚠️ Mode simulation - OpenAI API key non configurée")
         else:
-            self.client = AsyncOpenAI(api_key=self.api_key)
+            # Transport par défaut, ou enregistrement / rejeu des échanges (OPENAI_REPLAY_MODE)
+            self.client = AsyncOpenAI(api_key=self.api_key, http_client=http_client_from_env())
             self.simulation_mode = False
             logger.info("✅ Service IA initialisé avec OpenAI")
         
-        # Cache simple en mémoire (utiliser Redis en production)
-        self.cache = {}
-        self.cache_ttl = 3600  # 1 heure
+        # Cache LRU borné + TTL, persistant (SQLite partagé entre workers)
+        self.cache = cache or AIResponseCache()
+        self.cache_ttl = self.cache.ttl
+        # Cache sémantique: questions quasi identiques (n-grammes hachés, par entreprise)
+        self.semantic_cache = SemanticCache()
+        # Regroupement des appels identiques, quotas par entreprise, plafond global
+        self.limiter = OpenAILimiter()
+        # Délai maximal de chaque function appelée par GPT
+        self.tool_timeout = AI_TOOL_TIMEOUT
+        # Index BM25 des devis par entreprise (devis similaires)
+        self.quote_index = QuoteSearchIndex(supabase_client)
+        # Statistiques de période agrégées en SQL, cache TTL court (IA + /api/ai/stats)
+        self.period_stats = PeriodStatistics(supabase_client)
+        
+        # Historique de conversation borné en tokens (résumé glissant des anciens messages)
+        self.history = HistoryCompactor(self._summarize_history)
+        self.prompt_budget = AI_PROMPT_TOKEN_BUDGET
         
-        # Statistiques d'utilisation
+        # Télémétrie persistante par entreprise (ai_usage_events, écrite par lots)
+        self.telemetry = telemetry or AITelemetry(supabase_client)
+        
+        # Statistiques d'utilisation (ce worker)
         self.stats = {
             "total_requests": 0,
             "cache_hits": 0,
@@ -85,7 +142,7 @@ class AIService:
             # Filtres optionnels
             if filters.get("client_name"):
                 # Recherche client par nom
-                clients = self.supabase.table("clients").select("id").eq("company_id", company_id).ilike("nom", f"%{filters['client_name']}%").execute()
+                clients = await self._execute(self.supabase.table("clients").select("id").eq("company_id", company_id).ilike("nom", f"%{filters['client_name']}%"))
                 client_ids = [c["id"] for c in clients.data]
                 if client_ids:
                     query = query.in_("client_id", client_ids)
@@ -106,7 +163,7 @@ class AIService:
                 query = query.lte("created_at", filters["date_to"])
             
             # Limite à 10 résultats (envoyer seulement ça à GPT)
-            result = query.order("created_at", desc=True).limit(10).execute()
+            result = await self._execute(query.order("created_at", desc=True).limit(10))
             
             logger.info(f"🔍 Filtrage local: {len(result.data)} devis trouvés")
             return result.data
@@ -129,7 +186,7 @@ class AIService:
             if filters.get("city"):
                 query = query.ilike("adresse", f"%{filters['city']}%")
             
-            result = query.order("nom").limit(10).execute()
+            result = await self._execute(query.order("nom").limit(10))
             logger.info(f"🔍 Filtrage local: {len(result.data)} clients trouvés")
             return result.data
         
@@ -157,7 +214,7 @@ class AIService:
             if filters.get("date_to"):
                 query = query.lte("created_at", filters["date_to"])
             
-            result = query.order("created_at", desc=True).limit(10).execute()
+            result = await self._execute(query.order("created_at", desc=True).limit(10))
             logger.info(f"🔍 Filtrage local: {len(result.data)} recherches trouvées")
             return result.data
         
@@ -185,7 +242,7 @@ class AIService:
             if filters.get("location"):
                 query = query.ilike("location", f"%{filters['location']}%")
             
-            result = query.order("date").limit(20).execute()
+            result = await self._execute(query.order("date").limit(20))
             logger.info(f"🔍 Filtrage local: {len(result.data)} événements trouvés")
             return result.data
         
@@ -196,7 +253,7 @@ class AIService:
     async def _get_devis_details(self, company_id: str, quote_id: str) -> Optional[Dict]:
         """Récupère les détails complets d'un devis"""
         try:
-            result = self.supabase.table("quotes").select("*, client:clients(*)").eq("id", quote_id).eq("company_id", company_id).single().execute()
+            result = await self._execute(self.supabase.table("quotes").select("*, client:clients(*)").eq("id", quote_id).eq("company_id", company_id).single())
             return result.data
         except Exception as e:
             logger.error(f"❌ Erreur détails devis: {e}")
@@ -205,8 +262,10 @@ class AIService:
     async def _get_client_details(self, company_id: str, client_id: str) -> Optional[Dict]:
         """Récupère les détails complets d'un client avec son historique"""
         try:
-            client = self.supabase.table("clients").select("*").eq("id", client_id).eq("company_id", company_id).single().execute()
-            quotes = self.supabase.table("quotes").select("*").eq("client_id", client_id).execute()
+            client, quotes = await asyncio.gather(
+                self._execute(self.supabase.table("clients").select("*").eq("id", client_id).eq("company_id", company_id).single()),
+                self._execute(self.supabase.table("quotes").select("*").eq("client_id", client_id)),
+            )
             
             return {
                 **client.data,
@@ -219,42 +278,9 @@ class AIService:
             return None
     
     async def _get_statistics(self, company_id: str, period: str = "month") -> Dict:
-        """Calcule des statistiques pour l'entreprise"""
+        """Calcule des statistiques pour l'entreprise (agrégats SQL par statut et par période)"""
         try:
-            # Période
-            now = datetime.utcnow()
-            if period == "week":
-                date_from = now - timedelta(days=7)
-            elif period == "month":
-                date_from = now - timedelta(days=30)
-            else:  # year
-                date_from = now - timedelta(days=365)
-            
-            # Devis
-            quotes = self.supabase.table("quotes").select("*").eq("company_id", company_id).gte("created_at", date_from.isoformat()).execute()
-            
-            # Clients
-            clients = self.supabase.table("clients").select("id").eq("company_id", company_id).execute()
-            
-            # Recherches terrain
-            searches = self.supabase.table("searches").select("*").eq("company_id", company_id).gte("created_at", date_from.isoformat()).execute()
-            
-            return {
-                "period": period,
-                "quotes": {
-                    "total": len(quotes.data),
-                    "amount": sum(q.get("amount", 0) for q in quotes.data),
-                    "accepted": len([q for q in quotes.data if q.get("status") == "ACCEPTED"]),
-                    "pending": len([q for q in quotes.data if q.get("status") == "SENT"]),
-                },
-                "clients": {
-                    "total": len(clients.data)
-                },
-                "searches": {
-                    "total": len(searches.data),
-                    "processed": len([s for s in searches.data if s.get("status") == "PROCESSED"]),
-                }
-            }
+            return await self.period_stats.get(company_id, period)
         except Exception as e:
             logger.error(f"❌ Erreur statistiques: {e}")
             return {}
@@ -263,10 +289,11 @@ class AIService:
     # FONCTIONS INTELLIGENTES
     # ============================================================================
     
+    @_tracked("analyze_rapport")
     async def _analyze_rapport(self, company_id: str, search_id: str) -> Dict:
         """Analyse un rapport de recherche terrain (GPT-4o pour PDF complexes)"""
         try:
-            search = self.supabase.table("searches").select("*").eq("id", search_id).eq("company_id", company_id).single().execute()
+            search = await self._execute(self.supabase.table("searches").select("*").eq("id", search_id).eq("company_id", company_id).single())
             
             if self.simulation_mode:
                 return {
@@ -291,7 +318,8 @@ Réponds en JSON avec:
 - materials_needed (matériaux potentiellement nécessaires)
 """
             
-            response = await self.client.chat.completions.create(
+            response = await self._chat(
+                company_id,
                 model=self.models["advanced"],  # GPT-4o pour analyse complexe
                 messages=[
                     {"role": "system", "content": "Tu es un expert BTP français. Analyse technique et précise."},
@@ -302,13 +330,15 @@ Réponds en JSON avec:
             )
             
             result = json.loads(response.choices[0].message.content)
-            self._track_usage(response.usage)
             return result
         
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ Erreur analyse rapport: {e}")
             return {"error": str(e)}
     
+    @_tracked("generate_devis_draft")
     async def _generate_devis_draft(self, company_id: str, client_id: str, description: str) -> Dict:
         """Génère un brouillon de devis basé sur des devis similaires"""
         try:
@@ -330,7 +360,7 @@ Réponds en JSON avec:
                 }
             
             # GPT-4o-mini pour génération rapide
-            context = f"Devis similaires trouvés:\n" + "\n".join([f"- {s.get('title')}: {s.get('amount')}€" for s in similar[:3]])
+            context = f"Devis similaires trouvés:\n" + "\n".join([self._similar_devis_line(s) for s in similar[:3]])
             
             prompt = f"""Génère un brouillon de devis pour:
 {description}
@@ -344,7 +374,8 @@ Réponds en JSON avec:
 - notes (conseils pour l'utilisateur)
 """
             
-            response = await self.client.chat.completions.create(
+            response = await self._chat(
+                company_id,
                 model=self.models["fast"],  # GPT-4o-mini suffisant
                 messages=[
                     {"role": "system", "content": "Tu es un assistant BTP expert en devis. Sois précis et réaliste sur les prix."},
@@ -355,42 +386,41 @@ Réponds en JSON avec:
             )
             
             result = json.loads(response.choices[0].message.content)
-            self._track_usage(response.usage)
             return result
         
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ Erreur génération devis: {e}")
             return {"error": str(e)}
     
     async def _find_similar_devis(self, company_id: str, description: str) -> List[Dict]:
-        """Trouve des devis similaires pour pré-remplissage"""
+        """Trouve des devis similaires pour pré-remplissage (index BM25 de l'entreprise)"""
         try:
-            # Recherche simple par mots-clés
-            quotes = self.supabase.table("quotes").select("*").eq("company_id", company_id).limit(50).execute()
-            
-            # Filtrage basique par mots-clés
-            keywords = description.lower().split()
-            similar = []
-            for quote in quotes.data:
-                title = quote.get("title", "").lower()
-                desc = quote.get("description", "").lower()
-                score = sum(1 for kw in keywords if kw in title or kw in desc)
-                if score > 0:
-                    similar.append({**quote, "similarity_score": score})
-            
-            # Trier par score
-            similar.sort(key=lambda x: x["similarity_score"], reverse=True)
-            return similar[:5]
+            # Construction / synchronisation éventuelle de l'index: hors de la boucle d'événements
+            return await asyncio.to_thread(self.quote_index.search, company_id, description, 5)
         
         except Exception as e:
             logger.error(f"❌ Erreur recherche devis similaires: {e}")
             return []
     
+    @staticmethod
+    def _similar_devis_line(quote: Dict) -> str:
+        """'- Titre: 1200€ (Peinture murs x 40, Enduit x 2)' pour le prompt de génération"""
+        items = [
+            f"{item.get('name') or item.get('designation') or item.get('description')} x {item.get('quantity', 1)}"
+            for item in (quote.get("items") or [])[:6]
+            if item.get("name") or item.get("designation") or item.get("description")
+        ]
+        line = f"- {quote.get('title')}: {quote.get('amount')}€"
+        return f"{line} ({', '.join(items)})" if items else line
+    
+    @_tracked("predict_delays")
     async def _predict_delays(self, company_id: str) -> Dict:
         """Prédit les retards potentiels dans les projets (IA prédictive)"""
         try:
             # Récupérer projets en cours
-            projects = self.supabase.table("projects").select("*").eq("company_id", company_id).in_("status", ["ACTIVE", "IN_PROGRESS"]).execute()
+            projects = await self._execute(self.supabase.table("projects").select("*").eq("company_id", company_id).in_("status", ["ACTIVE", "IN_PROGRESS"]))
             
             if self.simulation_mode:
                 return {
@@ -415,7 +445,8 @@ Réponds en JSON avec:
 - predictions (liste: project_id, risk_level (LOW/MEDIUM/HIGH), reasons)
 """
             
-            response = await self.client.chat.completions.create(
+            response = await self._chat(
+                company_id,
                 model=self.models["fast"],
                 messages=[
                     {"role": "system", "content": "Tu es un expert en gestion de projets BTP."},
@@ -426,9 +457,10 @@ Réponds en JSON avec:
             )
             
             result = json.loads(response.choices[0].message.content)
-            self._track_usage(response.usage)
             return result
         
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ Erreur prédiction retards: {e}")
             return {"error": str(e)}
@@ -437,140 +469,151 @@ Réponds en JSON avec:
     # ÉTAPE 2 : IA DÉCIDE (sur résultats filtrés uniquement)
     # ============================================================================
     
-    async def universal_query(
-        self,
-        company_id: str,
-        user_query: str,
-        user_role: str,
-        conversation_history: Optional[List[Dict]] = None
-    ) -> Dict[str, Any]:
+    def _cached_answer(self, company_id: str, cache_key: str, user_query: str,
+                       conversation_history: Optional[List[Dict]]) -> Optional[Dict[str, Any]]:
+        """Cache exact puis cache sémantique (hors conversation: la réponse dépend alors du contexte)"""
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            logger.info("💾 Réponse du cache")
+            return cached
+        if not conversation_history:
+            semantic = self.semantic_cache.lookup(company_id, user_query)
+            if semantic is not None:
+                response, similarity = semantic
+                self.stats["cache_hits"] += 1
+                logger.info(f"💾 Réponse du cache sémantique (similarité {similarity:.2f})")
+                return {**response, "cached": "semantic", "similarity": round(similarity, 3)}
+        return None
+    
+    def _store_answer(self, company_id: str, cache_key: str, user_query: str,
+                      conversation_history: Optional[List[Dict]], result: Dict[str, Any], cost_before: float):
+        """Mettre en cache (les erreurs et échecs partiels ne sont pas conservés)"""
+        if not result.get("success") or result.get("failed_functions"):
+            return
+        self.cache.set(cache_key, result, company_id)
+        if not conversation_history:
+            self.semantic_cache.store(
+                company_id, user_query, result,
+                tokens_used=result.get("tokens_used") or 0,
+                cost=self.stats["cost_estimate"] - cost_before,
+            )
+    
+    async def _build_query_messages(self, company_id: str, user_query: str, user_role: str,
+                                    conversation_history: Optional[List[Dict]] = None):
         """
-        Requête universelle IA - Interprète la demande et route vers les bonnes functions
-        Architecture: Filtrage local → IA décide
+        Messages (contexte système + historique + question), functions exposées à GPT et rapport
+        de compactage de l'historique (None sans historique). Le prompt complet reste dans
+        self.prompt_budget tokens: l'historique dispose de ce que laissent contexte, functions et question.
         """
-        self.stats["total_requests"] += 1
-        
-        # Vérifier cache
-        cache_key = self._get_cache_key(company_id, user_query)
-        if cache_key in self.cache:
-            cache_entry = self.cache[cache_key]
-            if datetime.utcnow().timestamp() - cache_entry["timestamp"] < self.cache_ttl:
-                self.stats["cache_hits"] += 1
-                logger.info("💾 Réponse du cache")
-                return cache_entry["response"]
-        
-        if self.simulation_mode:
-            return self._simulate_response(user_query)
+        # Définir les functions disponibles pour GPT
+        functions_schema = [
+            {
+                "name": "search_devis",
+                "description": "Recherche des devis avec filtres optionnels (client, montant, statut, dates)",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "client_name": {"type": "string", "description": "Nom du client"},
+                        "status": {"type": "string", "enum": ["DRAFT", "SENT", "ACCEPTED", "REJECTED", "EXPIRED"]},
+                        "min_amount": {"type": "number", "description": "Montant minimum"},
+                        "max_amount": {"type": "number", "description": "Montant maximum"},
+                        "date_from": {"type": "string", "description": "Date début ISO"},
+                        "date_to": {"type": "string", "description": "Date fin ISO"},
+                    },
+                    "required": []
+                }
+            },
+            {
+                "name": "search_clients",
+                "description": "Recherche des clients par nom, email ou ville",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string", "description": "Nom du client"},
+                        "email": {"type": "string", "description": "Email"},
+                        "city": {"type": "string", "description": "Ville"},
+                    },
+                    "required": []
+                }
+            },
+            {
+                "name": "search_searches",
+                "description": "Recherche des rapports terrain avec filtres (lieu, statut, dates, technicien)",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "status": {"type": "string", "enum": ["DRAFT", "ACTIVE", "PROCESSED", "ARCHIVED"]},
+                        "location": {"type": "string", "description": "Lieu de la recherche"},
+                        "user_id": {"type": "string", "description": "ID du technicien"},
+                        "date_from": {"type": "string", "description": "Date début"},
+                        "date_to": {"type": "string", "description": "Date fin"},
+                    },
+                    "required": []
+                }
+            },
+            {
+                "name": "search_planning",
+                "description": "Recherche dans le planning avec filtres (dates, technicien, lieu)",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "date": {"type": "string", "description": "Date spécifique"},
+                        "date_from": {"type": "string", "description": "Date début"},
+                        "date_to": {"type": "string", "description": "Date fin"},
+                        "user_id": {"type": "string", "description": "ID du technicien"},
+                        "location": {"type": "string", "description": "Lieu"},
+                    },
+                    "required": []
+                }
+            },
+            {
+                "name": "get_statistics",
+                "description": "Récupère les statistiques de l'entreprise",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "period": {"type": "string", "enum": ["week", "month", "year"], "description": "Période"},
+                    },
+                    "required": []
+                }
+            },
+            {
+                "name": "generate_devis_draft",
+                "description": "Génère un brouillon de devis basé sur une description",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "client_id": {"type": "string", "description": "ID du client"},
+                        "description": {"type": "string", "description": "Description des travaux"},
+                    },
+                    "required": ["client_id", "description"]
+                }
+            },
+            {
+                "name": "analyze_rapport",
+                "description": "Analyse un rapport de recherche terrain",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "search_id": {"type": "string", "description": "ID de la recherche"},
+                    },
+                    "required": ["search_id"]
+                }
+            },
+            {
+                "name": "predict_delays",
+                "description": "Prédit les retards potentiels dans les projets",
+                "parameters": {
+                    "type": "object",
+                    "properties": {},
+                    "required": []
+                }
+            },
+        ]
         
-        try:
-            # Définir les functions disponibles pour GPT
-            functions_schema = [
-                {
-                    "name": "search_devis",
-                    "description": "Recherche des devis avec filtres optionnels (client, montant, statut, dates)",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "client_name": {"type": "string", "description": "Nom du client"},
-                            "status": {"type": "string", "enum": ["DRAFT", "SENT", "ACCEPTED", "REJECTED", "EXPIRED"]},
-                            "min_amount": {"type": "number", "description": "Montant minimum"},
-                            "max_amount": {"type": "number", "description": "Montant maximum"},
-                            "date_from": {"type": "string", "description": "Date début ISO"},
-                            "date_to": {"type": "string", "description": "Date fin ISO"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "search_clients",
-                    "description": "Recherche des clients par nom, email ou ville",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "name": {"type": "string", "description": "Nom du client"},
-                            "email": {"type": "string", "description": "Email"},
-                            "city": {"type": "string", "description": "Ville"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "search_searches",
-                    "description": "Recherche des rapports terrain avec filtres (lieu, statut, dates, technicien)",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "status": {"type": "string", "enum": ["DRAFT", "ACTIVE", "PROCESSED", "ARCHIVED"]},
-                            "location": {"type": "string", "description": "Lieu de la recherche"},
-                            "user_id": {"type": "string", "description": "ID du technicien"},
-                            "date_from": {"type": "string", "description": "Date début"},
-                            "date_to": {"type": "string", "description": "Date fin"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "search_planning",
-                    "description": "Recherche dans le planning avec filtres (dates, technicien, lieu)",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "date": {"type": "string", "description": "Date spécifique"},
-                            "date_from": {"type": "string", "description": "Date début"},
-                            "date_to": {"type": "string", "description": "Date fin"},
-                            "user_id": {"type": "string", "description": "ID du technicien"},
-                            "location": {"type": "string", "description": "Lieu"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "get_statistics",
-                    "description": "Récupère les statistiques de l'entreprise",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "period": {"type": "string", "enum": ["week", "month", "year"], "description": "Période"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "generate_devis_draft",
-                    "description": "Génère un brouillon de devis basé sur une description",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "client_id": {"type": "string", "description": "ID du client"},
-                            "description": {"type": "string", "description": "Description des travaux"},
-                        },
-                        "required": ["client_id", "description"]
-                    }
-                },
-                {
-                    "name": "analyze_rapport",
-                    "description": "Analyse un rapport de recherche terrain",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "search_id": {"type": "string", "description": "ID de la recherche"},
-                        },
-                        "required": ["search_id"]
-                    }
-                },
-                {
-                    "name": "predict_delays",
-                    "description": "Prédit les retards potentiels dans les projets",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "required": []
-                    }
-                },
-            ]
-            
-            # Contexte système
-            system_context = f"""Tu es SkyBot, l'assistant IA intelligent de SkyApp, le premier logiciel BTP intelligent en France.
+        # Contexte système
+        system_context = f"""Tu es SkyBot, l'assistant IA intelligent de SkyApp, le premier logiciel BTP intelligent en France.
 
 Rôle utilisateur: {user_role}
 Entreprise ID: {company_id}
@@ -594,86 +637,117 @@ CAPACITÉS:
 - Prédire retards et problèmes
 - Calculer statistiques
 """
-            
-            # Messages avec historique
-            messages = [
-                {"role": "system", "content": system_context}
-            ]
-            
-            if conversation_history:
-                messages.extend(conversation_history[-10:])  # 10 derniers messages
-            
-            messages.append({"role": "user", "content": user_query})
+        
+        # Messages avec historique
+        messages = [
+            {"role": "system", "content": system_context}
+        ]
+        question = {"role": "user", "content": user_query}
+        
+        history_report = None
+        if conversation_history:
+            fixed = sum(message_tokens(m) for m in messages) + message_tokens(question) + estimate_tokens(functions_schema)
+            history, history_report = await self.history.compact(
+                company_id, conversation_history, max(self.prompt_budget - fixed, MIN_HISTORY_BUDGET)
+            )
+            messages.extend(history)
+        
+        messages.append(question)
+        
+        return messages, functions_schema, history_report
+    
+    @_tracked("universal_query")
+    async def universal_query(
+        self,
+        company_id: str,
+        user_query: str,
+        user_role: str,
+        conversation_history: Optional[List[Dict]] = None
+    ) -> Dict[str, Any]:
+        """
+        Requête universelle IA - Interprète la demande et route vers les bonnes functions
+        Architecture: Filtrage local → IA décide
+        """
+        self.stats["total_requests"] += 1
+        
+        # Vérifier cache
+        cache_key = self._get_cache_key(company_id, user_query)
+        cached = self._cached_answer(company_id, cache_key, user_query, conversation_history)
+        if cached is not None:
+            self._note_usage(cache=cached.get("cached", "exact"))
+            return cached
+        
+        if self.simulation_mode:
+            self._note_usage(cache="simulation")
+            return self._simulate_response(user_query)
+        
+        cost_before = self.stats["cost_estimate"]
+        try:
+            messages, functions_schema, history_report = await self._build_query_messages(
+                company_id, user_query, user_role, conversation_history
+            )
+            started = time.perf_counter()
             
             # Appel GPT avec function calling (GPT-4o-mini pour 95% des cas)
-            response = await self.client.chat.completions.create(
+            response = await self._chat(
+                company_id,
                 model=self.models["fast"],  # GPT-4o-mini - économique
                 messages=messages,
-                functions=functions_schema,
-                function_call="auto",
+                tools=self._tools_schema(functions_schema),
+                tool_choice="auto",
                 temperature=0.5,
                 max_tokens=1000
             )
+            first_ms = (time.perf_counter() - started) * 1000
             
             message = response.choices[0].message
-            self._track_usage(response.usage)
             
-            # Si function call
-            if message.function_call:
-                function_name = message.function_call.name
-                function_args = json.loads(message.function_call.arguments)
+            # Si function call(s): exécutées simultanément
+            if message.tool_calls:
+                calls = [{"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+                         for call in message.tool_calls]
+                logger.info(f"🔧 Function calls: {', '.join(c['name'] for c in calls)}")
+                
+                tools_started = time.perf_counter()
+                outcomes = await self._run_tool_calls(company_id, calls)
+                tools_ms = (time.perf_counter() - tools_started) * 1000
+                
+                # Envoyer résultats à GPT pour formulation finale
+                self._append_tool_results(messages, message.content, outcomes)
                 
-                logger.info(f"🔧 Function call: {function_name} avec args {function_args}")
+                final_started = time.perf_counter()
+                final_response = await self._chat(
+                    company_id,
+                    model=self.models["fast"],
+                    messages=messages,
+                    temperature=0.5,
+                    max_tokens=800
+                )
+                final_ms = (time.perf_counter() - final_started) * 1000
                 
-                # Exécuter la function
-                if function_name in self.functions:
-                    function_result = await self.functions[function_name](company_id, **function_args)
-                    
-                    # Envoyer résultat à GPT pour formulation finale
-                    messages.append({
-                        "role": "function",
-                        "name": function_name,
-                        "content": json.dumps(function_result, ensure_ascii=False, default=str)
-                    })
-                    
-                    final_response = await self.client.chat.completions.create(
-                        model=self.models["fast"],
-                        messages=messages,
-                        temperature=0.5,
-                        max_tokens=800
-                    )
-                    
-                    self._track_usage(final_response.usage)
-                    final_message = final_response.choices[0].message.content
-                    
-                    result = {
-                        "success": True,
-                        "message": final_message,
-                        "function_called": function_name,
-                        "data": function_result,
-                        "tokens_used": response.usage.total_tokens + final_response.usage.total_tokens
-                    }
-                else:
-                    result = {
-                        "success": False,
-                        "message": f"Function {function_name} non disponible"
-                    }
+                result = {
+                    "success": True,
+                    "message": final_response.choices[0].message.content,
+                    **self._tool_summary(outcomes),
+                    "tokens_used": response.usage.total_tokens + final_response.usage.total_tokens,
+                    "latency": self._latency(started, first_ms, outcomes, tools_ms, final_ms),
+                }
             else:
                 # Réponse directe sans function
                 result = {
                     "success": True,
                     "message": message.content,
-                    "tokens_used": response.usage.total_tokens
+                    "tokens_used": response.usage.total_tokens,
+                    "latency": self._latency(started, first_ms),
                 }
+            if history_report:
+                result["history"] = history_report
             
-            # Mettre en cache
-            self.cache[cache_key] = {
-                "response": result,
-                "timestamp": datetime.utcnow().timestamp()
-            }
-            
+            self._store_answer(company_id, cache_key, user_query, conversation_history, result, cost_before)
             return result
         
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ Erreur requête universelle: {e}")
             return {
@@ -681,22 +755,415 @@ CAPACITÉS:
                 "message": f"Erreur: {str(e)}"
             }
     
+    async def universal_query_stream(
+        self,
+        company_id: str,
+        user_query: str,
+        user_role: str,
+        conversation_history: Optional[List[Dict]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Variante streaming de universal_query: événements (type, données)
+        - "meta": étape en cours (cache, simulation, function appelée)
+        - "token": fragment de la réponse ({"delta": ...})
+        - "done": réponse complète, identique à universal_query (et mise en cache)
+        Le function calling local reste exécuté avant la formulation finale.
+        """
+        usage = self._new_usage_event(company_id, "universal_query_stream")
+        events = self._universal_query_stream(company_id, user_query, user_role, conversation_history, usage)
+        async for event in self._track_stream(usage, events):
+            yield event
+    
+    async def _universal_query_stream(self, company_id: str, user_query: str, user_role: str,
+                                      conversation_history: Optional[List[Dict]], usage: Dict[str, Any]
+                                      ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        self.stats["total_requests"] += 1
+        
+        cache_key = self._get_cache_key(company_id, user_query)
+        cached = self._cached_answer(company_id, cache_key, user_query, conversation_history)
+        if cached is not None:
+            usage["cache"] = cached.get("cached", "exact")
+            yield "meta", {"stage": "cache", "cached": usage["cache"]}
+            async for event in self._replay(cached):
+                yield event
+            return
+        
+        if self.simulation_mode:
+            usage["cache"] = "simulation"
+            yield "meta", {"stage": "simulation", "simulation": True}
+            async for event in self._replay(self._simulate_response(user_query), SIMULATION_TOKEN_DELAY):
+                yield event
+            return
+        
+        # 429 avant le premier octet si le quota est déjà épuisé
+        self.limiter.precheck(company_id)
+        yield "meta", {"stage": "thinking"}
+        
+        cost_before = self.stats["cost_estimate"]
+        try:
+            with self._usage_context(usage):
+                messages, functions_schema, history_report = await self._build_query_messages(
+                    company_id, user_query, user_role, conversation_history
+                )
+            
+            started = time.perf_counter()
+            first: Dict[str, Any] = {"usage_event": usage}
+            parts = []
+            async for text in self._stream_chat(
+                company_id, first,
+                model=self.models["fast"],
+                messages=messages,
+                tools=self._tools_schema(functions_schema),
+                tool_choice="auto",
+                temperature=0.5,
+                max_tokens=1000
+            ):
+                parts.append(text)
+                yield "token", {"delta": text}
+            first_ms = (time.perf_counter() - started) * 1000
+            
+            calls = first.get("tool_calls")
+            if calls:
+                logger.info(f"🔧 Function calls: {', '.join(c['name'] for c in calls)}")
+                yield "meta", {"stage": "function", "function_called": calls[0]["name"],
+                               "functions_called": [c["name"] for c in calls]}
+                
+                tools_started = time.perf_counter()
+                with self._usage_context(usage):
+                    outcomes = await self._run_tool_calls(company_id, calls)
+                tools_ms = (time.perf_counter() - tools_started) * 1000
+                self._append_tool_results(messages, "".join(parts) or None, outcomes)
+                
+                final_started = time.perf_counter()
+                final: Dict[str, Any] = {"usage_event": usage}
+                parts = []
+                async for text in self._stream_chat(
+                    company_id, final,
+                    model=self.models["fast"],
+                    messages=messages,
+                    temperature=0.5,
+                    max_tokens=800
+                ):
+                    parts.append(text)
+                    yield "token", {"delta": text}
+                final_ms = (time.perf_counter() - final_started) * 1000
+                
+                result = {
+                    "success": True,
+                    "message": "".join(parts),
+                    **self._tool_summary(outcomes),
+                    "tokens_used": first.get("tokens", 0) + final.get("tokens", 0),
+                    "latency": self._latency(started, first_ms, outcomes, tools_ms, final_ms),
+                }
+            else:
+                result = {
+                    "success": True,
+                    "message": "".join(parts),
+                    "tokens_used": first.get("tokens", 0),
+                    "latency": self._latency(started, first_ms),
+                }
+            if history_report:
+                result["history"] = history_report
+            
+            self._store_answer(company_id, cache_key, user_query, conversation_history, result, cost_before)
+            yield "done", result
+        
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Erreur requête universelle (streaming): {e}")
+            yield "done", {"success": False, "message": f"Erreur: {str(e)}"}
+    
+    async def stream_completion(
+        self,
+        company_id: Optional[str],
+        messages: List[Dict],
+        simulated_text: Optional[str] = None,
+        function: str = "stream_completion",
+        **params
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Appel direct en streaming (ex: amélioration de texte): "token"... puis "done" {message, tokens_used}"""
+        usage = self._new_usage_event(company_id, function)
+        async for event in self._track_stream(usage, self._stream_completion(company_id, messages, simulated_text,
+                                                                             usage, **params)):
+            yield event
+    
+    async def _stream_completion(self, company_id: Optional[str], messages: List[Dict], simulated_text: Optional[str],
+                                 usage: Dict[str, Any], **params) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        if self.simulation_mode:
+            usage["cache"] = "simulation"
+            yield "meta", {"stage": "simulation", "simulation": True}
+            async for event in self._replay({"success": True, "message": simulated_text or "", "simulation": True},
+                                            SIMULATION_TOKEN_DELAY):
+                yield event
+            return
+        
+        self.limiter.precheck(company_id)
+        state: Dict[str, Any] = {"usage_event": usage}
+        parts = []
+        async for text in self._stream_chat(company_id, state, model=params.pop("model", self.models["fast"]),
+                                            messages=messages, **params):
+            parts.append(text)
+            yield "token", {"delta": text}
+        yield "done", {"success": True, "message": "".join(parts), "tokens_used": state.get("tokens", 0)}
+    
     # ============================================================================
     # UTILITAIRES
     # ============================================================================
     
+    async def _execute(self, query):
+        """Exécute une requête Supabase (client synchrone) hors de la boucle d'événements"""
+        return await asyncio.to_thread(query.execute)
+    
+    @staticmethod
+    def _tools_schema(functions_schema: List[Dict]) -> List[Dict]:
+        """Functions exposées sous forme de "tools": GPT peut en demander plusieurs dans un même tour"""
+        return [{"type": "function", "function": function} for function in functions_schema]
+    
+    async def _run_tool(self, company_id: str, call_id: str, name: str, arguments: Optional[str]) -> Dict[str, Any]:
+        """Exécute une function demandée par GPT; délai dépassé ou erreur -> statut, sans lever"""
+        started = time.perf_counter()
+        outcome: Dict[str, Any] = {"id": call_id, "name": name, "arguments": arguments or "{}"}
+        try:
+            function = self.functions.get(name)
+            if function is None:
+                raise ValueError(f"Function {name} non disponible")
+            args = json.loads(arguments or "{}")
+            # Les recherches attendent leurs critères regroupés dans `filters`
+            if "filters" in inspect.signature(function).parameters and "filters" not in args:
+                args = {"filters": args}
+            outcome["result"] = await asyncio.wait_for(function(company_id, **args), timeout=self.tool_timeout)
+            outcome["status"] = "ok"
+        except RateLimitExceeded:
+            raise
+        except asyncio.TimeoutError:
+            outcome["status"] = "timeout"
+            outcome["error"] = f"Délai dépassé ({self.tool_timeout:.0f} s)"
+        except Exception as e:
+            outcome["status"] = "error"
+            outcome["error"] = str(e)
+        outcome["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if outcome["status"] != "ok":
+            logger.warning(f"⚠️ Function {name} en échec ({outcome['status']}): {outcome['error']}")
+        return outcome
+    
+    async def _run_tool_calls(self, company_id: str, calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Toutes les functions d'un même tour en parallèle; l'échec de l'une n'annule pas les autres"""
+        return list(await asyncio.gather(*(
+            self._run_tool(company_id, call["id"], call["name"], call["arguments"]) for call in calls
+        )))
+    
+    @staticmethod
+    def _append_tool_results(messages: List[Dict], content: Optional[str], outcomes: List[Dict[str, Any]]):
+        """Message assistant (appels demandés) puis un message "tool" par résultat ou erreur"""
+        messages.append({
+            "role": "assistant",
+            "content": content,
+            "tool_calls": [
+                {"id": o["id"], "type": "function", "function": {"name": o["name"], "arguments": o["arguments"]}}
+                for o in outcomes
+            ],
+        })
+        for o in outcomes:
+            payload = o["result"] if o["status"] == "ok" else {"error": o["error"]}
+            messages.append({
+                "role": "tool",
+                "tool_call_id": o["id"],
+                "content": json.dumps(payload, ensure_ascii=False, default=str),
+            })
+    
+    @staticmethod
+    def _tool_summary(outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Champs de réponse: function(s) appelée(s), données, échecs partiels"""
+        summary: Dict[str, Any] = {
+            "function_called": outcomes[0]["name"],
+            "functions_called": [o["name"] for o in outcomes],
+        }
+        if len(outcomes) == 1:
+            summary["data"] = outcomes[0].get("result")
+        else:
+            summary["data"] = [
+                {"function": o["name"], **({"result": o["result"]} if o["status"] == "ok" else {"error": o["error"]})}
+                for o in outcomes
+            ]
+        failed = [{"function": o["name"], "status": o["status"], "error": o["error"]}
+                  for o in outcomes if o["status"] != "ok"]
+        if failed:
+            summary["failed_functions"] = failed
+        return summary
+    
+    @staticmethod
+    def _latency(started: float, first_ms: float, outcomes: Optional[List[Dict[str, Any]]] = None,
+                 tools_ms: float = 0.0, final_ms: float = 0.0) -> Dict[str, Any]:
+        """Décomposition du temps de réponse d'un tour (ms)"""
+        latency: Dict[str, Any] = {"model_ms": round(first_ms, 1)}
+        if outcomes is not None:
+            latency["tools_ms"] = round(tools_ms, 1)
+            latency["tools"] = [{"function": o["name"], "ms": o["ms"], "status": o["status"]} for o in outcomes]
+            latency["final_ms"] = round(final_ms, 1)
+        latency["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return latency
+    
+    async def _summarize_history(self, company_id: str, previous_summary: Optional[str],
+                                 messages: List[Dict[str, str]]) -> str:
+        """Résumé glissant de l'historique (GPT-4o-mini); une erreur bascule sur le résumé local"""
+        if self.simulation_mode:
+            raise RuntimeError("Mode simulation")
+        transcript = "\n".join(
+            f"{'Utilisateur' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+        )
+        if previous_summary:
+            transcript = f"Résumé existant:\n{previous_summary}\n\nSuite de la conversation:\n{transcript}"
+        response = await self._chat(
+            company_id,
+            model=self.models["fast"],
+            messages=[
+                {"role": "system", "content": "Résume cette conversation entre un utilisateur de SkyApp et son assistant BTP. "
+                                              "Garde les faits utiles pour la suite: clients, devis, chantiers, montants, dates, "
+                                              "demandes en cours. Style télégraphique, en français."},
+                {"role": "user", "content": transcript}
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS
+        )
+        return response.choices[0].message.content or ""
+    
+    async def _chat(self, company_id: Optional[str], **params):
+        """chat.completions.create derrière le limiteur (GPT-4o compte pour 5 unités de quota)"""
+        cost = 5.0 if params.get("model") == self.models["advanced"] else 1.0
+        
+        async def create():
+            response = await self.client.chat.completions.create(**params)
+            # Comptabilisé une seule fois, même si l'appel est partagé
+            self._track_usage(response.usage, params.get("model"))
+            return response
+        
+        return await self.limiter.call(company_id, request_key(company_id or "", params), create, cost=cost)
+    
+    async def _stream_chat(self, company_id: Optional[str], state: Dict[str, Any], **params) -> AsyncIterator[str]:
+        """
+        chat.completions en streaming derrière le limiteur (sans regroupement).
+        Produit les fragments de texte; `state` reçoit tool_calls et tokens consommés
+        (et les reporte sur state["usage_event"], l'événement de télémétrie du flux).
+        """
+        cost = 5.0 if params.get("model") == self.models["advanced"] else 1.0
+        async with self.limiter.admit(company_id, cost):
+            stream = await self.client.chat.completions.create(
+                **params, stream=True, stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    self._track_usage(chunk.usage, params.get("model"), state.get("usage_event"))
+                    state["tokens"] = state.get("tokens", 0) + chunk.usage.total_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                for fragment in getattr(delta, "tool_calls", None) or []:
+                    # Les appels arrivent par morceaux, repérés par leur index
+                    calls = state.setdefault("tool_calls", [])
+                    while len(calls) <= fragment.index:
+                        calls.append({"id": "", "name": "", "arguments": ""})
+                    call = calls[fragment.index]
+                    call["id"] = fragment.id or call["id"]
+                    if fragment.function:
+                        call["name"] += fragment.function.name or ""
+                        call["arguments"] += fragment.function.arguments or ""
+                if delta.content:
+                    yield delta.content
+    
+    async def _replay(self, result: Dict[str, Any], delay: float = 0.0) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Rejoue une réponse déjà complète (cache, simulation) sous forme de fragments"""
+        for piece in re.findall(r"\S+\s*|\s+", result.get("message") or ""):
+            yield "token", {"delta": piece}
+            if delay:
+                await asyncio.sleep(delay)
+        yield "done", result
+    
+    async def chat_completion(self, messages: List[Dict], use_functions: bool = False,
+                              company_id: Optional[str] = None, function: str = "chat_completion", **params):
+        """Appel direct (sans function calling), ex: amélioration de texte"""
+        if self.simulation_mode:
+            raise RuntimeError("Mode simulation - OpenAI API key non configurée")
+        with self._usage_scope(company_id, function):
+            return await self._chat(company_id, model=params.pop("model", self.models["fast"]), messages=messages, **params)
+    
     def _get_cache_key(self, company_id: str, query: str) -> str:
-        """Génère une clé de cache unique"""
-        return hashlib.md5(f"{company_id}:{query}".encode()).hexdigest()
+        """Génère une clé de cache unique (génération de données lue avant la réponse: une écriture
+        pendant le calcul rend la réponse inaccessible au lieu de la servir comme fraîche)"""
+        generation = self.cache.generation(company_id)
+        return hashlib.md5(f"{company_id}:{generation}:{query}".encode()).hexdigest()
     
-    def _track_usage(self, usage):
-        """Suit l'utilisation des tokens et estime le coût"""
+    def _track_usage(self, usage, model: Optional[str] = None, event: Optional[Dict[str, Any]] = None):
+        """Suit l'utilisation des tokens et estime le coût (worker + événement de télémétrie en cours)"""
         self.stats["tokens_used"] += usage.total_tokens
         
-        # Estimation coût (GPT-4o-mini: 0.15$ input + 0.60$ output / 1M tokens)
-        input_cost = (usage.prompt_tokens / 1_000_000) * 0.15
-        output_cost = (usage.completion_tokens / 1_000_000) * 0.60
-        self.stats["cost_estimate"] += input_cost + output_cost
+        # Estimation coût selon le modèle (GPT-4o-mini: 0.15$ input + 0.60$ output / 1M tokens)
+        cost = usage_cost(model, usage.prompt_tokens, usage.completion_tokens)
+        self.stats["cost_estimate"] += cost
+        
+        event = event if event is not None else _usage_event.get()
+        if event is not None:
+            event["prompt_tokens"] += usage.prompt_tokens
+            event["completion_tokens"] += usage.completion_tokens
+            event["cost"] += cost
+            if model and model not in (event["model"] or "").split(","):
+                event["model"] = f"{event['model']},{model}" if event["model"] else model
+    
+    @staticmethod
+    def _new_usage_event(company_id: Optional[str], function: str) -> Dict[str, Any]:
+        return {"company_id": company_id, "function": function, "model": None, "prompt_tokens": 0,
+                "completion_tokens": 0, "cost": 0.0, "cache": "miss", "success": True}
+    
+    @contextmanager
+    def _usage_context(self, event: Dict[str, Any]):
+        """Rattache les appels OpenAI du bloc à `event`"""
+        token = _usage_event.set(event)
+        try:
+            yield event
+        finally:
+            _usage_event.reset(token)
+    
+    @contextmanager
+    def _usage_scope(self, company_id: Optional[str], function: str):
+        """Événement de télémétrie d'une requête IA; imbriqué dans une autre requête: rattaché à celle-ci"""
+        current = _usage_event.get()
+        if current is not None:
+            yield current
+            return
+        event = self._new_usage_event(company_id, function)
+        started = time.perf_counter()
+        try:
+            with self._usage_context(event):
+                yield event
+        except BaseException:
+            event["success"] = False
+            raise
+        finally:
+            self._record_usage(event, started)
+    
+    def _note_usage(self, **fields):
+        """Complète l'événement en cours (ex: résultat du cache)"""
+        event = _usage_event.get()
+        if event is not None:
+            event.update(fields)
+    
+    def _record_usage(self, event: Dict[str, Any], started: float):
+        self.telemetry.record(latency_ms=(time.perf_counter() - started) * 1000, **event)
+    
+    async def _track_stream(self, usage: Dict[str, Any], events: AsyncIterator[Tuple[str, Dict[str, Any]]]
+                            ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Relaie un flux d'événements SSE puis enregistre sa télémétrie (durée totale du flux)"""
+        started = time.perf_counter()
+        try:
+            async for kind, data in events:
+                if kind == "done" and not data.get("success"):
+                    usage["success"] = False
+                yield kind, data
+        except BaseException:
+            usage["success"] = False
+            raise
+        finally:
+            self._record_usage(usage, started)
     
     def _simulate_response(self, query: str) -> Dict:
         """Mode simulation sans API key"""
@@ -747,12 +1214,20 @@ CAPACITÉS:
         return {
             **self.stats,
             "cache_hit_rate": f"{(self.stats['cache_hits'] / max(1, self.stats['total_requests'])) * 100:.1f}%",
-            "cost_estimate_formatted": f"{self.stats['cost_estimate']:.4f}€"
+            "cost_estimate_formatted": f"{self.stats['cost_estimate']:.4f}€",
+            "cache": self.cache.stats(),
+            "semantic_cache": self.semantic_cache.stats(),
+            "limiter": self.limiter.stats(),
+            "quote_index": self.quote_index.stats(),
+            "telemetry": self.telemetry.stats(),
+            "history": self.history.stats(),
+            "period_stats": self.period_stats.stats(),
         }
     
-    def clear_cache(self):
-        """Vide le cache"""
-        self.cache = {}
+    def clear_cache(self, company_id: Optional[str] = None):
+        """Vide le cache (d'une entreprise ou entièrement)"""
+        self.cache.clear(company_id)
+        self.semantic_cache.clear(company_id)
         logger.info("🗑️ Cache vidé")
 
 
@@ -0,0 +1,204 @@
+"""
+Télémétrie d'utilisation de l'IA pour SkyApp
+Un événement par requête IA (entreprise, fonction, modèle, tokens, latence, résultat du cache).
+Les événements sont mis en tampon puis écrits par lots dans ai_usage_events par une tâche de
+fond: aucune écriture sur le chemin de la requête. /api/ai/stats lit les agrégats calculés en
+base (get_ai_usage_rollup), donc valables pour tous les workers.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+AI_TELEMETRY_BATCH_SIZE = int(os.getenv("AI_TELEMETRY_BATCH_SIZE", "200"))
+AI_TELEMETRY_FLUSH_INTERVAL = float(os.getenv("AI_TELEMETRY_FLUSH_INTERVAL", "5"))  # secondes
+AI_TELEMETRY_MAX_BUFFER = int(os.getenv("AI_TELEMETRY_MAX_BUFFER", "10000"))
+TELEMETRY_TABLE = "ai_usage_events"
+
+# $ / 1M tokens (entrée, sortie)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+CACHE_HITS = ("exact", "semantic")
+REPORT_TZ = ZoneInfo("Europe/Paris")  # jour de rattachement des coûts
+
+
+def usage_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    """Coût estimé d'un appel (tarif GPT-4o-mini si le modèle est inconnu)"""
+    input_price, output_price = MODEL_PRICES.get(model or "", MODEL_PRICES["gpt-4o-mini"])
+    return (prompt_tokens / 1_000_000) * input_price + (completion_tokens / 1_000_000) * output_price
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentile par interpolation linéaire (comme percentile_cont en SQL)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return round(ordered[low] + (ordered[high] - ordered[low]) * (position - low), 1)
+
+
+def summarize(events: Iterable[Dict[str, Any]], days: int = 30) -> Dict[str, Any]:
+    """Agrégats au format de get_ai_usage_rollup, calculés en Python (repli local)"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    events = [e for e in events if e["created_at"] >= since]
+
+    def block(rows: List[Dict[str, Any]], latencies: List[float]) -> Dict[str, Any]:
+        return {
+            "requests": len(rows),
+            "cache_hits": sum(1 for e in rows if e["cache"] in CACHE_HITS),
+            "tokens": sum(e["prompt_tokens"] + e["completion_tokens"] for e in rows),
+            "cost": round(sum(e["cost"] for e in rows), 6),
+            "latency_ms_p50": percentile(latencies, 0.5),
+            "latency_ms_p95": percentile(latencies, 0.95),
+        }
+
+    totals = block(events, [e["latency_ms"] for e in events])
+    totals.update(
+        prompt_tokens=sum(e["prompt_tokens"] for e in events),
+        completion_tokens=sum(e["completion_tokens"] for e in events),
+        errors=sum(1 for e in events if not e["success"]),
+    )
+    del totals["tokens"]
+
+    by_function: Dict[str, List[Dict[str, Any]]] = {}
+    by_day: Dict[tuple, List[Dict[str, Any]]] = {}
+    for e in events:
+        by_function.setdefault(e["function"], []).append(e)
+        day = datetime.fromisoformat(e["created_at"]).astimezone(REPORT_TZ).date().isoformat()
+        by_day.setdefault((e["company_id"], day), []).append(e)
+
+    return {
+        "days": days,
+        "totals": totals,
+        "by_function": [
+            {"function": name,
+             **block(rows, [e["latency_ms"] for e in rows if e["cache"] == "miss"])}
+            for name, rows in sorted(by_function.items())
+        ],
+        "by_company_day": [
+            {"company_id": company_id, "day": day, "requests": len(rows),
+             "tokens": sum(e["prompt_tokens"] + e["completion_tokens"] for e in rows),
+             "cost": round(sum(e["cost"] for e in rows), 6)}
+            for (company_id, day), rows in sorted(by_day.items(), key=lambda item: (item[0][1], str(item[0][0])),
+                                                  reverse=True)
+        ],
+    }
+
+
+class AITelemetry:
+    """Tampon d'événements + écriture par lots en tâche de fond (sans client: mémoire seulement)"""
+
+    def __init__(self, client=None, batch_size: int = AI_TELEMETRY_BATCH_SIZE,
+                 flush_interval: float = AI_TELEMETRY_FLUSH_INTERVAL, max_buffer: int = AI_TELEMETRY_MAX_BUFFER):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: deque = deque()
+        self._recent: deque = deque(maxlen=5000)  # repli local de /ai/stats si la base est injoignable
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {"recorded": 0, "written": 0, "dropped": 0, "flush_errors": 0}
+
+    def record(self, company_id: Optional[str], function: str, model: Optional[str] = None,
+               prompt_tokens: int = 0, completion_tokens: int = 0, cost: float = 0.0,
+               latency_ms: float = 0.0, cache: str = "miss", success: bool = True):
+        """Appelé sur le chemin de la requête: ajout en mémoire uniquement"""
+        event = {
+            "company_id": company_id or None,
+            "function": function,
+            "model": model,
+            "prompt_tokens": int(prompt_tokens),
+            "completion_tokens": int(completion_tokens),
+            "cost": round(cost, 6),
+            "latency_ms": round(latency_ms, 1),
+            "cache": cache,
+            "success": bool(success),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self.metrics["recorded"] += 1
+        self._recent.append(event)
+        if self.client is None:
+            return
+        if len(self._buffer) >= self.max_buffer:
+            self._buffer.popleft()
+            self.metrics["dropped"] += 1
+        self._buffer.append(event)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    def start(self):
+        """Lance la tâche d'écriture (boucle d'événements en cours requise)"""
+        if self.client is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Arrêt du worker: dernière écriture des événements en attente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Écrit le tampon par lots; en cas d'échec le lot est remis en tête pour le prochain essai"""
+        written = 0
+        while self._buffer and self.client is not None:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                await asyncio.to_thread(self.client.table(TELEMETRY_TABLE).insert(batch).execute)
+            except Exception as e:
+                self.metrics["flush_errors"] += 1
+                room = self.max_buffer - len(self._buffer)
+                self.metrics["dropped"] += max(0, len(batch) - room)
+                self._buffer.extendleft(reversed(batch[:max(0, room)]))
+                logger.warning(f"⚠️ Écriture télémétrie IA impossible ({len(batch)} événements): {e}")
+                break
+            written += len(batch)
+            self.metrics["written"] += len(batch)
+        return written
+
+    # ------------------------------------------------------------------
+    async def rollup(self, company_id: Optional[str] = None, days: int = 30) -> Dict[str, Any]:
+        """Agrégats tous workers (RPC); repli sur les événements récents de ce worker"""
+        if self.client is not None:
+            try:
+                result = await asyncio.to_thread(
+                    self.client.rpc("get_ai_usage_rollup", {"p_company_id": company_id, "p_days": days}).execute
+                )
+                if result.data:
+                    return {**result.data, "source": "database"}
+            except Exception as e:
+                logger.warning(f"⚠️ Agrégats télémétrie IA indisponibles: {e} - repli local")
+        events = [e for e in self._recent if not company_id or e["company_id"] == company_id]
+        return {**summarize(events, days), "source": "local"}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "buffered": len(self._buffer),
+            "backend": "database" if self.client is not None else "memory",
+        }
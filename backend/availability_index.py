@@ -0,0 +1,254 @@
+"""
+Index de disponibilité des techniciens pour SkyApp
+Créneaux libres précalculés par technicien et par jour (table technician_availability) sur
+un horizon glissant de N semaines. L'API met à jour les jours touchés à chaque écriture de
+planning (tâches de fond non ordonnées: chaque ligne porte la version de synchronisation du
+technicien lue avant le calcul, et la RPC ne remplace pas une ligne plus récente);
+la reconstruction complète se lance en ligne de commande:
+
+    python availability_index.py rebuild [--company <id>] [--weeks 8]
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from schedule_conflicts import (
+    MINUTES_PER_DAY,
+    ScheduleConflictEngine,
+    busy_from_slots,
+    format_minutes,
+    schedule_window_filter,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZON_WEEKS = int(os.environ.get("AVAILABILITY_HORIZON_WEEKS", "8"))
+SCHEDULE_FIELDS = "id, collaborator_id, date, start_date, end_date, time, end_time, hours, status"
+
+
+def free_intervals(busy: Sequence[Tuple[int, int]], day_start: int = 0, day_end: int = MINUTES_PER_DAY) -> List[List[int]]:
+    """Complément des plages occupées (triées) dans [day_start, day_end)"""
+    free = []
+    cursor = day_start
+    for b_start, b_end in busy:
+        if b_start > cursor:
+            free.append([cursor, min(b_start, day_end)])
+        cursor = max(cursor, b_end)
+        if cursor >= day_end:
+            break
+    if cursor < day_end:
+        free.append([cursor, day_end])
+    return [interval for interval in free if interval[1] > interval[0]]
+
+
+def busy_minutes(busy: Sequence[Tuple[int, int]]) -> int:
+    """Minutes occupées (plages fusionnées)"""
+    total, cursor = 0, 0
+    for b_start, b_end in busy:
+        start = max(b_start, cursor)
+        if b_end > start:
+            total += b_end - start
+        cursor = max(cursor, b_end)
+    return total
+
+
+def _days(first_day: date, last_day: date) -> List[date]:
+    return [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+
+class AvailabilityIndex:
+    """Lecture / mise à jour de technician_availability via un client Supabase"""
+
+    def __init__(self, client, horizon_weeks: int = DEFAULT_HORIZON_WEEKS):
+        self.client = client
+        self.horizon_weeks = horizon_weeks
+
+    def horizon(self, today: Optional[date] = None) -> Tuple[date, date]:
+        today = today or date.today()
+        return today, today + timedelta(weeks=self.horizon_weeks) - timedelta(days=1)
+
+    def technicians(self, company_id: str, collaborator_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        q = self.client.table("users").select("id, first_name, last_name, email") \
+            .eq("company_id", company_id).eq("role", "TECHNICIEN")
+        ids = sorted({str(c) for c in collaborator_ids or [] if c})
+        if ids:
+            q = q.in_("id", ids)
+        return q.execute().data or []
+
+    def versions(self, company_id: str, collaborator_ids: Sequence[str]) -> Dict[str, int]:
+        """Versions de synchronisation des techniciens (schedule_sync_versions), vide si la migration manque"""
+        try:
+            res = self.client.table("schedule_sync_versions").select("collaborator_id, version") \
+                .eq("company_id", company_id).in_("collaborator_id", list(collaborator_ids)).execute()
+        except Exception as e:
+            logger.debug(f"schedule_sync_versions indisponible: {e}")
+            return {}
+        return {str(r["collaborator_id"]): r.get("version") or 0 for r in res.data or []}
+
+    def compute(self, company_id: str, collaborator_ids: Sequence[str], first_day: date, last_day: date) -> List[Dict[str, Any]]:
+        """Lignes de disponibilité calculées depuis `schedules` (une requête pour tous les techniciens)"""
+        if not collaborator_ids:
+            return []
+        # La veille est chargée pour la fin des créneaux de nuit
+        res = self.client.table("schedules").select(SCHEDULE_FIELDS) \
+            .eq("company_id", company_id) \
+            .in_("collaborator_id", sorted(set(collaborator_ids))) \
+            .or_(schedule_window_filter(first_day - timedelta(days=1), last_day)) \
+            .execute()
+        engine = ScheduleConflictEngine.from_rows(res.data or [])
+        days = _days(first_day, last_day)
+        busy = busy_from_slots(
+            [slot for collaborator_id in collaborator_ids for slot in engine.slots_for(collaborator_id)], days
+        )
+        rows = []
+        for collaborator_id in collaborator_ids:
+            for day in days:
+                intervals = busy.get((str(collaborator_id), day), [])
+                rows.append({
+                    "collaborator_id": collaborator_id,
+                    "day": day.isoformat(),
+                    "free_intervals": free_intervals(intervals),
+                    "busy_minutes": busy_minutes(intervals),
+                })
+        return rows
+
+    def refresh(self, company_id: str, collaborator_ids: Iterable[str], first_day: date, last_day: date) -> int:
+        """Recalcule les jours [first_day, last_day] (limités à l'horizon) des techniciens donnés"""
+        lo, hi = self.horizon()
+        first_day, last_day = max(first_day, lo), min(last_day, hi)
+        ids = sorted({str(c) for c in collaborator_ids if c})
+        if not ids or first_day > last_day:
+            return 0
+        # Version lue avant les plannings: le résultat reflète au moins cette version
+        versions = self.versions(company_id, ids)
+        rows = self.compute(company_id, ids, first_day, last_day)
+        for row in rows:
+            row["sync_version"] = versions.get(str(row["collaborator_id"]), 0)
+        self.client.rpc("refresh_technician_availability", {
+            "p_company_id": company_id,
+            "p_collaborator_ids": ids,
+            "p_first_day": first_day.isoformat(),
+            "p_last_day": last_day.isoformat(),
+            "p_rows": rows,
+        }).execute()
+        return len(rows)
+
+    def refresh_for_schedules(self, company_id: str, schedules: Iterable[Dict[str, Any]]) -> int:
+        """Mise à jour incrémentale après écriture: jours couverts par les plannings (ancienne et nouvelle version)"""
+        spans: Dict[str, List[date]] = {}
+        for row in schedules:
+            if not row or not row.get("collaborator_id"):
+                continue
+            first = row.get("start_date") or row.get("period_start") or row.get("date")
+            last = row.get("end_date") or row.get("period_end") or row.get("date") or first
+            try:
+                first_day, last_day = date.fromisoformat(str(first)[:10]), date.fromisoformat(str(last)[:10])
+            except ValueError:
+                continue
+            # Le lendemain peut porter la fin d'un créneau de nuit
+            span = spans.setdefault(str(row["collaborator_id"]), [first_day, last_day + timedelta(days=1)])
+            span[0], span[1] = min(span[0], first_day), max(span[1], last_day + timedelta(days=1))
+        return sum(
+            self.refresh(company_id, [collaborator_id], first_day, last_day)
+            for collaborator_id, (first_day, last_day) in spans.items()
+        )
+
+    def rebuild(self, company_id: str) -> int:
+        """Reconstruit tout l'horizon pour tous les techniciens de l'entreprise"""
+        first_day, last_day = self.horizon()
+        ids = [t["id"] for t in self.technicians(company_id)]
+        count = self.refresh(company_id, ids, first_day, last_day)
+        logger.info(f"📆 Index de disponibilité reconstruit pour {company_id}: {count} jour(s) technicien")
+        return count
+
+    def available(self, company_id: str, first_day: date, last_day: date, start_min: int, end_min: int,
+                  collaborator_ids: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Techniciens libres sur [start_min, end_min) chaque jour de first_day à last_day.
+        Les jours hors horizon ou absents de l'index sont calculés à la volée.
+        """
+        technicians = self.technicians(company_id, collaborator_ids)
+        ids = [t["id"] for t in technicians]
+        days = [d.isoformat() for d in _days(first_day, last_day)]
+        indexed: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        if ids:
+            res = self.client.table("technician_availability") \
+                .select("collaborator_id, day, free_intervals, busy_minutes") \
+                .eq("company_id", company_id) \
+                .gte("day", days[0]).lte("day", days[-1]) \
+                .in_("collaborator_id", ids) \
+                .execute()
+            indexed = {(r["collaborator_id"], r["day"]): r for r in res.data or []}
+
+        missing_days = [(cid, day) for cid in ids for day in days if (cid, day) not in indexed]
+        missing = sorted({cid for cid, _ in missing_days})
+        if missing:
+            for row in self.compute(company_id, missing, first_day, last_day):
+                indexed.setdefault((row["collaborator_id"], row["day"]), row)
+
+        available, busy = [], []
+        for tech in technicians:
+            rows = [indexed[(tech["id"], day)] for day in days]
+            free = all(
+                any(s <= start_min and end_min <= e for s, e in row["free_intervals"])
+                for row in rows
+            )
+            entry = {
+                "collaborator_id": tech["id"],
+                "name": f"{tech.get('first_name') or ''} {tech.get('last_name') or ''}".strip() or tech.get("email"),
+                "busy_minutes": sum(row["busy_minutes"] for row in rows),
+                "free_intervals": {
+                    row["day"]: [[format_minutes(s), format_minutes(e) if e < MINUTES_PER_DAY else "24:00"]
+                                 for s, e in row["free_intervals"]]
+                    for row in rows
+                },
+            }
+            (available if free else busy).append(entry)
+        # Les moins chargés d'abord
+        available.sort(key=lambda e: (e["busy_minutes"], e["name"] or ""))
+        return {
+            "available": available,
+            "unavailable": [{"collaborator_id": e["collaborator_id"], "name": e["name"]} for e in busy],
+            "indexed_days": len(days) * len(ids) - len(missing_days),
+            "computed_days": len(missing_days),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Index de disponibilité des techniciens")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="Reconstruit l'index (toutes les entreprises par défaut)")
+    rebuild.add_argument("--company", help="Identifiant d'une entreprise")
+    rebuild.add_argument("--weeks", type=int, default=DEFAULT_HORIZON_WEEKS, help="Horizon en semaines")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        print("❌ ERREUR: Variables SUPABASE_URL ou SUPABASE_SERVICE_KEY manquantes dans .env")
+        return 1
+
+    client = create_client(url, key)
+    index = AvailabilityIndex(client, horizon_weeks=args.weeks)
+    companies = [args.company] if args.company else [
+        c["id"] for c in client.table("companies").select("id").execute().data or []
+    ]
+    total = 0
+    for company_id in companies:
+        total += index.rebuild(company_id)
+        print(f"✅ {company_id}: index reconstruit")
+    print(f"📆 {total} jour(s) technicien indexé(s) pour {len(companies)} entreprise(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
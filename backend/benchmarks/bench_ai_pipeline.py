@@ -0,0 +1,296 @@
+"""
+Benchmark du pipeline IA (AIService) sans réseau
+Les appels OpenAI passent par ai_replay.RecordReplayTransport: réponses rejouées depuis des
+fixtures (enregistrées avec --record, ou synthétisées à la volée) avec une latence simulée.
+Supabase est remplacé par des tables en mémoire. Le temps passé hors modèle (filtrage local,
+prompts, dispatch des functions, caches, limiteur) est isolé: pipeline = total - attente modèle.
+
+Usage: python benchmarks/bench_ai_pipeline.py [--latency 0.3 | --recorded] [--fixtures DIR] [--record] [--quotes N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+
+from ai_cache import AIResponseCache  # noqa: E402
+from ai_history import estimate_tokens  # noqa: E402
+from ai_limiter import OpenAILimiter  # noqa: E402
+from ai_replay import RecordReplayTransport  # noqa: E402
+from ai_service import AIService  # noqa: E402
+from ai_telemetry import AITelemetry  # noqa: E402
+
+COMPANY_ID = "00000000-0000-0000-0000-00000000b001"
+
+QUERIES = [
+    "Montre-moi les devis envoyés",
+    "Quels clients habitent à Lyon ?",
+    "Statistiques du mois",
+    "Quels projets risquent d'être en retard ?",
+    "Les devis acceptés et les statistiques de l'année",
+    "Liste des clients et de leurs devis en attente",
+]
+# Reformulations: même question normalisée (cache sémantique)
+PARAPHRASES = [
+    "montre moi les devis envoyes",
+    "Quels clients habitent a Lyon",
+    "statistiques du mois svp",
+    "Quels projets risquent d'etre en retard",
+    "Les devis acceptes et les statistiques de l'annee",
+    "Liste des clients et leurs devis en attente",
+]
+DEVIS_DESCRIPTIONS = [
+    "Peinture complète du salon, murs et plafond",
+    "Rénovation salle de bain avec carrelage",
+    "Isolation des combles perdus",
+    "Remplacement du tableau électrique",
+    "Ravalement de façade et enduit",
+]
+
+
+# ----------------------------------------------------------------------
+# Supabase en mémoire (sous-ensemble de PostgREST utilisé par AIService)
+# ----------------------------------------------------------------------
+def _comparable(value):
+    return value if isinstance(value, (int, float)) else str(value or "")
+
+
+class MemoryQuery:
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.sort = None
+        self.window = None
+        self.is_single = False
+        self.count = None
+        self.head = False
+
+    def select(self, *columns, count=None, head=False):
+        self.count, self.head = count, head
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: _comparable(row.get(column)) > _comparable(value))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: _comparable(row.get(column)) >= _comparable(value))
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: _comparable(row.get(column)) <= _comparable(value))
+        return self
+
+    def ilike(self, column, pattern):
+        needle = pattern.strip("%").lower()
+        self.filters.append(lambda row: needle in str(row.get(column) or "").lower())
+        return self
+
+    def order(self, column, desc=False):
+        self.sort = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.window = (0, count)
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end + 1)
+        return self
+
+    def single(self):
+        self.is_single = True
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(f(row) for f in self.filters)]
+        # count="exact": total des lignes filtrées, avant pagination; head=True: sans les lignes
+        count = len(rows) if self.count else None
+        if self.head:
+            return SimpleNamespace(data=[], count=count)
+        if self.sort:
+            rows.sort(key=lambda row: _comparable(row.get(self.sort[0])), reverse=self.sort[1])
+        if self.window:
+            rows = rows[self.window[0]:self.window[1]]
+        if self.is_single:
+            return SimpleNamespace(data=rows[0] if rows else None, count=count)
+        return SimpleNamespace(data=[dict(row) for row in rows], count=count)
+
+
+class MemorySupabase:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def table(self, name):
+        return MemoryQuery(self.tables.setdefault(name, []))
+
+    def rpc(self, name, params):
+        raise NotImplementedError(f"RPC {name} absente du jeu de données en mémoire")
+
+
+def generate_dataset(quotes: int, seed: int = 7):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    works = ["Peinture", "Carrelage", "Plomberie", "Électricité", "Isolation", "Ravalement", "Menuiserie"]
+    rooms = ["salon", "cuisine", "salle de bain", "combles", "façade", "chambre"]
+    cities = ["Lyon", "Paris", "Mennecy", "Marseille", "Lille"]
+    clients = [{"id": f"c{i}", "company_id": COMPANY_ID, "nom": f"Client {i}", "email": f"client{i}@exemple.fr",
+                "adresse": f"{i} rue de la Paix, {rng.choice(cities)}"} for i in range(200)]
+
+    def stamp(days):
+        return (now - timedelta(days=days, minutes=rng.randrange(1440))).isoformat()
+
+    return {
+        "clients": clients,
+        "quotes": [{
+            "id": f"q{i}", "company_id": COMPANY_ID, "client_id": rng.choice(clients)["id"],
+            "title": f"{rng.choice(works)} {rng.choice(rooms)}", "description": "Travaux et finitions",
+            "amount": rng.randrange(300, 30000), "status": rng.choice(["DRAFT", "SENT", "ACCEPTED", "REJECTED"]),
+            "items": [{"name": rng.choice(works), "quantity": rng.randrange(1, 40), "price": rng.randrange(5, 400)}
+                      for _ in range(rng.randrange(2, 6))],
+            "created_at": stamp(rng.randrange(400)), "updated_at": stamp(0),
+        } for i in range(quotes)],
+        "searches": [{"id": f"s{i}", "company_id": COMPANY_ID, "location": rng.choice(cities),
+                      "status": rng.choice(["DRAFT", "ACTIVE", "PROCESSED"]), "created_at": stamp(rng.randrange(400))}
+                     for i in range(quotes // 2)],
+        "projects": [{"id": f"p{i}", "company_id": COMPANY_ID, "title": f"Chantier {i}",
+                      "status": rng.choice(["ACTIVE", "IN_PROGRESS", "DONE"]),
+                      "deadline_date": (now + timedelta(days=rng.randrange(-10, 60))).date().isoformat()}
+                     for i in range(40)],
+        "schedules": [],
+    }
+
+
+# ----------------------------------------------------------------------
+# Réponses OpenAI synthétiques (fixtures créées à la première requête inconnue)
+# ----------------------------------------------------------------------
+def synthetic_completion(body):
+    messages = body.get("messages", [])
+    last = messages[-1] if messages else {}
+    content, tool_calls = None, None
+    text = (last.get("content") or "").lower()
+
+    if body.get("tools") and last.get("role") == "user":
+        wanted = [("devis", "search_devis", {"status": "SENT"}), ("client", "search_clients", {"city": "Lyon"}),
+                  ("statist", "get_statistics", {"period": "month"}), ("retard", "predict_delays", {})]
+        tool_calls = [{"id": f"call_{i}", "type": "function",
+                       "function": {"name": name, "arguments": json.dumps(args)}}
+                      for i, (keyword, name, args) in enumerate(wanted) if keyword in text] or None
+        if not tool_calls:
+            content = "Je peux chercher des devis, clients, rapports ou plannings."
+    elif body.get("response_format", {}).get("type") == "json_object":
+        system = (messages[0].get("content") or "").lower()
+        if "projets" in system:
+            content = json.dumps({"at_risk": 1, "predictions": [
+                {"project_id": "p1", "risk_level": "MEDIUM", "reasons": ["Échéance proche"]}]})
+        else:
+            content = json.dumps({"title": "Devis travaux", "items": [
+                {"description": "Main d'œuvre", "quantity": 1, "unit_price": 900, "total": 900}],
+                "total_ht": 900, "tva": 180, "total_ttc": 1080, "notes": "Prix indicatifs"}, ensure_ascii=False)
+    else:
+        content = "Synthèse: " + " ".join(["résultat"] * 60)
+
+    prompt_tokens = estimate_tokens(messages) + estimate_tokens(body.get("tools"))
+    completion_tokens = estimate_tokens(content) + estimate_tokens(tool_calls)
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return {
+        "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": body.get("model"),
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+# ----------------------------------------------------------------------
+async def measure(name, service, transport, calls):
+    """Exécute les appels en série: temps total, attente modèle, requêtes OpenAI, hits de cache"""
+    requests_before = transport.stats["requests"]
+    wait_before = transport.stats["model_wait_ms"]
+    hits_before = service.stats["cache_hits"]
+    durations = []
+    for call in calls:
+        started = time.perf_counter()
+        await call()
+        durations.append((time.perf_counter() - started) * 1000)
+    model_ms = transport.stats["model_wait_ms"] - wait_before
+    pipeline_ms = (sum(durations) - model_ms) / len(calls)
+    print(f"{name:<34} {len(calls):>6} {transport.stats['requests'] - requests_before:>7} "
+          f"{service.stats['cache_hits'] - hits_before:>6} {statistics.median(durations):>11.1f} "
+          f"{model_ms / len(calls):>12.1f} {pipeline_ms:>15.2f}")
+
+
+async def run(args):
+    fixtures = args.fixtures or tempfile.mkdtemp(prefix="skyapp-openai-")
+    transport = RecordReplayTransport(
+        fixtures, mode="record" if args.record else "replay",
+        latency="recorded" if args.recorded else args.latency,
+        on_miss=None if args.record else synthetic_completion,
+    )
+    api_key = os.getenv("OPENAI_API_KEY") if args.record else "sk-replay"
+    service = AIService(MemorySupabase(generate_dataset(args.quotes)), api_key=api_key,
+                        cache=AIResponseCache(path=""), telemetry=AITelemetry())
+    service.client = AsyncOpenAI(api_key=api_key, http_client=httpx.AsyncClient(transport=transport), max_retries=0)
+    service.limiter = OpenAILimiter(max_concurrency=64, company_rate=1e6, company_burst=1e6)
+
+    print(f"fixtures: {fixtures} ({transport.mode}, latence {'enregistrée' if args.recorded else f'{args.latency}s'})")
+    print(f"{'scénario':<34} {'appels':>6} {'OpenAI':>7} {'cache':>6} {'p50 (ms)':>11} "
+          f"{'modèle (ms)':>12} {'pipeline (ms)':>15}")
+
+    def query(text):
+        return lambda: service.universal_query(COMPANY_ID, text, "ADMIN")
+
+    await measure("universal_query (froid)", service, transport, [query(q) for q in QUERIES])
+    await measure("universal_query (cache exact)", service, transport, [query(q) for q in QUERIES])
+    await measure("universal_query (reformulé)", service, transport, [query(q) for q in PARAPHRASES])
+    service.clear_cache()
+    await measure("universal_query (rejeu, cache vidé)", service, transport, [query(q) for q in QUERIES])
+
+    service.quote_index.invalidate()
+    await measure("_generate_devis_draft (index froid)", service, transport, [
+        lambda: service._generate_devis_draft(COMPANY_ID, "c1", DEVIS_DESCRIPTIONS[0])])
+    await measure("_generate_devis_draft", service, transport, [
+        (lambda d=d: service._generate_devis_draft(COMPANY_ID, "c1", d)) for d in DEVIS_DESCRIPTIONS * 2])
+    await measure("_predict_delays", service, transport, [
+        lambda: service._predict_delays(COMPANY_ID) for _ in range(5)])
+
+    semantic = service.semantic_cache.stats()
+    print(f"\ncache exact: {service.cache.stats()['hit_rate']}  sémantique: {semantic['hit_rate']} "
+          f"({semantic['tokens_saved']} tokens économisés)  transport: {transport.stats}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.3, help="latence simulée par appel OpenAI (s)")
+    parser.add_argument("--recorded", action="store_true", help="rejouer la latence enregistrée dans les fixtures")
+    parser.add_argument("--fixtures", help="répertoire des fixtures (défaut: répertoire temporaire)")
+    parser.add_argument("--record", action="store_true", help="appeler OpenAI (OPENAI_API_KEY) et enregistrer")
+    parser.add_argument("--quotes", type=int, default=5000, help="nombre de devis du jeu de données")
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
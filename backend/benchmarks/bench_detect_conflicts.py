@@ -0,0 +1,63 @@
+"""
+Benchmark de la détection de conflits de planning (/ai/planning?action=detect_conflicts)
+Compare la comparaison paire à paire (O(n²)) au balayage de schedule_conflicts.sweep_conflicts.
+
+Usage: python benchmarks/bench_detect_conflicts.py [nb_plannings ...]
+"""
+
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from schedule_conflicts import ScheduleSlot, sweep_conflicts  # noqa: E402
+
+
+def generate_slots(count: int, technicians: int = 60, days: int = 60, seed: int = 42):
+    """Plannings aléatoires: 80% date unique, 20% périodes de 2 à 10 jours, quelques nuits"""
+    rng = random.Random(seed)
+    start = date(2026, 1, 5)
+    slots = []
+    for i in range(count):
+        first = start + timedelta(days=rng.randrange(days))
+        last = first + timedelta(days=rng.randrange(1, 10)) if rng.random() < 0.2 else first
+        hour = rng.choice([6, 7, 8, 9, 13, 14, 22])
+        slots.append(ScheduleSlot.from_values(
+            f"tech-{rng.randrange(technicians)}", first, last,
+            f"{hour:02d}:00", hours=rng.choice([2, 4, 8]), schedule_id=f"s{i}",
+        ))
+    return slots
+
+
+def pairwise_conflicts(slots):
+    """Référence O(n²)"""
+    found = {}
+    for i, a in enumerate(slots):
+        for b in slots[i + 1:]:
+            if a.collaborator_id == b.collaborator_id:
+                minutes = a.overlap_minutes(b)
+                if minutes > 0:
+                    found[(a.id, b.id)] = minutes
+    return found
+
+
+def main(sizes):
+    print(f"{'plannings':>10} {'conflits':>9} {'balayage (ms)':>14} {'paires (ms)':>12} {'gain':>6}")
+    for size in sizes:
+        slots = generate_slots(size)
+        t0 = time.perf_counter()
+        sweep = sweep_conflicts(slots)
+        t1 = time.perf_counter()
+        reference = pairwise_conflicts(slots)
+        t2 = time.perf_counter()
+        got = {(p["schedule1"].id, p["schedule2"].id): p["overlap_minutes"] for p in sweep}
+        assert got == reference, "résultats différents de la référence O(n²)"
+        sweep_ms, pair_ms = (t1 - t0) * 1000, (t2 - t1) * 1000
+        print(f"{size:>10} {len(sweep):>9} {sweep_ms:>14.1f} {pair_ms:>12.1f} {pair_ms / sweep_ms:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1000, 2000, 5000, 10000])
@@ -0,0 +1,80 @@
+"""
+Benchmark de la recherche de devis similaires (generate_devis_draft)
+Mesure la construction de l'index BM25 (quote_index.BM25Index) et le temps d'une recherche top-5,
+comparé à l'ancien filtrage par sous-chaînes sur tous les devis.
+
+Usage: python benchmarks/bench_quote_index.py [nb_devis ...]
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from quote_index import BM25Index  # noqa: E402
+
+WORKS = ["Peinture", "Carrelage", "Plomberie", "Électricité", "Isolation", "Menuiserie", "Toiture",
+         "Maçonnerie", "Plâtrerie", "Ravalement", "Chauffage", "Parquet"]
+ROOMS = ["salon", "cuisine", "salle de bain", "chambre", "façade", "combles", "garage", "bureau", "terrasse"]
+ITEMS = ["Enduit de lissage", "Peinture acrylique", "Carreaux grès cérame", "Colle carrelage", "Tube cuivre",
+         "Tableau électrique", "Laine de verre", "Porte intérieure", "Tuiles terre cuite", "Parpaings",
+         "Plaque de plâtre", "Radiateur", "Lames chêne", "Main d'œuvre", "Évacuation gravats"]
+QUERIES = ["peinture salon murs et plafond", "rénovation salle de bain carrelage", "isolation des combles",
+           "remplacement tableau électrique", "ravalement façade enduit", "pose parquet chêne chambre"]
+
+
+def generate_quotes(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    quotes = []
+    for i in range(count):
+        work, room = rng.choice(WORKS), rng.choice(ROOMS)
+        quotes.append({
+            "id": f"q{i}",
+            "title": f"{work} {room}",
+            "description": f"{work} complète {room}, {rng.choice(ROOMS)} et finitions",
+            "amount": rng.randrange(300, 30000),
+            "items": [{"name": rng.choice(ITEMS), "quantity": rng.randrange(1, 50), "price": rng.randrange(5, 500)}
+                      for _ in range(rng.randrange(2, 8))],
+        })
+    return quotes
+
+
+def substring_search(quotes, description, k=5):
+    """Référence: ancienne implémentation de _find_similar_devis"""
+    keywords = description.lower().split()
+    similar = []
+    for quote in quotes:
+        title, desc = quote["title"].lower(), quote["description"].lower()
+        score = sum(1 for kw in keywords if kw in title or kw in desc)
+        if score:
+            similar.append((score, quote))
+    similar.sort(key=lambda x: x[0], reverse=True)
+    return similar[:k]
+
+
+def main(sizes):
+    print(f"{'devis':>8} {'construction (ms)':>17} {'top-5 bm25 (ms)':>16} {'sous-chaînes (ms)':>18}")
+    for size in sizes:
+        quotes = generate_quotes(size)
+        t0 = time.perf_counter()
+        index = BM25Index()
+        for quote in quotes:
+            index.add(quote)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        for query in QUERIES:
+            assert index.search(query, 5)
+        bm25_ms = (time.perf_counter() - t0) * 1000 / len(QUERIES)
+
+        t0 = time.perf_counter()
+        for query in QUERIES:
+            substring_search(quotes, query)
+        scan_ms = (time.perf_counter() - t0) * 1000 / len(QUERIES)
+        print(f"{size:>8} {build_ms:>17.1f} {bm25_ms:>16.2f} {scan_ms:>18.2f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1000, 10000, 50000])
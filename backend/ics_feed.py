@@ -0,0 +1,277 @@
+"""
+Flux iCalendar (ICS) par technicien pour SkyApp
+URL signée (HMAC) à ajouter dans l'agenda du téléphone. Chaque mission est rendue une fois
+(cache par id + updated_at); le flux complet est gardé en mémoire et servi tel quel tant que
+les plannings du technicien n'ont pas changé (invalidation par l'API + revalidation légère).
+"""
+
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from schedule_conflicts import INACTIVE_STATUSES, ScheduleSlot, parse_day, schedule_window_filter
+
+logger = logging.getLogger(__name__)
+
+ICS_REVALIDATE_SECONDS = 60  # au-delà, une requête légère (id, updated_at) vérifie le cache
+ICS_PAST_DAYS = 90  # missions passées conservées dans le flux
+ICS_FETCH_CHUNK = 200
+FEED_TZ = "Europe/Paris"
+EVENT_FIELDS = (
+    "id, collaborator_id, date, start_date, end_date, time, end_time, hours, status, "
+    "intervention_category, client_name, client_address, client_contact, description, "
+    "worksite_id, team_leader_id, updated_at"
+)
+
+# Fuseau Europe/Paris (règles UE) pour les clients qui n'ont pas la base tz
+VTIMEZONE = [
+    "BEGIN:VTIMEZONE",
+    f"TZID:{FEED_TZ}",
+    "BEGIN:DAYLIGHT",
+    "TZOFFSETFROM:+0100",
+    "TZOFFSETTO:+0200",
+    "TZNAME:CEST",
+    "DTSTART:19700329T020000",
+    "RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU",
+    "END:DAYLIGHT",
+    "BEGIN:STANDARD",
+    "TZOFFSETFROM:+0200",
+    "TZOFFSETTO:+0100",
+    "TZNAME:CET",
+    "DTSTART:19701025T030000",
+    "RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU",
+    "END:STANDARD",
+    "END:VTIMEZONE",
+]
+
+
+# ----------------------------------------------------------------------
+# Jeton signé
+# ----------------------------------------------------------------------
+def feed_signature(secret: str, collaborator_id: str) -> str:
+    return hmac.new(secret.encode(), f"ics:{collaborator_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def feed_token(secret: str, collaborator_id: str) -> str:
+    return f"{collaborator_id}.{feed_signature(secret, collaborator_id)}"
+
+
+def parse_feed_token(secret: str, token: str) -> Optional[str]:
+    """Identifiant du technicien si la signature est valide, sinon None"""
+    collaborator_id, _, signature = (token or "").rpartition(".")
+    if not collaborator_id or not hmac.compare_digest(signature, feed_signature(secret, collaborator_id)):
+        return None
+    return collaborator_id
+
+
+# ----------------------------------------------------------------------
+# Rendu
+# ----------------------------------------------------------------------
+def _escape(text: Any) -> str:
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Repli RFC 5545: lignes de 75 octets max, sans couper un caractère UTF-8"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        if size + width > (75 if not parts else 74):
+            parts.append(current)
+            current, size = "", 0
+        current += char
+        size += width
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _local(day: date, minutes: int) -> str:
+    moment = datetime(day.year, day.month, day.day) + timedelta(minutes=minutes)
+    return moment.strftime("%Y%m%dT%H%M%S")
+
+
+def render_event(row: Dict[str, Any], worksite: Optional[Dict[str, Any]] = None,
+                 team_leader: Optional[str] = None, domain: str = "skyapp.fr") -> str:
+    """VEVENT d'un planning (vide si la ligne n'a pas de date). Périodes: occurrence quotidienne"""
+    slot = ScheduleSlot.from_row(row)
+    first = parse_day(row.get("start_date") or row.get("date"))
+    if first is None:
+        return ""
+    stamp = _parse_timestamp(row.get("updated_at")) or datetime(2000, 1, 1, tzinfo=timezone.utc)
+    stamp_utc = stamp.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    title = (worksite or {}).get("title") or row.get("client_name") or \
+        str(row.get("intervention_category") or "Mission").capitalize()
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{row['id']}@{domain}",
+        f"DTSTAMP:{stamp_utc}",
+        f"LAST-MODIFIED:{stamp_utc}",
+        f"SUMMARY:{_escape(title)}",
+    ]
+    if slot is not None:
+        lines.append(f"DTSTART;TZID={FEED_TZ}:{_local(slot.first_day, slot.start_min)}")
+        lines.append(f"DTEND;TZID={FEED_TZ}:{_local(slot.first_day, slot.end_min)}")
+        if slot.is_period:
+            lines.append(f"RRULE:FREQ=DAILY;COUNT={(slot.last_day - slot.first_day).days + 1}")
+    else:
+        # Pas d'heure: événement sur la journée (ou toute la période)
+        last = parse_day(row.get("end_date") or row.get("date")) or first
+        lines.append(f"DTSTART;VALUE=DATE:{first.strftime('%Y%m%d')}")
+        lines.append(f"DTEND;VALUE=DATE:{(max(first, last) + timedelta(days=1)).strftime('%Y%m%d')}")
+
+    location = row.get("client_address") or (worksite or {}).get("address")
+    if location:
+        lines.append(f"LOCATION:{_escape(location)}")
+    details = [
+        row.get("description"),
+        f"Client: {row['client_name']}" if row.get("client_name") else None,
+        f"Contact: {row['client_contact']}" if row.get("client_contact") else None,
+        f"Chef d'équipe: {team_leader}" if team_leader else None,
+    ]
+    details = [d for d in details if d]
+    if details:
+        lines.append(f"DESCRIPTION:{_escape(chr(10).join(details))}")
+    status = str(row.get("status") or "").lower()
+    lines.append("STATUS:CANCELLED" if status in INACTIVE_STATUSES else "STATUS:CONFIRMED")
+    lines.append("END:VEVENT")
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+
+# ----------------------------------------------------------------------
+# Cache
+# ----------------------------------------------------------------------
+@dataclass
+class ICSFeed:
+    collaborator_id: str
+    company_id: Optional[str]
+    calendar_name: str
+    events: Dict[str, Tuple[str, str, str]] = field(default_factory=dict)  # id -> (updated_at, tri, VEVENT)
+    body: bytes = b""
+    etag: str = ""
+    last_modified: str = ""
+    checked_at: float = 0.0
+    stale: bool = True
+
+
+class ICSFeedCache:
+    """Flux rendus par technicien; seules les missions créées ou modifiées sont re-rendues"""
+
+    def __init__(self, client, directory=None, revalidate_seconds: int = ICS_REVALIDATE_SECONDS):
+        self.client = client
+        self.directory = directory
+        self.revalidate_seconds = revalidate_seconds
+        self._feeds: Dict[str, ICSFeed] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, collaborator_ids: Iterable[Optional[str]]):
+        """Appelé après une écriture de planning: le prochain appel revérifie la base"""
+        for collaborator_id in collaborator_ids:
+            feed = self._feeds.get(str(collaborator_id)) if collaborator_id else None
+            if feed:
+                feed.stale = True
+
+    def get(self, collaborator_id: str) -> Optional[ICSFeed]:
+        feed = self._feeds.get(collaborator_id)
+        if feed and not feed.stale and time.time() - feed.checked_at < self.revalidate_seconds:
+            return feed
+        with self._lock:
+            feed = self._feeds.get(collaborator_id) or self._new_feed(collaborator_id)
+            if feed is None:
+                return None
+            self._sync(feed)
+            self._feeds[collaborator_id] = feed
+            return feed
+
+    def _new_feed(self, collaborator_id: str) -> Optional[ICSFeed]:
+        res = self.client.table("users").select("id, company_id, first_name, last_name") \
+            .eq("id", collaborator_id).execute()
+        if not res.data:
+            return None
+        user = res.data[0]
+        name = f"{user.get('first_name') or ''} {user.get('last_name') or ''}".strip()
+        return ICSFeed(collaborator_id, user.get("company_id"), f"SkyApp - {name}" if name else "SkyApp")
+
+    def _window_filter(self) -> str:
+        return schedule_window_filter(date.today() - timedelta(days=ICS_PAST_DAYS), date(9999, 12, 31))
+
+    def _sync(self, feed: ICSFeed):
+        # Mise à jour des tampons avant la lecture: une écriture concurrente reste marquée
+        feed.stale = False
+        feed.checked_at = time.time()
+        index = self.client.table("schedules").select("id, updated_at") \
+            .eq("collaborator_id", feed.collaborator_id).or_(self._window_filter()).execute().data or []
+        versions = {str(r["id"]): str(r.get("updated_at") or "") for r in index}
+        changed = [sid for sid, updated in versions.items() if feed.events.get(sid, ("",))[0] != updated or not updated]
+        removed = [sid for sid in feed.events if sid not in versions]
+        if feed.body and not changed and not removed:
+            return
+
+        for sid in removed:
+            del feed.events[sid]
+        for i in range(0, len(changed), ICS_FETCH_CHUNK):
+            rows = self.client.table("schedules").select(EVENT_FIELDS) \
+                .in_("id", changed[i:i + ICS_FETCH_CHUNK]).execute().data or []
+            for row in rows:
+                feed.events[str(row["id"])] = (
+                    versions.get(str(row["id"]), ""),
+                    f"{row.get('start_date') or row.get('date') or ''}|{row.get('time') or ''}|{row['id']}",
+                    self._render(feed, row),
+                )
+        self._assemble(feed, versions, bool(removed))
+        logger.info(f"📅 Flux ICS {feed.collaborator_id}: {len(changed)} mission(s) rendue(s), {len(removed)} retirée(s)")
+
+    def _render(self, feed: ICSFeed, row: Dict[str, Any]) -> str:
+        worksite, team_leader = None, None
+        if self.directory is not None and feed.company_id:
+            try:
+                worksite = self.directory.get(feed.company_id, "worksites", row.get("worksite_id"))
+                leader = self.directory.get(feed.company_id, "team_leaders", row.get("team_leader_id"))
+                team_leader = self.directory.team_leader_name(feed.company_id, leader) or None
+            except Exception as e:
+                logger.warning(f"⚠️ Annuaire indisponible pour le flux ICS: {e}")
+        return render_event(row, worksite, team_leader)
+
+    def _assemble(self, feed: ICSFeed, versions: Dict[str, str], removed: bool = False):
+        header = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//SkyApp//Planning//FR",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{_escape(feed.calendar_name)}",
+            f"X-WR-TIMEZONE:{FEED_TZ}",
+            "REFRESH-INTERVAL;VALUE=DURATION:PT15M",
+            *VTIMEZONE,
+        ]
+        events = [event for _, _, event in sorted(feed.events.values(), key=lambda e: e[1])]
+        text = "".join(_fold(line) + "\r\n" for line in header) + "".join(events) + "END:VCALENDAR\r\n"
+        feed.body = text.encode("utf-8")
+        version = "|".join(f"{sid}:{versions[sid]}" for sid in sorted(versions))
+        feed.etag = f'"{hashlib.sha1(f"{feed.calendar_name}|{version}".encode(), usedforsecurity=False).hexdigest()}"'
+        # Une suppression ne laisse pas de updated_at: Last-Modified passe à maintenant
+        stamps = [s for s in (_parse_timestamp(v) for v in versions.values()) if s]
+        modified = datetime.now(timezone.utc) if removed or not stamps else max(stamps).astimezone(timezone.utc)
+        feed.last_modified = format_datetime(modified.replace(microsecond=0), usegmt=True)
@@ -0,0 +1,113 @@
+"""
+Synchronisation incrémentale des missions (application mobile) pour SkyApp
+Le curseur est la version de synchronisation du technicien (schedule_sync_versions,
+incrémentée par trigger dans l'ordre des commits) suivie du jour d'émission: "<version>:<jour>".
+Une synchronisation renvoie les missions de la fenêtre écrites après la version du curseur et,
+dans `deleted`, les missions supprimées ou réassignées (tombstones) ainsi que celles sorties de
+la fenêtre (statut, dates, fenêtre glissante). La version sert aussi d'ETag: un sondage sans
+changement coûte une lecture de clé primaire et se termine en 304.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# Curseur émis avant le passage aux versions (horodatage ISO): resynchronisation complète
+LEGACY_VERSION = -1
+
+
+@dataclass(frozen=True)
+class SyncCursor:
+    version: int
+    issued_on: date
+
+    def __str__(self) -> str:
+        return f"{self.version}:{self.issued_on.isoformat()}"
+
+
+def parse_sync_cursor(value: Optional[str]) -> Optional[SyncCursor]:
+    """'<version>:<YYYY-MM-DD>' -> SyncCursor; ValueError si illisible"""
+    if not value:
+        return None
+    value = value.strip()
+    version, sep, issued = value.partition(":")
+    if sep and version.isdigit():
+        return SyncCursor(int(version), date.fromisoformat(issued))
+    # Ancien curseur (horodatage updated_at)
+    legacy = datetime.fromisoformat(value.replace(" ", "+").replace("Z", "+00:00"))
+    return SyncCursor(LEGACY_VERSION, legacy.date())
+
+
+def sync_etag(collaborator_id: str, window_key: str, version: int) -> str:
+    base = f"{collaborator_id}|{window_key}|{version}"
+    return f'W/"{hashlib.sha1(base.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    return etag in [t.strip() for t in (if_none_match or "").split(",")]
+
+
+@dataclass
+class MissionSyncSource:
+    """
+    Requêtes d'un endpoint de missions (fournies par le serveur):
+    - state(): {"version", "purged_version"} du technicien, None si la migration manque
+    - load(version): missions de la fenêtre (écrites après `version`, toutes si None)
+    - tombstones(version): ids supprimés / réassignés après `version`
+    - left_scope(cursor): ids sortis de la fenêtre depuis le curseur
+    - prepare(): mise à jour préalable (auto-complétion), True si des lignes ont changé
+    """
+
+    state: Callable[[], Optional[Dict[str, int]]]
+    load: Callable[[Optional[int]], List[Dict[str, Any]]]
+    tombstones: Callable[[int], List[str]]
+    left_scope: Callable[[SyncCursor], List[str]]
+    prepare: Optional[Callable[[], bool]] = None
+
+
+@dataclass
+class SyncResult:
+    status_code: int
+    etag: Optional[str] = None
+    cursor: Optional[str] = None
+    rows: Optional[List[Dict[str, Any]]] = None
+    deleted: Optional[List[str]] = None
+    full_sync: bool = False
+    incremental: bool = False
+
+
+def synchronize(source: MissionSyncSource, collaborator_id: str, window_key: str,
+                cursor: Optional[SyncCursor], if_none_match: Optional[str], today: date) -> SyncResult:
+    """
+    - If-None-Match identique -> 304 sans charger les missions (ni lancer prepare)
+    - sans curseur -> liste complète
+    - avec curseur -> missions écrites depuis + ids à retirer; resynchronisation complète si
+      le curseur précède la rétention des tombstones, vient d'un autre compteur ou est ancien
+    """
+    state = source.state()
+    etag = sync_etag(collaborator_id, window_key, state["version"]) if state else None
+    if etag and etag_matches(if_none_match, etag):
+        return SyncResult(304, etag=etag, cursor=str(SyncCursor(state["version"], today)))
+
+    if source.prepare is not None and source.prepare():
+        state = source.state()
+        etag = sync_etag(collaborator_id, window_key, state["version"]) if state else None
+    # Version lue avant les missions: les écritures validées entre-temps seront renvoyées
+    # au prochain appel (doublons possibles, jamais de perte)
+    next_cursor = str(SyncCursor(state["version"], today)) if state else None
+
+    if cursor is None:
+        return SyncResult(200, etag=etag, cursor=next_cursor, rows=source.load(None))
+
+    full_sync = (state is None or cursor.version == LEGACY_VERSION
+                 or cursor.version < state.get("purged_version", 0) or cursor.version > state["version"])
+    if full_sync:
+        return SyncResult(200, etag=etag, cursor=next_cursor, rows=source.load(None), deleted=[],
+                          full_sync=True, incremental=True)
+
+    rows = source.load(cursor.version)
+    kept = {row.get("id") for row in rows}
+    removed = set(source.tombstones(cursor.version)) | set(source.left_scope(cursor))
+    return SyncResult(200, etag=etag, cursor=next_cursor, rows=rows, incremental=True,
+                      deleted=sorted(str(i) for i in removed if i not in kept))
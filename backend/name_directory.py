@@ -0,0 +1,149 @@
+"""
+Annuaire des noms affichés pour SkyApp
+Par entreprise, en mémoire: utilisateurs, chefs d'équipe, clients et chantiers. Chargé en
+un aller-retour (RPC get_company_directory), mis à jour par les écritures de l'API; les
+réponses de planning sont enrichies par simple lecture de dictionnaire.
+Chaque worker a son annuaire: il relit toutes les quelques secondes la version de l'entreprise
+(company_directory_versions, incrémentée par trigger) et recharge si elle a changé.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY_TTL = 60  # secondes: rechargement sans compteur de versions (migration non appliquée)
+REVALIDATE_INTERVAL = 5  # secondes entre deux lectures de la version de l'entreprise
+MISS_RELOAD_INTERVAL = 30  # id inconnu: rechargement au plus toutes les 30 secondes
+
+# Champs conservés par type d'entité
+DIRECTORY_FIELDS = {
+    "users": ("id", "first_name", "last_name", "email"),
+    "team_leaders": ("id", "first_name", "last_name", "user_id"),
+    "clients": ("id", "name", "prenom", "nom", "adresse"),
+    "worksites": ("id", "title", "client_id", "status", "address"),
+}
+# Table Supabase -> type d'entité
+TABLE_KINDS = {
+    "users": "users",
+    "planning_team_leaders": "team_leaders",
+    "clients": "clients",
+    "worksites": "worksites",
+}
+
+
+def full_name(entry: Optional[Dict[str, Any]]) -> str:
+    if not entry:
+        return ""
+    return f"{entry.get('first_name') or ''} {entry.get('last_name') or ''}".strip()
+
+
+class NameDirectory:
+    """Dictionnaires id -> entité par entreprise, avec rechargement paresseux"""
+
+    def __init__(self, loader: Callable[[str], Dict[str, list]], ttl: int = DIRECTORY_TTL,
+                 version: Optional[Callable[[str], Optional[int]]] = None,
+                 revalidate_interval: float = REVALIDATE_INTERVAL):
+        self._loader = loader
+        self._ttl = ttl
+        self._version = version
+        self._revalidate_interval = revalidate_interval
+        self._companies: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _current_version(self, company_id: str) -> Optional[int]:
+        return self._version(company_id) if self._version else None
+
+    def _load(self, company_id: str) -> Dict[str, Any]:
+        # Version lue avant les données: une écriture pendant le chargement force le suivant
+        version = self._current_version(company_id)
+        data = self._loader(company_id)
+        entry = {
+            kind: {
+                str(row["id"]): {f: row.get(f) for f in fields}
+                for row in data.get(kind) or [] if row.get("id")
+            }
+            for kind, fields in DIRECTORY_FIELDS.items()
+        }
+        entry["loaded_at"] = entry["checked_at"] = time.time()
+        entry["version"] = version
+        entry["miss_reload_at"] = 0.0
+        with self._lock:
+            self._companies[company_id] = entry
+        return entry
+
+    def _entry(self, company_id: str) -> Dict[str, Any]:
+        entry = self._companies.get(company_id)
+        if entry is None:
+            return self._load(company_id)
+        now = time.time()
+        if entry["version"] is not None:
+            if now - entry["checked_at"] > self._revalidate_interval:
+                version = self._current_version(company_id)
+                entry["checked_at"] = now
+                if version != entry["version"]:
+                    entry = self._load(company_id)
+        elif now - entry["loaded_at"] > self._ttl:
+            entry = self._load(company_id)
+        return entry
+
+    def warm(self, company_id: str):
+        self._load(company_id)
+
+    def get(self, company_id: str, kind: str, entity_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Entité par id; un id inconnu déclenche un rechargement (limité dans le temps)"""
+        if not company_id or not entity_id:
+            return None
+        entry = self._entry(company_id)
+        found = entry[kind].get(str(entity_id))
+        if found is None and time.time() - entry["miss_reload_at"] > MISS_RELOAD_INTERVAL:
+            entry = self._load(company_id)
+            entry["miss_reload_at"] = time.time()
+            found = entry[kind].get(str(entity_id))
+        return found
+
+    def user_name(self, company_id: str, user_id: Optional[str]) -> str:
+        return full_name(self.get(company_id, "users", user_id))
+
+    def team_leader_name(self, company_id: str, team_leader: Optional[Dict[str, Any]]) -> str:
+        """Nom du compte lié si le chef d'équipe en a un, sinon celui de la fiche"""
+        if not team_leader:
+            return ""
+        linked = self.get(company_id, "users", team_leader.get("user_id")) if team_leader.get("user_id") else None
+        return full_name(linked or team_leader)
+
+    # ------------------------------------------------------------------
+    # Mises à jour après écriture
+    # ------------------------------------------------------------------
+    def upsert(self, table: str, row: Optional[Dict[str, Any]], company_id: Optional[str] = None):
+        """Reporte une ligne écrite (réponse Supabase) dans l'annuaire si l'entreprise est chargée"""
+        kind = TABLE_KINDS.get(table, table)
+        if not row or not row.get("id") or kind not in DIRECTORY_FIELDS:
+            return
+        company_id = company_id or row.get("company_id")
+        with self._lock:
+            targets = [self._companies[company_id]] if company_id in self._companies else (
+                [] if company_id else [e for e in self._companies.values() if str(row["id"]) in e[kind]]
+            )
+            for entry in targets:
+                current = entry[kind].get(str(row["id"]), {})
+                entry[kind][str(row["id"])] = {
+                    f: row.get(f, current.get(f)) for f in DIRECTORY_FIELDS[kind]
+                }
+
+    def remove(self, table: str, entity_id: str, company_id: Optional[str] = None):
+        kind = TABLE_KINDS.get(table, table)
+        with self._lock:
+            entries = [self._companies.get(company_id)] if company_id else list(self._companies.values())
+            for entry in entries:
+                if entry:
+                    entry[kind].pop(str(entity_id), None)
+
+    def invalidate(self, company_id: Optional[str] = None):
+        with self._lock:
+            if company_id:
+                self._companies.pop(company_id, None)
+            else:
+                self._companies.clear()
@@ -0,0 +1,173 @@
+"""
+Statistiques de période de l'entreprise pour SkyApp (devis, clients, recherches terrain)
+Agrégées en SQL (RPC get_period_statistics: groupes statut x période en un aller-retour) puis
+gardées quelques secondes en mémoire, le temps que l'IA et /api/ai/stats les relisent.
+Sans la RPC (migration non appliquée), repli sur les colonnes utiles agrégées en Python.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+AI_STATS_TTL = float(os.getenv("AI_STATS_TTL", "60"))  # secondes
+PERIOD_DAYS = {"week": 7, "month": 30, "year": 365}
+# Granularité de la répartition temporelle selon la période demandée
+PERIOD_BUCKETS = {"week": "day", "month": "week", "year": "month"}
+STATS_TZ = ZoneInfo("Europe/Paris")
+# Taille des pages du repli (max-rows par défaut de PostgREST: au-delà, résultat tronqué)
+FALLBACK_PAGE_SIZE = 1000
+
+
+def bucket_start(created_at: str, bucket: str) -> str:
+    """Début de la période (jour / semaine ISO / mois, heure de Paris) comme date_trunc"""
+    day = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    if day.tzinfo is None:
+        day = day.replace(tzinfo=timezone.utc)
+    day = day.astimezone(STATS_TZ).date()
+    if bucket == "week":
+        day -= timedelta(days=day.weekday())
+    elif bucket == "month":
+        day = day.replace(day=1)
+    return day.isoformat()
+
+
+def group_rows(rows: Iterable[Dict[str, Any]], bucket: str, amounts: bool = False) -> List[Dict[str, Any]]:
+    """Lignes brutes -> groupes statut x période au format de la RPC"""
+    groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for row in rows:
+        key = (row.get("status"), bucket_start(row["created_at"], bucket))
+        group = groups.setdefault(key, {"status": key[0], "period": key[1], "count": 0,
+                                        **({"amount": 0} if amounts else {})})
+        group["count"] += 1
+        if amounts:
+            group["amount"] += row.get("amount") or 0
+    return sorted(groups.values(), key=lambda g: (g["period"], str(g["status"])))
+
+
+def summarize(raw: Dict[str, Any], period: str) -> Dict[str, Any]:
+    """Groupes statut x période -> statistiques de get_statistics (totaux + répartitions)"""
+    quotes, searches = raw.get("quotes") or [], raw.get("searches") or []
+
+    def by(groups, field, amounts=False):
+        totals: Dict[Any, Dict[str, Any]] = {}
+        for group in groups:
+            entry = totals.setdefault(group[field], {field: group[field], "count": 0,
+                                                     **({"amount": 0} if amounts else {})})
+            entry["count"] += group["count"]
+            if amounts:
+                entry["amount"] += float(group.get("amount") or 0)
+        return sorted(totals.values(), key=lambda e: str(e[field]))
+
+    def count(groups, status):
+        return sum(g["count"] for g in groups if g["status"] == status)
+
+    return {
+        "period": period,
+        "bucket": raw.get("bucket"),
+        "quotes": {
+            "total": sum(g["count"] for g in quotes),
+            "amount": sum(float(g.get("amount") or 0) for g in quotes),
+            "accepted": count(quotes, "ACCEPTED"),
+            "pending": count(quotes, "SENT"),
+            "by_status": by(quotes, "status", amounts=True),
+            "by_period": by(quotes, "period", amounts=True),
+        },
+        "clients": {
+            "total": raw.get("clients") or 0
+        },
+        "searches": {
+            "total": sum(g["count"] for g in searches),
+            "processed": count(searches, "PROCESSED"),
+            "by_status": by(searches, "status"),
+            "by_period": by(searches, "period"),
+        },
+    }
+
+
+class PeriodStatistics:
+    """Statistiques par (entreprise, période), cache TTL court invalidé aux écritures"""
+
+    def __init__(self, client=None, ttl: float = AI_STATS_TTL, max_entries: int = 1000):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.metrics = {"hits": 0, "misses": 0, "rpc": 0, "fallback": 0}
+
+    async def get(self, company_id: str, period: str = "month") -> Dict[str, Any]:
+        if period not in PERIOD_DAYS:
+            period = "year"
+        key = (company_id, period)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            return entry[1]
+
+        self.metrics["misses"] += 1
+        since = (datetime.now(timezone.utc) - timedelta(days=PERIOD_DAYS[period])).isoformat()
+        raw = await self._load(company_id, since, PERIOD_BUCKETS[period])
+        result = summarize(raw, period)
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, company_id: Optional[str] = None):
+        for key in [k for k in self._entries if company_id is None or k[0] == company_id]:
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {**self.metrics, "entries": len(self._entries), "ttl": self.ttl,
+                "hit_rate": f"{self.metrics['hits'] / max(1, lookups) * 100:.1f}%"}
+
+    # ------------------------------------------------------------------
+    async def _load(self, company_id: str, since: str, bucket: str) -> Dict[str, Any]:
+        try:
+            result = await asyncio.to_thread(self.client.rpc("get_period_statistics", {
+                "p_company_id": company_id, "p_since": since, "p_bucket": bucket}).execute)
+            if result.data:
+                self.metrics["rpc"] += 1
+                return result.data
+        except Exception as e:
+            logger.warning(f"⚠️ RPC get_period_statistics indisponible: {e} - agrégation locale")
+        return await self._load_rows(company_id, since, bucket)
+
+    async def _load_rows(self, company_id: str, since: str, bucket: str) -> Dict[str, Any]:
+        """Repli: seules les colonnes utiles, lues par pages et agrégées ici"""
+        def fetch_all(table, columns):
+            rows: List[Dict[str, Any]] = []
+            while True:
+                page = self.client.table(table).select(columns).eq("company_id", company_id) \
+                    .gte("created_at", since).order("id") \
+                    .range(len(rows), len(rows) + FALLBACK_PAGE_SIZE - 1).execute().data or []
+                rows.extend(page)
+                if len(page) < FALLBACK_PAGE_SIZE:
+                    return rows
+
+        def count_clients():
+            # head=True: seul le total revient, pas les lignes
+            return self.client.table("clients").select("id", count="exact", head=True) \
+                .eq("company_id", company_id).execute().count or 0
+
+        quotes, searches, clients = await asyncio.gather(
+            asyncio.to_thread(fetch_all, "quotes", "status, amount, created_at"),
+            asyncio.to_thread(fetch_all, "searches", "status, created_at"),
+            asyncio.to_thread(count_clients),
+        )
+        self.metrics["fallback"] += 1
+        return {
+            "bucket": bucket,
+            "quotes": group_rows(quotes, bucket, amounts=True),
+            "searches": group_rows(searches, bucket),
+            "clients": clients,
+        }
@@ -0,0 +1,184 @@
+"""
+Traitement des photos à l'upload pour SkyApp
+Normalisation EXIF unique (rotation + suppression des métadonnées) et extraction
+des informations utiles (date de prise de vue, GPS, dimensions)
+"""
+
+import io
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Tags EXIF (https://exiftool.org/TagNames/EXIF.html)
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+TAG_DATETIME = 0x0132
+TAG_DATETIME_ORIGINAL = 0x9003
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+# Formats ré-encodés tels quels; le reste (HEIC, BMP, ...) est converti en JPEG
+KEEP_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+JPEG_QUALITY = 88
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        # Anciennes versions de Pillow: tuple (numérateur, dénominateur)
+        num, den = value
+        return float(num) / float(den)
+
+
+def _gps_to_decimal(coords: Any, ref: Optional[str]) -> Optional[float]:
+    """Convertit (degrés, minutes, secondes) en degrés décimaux signés"""
+    try:
+        degrees, minutes, seconds = (_to_float(c) for c in coords)
+    except Exception:
+        return None
+    value = degrees + minutes / 60.0 + seconds / 3600.0
+    if ref and str(ref).upper() in ("S", "W"):
+        value = -value
+    return round(value, 7)
+
+
+def _parse_exif_datetime(value: Any) -> Optional[str]:
+    """Format EXIF 'YYYY:MM:DD HH:MM:SS' -> ISO 8601 (heure locale de l'appareil)"""
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode("ascii", errors="ignore")
+    try:
+        return datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S").isoformat()
+    except ValueError:
+        return None
+
+
+def extract_metadata(image: Image.Image) -> Dict[str, Any]:
+    """Lit la date de prise de vue et la position GPS depuis l'EXIF"""
+    metadata: Dict[str, Any] = {"taken_at": None, "latitude": None, "longitude": None}
+    try:
+        exif = image.getexif()
+    except Exception:
+        return metadata
+    if not exif:
+        return metadata
+
+    try:
+        exif_ifd = exif.get_ifd(EXIF_IFD_POINTER)
+    except Exception:
+        exif_ifd = {}
+    metadata["taken_at"] = _parse_exif_datetime(exif_ifd.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME))
+
+    try:
+        gps = exif.get_ifd(GPS_IFD_POINTER)
+    except Exception:
+        gps = {}
+    if gps.get(GPS_LATITUDE) and gps.get(GPS_LONGITUDE):
+        lat = _gps_to_decimal(gps[GPS_LATITUDE], gps.get(GPS_LATITUDE_REF))
+        lon = _gps_to_decimal(gps[GPS_LONGITUDE], gps.get(GPS_LONGITUDE_REF))
+        if lat is not None and lon is not None and -90 <= lat <= 90 and -180 <= lon <= 180:
+            metadata["latitude"] = lat
+            metadata["longitude"] = lon
+    return metadata
+
+
+def normalize_photo(content: bytes, content_type: Optional[str] = None) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Étape d'ingestion: applique l'orientation EXIF, supprime l'EXIF et extrait les métadonnées.
+
+    Fonction bloquante (décodage/encodage d'image): l'appeler via asyncio.to_thread.
+
+    Returns:
+        (contenu normalisé, content-type, métadonnées). Si le fichier n'est pas une
+        image lisible (ou dépasse Image.MAX_IMAGE_PIXELS: bombe de décompression), il est
+        retourné inchangé avec des métadonnées vides.
+    """
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        logger.warning(f"⚠️ Photo non décodable, stockée telle quelle: {e}")
+        empty = {"taken_at": None, "latitude": None, "longitude": None, "width": None, "height": None}
+        return content, content_type or "application/octet-stream", empty
+
+    source_format = image.format
+    metadata = extract_metadata(image)
+
+    # Rotation physique des pixels selon le tag Orientation (une seule fois, à l'upload)
+    image = ImageOps.exif_transpose(image)
+    metadata["width"], metadata["height"] = image.size
+
+    out_format = source_format if source_format in KEEP_FORMATS else "JPEG"
+    if out_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    save_kwargs: Dict[str, Any] = {}
+    if image.info.get("icc_profile"):
+        save_kwargs["icc_profile"] = image.info["icc_profile"]
+    if out_format == "JPEG":
+        save_kwargs.update(quality=JPEG_QUALITY, optimize=True)
+    elif out_format == "WEBP":
+        save_kwargs.update(quality=JPEG_QUALITY)
+    # Pas de paramètre exif=...: les métadonnées (dont GPS) ne sont pas réécrites
+    image.info.pop("exif", None)
+    image.save(buffer, format=out_format, **save_kwargs)
+    return buffer.getvalue(), KEEP_FORMATS[out_format], metadata
+
+
+def extension_for(content_type: str, fallback: str = "") -> str:
+    """Extension de fichier correspondant au content-type produit par normalize_photo"""
+    return {
+        "image/jpeg": ".jpg",
+        "image/png": ".png",
+        "image/webp": ".webp",
+    }.get(content_type, fallback)
+
+
+def make_thumbnail(content: bytes, max_size: int = 400) -> Optional[bytes]:
+    """Miniature JPEG (côté le plus long = max_size). Fonction bloquante, None si non décodable."""
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=80, optimize=True)
+    return buffer.getvalue()
+
+
+# Largeurs des variantes de logo (en-têtes d'interface, PDF, favicon)
+LOGO_VARIANT_WIDTHS = (128, 256, 512)
+
+
+def make_logo_variants(content: bytes, widths: Tuple[int, ...] = LOGO_VARIANT_WIDTHS) -> Dict[int, bytes]:
+    """Variantes PNG redimensionnées d'un logo (transparence conservée). Fonction bloquante."""
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return {}
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+    variants: Dict[int, bytes] = {}
+    for width in widths:
+        if width >= image.width:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        buffer = io.BytesIO()
+        image.resize((width, height), Image.LANCZOS).save(buffer, format="PNG", optimize=True)
+        variants[width] = buffer.getvalue()
+    return variants
@@ -0,0 +1,373 @@
+"""
+Optimiseur de planning local pour SkyApp (sans LLM)
+Affecte des chantiers aux techniciens sur un horizon de quelques jours en minimisant les
+kilomètres parcourus, sans chevaucher les plannings existants et en respectant les
+compétences (colonne users.skills). Heuristique gloutonne + recherche locale (déplacement
+entre tournées, 2-opt dans une tournée) bornée par un budget de temps.
+Résultat déterministe: mêmes entrées -> mêmes affectations (tant que le budget n'est pas atteint).
+"""
+
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from schedule_conflicts import format_minutes
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_SPEED_KMH = 40.0  # vitesse moyenne en agglomération
+DEFAULT_DAY_START = 8 * 60
+DEFAULT_DAY_END = 18 * 60
+DEFAULT_TIME_BUDGET_MS = 800
+_SKILL_SPLIT_RE = re.compile(r"[,;/|\n]+|\s+et\s+")
+
+
+def normalize_skills(value: Any) -> FrozenSet[str]:
+    """'Électricien, plombier' / ['Plomberie'] -> {'electricien', 'plombier'} (minuscules, sans accents)"""
+    if not value:
+        return frozenset()
+    parts = value if isinstance(value, (list, tuple, set, frozenset)) else _SKILL_SPLIT_RE.split(str(value))
+    skills = set()
+    for part in parts:
+        folded = unicodedata.normalize("NFKD", str(part)).encode("ascii", "ignore").decode().strip().lower()
+        if folded:
+            skills.add(folded)
+    return frozenset(skills)
+
+
+def haversine_matrix(latitudes: Sequence[Optional[float]], longitudes: Sequence[Optional[float]]) -> np.ndarray:
+    """
+    Distances (km) entre tous les points, calculées en une opération vectorisée.
+    Les points sans coordonnées reçoivent la distance moyenne connue (0 si aucune).
+    """
+    lat = np.radians(np.array([np.nan if v is None else v for v in latitudes], dtype=float))
+    lon = np.radians(np.array([np.nan if v is None else v for v in longitudes], dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    unknown = np.isnan(dist)
+    if unknown.any():
+        known = dist[~unknown]
+        dist[unknown] = known.mean() if known.size else 0.0
+    np.fill_diagonal(dist, 0.0)
+    return dist
+
+
+@dataclass
+class PlanningJob:
+    """Intervention à placer (un chantier, une durée, des compétences requises)"""
+
+    id: str
+    duration_min: int
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    skills: FrozenSet[str] = frozenset()
+    title: Optional[str] = None
+    days: Optional[FrozenSet[date]] = None  # jours autorisés (None = tout l'horizon)
+
+
+@dataclass
+class PlanningTechnician:
+    """Technicien disponible (point de départ optionnel, amplitude horaire)"""
+
+    id: str
+    name: str = ""
+    skills: FrozenSet[str] = frozenset()
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    day_start: int = DEFAULT_DAY_START
+    day_end: int = DEFAULT_DAY_END
+
+
+@dataclass
+class PlanningResult:
+    assignments: List[Dict[str, Any]]
+    unassigned: List[Dict[str, Any]]
+    total_km: float
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "assignments": self.assignments,
+            "unassigned": self.unassigned,
+            "total_km": round(self.total_km, 1),
+            "stats": self.stats,
+        }
+
+
+def _earliest_start(busy: Sequence[Tuple[int, int]], ready: float, duration: int) -> float:
+    """Premier début >= ready tel que [début, début + durée) ne chevauche aucune plage occupée"""
+    start = ready
+    for b_start, b_end in busy:
+        if start + duration <= b_start:
+            break
+        if b_end > start:
+            start = b_end
+    return start
+
+
+class PlanningOptimizer:
+    """
+    Tournées par (technicien, jour). Les nœuds du graphe sont les chantiers, puis les points
+    de départ des techniciens, puis un nœud virtuel à distance nulle de tous (technicien sans
+    point de départ connu).
+    """
+
+    def __init__(
+        self,
+        jobs: Sequence[PlanningJob],
+        technicians: Sequence[PlanningTechnician],
+        days: Sequence[date],
+        busy: Optional[Dict[Tuple[str, date], List[Tuple[int, int]]]] = None,
+        speed_kmh: float = DEFAULT_SPEED_KMH,
+    ):
+        self.jobs = list(jobs)
+        self.technicians = list(technicians)
+        self.days = sorted(set(days))
+        self.speed_kmh = speed_kmh
+        n_jobs, n_techs = len(self.jobs), len(self.technicians)
+
+        dist = haversine_matrix(
+            [j.latitude for j in self.jobs] + [t.latitude for t in self.technicians],
+            [j.longitude for j in self.jobs] + [t.longitude for t in self.technicians],
+        )
+        self.virtual = n_jobs + n_techs
+        self.dist = np.zeros((n_jobs + n_techs + 1, n_jobs + n_techs + 1))
+        self.dist[: self.virtual, : self.virtual] = dist
+        self.travel = self.dist / speed_kmh * 60.0  # minutes
+
+        self.homes = np.array([
+            n_jobs + t if tech.latitude is not None and tech.longitude is not None else self.virtual
+            for t, tech in enumerate(self.technicians)
+        ], dtype=int)
+        busy = busy or {}
+        # Routes indexées r = t * nb_jours + d
+        self.route_busy = [busy.get((tech.id, day), []) for tech in self.technicians for day in self.days]
+        self.route_tech = np.repeat(np.arange(n_techs), len(self.days))
+        self.route_day = np.tile(np.arange(len(self.days)), n_techs)
+        self.durations = np.array([j.duration_min for j in self.jobs], dtype=float)
+        self._edges_cache = None
+
+        # Compatibilité chantier x route (compétences + jours autorisés)
+        self.eligible = np.zeros((n_jobs, len(self.route_busy)), dtype=bool)
+        for j, job in enumerate(self.jobs):
+            for r in range(len(self.route_busy)):
+                tech = self.technicians[self.route_tech[r]]
+                day = self.days[self.route_day[r]]
+                self.eligible[j, r] = job.skills <= tech.skills and (job.days is None or day in job.days)
+
+    # ------------------------------------------------------------------
+    # Évaluation d'une tournée
+    # ------------------------------------------------------------------
+    def _timing(self, r: int, seq: Sequence[int]) -> Optional[List[Tuple[float, float]]]:
+        """Horaires (début, fin) des chantiers de la tournée, None si elle ne tient pas dans la journée"""
+        tech = self.technicians[self.route_tech[r]]
+        busy = self.route_busy[r]
+        current, loc = float(tech.day_start), self.homes[self.route_tech[r]]
+        times = []
+        for j in seq:
+            duration = int(self.durations[j])
+            start = _earliest_start(busy, current + self.travel[loc, j], duration)
+            end = start + duration
+            if end > tech.day_end:
+                return None
+            times.append((start, end))
+            current, loc = end, j
+        return times
+
+    def _route_km(self, r: int, seq: Sequence[int]) -> float:
+        if not seq:
+            return 0.0
+        home = self.homes[self.route_tech[r]]
+        path = np.array([home, *seq, home])
+        return float(self.dist[path[:-1], path[1:]].sum())
+
+    # ------------------------------------------------------------------
+    # Construction gloutonne + recherche locale
+    # ------------------------------------------------------------------
+    def solve(self, time_budget_ms: int = DEFAULT_TIME_BUDGET_MS) -> PlanningResult:
+        started = time.perf_counter()
+        deadline = started + time_budget_ms / 1000.0
+        routes: List[List[int]] = [[] for _ in self.route_busy]
+        self._edges_cache = None
+        unassigned: List[int] = []
+
+        # Les chantiers les plus contraints d'abord (peu de routes compatibles, longue durée)
+        order = sorted(
+            range(len(self.jobs)),
+            key=lambda j: (int(self.eligible[j].sum()), -self.durations[j], self.jobs[j].id),
+        )
+        for j in order:
+            if not self._insert_best(routes, j):
+                unassigned.append(j)
+
+        greedy_km = sum(self._route_km(r, seq) for r, seq in enumerate(routes))
+        passes, moves = 0, 0
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            passes += 1
+            for r in range(len(routes)):
+                if time.perf_counter() >= deadline:
+                    break
+                if self._two_opt(routes, r, deadline):
+                    improved, moves = True, moves + 1
+            for j in range(len(self.jobs)):
+                if time.perf_counter() >= deadline:
+                    break
+                if j in unassigned:
+                    if self._insert_best(routes, j):
+                        unassigned.remove(j)
+                        improved, moves = True, moves + 1
+                elif self._relocate(routes, j):
+                    improved, moves = True, moves + 1
+
+        return self._result(routes, unassigned, {
+            "greedy_km": round(greedy_km, 1),
+            "local_search_passes": passes,
+            "local_search_moves": moves,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "time_budget_reached": time.perf_counter() >= deadline,
+        })
+
+    def _edges(self, routes: List[List[int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Toutes les positions d'insertion (nœud précédent, nœud suivant, route, position) de toutes les tournées"""
+        if self._edges_cache is None:
+            prev, nxt, route, pos = [], [], [], []
+            for r, seq in enumerate(routes):
+                home = int(self.homes[self.route_tech[r]])
+                nodes = [home, *seq, home]
+                prev.extend(nodes[:-1])
+                nxt.extend(nodes[1:])
+                route.extend([r] * (len(nodes) - 1))
+                pos.extend(range(len(nodes) - 1))
+            self._edges_cache = tuple(np.array(a, dtype=int) for a in (prev, nxt, route, pos))
+        return self._edges_cache
+
+    def _insert_best(self, routes: List[List[int]], j: int, exclude_route: Optional[int] = None,
+                     max_delta: float = np.inf) -> bool:
+        """Insère j à la position réalisable la moins coûteuse (toutes routes compatibles)"""
+        prev, nxt, route, pos = self._edges(routes)
+        # Surcoût (km) de chaque position d'insertion, en une opération vectorisée
+        deltas = self.dist[prev, j] + self.dist[j, nxt] - self.dist[prev, nxt]
+        allowed = self.eligible[j, route] & (deltas < max_delta)
+        if exclude_route is not None:
+            allowed &= route != exclude_route
+        candidates = np.flatnonzero(allowed)
+        for c in candidates[np.argsort(deltas[candidates], kind="stable")]:
+            r, p = int(route[c]), int(pos[c])
+            seq = routes[r][:p] + [j] + routes[r][p:]
+            if self._timing(r, seq) is not None:
+                routes[r] = seq
+                self._edges_cache = None
+                return True
+        return False
+
+    def _relocate(self, routes: List[List[int]], j: int) -> bool:
+        """Déplace j vers une autre route si cela réduit les kilomètres"""
+        r = next((i for i, seq in enumerate(routes) if j in seq), None)
+        if r is None:
+            return False
+        seq = routes[r]
+        remaining = [x for x in seq if x != j]
+        gain = self._route_km(r, seq) - self._route_km(r, remaining)
+        # Retirer un chantier ne retarde jamais les suivants: la route d'origine reste réalisable
+        routes[r] = remaining
+        self._edges_cache = None
+        if self._insert_best(routes, j, exclude_route=r, max_delta=gain - 1e-6):
+            return True
+        routes[r] = seq
+        self._edges_cache = None
+        return False
+
+    def _two_opt(self, routes: List[List[int]], r: int, deadline: float) -> bool:
+        """Inversion de segments dans une tournée (2-opt), première amélioration réalisable"""
+        seq = routes[r]
+        if len(seq) < 3:
+            return False
+        best_km = self._route_km(r, seq)
+        for i in range(len(seq) - 1):
+            if time.perf_counter() >= deadline:
+                return False
+            for k in range(i + 1, len(seq)):
+                candidate = seq[:i] + seq[i:k + 1][::-1] + seq[k + 1:]
+                km = self._route_km(r, candidate)
+                if km < best_km - 1e-6 and self._timing(r, candidate) is not None:
+                    routes[r] = candidate
+                    self._edges_cache = None
+                    return True
+        return False
+
+    def _result(self, routes: List[List[int]], unassigned: List[int], stats: Dict[str, Any]) -> PlanningResult:
+        assignments = []
+        total_km = 0.0
+        for r, seq in enumerate(routes):
+            if not seq:
+                continue
+            tech = self.technicians[self.route_tech[r]]
+            day = self.days[self.route_day[r]]
+            times = self._timing(r, seq) or []
+            loc = self.homes[self.route_tech[r]]
+            for order, (j, (start, end)) in enumerate(zip(seq, times)):
+                job = self.jobs[j]
+                assignments.append({
+                    "job_id": job.id,
+                    "title": job.title,
+                    "collaborator_id": tech.id,
+                    "collaborator_name": tech.name,
+                    "date": day.isoformat(),
+                    "time": format_minutes(int(round(start))),
+                    "end_time": format_minutes(int(round(end))),
+                    "order": order,
+                    "travel_km": round(float(self.dist[loc, j]), 1),
+                })
+                loc = j
+            total_km += self._route_km(r, seq)
+        assignments.sort(key=lambda a: (a["date"], a["collaborator_id"], a["order"]))
+        reasons = []
+        for j in sorted(unassigned, key=lambda j: self.jobs[j].id):
+            job = self.jobs[j]
+            reason = "Aucun technicien avec les compétences requises" if not self.eligible[j].any() \
+                else "Aucun créneau disponible sur la période"
+            reasons.append({"job_id": job.id, "title": job.title, "reason": reason})
+        stats = {**stats, "jobs": len(self.jobs), "technicians": len(self.technicians), "days": len(self.days)}
+        return PlanningResult(assignments, reasons, total_km, stats)
+
+    # ------------------------------------------------------------------
+    # Suggestions de créneaux pour un chantier
+    # ------------------------------------------------------------------
+    def suggest_slots(self, job_index: int, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Meilleurs créneaux libres pour un chantier: premier début possible de chaque
+        (technicien, jour) compatible, classés par distance depuis le point de départ puis par date.
+        """
+        job = self.jobs[job_index]
+        duration = int(self.durations[job_index])
+        options = []
+        for r in np.flatnonzero(self.eligible[job_index]):
+            tech = self.technicians[self.route_tech[r]]
+            home = self.homes[self.route_tech[r]]
+            travel = self.travel[home, job_index]
+            start = _earliest_start(self.route_busy[r], tech.day_start + travel, duration)
+            if start + duration > tech.day_end:
+                continue
+            day = self.days[self.route_day[r]]
+            options.append((round(float(self.dist[home, job_index]), 1), day, start, tech))
+        options.sort(key=lambda o: (o[0], o[1], o[2], o[3].id))
+        return [
+            {
+                "job_id": job.id,
+                "collaborator_id": tech.id,
+                "collaborator_name": tech.name,
+                "date": day.isoformat(),
+                "time": format_minutes(int(round(start))),
+                "end_time": format_minutes(int(round(start + duration))),
+                "travel_km": km,
+            }
+            for km, day, start, tech in options[:limit]
+        ]
@@ -0,0 +1,294 @@
+"""
+Index de recherche des devis pour SkyApp (devis similaires)
+Index inversé BM25 par entreprise sur le titre, la description et les lignes des devis.
+Texte normalisé (minuscules, accents retirés) et racinisé (suffixes français courants).
+Construit une fois par entreprise puis tenu à jour à chaque création / modification /
+suppression de devis par l'API; les écritures faites hors API sont rattrapées par updated_at.
+"""
+
+import functools
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 2  # les mots du titre comptent double
+DELTA_SYNC_SECONDS = 60  # rattrapage des devis modifiés hors API
+FULL_REBUILD_SECONDS = 6 * 3600  # suppressions hors API
+PAGE_SIZE = 1000
+QUOTE_FIELDS = "id, title, description, items, amount, status, client_id, created_at, updated_at"
+
+STOPWORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "dans", "de", "des", "du", "en", "et", "l", "la", "le",
+    "les", "leur", "leurs", "ou", "par", "pour", "sur", "un", "une", "d", "sans", "sous", "y", "m",
+    "m2", "ml", "u", "ens", "forfait", "fourniture", "pose",
+}
+# Suffixes retirés (du plus long au plus court), racine minimale de 3 lettres
+SUFFIXES = (
+    "issements", "issement", "ements", "ement", "ations", "ation", "atrices", "atrice", "ateurs",
+    "ateur", "ances", "ance", "ences", "ence", "ismes", "isme", "istes", "iste", "ables", "able",
+    "ibles", "ible", "euses", "euse", "eux", "ites", "ite", "ives", "ive", "ifs", "if",
+    "ees", "ee", "es", "er", "ez", "e", "s", "x",
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: Any) -> str:
+    """Minuscules sans accents"""
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(token: str) -> str:
+    """Racinisation légère du français: 'peintures' -> 'peintur', 'carrelage' -> 'carrelag'"""
+    if token.isdigit() or len(token) <= 3:
+        return token
+    if token.endswith("aux") and len(token) > 5:
+        return token[:-3] + "al"
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: Any) -> List[str]:
+    return [stem(t) for t in _TOKEN_RE.findall(fold(text)) if t not in STOPWORDS]
+
+
+def quote_terms(quote: Dict[str, Any]) -> Counter:
+    """Termes pondérés d'un devis: titre (x2), description, désignations des lignes"""
+    terms = Counter()
+    for _ in range(TITLE_WEIGHT):
+        terms.update(tokenize(quote.get("title")))
+    terms.update(tokenize(quote.get("description")))
+    for item in quote.get("items") or []:
+        if isinstance(item, dict):
+            for key in ("name", "designation", "description"):
+                terms.update(tokenize(item.get(key)))
+    return terms
+
+
+def _summary(quote: Dict[str, Any]) -> Dict[str, Any]:
+    """Champs conservés en mémoire pour chaque devis (renvoyés avec les résultats)"""
+    items = [i for i in quote.get("items") or [] if isinstance(i, dict)]
+    return {
+        "id": quote.get("id"),
+        "title": quote.get("title"),
+        "description": (quote.get("description") or "")[:300],
+        "amount": quote.get("amount"),
+        "status": quote.get("status"),
+        "client_id": quote.get("client_id"),
+        "created_at": quote.get("created_at"),
+        "items": [
+            {k: i.get(k) for k in ("name", "designation", "description", "quantity", "price", "unit_price", "unit")
+             if i.get(k) is not None}
+            for i in items[:20]
+        ],
+    }
+
+
+class BM25Index:
+    """Index inversé d'une entreprise: terme -> {devis: fréquence du terme}"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.terms: Dict[str, Tuple[str, ...]] = {}  # index direct, pour retirer un devis
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, quote: Dict[str, Any]):
+        """Ajoute ou remplace un devis"""
+        quote_id = str(quote["id"])
+        self.remove(quote_id)
+        terms = quote_terms(quote)
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[quote_id] = count
+        length = sum(terms.values())
+        self.lengths[quote_id] = length
+        self.terms[quote_id] = tuple(terms)
+        self.total_length += length
+        self.docs[quote_id] = _summary(quote)
+
+    def remove(self, quote_id: str):
+        quote_id = str(quote_id)
+        if quote_id not in self.lengths:
+            return
+        self.total_length -= self.lengths.pop(quote_id)
+        self.docs.pop(quote_id, None)
+        for term in self.terms.pop(quote_id, ()):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(quote_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """Les k meilleurs devis (score BM25 décroissant); seuls les devis partageant un terme sont notés"""
+        n = len(self.lengths)
+        if not n or k <= 0:
+            return []
+        avg_length = (self.total_length / n) or 1.0
+        # norm = k1 * (1 - b + b * longueur / longueur moyenne), développé hors de la boucle
+        base, per_length = BM25_K1 * (1 - BM25_B), BM25_K1 * BM25_B / avg_length
+        lengths = self.lengths
+        scores: Dict[str, float] = {}
+        get = scores.get
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            weight = idf * (BM25_K1 + 1)
+            for quote_id, tf in posting.items():
+                scores[quote_id] = get(quote_id, 0.0) + weight * tf / (tf + base + per_length * lengths[quote_id])
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self.docs[quote_id]) for quote_id, score in best]
+
+
+class _CompanyState:
+    def __init__(self):
+        self.index = BM25Index()
+        self.built_at = 0.0
+        self.synced_at = 0.0
+        self.last_updated_at: Optional[str] = None  # plus grand updated_at vu en base
+
+
+class QuoteSearchIndex:
+    """Index BM25 par entreprise, construit à la première recherche puis mis à jour incrémentalement"""
+
+    def __init__(self, client, delta_sync_seconds: int = DELTA_SYNC_SECONDS,
+                 full_rebuild_seconds: int = FULL_REBUILD_SECONDS):
+        self.client = client
+        self.delta_sync_seconds = delta_sync_seconds
+        self.full_rebuild_seconds = full_rebuild_seconds
+        self._companies: Dict[str, _CompanyState] = {}
+        self._lock = threading.Lock()
+        self.metrics = {"searches": 0, "builds": 0, "delta_syncs": 0, "upserts": 0, "removals": 0,
+                        "build_ms": 0.0, "search_ms_max": 0.0}
+
+    # ------------------------------------------------------------------
+    def search(self, company_id: str, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Devis les plus proches de `query` avec leur score ("similarity_score")"""
+        if not company_id:
+            return []
+        state = self._state(company_id)
+        started = time.perf_counter()
+        with self._lock:
+            results = state.index.search(query, k)
+            self.metrics["searches"] += 1
+        elapsed = (time.perf_counter() - started) * 1000
+        self.metrics["search_ms_max"] = max(self.metrics["search_ms_max"], round(elapsed, 3))
+        return [{**doc, "similarity_score": round(score, 4)} for score, doc in results]
+
+    def upsert(self, company_id: Optional[str], quote: Dict[str, Any]):
+        """Devis créé ou modifié par l'API (index non construit: rien à faire, il le sera à la demande)"""
+        company_id = company_id or quote.get("company_id")
+        if not company_id or not quote.get("id"):
+            return
+        with self._lock:
+            state = self._companies.get(company_id)
+            if state is None:
+                return
+            state.index.add(quote)
+            if quote.get("updated_at") and (state.last_updated_at or "") < quote["updated_at"]:
+                state.last_updated_at = quote["updated_at"]
+            self.metrics["upserts"] += 1
+
+    def remove(self, company_id: Optional[str], quote_id: str):
+        with self._lock:
+            state = self._companies.get(company_id) if company_id else None
+            if state is not None:
+                state.index.remove(quote_id)
+                self.metrics["removals"] += 1
+
+    def invalidate(self, company_id: Optional[str] = None):
+        with self._lock:
+            if company_id:
+                self._companies.pop(company_id, None)
+            else:
+                self._companies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.metrics,
+                "build_ms": round(self.metrics["build_ms"], 1),
+                "companies": len(self._companies),
+                "quotes": sum(len(state.index) for state in self._companies.values()),
+                "terms": sum(len(state.index.postings) for state in self._companies.values()),
+            }
+
+    # ------------------------------------------------------------------
+    def _state(self, company_id: str) -> _CompanyState:
+        now = time.time()
+        with self._lock:
+            state = self._companies.get(company_id)
+        # Lectures en base hors du verrou: les écritures de l'API (boucle d'événements) n'attendent pas
+        if state is None or now - state.built_at > self.full_rebuild_seconds:
+            return self._build(company_id)
+        if now - state.synced_at > self.delta_sync_seconds:
+            self._delta_sync(company_id, state)
+        return state
+
+    def _fetch(self, company_id: str, since: Optional[str] = None):
+        """Devis de l'entreprise par pages (ordre updated_at), éventuellement modifiés après `since`"""
+        offset = 0
+        while True:
+            query = self.client.table("quotes").select(QUOTE_FIELDS).eq("company_id", company_id)
+            if since:
+                query = query.gt("updated_at", since)
+            rows = query.order("updated_at").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            yield from rows
+            if len(rows) < PAGE_SIZE:
+                return
+            offset += PAGE_SIZE
+
+    def _build(self, company_id: str) -> _CompanyState:
+        started = time.perf_counter()
+        state = _CompanyState()
+        try:
+            for quote in self._fetch(company_id):
+                state.index.add(quote)
+                if quote.get("updated_at"):
+                    state.last_updated_at = max(state.last_updated_at or "", quote["updated_at"])
+        except Exception as e:
+            # Index vide mais non mémorisé: nouvel essai à la prochaine recherche
+            logger.warning(f"⚠️ Construction index devis impossible ({company_id}): {e}")
+            return state
+        state.built_at = state.synced_at = time.time()
+        with self._lock:
+            self._companies[company_id] = state
+        # Devis écrits pendant la construction: rattrapés par la prochaine synchronisation (updated_at)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.metrics["builds"] += 1
+        self.metrics["build_ms"] += elapsed
+        logger.info(f"🔎 Index devis construit: {company_id} ({len(state.index)} devis, {elapsed:.0f} ms)")
+        return state
+
+    def _delta_sync(self, company_id: str, state: _CompanyState):
+        """Rattrape les devis créés / modifiés hors API depuis la dernière synchronisation"""
+        state.synced_at = time.time()
+        try:
+            changed = list(self._fetch(company_id, since=state.last_updated_at))
+            with self._lock:
+                for quote in changed:
+                    state.index.add(quote)
+                    if quote.get("updated_at"):
+                        state.last_updated_at = max(state.last_updated_at or "", quote["updated_at"])
+            self.metrics["delta_syncs"] += 1
+        except Exception as e:
+            logger.warning(f"⚠️ Synchronisation index devis impossible ({company_id}): {e}")
@@ -0,0 +1,173 @@
+"""
+Uploads reprenables (protocole inspiré de tus.io) pour SkyApp
+Les photos terrain sont envoyées par morceaux (PATCH avec Upload-Offset). Les octets
+reçus sont conservés côté serveur: après une coupure réseau, le client reprend à
+l'offset connu au lieu de tout renvoyer.
+
+Les sessions vivent dans un répertoire local à l'instance: derrière plusieurs instances, les
+requêtes d'un même upload doivent arriver sur la même (routage collant) ou toutes pointer vers un
+RESUMABLE_UPLOADS_DIR partagé; sinon une reprise servie par une autre instance renvoie 404.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 30 * 1024 * 1024  # 30 Mo par photo
+DEFAULT_EXPIRATION = 24 * 3600  # sessions abandonnées supprimées après 24h
+
+
+class UploadError(Exception):
+    """Erreur de protocole; status_code correspond au code HTTP à renvoyer"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class ResumableUploadStore:
+    """
+    Sessions d'upload stockées sur disque: <id>.json (métadonnées) + <id>.part (octets reçus).
+    Une session finalisée laisse <id>.done (réponse de la finalisation), renvoyé tel quel si le
+    client rejoue la finalisation après avoir perdu la réponse.
+    """
+
+    def __init__(self, directory: Path, max_size: int = DEFAULT_MAX_SIZE, expiration: int = DEFAULT_EXPIRATION):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.expiration = expiration
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.directory / f"{upload_id}.json"
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.directory / f"{upload_id}.part"
+
+    def _done_path(self, upload_id: str) -> Path:
+        return self.directory / f"{upload_id}.done"
+
+    def _check_id(self, upload_id: str):
+        """Identifiant bien formé (pas de chemin) et session connue, sinon 404"""
+        if not upload_id.isalnum():
+            raise UploadError(404, "Upload introuvable")
+        if not self._meta_path(upload_id).exists() and not self._done_path(upload_id).exists():
+            raise UploadError(404, "Upload introuvable")
+
+    def lock(self, upload_id: str) -> asyncio.Lock:
+        """Verrou de la session (ajout d'octets, finalisation); créé seulement pour une session existante"""
+        lock = self._locks.get(upload_id)
+        if lock is None:
+            self._check_id(upload_id)
+            lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        return lock
+
+    async def create(self, length: int, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Ouvre une session pour un fichier de `length` octets"""
+        if length <= 0:
+            raise UploadError(400, "Upload-Length invalide")
+        if length > self.max_size:
+            raise UploadError(413, f"Fichier trop volumineux (max {self.max_size // (1024 * 1024)} Mo)")
+        self.purge_expired()
+        upload_id = uuid.uuid4().hex
+        session = {
+            "id": upload_id,
+            "length": length,
+            "created_at": time.time(),
+            "metadata": metadata,
+        }
+        async with aiofiles.open(self._meta_path(upload_id), "w") as f:
+            await f.write(json.dumps(session))
+        async with aiofiles.open(self._part_path(upload_id), "wb"):
+            pass
+        return {**session, "offset": 0}
+
+    async def get(self, upload_id: str) -> Dict[str, Any]:
+        """Session + offset courant (taille réellement reçue sur disque)"""
+        self._check_id(upload_id)
+        meta_path = self._meta_path(upload_id)
+        if not meta_path.exists():
+            raise UploadError(404, "Upload introuvable")
+        async with aiofiles.open(meta_path, "r") as f:
+            session = json.loads(await f.read())
+        part_path = self._part_path(upload_id)
+        session["offset"] = part_path.stat().st_size if part_path.exists() else 0
+        return session
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """Ajoute les octets reçus si `offset` correspond à ce qui est déjà stocké"""
+        async with self.lock(upload_id):
+            session = await self.get(upload_id)
+            if offset != session["offset"]:
+                raise UploadError(409, f"Upload-Offset attendu: {session['offset']}")
+            written = session["offset"]
+            # Les octets sont écrits au fil de l'eau: une coupure conserve ce qui est déjà arrivé
+            async with aiofiles.open(self._part_path(upload_id), "ab") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if written + len(chunk) > session["length"]:
+                        raise UploadError(413, "Données au-delà de Upload-Length")
+                    await f.write(chunk)
+                    written += len(chunk)
+            # Rafraîchit la date de la session pour la purge des uploads abandonnés
+            os.utime(self._meta_path(upload_id))
+            session["offset"] = written
+            return session
+
+    async def read_complete(self, upload_id: str) -> bytes:
+        """Contenu assemblé d'une session terminée"""
+        session = await self.get(upload_id)
+        if session["offset"] != session["length"]:
+            raise UploadError(409, f"Upload incomplet ({session['offset']}/{session['length']} octets)")
+        async with aiofiles.open(self._part_path(upload_id), "rb") as f:
+            return await f.read()
+
+    async def complete(self, upload_id: str, result: Dict[str, Any]):
+        """Marque la session comme finalisée: octets supprimés, résultat conservé jusqu'à expiration"""
+        async with aiofiles.open(self._done_path(upload_id), "w") as f:
+            await f.write(json.dumps(result))
+        for path in (self._part_path(upload_id), self._meta_path(upload_id)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        # Plus aucune écriture possible: une finalisation rejouée lit <id>.done
+        self._locks.pop(upload_id, None)
+
+    async def finalized(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """Résultat d'une session déjà finalisée, None sinon"""
+        if not upload_id.isalnum() or not self._done_path(upload_id).exists():
+            return None
+        async with aiofiles.open(self._done_path(upload_id), "r") as f:
+            return json.loads(await f.read())
+
+    def discard(self, upload_id: str):
+        """Supprime les fichiers d'une session (terminée ou abandonnée)"""
+        for path in (self._part_path(upload_id), self._meta_path(upload_id), self._done_path(upload_id)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self._locks.pop(upload_id, None)
+
+    def purge_expired(self):
+        """Supprime les sessions (et résultats de finalisation) plus anciens que `expiration`"""
+        limit = time.time() - self.expiration
+        for path in [*self.directory.glob("*.json"), *self.directory.glob("*.done")]:
+            try:
+                if path.stat().st_mtime < limit:
+                    self.discard(path.stem)
+            except OSError as e:
+                logger.warning(f"⚠️ Purge upload {path.stem} impossible: {e}")
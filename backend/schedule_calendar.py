@@ -0,0 +1,134 @@
+"""
+Matérialisation du calendrier de planning pour SkyApp
+Les plannings (date unique ou période) sont développés en cellules jour par jour côté
+serveur et renvoyés en colonnes; les entités référencées (techniciens, chantiers, chefs
+d'équipe) ne sont envoyées qu'une fois, dans des tables de correspondance indexées.
+"""
+
+import hashlib
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from schedule_conflicts import parse_day
+
+# Colonnes de la table `schedules` (une valeur par planning)
+SCHEDULE_COLUMNS = (
+    "id", "start_date", "end_date", "time", "end_time", "hours", "status", "shift",
+    "intervention_category", "client_name", "client_address", "description",
+)
+COLLABORATOR_FIELDS = ("id", "first_name", "last_name", "email")
+WORKSITE_FIELDS = ("id", "title", "status", "address", "client_id")
+TEAM_LEADER_FIELDS = ("id", "name")
+
+
+class _Lookup:
+    """Table de correspondance: chaque entité n'est stockée qu'une fois, référencée par son index"""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._index: Dict[str, int] = {}
+        self.rows: List[Dict[str, Any]] = []
+
+    def ref(self, entity: Optional[Dict[str, Any]]) -> Optional[int]:
+        if not entity or not entity.get("id"):
+            return None
+        key = str(entity["id"])
+        if key not in self._index:
+            self._index[key] = len(self.rows)
+            self.rows.append({f: entity.get(f) for f in self.fields})
+        return self._index[key]
+
+
+def calendar_etag(company_id: str, first_day: date, last_day: date, collaborator_id: Optional[str],
+                  max_updated_at: Optional[str], count: Optional[int]) -> str:
+    """ETag de la fenêtre: change dès qu'un planning est créé, modifié ou supprimé dans la fenêtre"""
+    base = f"{company_id}|{first_day}|{last_day}|{collaborator_id or ''}|{max_updated_at or ''}|{count or 0}"
+    return f'W/"{hashlib.sha1(base.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def team_leader_name(team_leader: Optional[Dict[str, Any]], users_by_id: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    """Nom du chef d'équipe: celui du compte utilisateur lié s'il existe, sinon celui de la fiche"""
+    if not team_leader:
+        return None
+    source = users_by_id.get(team_leader.get("user_id")) or team_leader
+    return f"{source.get('first_name') or ''} {source.get('last_name') or ''}".strip()
+
+
+def materialize_calendar(rows: List[Dict[str, Any]], first_day: date, last_day: date,
+                         users_by_id: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Développe les plannings en cellules journalières sur [first_day, last_day].
+
+    Args:
+        rows: lignes `schedules` avec les jointures worksites / users / planning_team_leaders
+        users_by_id: comptes liés aux chefs d'équipe (pour leur nom à jour)
+
+    Returns:
+        {"days", "schedules" (colonnes), "cells" (colonnes day/schedule), "collaborators",
+         "worksites", "team_leaders"}
+    """
+    users_by_id = users_by_id or {}
+    collaborators = _Lookup(COLLABORATOR_FIELDS)
+    worksites = _Lookup(WORKSITE_FIELDS)
+    team_leaders = _Lookup(TEAM_LEADER_FIELDS)
+
+    days = []
+    current = first_day
+    while current <= last_day:
+        days.append(current)
+        current += timedelta(days=1)
+
+    schedules: Dict[str, List[Any]] = {col: [] for col in SCHEDULE_COLUMNS}
+    schedules.update({"collaborator": [], "worksite": [], "team_leader": []})
+    cells: Dict[str, List[int]] = {"day": [], "schedule": []}
+
+    ordered = sorted(
+        rows,
+        key=lambda r: (str(r.get("start_date") or r.get("date") or ""), str(r.get("time") or ""), str(r.get("id"))),
+    )
+    for row in ordered:
+        start = parse_day(row.get("start_date") or row.get("date"))
+        end = parse_day(row.get("end_date") or row.get("date")) or start
+        if start is None:
+            continue
+        if end < start:
+            start, end = end, start
+        lo, hi = max(start, first_day), min(end, last_day)
+        if lo > hi:
+            continue
+
+        index = len(schedules["id"])
+        values = {**row, "start_date": start.isoformat(), "end_date": end.isoformat()}
+        for col in SCHEDULE_COLUMNS:
+            schedules[col].append(values.get(col))
+        schedules["collaborator"].append(collaborators.ref(row.get("users") or (
+            {"id": row.get("collaborator_id"),
+             "first_name": row.get("collaborator_first_name"),
+             "last_name": row.get("collaborator_last_name")} if row.get("collaborator_id") else None
+        )))
+        worksite = row.get("worksites")
+        if not worksite and row.get("worksite_id"):
+            worksite = {"id": row["worksite_id"], "title": row.get("worksite_title")}
+        schedules["worksite"].append(worksites.ref(worksite))
+        team_leader = row.get("planning_team_leaders")
+        schedules["team_leader"].append(team_leaders.ref(
+            {"id": team_leader.get("id"), "name": team_leader_name(team_leader, users_by_id)} if team_leader else None
+        ))
+
+        offset = (lo - first_day).days
+        for day_index in range(offset, offset + (hi - lo).days + 1):
+            cells["day"].append(day_index)
+            cells["schedule"].append(index)
+
+    # Cellules triées par jour puis par heure de début
+    order = sorted(range(len(cells["day"])), key=lambda i: (cells["day"][i], str(schedules["time"][cells["schedule"][i]] or "")))
+    cells = {key: [values[i] for i in order] for key, values in cells.items()}
+
+    return {
+        "days": [d.isoformat() for d in days],
+        "schedules": schedules,
+        "cells": cells,
+        "collaborators": collaborators.rows,
+        "worksites": worksites.rows,
+        "team_leaders": team_leaders.rows,
+    }
@@ -0,0 +1,522 @@
+"""
+Moteur de détection de conflits de planning pour SkyApp
+Index d'intervalles par collaborateur (arbre d'intervalles équilibré) couvrant
+les plannings à date unique et les plannings sur période (start_date -> end_date).
+ScheduleIndexCache garde ces index entre les requêtes, revalidés par la version de
+synchronisation du technicien.
+"""
+
+import heapq
+import random
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+DEFAULT_HOURS = 8
+# Plannings qui n'occupent plus le technicien
+INACTIVE_STATUSES = {"cancelled", "canceled", "annule", "annulé"}
+
+
+def parse_time(value: Any) -> Optional[int]:
+    """'HH:MM' ou 'HH:MM:SS' (type time Postgres) -> minutes depuis minuit"""
+    if value is None or value == "":
+        return None
+    parts = str(value).split(":")
+    try:
+        hours = int(parts[0])
+        minutes = int(parts[1]) if len(parts) > 1 else 0
+    except ValueError:
+        return None
+    return hours * 60 + minutes
+
+
+def parse_day(value: Any) -> Optional[date]:
+    """'YYYY-MM-DD' (ou ISO datetime) / date -> date"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def format_minutes(minutes: int) -> str:
+    """Minutes depuis minuit -> 'HH:MM' (modulo 24h)"""
+    minutes %= MINUTES_PER_DAY
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def schedule_window_filter(first_day: date, last_day: date) -> str:
+    """Filtre PostgREST: périodes qui touchent la fenêtre + anciens plannings à date unique"""
+    lo, hi = first_day.isoformat(), last_day.isoformat()
+    return f"and(start_date.lte.{hi},end_date.gte.{lo}),and(start_date.is.null,date.gte.{lo},date.lte.{hi})"
+
+
+@dataclass
+class ScheduleSlot:
+    """
+    Occupation d'un collaborateur: la plage horaire [start_min, end_min) répétée chaque
+    jour de first_day à last_day. end_min peut dépasser 1440 (créneau de nuit).
+    """
+
+    id: Optional[str]
+    collaborator_id: Optional[str]
+    first_day: date
+    last_day: date
+    start_min: int
+    end_min: int
+    row: Dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def is_period(self) -> bool:
+        return self.last_day > self.first_day
+
+    @property
+    def envelope(self) -> Tuple[int, int]:
+        """Intervalle absolu (minutes) englobant toutes les occurrences"""
+        return (
+            self.first_day.toordinal() * MINUTES_PER_DAY + self.start_min,
+            self.last_day.toordinal() * MINUTES_PER_DAY + self.end_min,
+        )
+
+    def overlap_minutes(self, other: "ScheduleSlot") -> int:
+        """Durée du chevauchement sur une occurrence (0 si aucun conflit)"""
+        best = 0
+        # Décalage en jours entre occurrences (créneaux de nuit: jusqu'à ±1 jour)
+        for delta in (-1, 0, 1):
+            lo = max(self.first_day.toordinal() + delta, other.first_day.toordinal())
+            hi = min(self.last_day.toordinal() + delta, other.last_day.toordinal())
+            if lo > hi:
+                continue
+            start = max(self.start_min - delta * MINUTES_PER_DAY, other.start_min)
+            end = min(self.end_min - delta * MINUTES_PER_DAY, other.end_min)
+            best = max(best, end - start)
+        return best
+
+    def overlaps(self, other: "ScheduleSlot") -> bool:
+        return self.overlap_minutes(other) > 0
+
+    def days(self) -> Iterable[date]:
+        current = self.first_day
+        while current <= self.last_day:
+            yield current
+            current += timedelta(days=1)
+
+    @classmethod
+    def from_values(
+        cls,
+        collaborator_id: Optional[str],
+        first_day: Any,
+        last_day: Any,
+        time_start: Any,
+        time_end: Any = None,
+        hours: Optional[float] = None,
+        schedule_id: Optional[str] = None,
+        row: Optional[Dict[str, Any]] = None,
+    ) -> Optional["ScheduleSlot"]:
+        first = parse_day(first_day)
+        last = parse_day(last_day) or first
+        start = parse_time(time_start)
+        if first is None or start is None:
+            return None
+        if last < first:
+            first, last = last, first
+        end = parse_time(time_end)
+        if end is None:
+            end = start + int(round(float(hours or DEFAULT_HOURS) * 60))
+        elif end <= start:
+            # Fin le lendemain (ex: 22:00 -> 06:00)
+            end += MINUTES_PER_DAY
+        return cls(schedule_id, collaborator_id, first, last, start, end, row or {})
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> Optional["ScheduleSlot"]:
+        """Construit un créneau depuis une ligne `schedules` (date unique ou période)"""
+        first = row.get("start_date") or row.get("period_start") or row.get("date")
+        last = row.get("end_date") or row.get("period_end") or row.get("date") or first
+        return cls.from_values(
+            row.get("collaborator_id"),
+            first,
+            last,
+            row.get("time"),
+            row.get("end_time"),
+            row.get("hours"),
+            row.get("id"),
+            row,
+        )
+
+
+def active_slot(row: Dict[str, Any]) -> Optional[ScheduleSlot]:
+    """Créneau d'une ligne `schedules`, None si annulée ou sans date / horaire exploitable"""
+    if str(row.get("status") or "").lower() in INACTIVE_STATUSES:
+        return None
+    return ScheduleSlot.from_row(row)
+
+
+class _Node:
+    __slots__ = ("start", "end", "slot", "priority", "max_end", "left", "right")
+
+    def __init__(self, slot: ScheduleSlot):
+        self.start, self.end = slot.envelope
+        self.slot = slot
+        self.priority = random.random()
+        self.max_end = self.end
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+
+    def update(self):
+        self.max_end = max(
+            self.end,
+            self.left.max_end if self.left else self.end,
+            self.right.max_end if self.right else self.end,
+        )
+
+
+class IntervalIndex:
+    """
+    Arbre d'intervalles (treap trié par début, augmenté du max des fins).
+    Insertion/suppression en O(log n), recherche des chevauchements en O(log n + k).
+    """
+
+    def __init__(self, slots: Iterable[ScheduleSlot] = ()):
+        self._root: Optional[_Node] = None
+        self._size = 0
+        for slot in slots:
+            self.add(slot)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _key(node_or_slot) -> Tuple[int, str]:
+        if isinstance(node_or_slot, _Node):
+            return node_or_slot.start, str(node_or_slot.slot.id)
+        return node_or_slot.envelope[0], str(node_or_slot.id)
+
+    def _split(self, node: Optional[_Node], key) -> Tuple[Optional[_Node], Optional[_Node]]:
+        """Sépare en (< key, >= key)"""
+        if node is None:
+            return None, None
+        if self._key(node) < key:
+            left, right = self._split(node.right, key)
+            node.right = left
+            node.update()
+            return node, right
+        left, right = self._split(node.left, key)
+        node.left = right
+        node.update()
+        return left, node
+
+    def _merge(self, left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+        if left is None or right is None:
+            return left or right
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            left.update()
+            return left
+        right.left = self._merge(left, right.left)
+        right.update()
+        return right
+
+    def add(self, slot: ScheduleSlot):
+        node = _Node(slot)
+        left, right = self._split(self._root, self._key(slot))
+        self._root = self._merge(self._merge(left, node), right)
+        self._size += 1
+
+    def remove(self, slot: ScheduleSlot) -> bool:
+        """Retire le créneau (même id et même début). True si trouvé."""
+        key = self._key(slot)
+        left, rest = self._split(self._root, key)
+        target, right = self._split(rest, (key[0], key[1] + "\0"))
+        found = target is not None
+        if found:
+            # Un seul nœud par clé (start, id); les éventuels doublons sont conservés
+            target = self._merge(target.left, target.right)
+            self._size -= 1
+        self._root = self._merge(self._merge(left, target), right)
+        return found
+
+    def overlapping(self, start: int, end: int) -> List[ScheduleSlot]:
+        """Créneaux dont l'enveloppe chevauche [start, end)"""
+        found: List[ScheduleSlot] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+            stack.append(node.left)
+            if node.start < end:
+                if node.end > start:
+                    found.append(node.slot)
+                stack.append(node.right)
+        return found
+
+    def __iter__(self):
+        stack, node = [], self._root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.slot
+            node = node.right
+
+
+class ScheduleConflictEngine:
+    """Index d'intervalles par collaborateur pour répondre aux questions de chevauchement"""
+
+    def __init__(self, slots: Iterable[ScheduleSlot] = ()):
+        self._indexes: Dict[str, IntervalIndex] = {}
+        self._by_id: Dict[str, ScheduleSlot] = {}
+        for slot in slots:
+            self.add(slot)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "ScheduleConflictEngine":
+        engine = cls()
+        for row in rows:
+            slot = active_slot(row)
+            if slot is not None:
+                engine.add(slot)
+        return engine
+
+    def add(self, slot: ScheduleSlot):
+        if slot.id is not None and slot.id in self._by_id:
+            self.remove(slot.id)
+        self._indexes.setdefault(str(slot.collaborator_id), IntervalIndex()).add(slot)
+        if slot.id is not None:
+            self._by_id[slot.id] = slot
+
+    def remove(self, schedule_id: str) -> bool:
+        slot = self._by_id.pop(schedule_id, None)
+        if slot is None:
+            return False
+        index = self._indexes.get(str(slot.collaborator_id))
+        return bool(index and index.remove(slot))
+
+    def conflicts(self, slot: ScheduleSlot, exclude_id: Optional[str] = None) -> List[Tuple[ScheduleSlot, int]]:
+        """Créneaux existants du même collaborateur qui chevauchent `slot`, avec la durée (minutes)"""
+        index = self._indexes.get(str(slot.collaborator_id))
+        if not index:
+            return []
+        start, end = slot.envelope
+        result = []
+        for other in index.overlapping(start, end):
+            if exclude_id is not None and other.id == exclude_id:
+                continue
+            minutes = slot.overlap_minutes(other)
+            if minutes > 0:
+                result.append((other, minutes))
+        return result
+
+    def has_conflict(self, slot: ScheduleSlot, exclude_id: Optional[str] = None) -> bool:
+        return bool(self.conflicts(slot, exclude_id))
+
+    def collaborator_ids(self) -> List[str]:
+        return sorted(self._indexes)
+
+    def slots_for(self, collaborator_id: str) -> List[ScheduleSlot]:
+        index = self._indexes.get(str(collaborator_id))
+        return list(index) if index else []
+
+
+@dataclass
+class ScheduleIndexSource:
+    """
+    Requêtes de l'index persistant (fournies par le serveur):
+    - version(company_id, collaborator_id): version de synchronisation du technicien, None si la migration manque
+    - load(company_id, collaborator_id, horizon): plannings qui finissent à partir de `horizon`
+    - changed(company_id, collaborator_id, version): plannings écrits après `version` (toutes dates)
+    - removed(company_id, collaborator_id, version): ids supprimés / réassignés après `version`
+    """
+
+    version: Callable[[str, str], Optional[int]]
+    load: Callable[[str, str, date], List[Dict[str, Any]]]
+    changed: Callable[[str, str, int], List[Dict[str, Any]]]
+    removed: Callable[[str, str, int], List[str]]
+
+
+@dataclass
+class _IndexEntry:
+    horizon: date
+    version: Optional[int] = None
+    engine: ScheduleConflictEngine = field(default_factory=ScheduleConflictEngine)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ScheduleIndexCache:
+    """
+    Index de conflits gardés en mémoire entre les requêtes, un par (entreprise, technicien).
+
+    Chaque vérification relit la version de synchronisation du technicien (clé primaire,
+    commune aux workers): inchangée -> l'index sert tel quel, sinon seules les écritures
+    postérieures (plannings et tombstones de version supérieure) y sont rejouées.
+    L'index couvre les plannings qui finissent après l'horizon (jour du chargement moins
+    `horizon_days`); conflicts() renvoie None pour un créneau antérieur ou sans compteur,
+    l'appelant interroge alors la base directement.
+    """
+
+    def __init__(self, source: ScheduleIndexSource, horizon_days: int = 7, max_entries: int = 500,
+                 today: Callable[[], date] = date.today):
+        self.source = source
+        self.horizon_days = horizon_days
+        self.max_entries = max_entries
+        self.today = today
+        self._entries: "OrderedDict[Tuple[str, str], _IndexEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "loads": 0, "replays": 0, "bypass": 0}
+
+    def conflicts(self, company_id: str, slot: ScheduleSlot,
+                  exclude_id: Optional[str] = None) -> Optional[List[Tuple[ScheduleSlot, int]]]:
+        horizon = self.today() - timedelta(days=self.horizon_days)
+        # Un jour de marge pour les créneaux de nuit de la veille
+        if slot.collaborator_id is None or slot.first_day - timedelta(days=1) < horizon:
+            self.metrics["bypass"] += 1
+            return None
+        collaborator_id = str(slot.collaborator_id)
+        version = self.source.version(company_id, collaborator_id)
+        if version is None:
+            self.metrics["bypass"] += 1
+            return None
+
+        entry = self._entry(company_id, collaborator_id, horizon)
+        with entry.lock:
+            if entry.version is None:
+                entry.engine = ScheduleConflictEngine.from_rows(
+                    self.source.load(company_id, collaborator_id, entry.horizon))
+                self.metrics["loads"] += 1
+            elif version > entry.version:
+                self._replay(entry, company_id, collaborator_id)
+                self.metrics["replays"] += 1
+            else:
+                self.metrics["hits"] += 1
+            # Version lue avant les requêtes: les écritures validées entre-temps sont
+            # rejouées au prochain appel (ajout / retrait idempotents)
+            entry.version = max(version, entry.version or 0)
+            return entry.engine.conflicts(slot, exclude_id=exclude_id)
+
+    def invalidate(self, company_id: Optional[str] = None):
+        with self._lock:
+            for key in [k for k in self._entries if company_id is None or k[0] == company_id]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.metrics, "entries": len(self._entries), "horizon_days": self.horizon_days}
+
+    # ------------------------------------------------------------------
+    def _entry(self, company_id: str, collaborator_id: str, horizon: date) -> _IndexEntry:
+        key = (company_id, collaborator_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            # Les plannings passés s'accumulent: rechargement quand l'horizon a trop reculé
+            if entry is None or entry.horizon < horizon - timedelta(days=self.horizon_days):
+                entry = self._entries[key] = _IndexEntry(horizon)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def _replay(self, entry: _IndexEntry, company_id: str, collaborator_id: str):
+        for schedule_id in self.source.removed(company_id, collaborator_id, entry.version):
+            entry.engine.remove(schedule_id)
+        for row in self.source.changed(company_id, collaborator_id, entry.version):
+            if row.get("id") is not None:
+                entry.engine.remove(row["id"])
+            slot = active_slot(row)
+            if slot is not None and str(slot.collaborator_id) == collaborator_id and slot.last_day >= entry.horizon:
+                entry.engine.add(slot)
+
+
+def busy_from_slots(slots: Iterable[ScheduleSlot], days: Sequence[date]) -> Dict[Tuple[str, date], List[Tuple[int, int]]]:
+    """Plages occupées par (technicien, jour), y compris la fin des créneaux de nuit de la veille"""
+    wanted = set(days)
+    busy: Dict[Tuple[str, date], List[Tuple[int, int]]] = {}
+    for slot in slots:
+        for day in slot.days():
+            if day in wanted:
+                busy.setdefault((str(slot.collaborator_id), day), []).append((slot.start_min, min(slot.end_min, MINUTES_PER_DAY)))
+            if slot.end_min > MINUTES_PER_DAY:
+                next_day = date.fromordinal(day.toordinal() + 1)
+                if next_day in wanted:
+                    busy.setdefault((str(slot.collaborator_id), next_day), []).append((0, slot.end_min - MINUTES_PER_DAY))
+    for intervals in busy.values():
+        intervals.sort()
+    return busy
+
+
+def conflict_payload(slot: ScheduleSlot, minutes: int) -> Dict[str, Any]:
+    """Description JSON d'un planning en conflit"""
+    return {
+        "schedule_id": slot.id,
+        "collaborator_id": slot.collaborator_id,
+        "start_date": slot.first_day.isoformat(),
+        "end_date": slot.last_day.isoformat(),
+        "time": format_minutes(slot.start_min),
+        "end_time": format_minutes(slot.end_min),
+        "overlap_minutes": minutes,
+        "worksite_title": slot.row.get("worksite_title"),
+    }
+
+
+def sweep_conflicts(slots: Iterable[ScheduleSlot]) -> List[Dict[str, Any]]:
+    """
+    Toutes les paires de plannings d'un même collaborateur qui se chevauchent réellement.
+
+    Balayage: chaque planning est développé en occurrences journalières (intervalles absolus
+    en minutes), triées par début; un tas par collaborateur garde les occurrences actives
+    triées par fin. O(n log n + k) pour n occurrences et k chevauchements.
+
+    Returns:
+        Une entrée par paire: jours en conflit, durée max sur une occurrence et durée totale.
+    """
+    events = []
+    for index, slot in enumerate(slots):
+        base = slot.first_day.toordinal() * MINUTES_PER_DAY
+        for offset in range((slot.last_day - slot.first_day).days + 1):
+            start = base + offset * MINUTES_PER_DAY + slot.start_min
+            events.append((start, start + slot.end_min - slot.start_min, index, slot))
+    events.sort(key=lambda e: (e[0], e[1], e[2]))
+
+    active: Dict[str, List[Tuple[int, int, ScheduleSlot]]] = {}
+    pairs: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for start, end, index, slot in events:
+        heap = active.setdefault(str(slot.collaborator_id), [])
+        while heap and heap[0][0] <= start:
+            heapq.heappop(heap)
+        for other_end, other_index, other in heap:
+            minutes = min(end, other_end) - start
+            key = (other_index, index) if other_index < index else (index, other_index)
+            pair = pairs.get(key)
+            if pair is None:
+                first, second = (other, slot) if other_index < index else (slot, other)
+                pair = pairs[key] = {
+                    "collaborator_id": slot.collaborator_id,
+                    "schedule1": first,
+                    "schedule2": second,
+                    "days": set(),
+                    "overlap_minutes": 0,
+                    "total_overlap_minutes": 0,
+                }
+            pair["days"].add(date.fromordinal(start // MINUTES_PER_DAY))
+            pair["overlap_minutes"] = max(pair["overlap_minutes"], minutes)
+            pair["total_overlap_minutes"] += minutes
+        heapq.heappush(heap, (end, index, slot))
+
+    result = []
+    for pair in pairs.values():
+        days = sorted(pair["days"])
+        result.append({
+            **pair,
+            "days": [d.isoformat() for d in days],
+            "first_conflict_day": days[0].isoformat(),
+        })
+    result.sort(key=lambda p: (p["first_conflict_day"], str(p["collaborator_id"]), str(p["schedule1"].id), str(p["schedule2"].id)))
+    return result
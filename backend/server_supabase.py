@@ -1,8 +1,7 @@
-﻿from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Form, Query
+﻿from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Form, Query, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
@@ -20,12 +19,15 @@ logger = logging.getLogger(__name__)
 logger.info("=" * 100)
 logger.info("CHARGEMENT DU FICHIER server_supabase.py - CODE MIS A JOUR LE 29 JANVIER 2026")
 logger.info("=" * 100)
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable
 import uuid
+import hashlib
+import json
 from datetime import datetime, timedelta, date, timezone
 from decimal import Decimal
 import tempfile
 import io
+import gzip
 import asyncio
 import aiofiles
 import shutil
@@ -45,6 +47,19 @@ from PIL import Image as PILImage
 import qrcode
 import base64
 import secrets
+from photo_processing import normalize_photo, extension_for, make_thumbnail, make_logo_variants
+from static_uploads import UploadsStaticFiles
+from resumable_uploads import ResumableUploadStore, UploadError
+from mission_sync import MissionSyncSource, etag_matches, parse_sync_cursor, synchronize
+from schedule_conflicts import (
+    INACTIVE_STATUSES, ScheduleConflictEngine, ScheduleIndexCache, ScheduleIndexSource, ScheduleSlot,
+    busy_from_slots, conflict_payload, schedule_window_filter, sweep_conflicts
+)
+from schedule_calendar import calendar_etag, materialize_calendar
+from planning_optimizer import PlanningJob, PlanningOptimizer, PlanningTechnician, normalize_skills
+from availability_index import AvailabilityIndex
+from name_directory import NameDirectory, full_name
+from ics_feed import ICSFeedCache, feed_token, parse_feed_token
 
 # IOPOLE Client for electronic invoicing
 try:
@@ -95,10 +110,21 @@ async def lifespan(app: FastAPI):
     except Exception:
         pass
     
+    # Service IA créé une seule fois (cache et statistiques conservés pendant toute la vie du worker)
+    if AI_SERVICE_AVAILABLE and supabase_service is not None:
+        try:
+            init_ai_service(supabase_service).telemetry.start()
+        except Exception as e:
+            logging.warning(f"⚠️ Impossible d'initialiser le service IA: {e}")
+    
     yield
     
-    # Shutdown (si besoin)
-    pass
+    # Shutdown: écriture des derniers événements de télémétrie IA
+    if AI_SERVICE_AVAILABLE:
+        try:
+            await get_ai_service().telemetry.stop()
+        except RuntimeError:
+            pass
 
 # Create the main app
 app = FastAPI(
@@ -144,6 +170,8 @@ app.add_middleware(
     allow_origins=_allow_origins,
     allow_methods=["*"],
     allow_headers=["*"],
+    # En-têtes lus par le frontend (uploads reprenables, cache conditionnel)
+    expose_headers=["Upload-Offset", "Upload-Length", "Location", "ETag", "X-Sync-Cursor"],
 )
 
 # Exception handler pour les erreurs de validation Pydantic
@@ -506,13 +534,14 @@ async def root():
 @api_router.get("/health")
 async def health_check():
     try:
-        # Initialiser le service IA si disponible
-        if AI_SERVICE_AVAILABLE and supabase_service is not None:
+        # Le service IA est initialisé au démarrage (lifespan): la sonde ne fait que le constater
+        ai_ready = False
+        if AI_SERVICE_AVAILABLE:
             try:
-                init_ai_service(supabase_service)
-                logging.info("✅ Service IA initialisé")
-            except Exception as e:
-                logging.warning(f"⚠️ Impossible d'initialiser le service IA: {e}")
+                get_ai_service()
+                ai_ready = True
+            except RuntimeError:
+                pass
         
         # Vérifier l'accès DB via clé service si disponible
         if supabase_service is not None:
@@ -523,7 +552,7 @@ async def health_check():
                     "database": "Connected", 
                     "service": "SkyApp Supabase", 
                     "mode": "service",
-                    "ai_service": AI_SERVICE_AVAILABLE,
+                    "ai_service": ai_ready,
                     "iopole": IOPOLE_AVAILABLE
                 }
             except Exception as e:
@@ -952,11 +981,12 @@ async def list_searches(
             all_items.sort(key=lambda x: x.get(sort_by, ''), reverse=desc)
             
             if page is None:
+                _attach_search_photos(all_items)
                 return {"data": all_items, "count": len(all_items)}
             
             # Pagination manuelle
             offset = (page - 1) * page_size
-            items = all_items[offset:offset + page_size]
+            items = _attach_search_photos(all_items[offset:offset + page_size])
             has_more = len(all_items) > offset + page_size
             return {"data": items, "page": page, "page_size": page_size, "has_more": has_more, "count": len(items)}
             
@@ -980,11 +1010,12 @@ async def list_searches(
 
             if page is None:
                 response = query.execute()
-                return {"data": response.data or [], "count": len(response.data or [])}
+                items = _attach_search_photos(response.data or [])
+                return {"data": items, "count": len(items)}
 
             offset = (page - 1) * page_size
             response = query.range(offset, offset + page_size - 1).execute()
-            items = response.data or []
+            items = _attach_search_photos(response.data or [])
             has_more = len(items) == page_size
             return {"data": items, "page": page, "page_size": page_size, "has_more": has_more, "count": len(items)}
     except HTTPException:
@@ -1015,6 +1046,7 @@ async def create_search_draft(user_data: dict = Depends(get_user_from_token)):
         }
         logging.info(f"Creating draft search for user {user_data['id']}, company {company_id}")
         response = supabase_service.table("searches").insert(draft_payload).execute()
+        _ai_data_changed(company_id)
         return {"message": "Brouillon créé", "search": response.data[0]}
     except HTTPException:
         raise
@@ -1045,6 +1077,7 @@ async def share_to_bureau(data: dict, user_data: dict = Depends(get_user_from_to
                 .eq("user_id", user_data["id"])\
                 .eq("company_id", company_id)\
                 .execute()
+        _ai_data_changed(company_id)
         
         logging.info(f"User {user_data['id']} shared {len(search_ids)} searches to bureau")
         return {"message": f"{len(search_ids)} recherche(s) partagée(s) avec le bureau"}
@@ -1076,14 +1109,14 @@ async def get_bureau_searches(user_data: dict = Depends(get_user_from_token)):
             .execute()
         
         # Récupérer les infos des techniciens séparément
-        searches = response.data
+        searches = _attach_search_photos(response.data or [])
         for search in searches:
             if search.get("user_id"):
                 user_resp = supabase_service.table("users").select("first_name, last_name, email").eq("id", search["user_id"]).execute()
                 if user_resp.data:
                     search["user"] = user_resp.data[0]
         
-        return {"searches": response.data}
+        return {"searches": searches}
     except HTTPException:
         raise
     except Exception as e:
@@ -1184,6 +1217,7 @@ async def convert_search_to_project(search_id: str, request: dict = None, user_d
                 
                 try:
                     client_result = supabase_service.table("clients").insert(client_data).execute()
+                    _directory_write("clients", client_result.data)
                     if client_result.data:
                         client_id = client_result.data[0]["id"]
                         logging.info(f"✅ Client non-récurrent créé: {client_id}")
@@ -1329,7 +1363,7 @@ async def get_searches(
             shared_results = shared_query.order("created_at", desc=True).execute()
             
             # Fusionner les résultats
-            all_searches = (my_results.data or []) + (shared_results.data or [])
+            all_searches = _attach_search_photos((my_results.data or []) + (shared_results.data or []))
             
             logger.info(f"🔵 Mes recherches: {len(my_results.data or [])} trouvées")
             logger.info(f"🔵 Recherches SHARED: {len(shared_results.data or [])} trouvées")
@@ -1358,10 +1392,11 @@ async def get_searches(
                 query = query.is_("project_id", None)
             
             result = query.order("created_at", desc=True).execute()
+            searches = _attach_search_photos(result.data or [])
             
-            logger.info(f"🟡 Résultats technicien: {len(result.data or [])} recherches")
+            logger.info(f"🟡 Résultats technicien: {len(searches)} recherches")
             
-            return {"data": result.data or [], "count": len(result.data or [])}
+            return {"data": searches, "count": len(searches)}
     
     except Exception as e:
         logging.error(f"Error fetching searches: {e}")
@@ -1410,7 +1445,10 @@ async def get_projects(
 class AIQueryModel(BaseModel):
     """Requête IA universelle"""
     query: str = Field(..., description="Question ou commande en langage naturel")
-    conversation_history: Optional[List[Dict]] = Field(default=None, description="Historique conversation (optionnel)")
+    conversation_history: Optional[List[Dict]] = Field(
+        default=None,
+        description="Historique conversation (optionnel); borné en tokens: messages récents intacts + résumé des anciens"
+    )
 
 @api_router.post("/ai/query")
 async def ai_universal_query(data: AIQueryModel, user_data: dict = Depends(get_user_from_token)):
@@ -1455,6 +1493,57 @@ async def ai_universal_query(data: AIQueryModel, user_data: dict = Depends(get_u
         logger.error(f"❌ Erreur AI query: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erreur IA: {str(e)}")
 
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+async def _sse_response(events) -> StreamingResponse:
+    """
+    Flux Server-Sent Events depuis un générateur (type, données) du service IA.
+    Le premier événement est produit avant l'envoi des en-têtes: un refus (429) garde son code HTTP.
+    """
+    first = await events.__anext__()
+    
+    async def body():
+        yield _sse(*first)
+        try:
+            async for event in events:
+                yield _sse(*event)
+        except HTTPException as e:
+            yield _sse("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"❌ Erreur flux IA: {e}", exc_info=True)
+            yield _sse("error", {"status": 500, "detail": f"Erreur IA: {str(e)}"})
+    
+    return StreamingResponse(body(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # pas de mise en tampon par le proxy
+    })
+
+@api_router.post("/ai/query/stream")
+async def ai_universal_query_stream(data: AIQueryModel, user_data: dict = Depends(get_user_from_token)):
+    """
+    🤖 RECHERCHE UNIVERSELLE IA - STREAMING (SSE)
+    
+    Même traitement que /ai/query (cache, function calling local), réponse envoyée au fil de l'eau:
+    - event: meta  -> étape (cache, thinking, function)
+    - event: token -> {"delta": "..."}
+    - event: done  -> réponse complète (même format que /ai/query)
+    """
+    if not AI_SERVICE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Service IA non disponible. Contactez l'administrateur.")
+    
+    company_id = await get_user_company(user_data)
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Entreprise non trouvée")
+    
+    ai_service = get_ai_service()
+    return await _sse_response(ai_service.universal_query_stream(
+        company_id=company_id,
+        user_query=data.query,
+        user_role=user_data.get("role", "TECHNICIEN"),
+        conversation_history=data.conversation_history
+    ))
+
 @api_router.post("/ai/devis")
 async def ai_generate_devis(
     client_id: str = Query(..., description="ID du client"),
@@ -1505,11 +1594,159 @@ async def ai_generate_devis(
         logger.error(f"❌ Erreur génération devis IA: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class PlanningOptimizeOptions(BaseModel):
+    """Paramètres de l'optimiseur local (optimize / suggest_slots)"""
+    worksite_ids: Optional[List[str]] = None  # optimize: chantiers à placer (défaut: chantiers PLANNED sans planning)
+    collaborator_ids: Optional[List[str]] = None  # défaut: tous les techniciens
+    duration_hours: float = Field(4, gt=0, le=24)
+    skills: Optional[str] = None  # suggest_slots sans chantier: compétences requises
+    day_start: str = "08:00"
+    day_end: str = "18:00"
+    include_weekends: bool = False
+    time_budget_ms: int = Field(800, ge=50, le=5000)
+    limit: int = Field(5, ge=1, le=50)
+
+PLANNING_OPTIMIZER_MAX_DAYS = 31
+
+def _planning_days(date_from: Optional[str], date_to: Optional[str], include_weekends: bool) -> List[date]:
+    """Jours de l'horizon (défaut: 5 prochains jours ouvrés)"""
+    try:
+        first = date.fromisoformat(date_from[:10]) if date_from else date.today() + timedelta(days=1)
+        last = date.fromisoformat(date_to[:10]) if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates invalides (format YYYY-MM-DD)")
+    days, current = [], first
+    while (last is None and len(days) < 5) or (last is not None and current <= last):
+        if include_weekends or current.weekday() < 5:
+            days.append(current)
+        current += timedelta(days=1)
+        if (current - first).days > PLANNING_OPTIMIZER_MAX_DAYS:
+            raise HTTPException(status_code=400, detail=f"Horizon limité à {PLANNING_OPTIMIZER_MAX_DAYS} jours")
+    return days
+
+def _load_planning_optimizer(company_id: str, days: List[date], options: PlanningOptimizeOptions,
+                             jobs: List[PlanningJob]) -> PlanningOptimizer:
+    """Techniciens (compétences, point de départ) + plannings existants de l'horizon -> optimiseur"""
+    working_hours = ScheduleSlot.from_values(None, days[0], days[0], options.day_start, options.day_end)
+    if working_hours is None:
+        raise HTTPException(status_code=400, detail="Horaires de journée invalides")
+
+    def _users(fields: str):
+        q = _svc().table("users").select(fields).eq("company_id", company_id).eq("role", "TECHNICIEN")
+        if options.collaborator_ids:
+            q = q.in_("id", options.collaborator_ids)
+        return q.execute().data or []
+
+    try:
+        users = _users("id, first_name, last_name, skills, base_latitude, base_longitude")
+    except Exception as e:
+        # Migration 2026-10-19_planning_optimizer_fields.sql pas encore appliquée
+        logger.warning(f"⚠️ Points de départ techniciens indisponibles: {e}")
+        users = _users("id, first_name, last_name, skills")
+    technicians = [
+        PlanningTechnician(
+            id=u["id"],
+            name=f"{u.get('first_name') or ''} {u.get('last_name') or ''}".strip(),
+            skills=normalize_skills(u.get("skills")),
+            latitude=u.get("base_latitude"),
+            longitude=u.get("base_longitude"),
+            day_start=working_hours.start_min,
+            day_end=working_hours.end_min,
+        )
+        for u in sorted(users, key=lambda u: u["id"])
+    ]
+    engine = _load_conflict_engine(company_id, [t.id for t in technicians], days[0], days[-1])
+    busy = busy_from_slots([slot for t in technicians for slot in engine.slots_for(t.id)], days)
+    return PlanningOptimizer(jobs, technicians, days, busy)
+
+def _planning_jobs(company_id: str, options: PlanningOptimizeOptions, days: List[date],
+                   unscheduled_only: bool) -> List[PlanningJob]:
+    """Chantiers à placer, avec coordonnées et compétences requises"""
+    def _worksites(fields: str):
+        q = _svc().table("worksites").select(fields).eq("company_id", company_id)
+        if options.worksite_ids:
+            q = q.in_("id", options.worksite_ids)
+        else:
+            q = q.eq("status", "PLANNED")
+        return q.execute().data or []
+
+    try:
+        worksites = _worksites("id, title, latitude, longitude, required_skills")
+    except Exception as e:
+        logger.warning(f"⚠️ Coordonnées chantiers indisponibles: {e}")
+        worksites = _worksites("id, title")
+
+    if unscheduled_only and worksites:
+        planned = _svc().table("schedules").select("worksite_id").eq("company_id", company_id) \
+            .in_("worksite_id", [w["id"] for w in worksites]) \
+            .or_(schedule_window_filter(days[0], days[-1])).execute()
+        already = {row["worksite_id"] for row in planned.data or []}
+        worksites = [w for w in worksites if w["id"] not in already]
+
+    duration = int(round(options.duration_hours * 60))
+    return [
+        PlanningJob(
+            id=w["id"],
+            duration_min=duration,
+            latitude=w.get("latitude"),
+            longitude=w.get("longitude"),
+            skills=normalize_skills(w.get("required_skills")),
+            title=w.get("title"),
+        )
+        for w in sorted(worksites, key=lambda w: w["id"])
+    ]
+
+DETECT_CONFLICTS_DEFAULT_DAYS = 30
+
+def _detect_schedule_conflicts(company_id: str, first_day: date, last_day: date):
+    """Plannings de la fenêtre -> paires en conflit (balayage), occurrences limitées à la fenêtre"""
+    res = _svc().table("schedules").select(f"{SCHEDULE_CONFLICT_FIELDS}, collaborator_first_name, collaborator_last_name") \
+        .eq("company_id", company_id) \
+        .or_(schedule_window_filter(first_day, last_day)) \
+        .execute()
+    engine = ScheduleConflictEngine.from_rows(res.data or [])
+    slots = []
+    for collaborator_id in engine.collaborator_ids():
+        for slot in engine.slots_for(collaborator_id):
+            # Une période qui déborde de la fenêtre n'est comparée que sur les jours affichés
+            lo, hi = max(slot.first_day, first_day), min(slot.last_day, last_day)
+            if lo <= hi:
+                slots.append(ScheduleSlot(slot.id, slot.collaborator_id, lo, hi, slot.start_min, slot.end_min, slot.row))
+    
+    def _describe(slot: ScheduleSlot) -> Dict[str, Any]:
+        row = slot.row
+        return {
+            "id": slot.id,
+            "start_date": row.get("start_date") or row.get("date"),
+            "end_date": row.get("end_date") or row.get("date"),
+            "time": row.get("time"),
+            "end_time": row.get("end_time"),
+            "worksite_title": row.get("worksite_title"),
+            "status": row.get("status"),
+        }
+    
+    conflicts = []
+    for pair in sweep_conflicts(slots):
+        row = pair["schedule1"].row
+        conflicts.append({
+            "collaborator_id": pair["collaborator_id"],
+            "collaborator_name": f"{row.get('collaborator_first_name') or ''} {row.get('collaborator_last_name') or ''}".strip(),
+            "schedule1": _describe(pair["schedule1"]),
+            "schedule2": _describe(pair["schedule2"]),
+            "days": pair["days"],
+            "first_conflict_day": pair["first_conflict_day"],
+            "overlap_minutes": pair["overlap_minutes"],
+            "total_overlap_minutes": pair["total_overlap_minutes"],
+            "reason": f"Chevauchement de {pair['overlap_minutes']} min",
+        })
+    return conflicts, len(slots)
+
 @api_router.post("/ai/planning")
 async def ai_planning_assistant(
     action: str = Query(..., description="suggest_slots | detect_conflicts | optimize"),
     date_from: Optional[str] = Query(None, description="Date début (ISO)"),
     date_to: Optional[str] = Query(None, description="Date fin (ISO)"),
+    options: Optional[PlanningOptimizeOptions] = None,
     user_data: dict = Depends(get_user_from_token)
 ):
     """
@@ -1519,58 +1756,86 @@ async def ai_planning_assistant(
     - suggest_slots: Propose créneaux optimaux pour techniciens disponibles
     - detect_conflicts: Détecte conflits dans le planning
     - optimize: Optimise les déplacements et l'organisation
+    
+    optimize et suggest_slots utilisent l'optimiseur local (sans LLM): distances entre
+    chantiers, compétences et plannings existants.
     """
     try:
-        if not AI_SERVICE_AVAILABLE:
-            return {"success": False, "message": "Service IA non disponible"}
-        
         company_id = await get_user_company(user_data)
+        options = options or PlanningOptimizeOptions()
         
-        # Pour l'instant, utiliser la recherche planning standard
-        ai_service = get_ai_service()
-        filters = {}
-        if date_from:
-            filters["date_from"] = date_from
-        if date_to:
-            filters["date_to"] = date_to
-        
-        schedules = await ai_service._search_planning(company_id, filters)
-        
-        if action == "detect_conflicts":
-            # Détecter conflits (même technicien, même jour, heures qui se chevauchent)
-            conflicts = []
-            for i, s1 in enumerate(schedules):
-                for s2 in schedules[i+1:]:
-                    if s1.get("user_id") == s2.get("user_id") and s1.get("date") == s2.get("date"):
-                        conflicts.append({
-                            "schedule1": s1,
-                            "schedule2": s2,
-                            "reason": "Même technicien, même jour"
-                        })
+        if action in ("optimize", "suggest_slots"):
+            days = _planning_days(date_from, date_to, options.include_weekends)
+            if not days:
+                raise HTTPException(status_code=400, detail="Aucun jour ouvré dans la période")
+            
+            if action == "optimize":
+                jobs = await asyncio.to_thread(_planning_jobs, company_id, options, days, True)
+                optimizer = await asyncio.to_thread(_load_planning_optimizer, company_id, days, options, jobs)
+                result = await asyncio.to_thread(optimizer.solve, options.time_budget_ms)
+                return {
+                    "success": True,
+                    "action": action,
+                    "date_from": days[0].isoformat(),
+                    "date_to": days[-1].isoformat(),
+                    **result.as_dict(),
+                }
             
+            # suggest_slots: un chantier (worksite_ids[0]) ou une intervention libre (compétences)
+            if options.worksite_ids:
+                options.worksite_ids = options.worksite_ids[:1]
+                jobs = await asyncio.to_thread(_planning_jobs, company_id, options, days, False)
+                if not jobs:
+                    raise HTTPException(status_code=404, detail="Chantier introuvable")
+            else:
+                jobs = [PlanningJob(id="new", duration_min=int(round(options.duration_hours * 60)),
+                                    skills=normalize_skills(options.skills))]
+            optimizer = await asyncio.to_thread(_load_planning_optimizer, company_id, days, options, jobs)
+            slots = optimizer.suggest_slots(0, options.limit)
             return {
                 "success": True,
                 "action": action,
-                "conflicts": conflicts,
-                "total_conflicts": len(conflicts)
+                "slots": slots,
+                "total": len(slots),
             }
         
-        elif action == "suggest_slots":
-            # Suggérer créneaux libres
+        if action == "detect_conflicts":
+            # Chevauchements réels (plages horaires, périodes multi-jours, créneaux de nuit)
+            try:
+                first = date.fromisoformat(date_from[:10]) if date_from else date.today()
+                last = date.fromisoformat(date_to[:10]) if date_to else first + timedelta(days=DETECT_CONFLICTS_DEFAULT_DAYS)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Dates invalides (format YYYY-MM-DD)")
+            conflicts, total_schedules = await asyncio.to_thread(_detect_schedule_conflicts, company_id, first, last)
             return {
                 "success": True,
                 "action": action,
-                "message": "Fonctionnalité en développement - bientôt disponible",
-                "current_schedules": len(schedules)
+                "date_from": first.isoformat(),
+                "date_to": last.isoformat(),
+                "conflicts": conflicts,
+                "total_conflicts": len(conflicts),
+                "total_schedules": total_schedules,
             }
         
-        else:
-            return {
-                "success": True,
-                "action": action,
-                "schedules": schedules,
-                "total": len(schedules)
-            }
+        if not AI_SERVICE_AVAILABLE:
+            return {"success": False, "message": "Service IA non disponible"}
+        
+        # Pour l'instant, utiliser la recherche planning standard
+        ai_service = get_ai_service()
+        filters = {}
+        if date_from:
+            filters["date_from"] = date_from
+        if date_to:
+            filters["date_to"] = date_to
+        
+        schedules = await ai_service._search_planning(company_id, filters)
+        
+        return {
+            "success": True,
+            "action": action,
+            "schedules": schedules,
+            "total": len(schedules)
+        }
     
     except HTTPException:
         raise
@@ -1723,6 +1988,31 @@ async def ai_predictions(
         logger.error(f"❌ Erreur prédictions IA: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _improve_text_messages(text: str) -> List[Dict[str, str]]:
+    """Prompt de correction des rapports techniciens (réponse JSON et flux SSE)"""
+    return [
+        {
+            "role": "system",
+            "content": """Tu es un assistant qui améliore les rapports de techniciens BTP.
+
+RÈGLES:
+1. Corrige TOUTES les fautes d'orthographe et de grammaire
+2. Réécris de manière professionnelle mais concise
+3. Garde le sens exact du message original
+4. Utilise le vocabulaire BTP approprié
+5. Structure en phrases courtes et claires
+6. NE PAS inventer d'informations
+7. Si le texte est déjà correct, retourne-le tel quel
+
+FORMAT DE RÉPONSE:
+Retourne UNIQUEMENT le texte amélioré, sans préambule ni explication."""
+        },
+        {
+            "role": "user",
+            "content": f"Améliore ce rapport technicien:\n\n{text}"
+        }
+    ]
+
 @api_router.post("/ai/improve-text")
 async def ai_improve_text(
     text: str = Query(..., description="Texte à améliorer (rapport technicien)"),
@@ -1753,30 +2043,10 @@ async def ai_improve_text(
         ai_service = get_ai_service()
         
         # Utiliser GPT-4o-mini pour correction rapide et économique
-        messages = [
-            {
-                "role": "system",
-                "content": """Tu es un assistant qui améliore les rapports de techniciens BTP.
-
-RÈGLES:
-1. Corrige TOUTES les fautes d'orthographe et de grammaire
-2. Réécris de manière professionnelle mais concise
-3. Garde le sens exact du message original
-4. Utilise le vocabulaire BTP approprié
-5. Structure en phrases courtes et claires
-6. NE PAS inventer d'informations
-7. Si le texte est déjà correct, retourne-le tel quel
-
-FORMAT DE RÉPONSE:
-Retourne UNIQUEMENT le texte amélioré, sans préambule ni explication."""
-            },
-            {
-                "role": "user",
-                "content": f"Améliore ce rapport technicien:\n\n{text}"
-            }
-        ]
+        messages = _improve_text_messages(text)
         
-        result = await ai_service.chat_completion(messages, use_functions=False)
+        result = await ai_service.chat_completion(messages, use_functions=False, company_id=user_data.get("company_id"),
+                                                  function="improve_text")
         improved_text = result.choices[0].message.content.strip()
         
         return {
@@ -1798,16 +2068,55 @@ Retourne UNIQUEMENT le texte amélioré, sans préambule ni explication."""
             "message": f"Erreur: {str(e)}"
         }
 
+@api_router.post("/ai/improve-text/stream")
+async def ai_improve_text_stream(
+    text: str = Query(..., description="Texte à améliorer (rapport technicien)"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """✨ AMÉLIORATION TEXTE - STREAMING (SSE): event token {"delta"} puis done {original, improved, tokens}"""
+    if not AI_SERVICE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Service IA non disponible. Texte non modifié.")
+    
+    ai_service = get_ai_service()
+    
+    async def events():
+        async for event, payload in ai_service.stream_completion(
+            user_data.get("company_id"), _improve_text_messages(text), simulated_text=text, function="improve_text"
+        ):
+            if event == "done":
+                tokens = payload.get("tokens_used") or 0
+                payload = {
+                    "success": payload.get("success", True),
+                    "original": text,
+                    "improved": (payload.get("message") or text).strip(),
+                    "tokens": tokens,
+                    "cost_euros": tokens * 0.15 / 1000000,
+                    **({"simulation": True} if payload.get("simulation") else {}),
+                }
+            yield event, payload
+    
+    return await _sse_response(events())
+
 @api_router.get("/ai/stats")
-async def ai_stats(user_data: dict = Depends(get_user_from_token)):
+async def ai_stats(
+    days: int = Query(30, ge=1, le=365, description="Période des agrégats d'utilisation (jours)"),
+    period: str = Query("month", pattern="^(week|month|year)$", description="Période des statistiques d'activité"),
+    user_data: dict = Depends(get_user_from_token)
+):
     """
     📊 STATISTIQUES D'UTILISATION IA
     
     Monitoring:
     - Nombre de requêtes
-    - Cache hit rate
+    - Cache hit rate (hits mémoire / SQLite, miss, évictions)
+    - Cache sémantique (questions quasi identiques): hit rate, tokens et coût économisés
+    - Limiteur OpenAI: appels regroupés, refus 429, temps d'attente p50/p95
     - Tokens utilisés
     - Coût estimé
+    - usage: agrégats persistants de l'entreprise, tous workers (latence p50/p95 par fonction,
+      coût par jour) depuis ai_usage_events
+    - statistics: devis / recherches par statut et par période, nombre de clients
+      (get_period_statistics, mêmes données que la function IA get_statistics)
     """
     try:
         if not AI_SERVICE_AVAILABLE:
@@ -1819,10 +2128,17 @@ async def ai_stats(user_data: dict = Depends(get_user_from_token)):
         
         ai_service = get_ai_service()
         stats = ai_service.get_stats()
+        company_id = await get_user_company(user_data)
+        usage, statistics = await asyncio.gather(
+            ai_service.telemetry.rollup(company_id, days),
+            ai_service.period_stats.get(company_id, period),
+        )
         
         return {
             "success": True,
             "stats": stats,
+            "usage": usage,
+            "statistics": statistics,
             "mode": "simulation" if ai_service.simulation_mode else "production"
         }
     
@@ -2040,6 +2356,7 @@ async def create_user(request: Request, user_data: dict = Depends(get_user_from_
         # Insérer dans Supabase
         response = supabase_service.table("users").insert(new_user).execute()
         logger.info(f"✅ Response data: {response.data}")
+        _directory_write("users", response.data)
         
         if not response.data:
             raise HTTPException(status_code=500, detail="Échec de la création de l'utilisateur")
@@ -2059,6 +2376,7 @@ async def create_user(request: Request, user_data: dict = Depends(get_user_from_
                     "notes": body.get("notes", "")
                 }
                 supabase_service.table("team_leader_collaborators").insert(assignment).execute()
+                _invalidate_team_leader_stats(created_user.get("company_id"))
             except Exception as e:
                 # Ne pas bloquer la création si l'assignation échoue
                 logger.warning(f"Avertissement: assignation échouée - {str(e)}")
@@ -2099,6 +2417,7 @@ async def delete_user(user_id: str, user_data: dict = Depends(get_user_from_toke
         
         # Supprimer l'utilisateur
         response = supabase_service.table("users").delete().eq("id", user_id).execute()
+        _directory_write("users", None, deleted_id=user_id)
         
         return {"message": "Utilisateur supprimé avec succès", "id": user_id}
         
@@ -2170,6 +2489,7 @@ async def update_my_profile(request: Request, user_data: dict = Depends(get_user
         try:
             response = supabase_service.table("users").update(update_data).eq("id", user_id).execute()
             logger.debug(f"📊 Response de Supabase: {response}")
+            _directory_write("users", response.data)
         except Exception as supabase_error:
             logger.error(f"❌ ERREUR SUPABASE: {str(supabase_error)}")
             error_msg = str(supabase_error)
@@ -2218,6 +2538,7 @@ async def update_user_role(user_id: str, user_update: dict, user_data: dict = De
         update_data = {k: v for k, v in user_update.items() if k in allowed_fields}
         
         response = supabase_service.table("users").update(update_data).eq("id", user_id).execute()
+        _directory_write("users", response.data)
         return response.data[0] if response.data else {}
     except HTTPException:
         raise
@@ -2411,6 +2732,7 @@ async def create_worksite(worksite_data: dict, user_data: dict = Depends(get_use
             logging.info(f"👥 Équipe à affecter (pour usage futur): {team_id}")
         
         response = supabase_service.table("worksites").insert(clean_data).execute()
+        _directory_write("worksites", response.data)
         return response.data[0] if response.data else {}
     except Exception as e:
         logging.error(f"❌ Erreur création worksite: {str(e)}")
@@ -2508,7 +2830,7 @@ async def recalculate_worksite_progress(worksite_id: str, user_data: dict = Depe
         raise HTTPException(status_code=500, detail=f"Erreur lors du recalcul du progress: {str(e)}")
 
 @api_router.put("/worksites/{worksite_id}")
-async def update_worksite(worksite_id: str, worksite_data: dict, user_data: dict = Depends(get_user_from_token)):
+async def update_worksite(worksite_id: str, worksite_data: dict, background_tasks: BackgroundTasks, user_data: dict = Depends(get_user_from_token)):
     """Modifier un chantier existant"""
     try:
         company_id = await get_user_company(user_data)
@@ -2583,11 +2905,16 @@ async def update_worksite(worksite_id: str, worksite_data: dict, user_data: dict
                             logging.info(f"🔄 Mise à jour des dates du schedule: {new_start_date} à {new_end_date}")
                             
                             # Mettre à jour le(s) schedule(s) existant(s) avec les nouvelles dates
+                            updated_schedules = []
                             for schedule in schedules_resp.data:
-                                supabase_service.table("schedules").update({
+                                updated = supabase_service.table("schedules").update({
                                     "start_date": new_start_date.isoformat(),
                                     "end_date": new_end_date.isoformat()
                                 }).eq("id", schedule["id"]).execute()
+                                updated_schedules.extend(updated.data or [])
+                            _invalidate_ics_feeds(*schedules_resp.data)
+                            # Anciens jours libérés, nouveaux jours occupés
+                            background_tasks.add_task(_refresh_availability, company_id, *schedules_resp.data, *updated_schedules)
                             
                             logging.info(f"  ✅ {len(schedules_resp.data)} schedule(s) mis à jour")
             
@@ -2598,6 +2925,7 @@ async def update_worksite(worksite_id: str, worksite_data: dict, user_data: dict
                 # Ne pas bloquer la mise à jour du chantier
         
         response = supabase_service.table("worksites").update(clean_data).eq("id", worksite_id).execute()
+        _directory_write("worksites", response.data)
         
         logging.info(f"✅ Chantier modifié avec succès")
         return response.data[0] if response.data else {}
@@ -2623,6 +2951,7 @@ async def delete_worksite(worksite_id: str, user_data: dict = Depends(get_user_f
             raise HTTPException(status_code=404, detail="Chantier non trouvé ou accès refusé")
         
         supabase_service.table("worksites").delete().eq("id", worksite_id).execute()
+        _directory_write("worksites", None, company_id, deleted_id=worksite_id)
         return {"message": "Chantier supprimé avec succès"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du chantier: {str(e)}")
@@ -2822,6 +3151,7 @@ async def update_search(search_id: str, update: SearchUpdate, user_data: dict =
             return {"message": "Aucune modification"}
         logger.info(f"🔧 Update payload for search {search_id}: {update_payload}")
         response = supabase_service.table("searches").update(update_payload).eq("id", search_id).execute()
+        _ai_data_changed(item.get("company_id") or company_id)
         logger.info(f"✅ Supabase response après UPDATE: {response.data}")
         
         # Vérifier que le status a bien été mis à jour
@@ -2910,9 +3240,8 @@ async def get_search(search_id: str, user_data: dict = Depends(get_user_from_tok
         if role != UserRole.ADMIN.value and item.get("user_id") != user_data.get("id"):
             raise HTTPException(status_code=403, detail="Accès refusé")
         
-        # Les photos sont déjà dans le champ "photos" (JSONB) de la table searches
-        # Pas besoin de requête supplémentaire
-        photos = item.get("photos") or []
+        # Les photos sont dans la table search_photos (une ligne par photo)
+        photos = _attach_search_photos([item])[0].get("photos") or []
         logging.info(f"✅ Photos récupérées pour recherche {search_id}: {len(photos)} photos")
         
         return item
@@ -2937,14 +3266,17 @@ async def _delete_or_archive_search(search_id: str, user_data: dict):
     status = (item.get("status") or "").upper()
     if status == SearchStatus.DRAFT.value:
         supabase_service.table("searches").delete().eq("id", search_id).execute()
+        _ai_data_changed(item.get("company_id") or company_id)
         return {"message": "Brouillon supprimé définitivement"}
     elif status == SearchStatus.ARCHIVED.value:
         # Supprimer définitivement les recherches déjà archivées
         supabase_service.table("searches").delete().eq("id", search_id).execute()
+        _ai_data_changed(item.get("company_id") or company_id)
         return {"message": "Recherche archivée supprimée définitivement"}
     else:
         # Archiver les recherches ACTIVE, SHARED, PROCESSED
         response = supabase_service.table("searches").update({"status": SearchStatus.ARCHIVED.value}).eq("id", search_id).execute()
+        _ai_data_changed(item.get("company_id") or company_id)
         return {"message": "Recherche archivée", "search": response.data[0] if response.data else None}
 
 @api_router.delete("/searches/{search_id}")
@@ -2970,17 +3302,134 @@ async def delete_search_post(search_id: str, user_data: dict = Depends(get_user_
 # Routes pour gérer les photos des recherches
 STORAGE_BUCKET = os.environ.get('SUPABASE_STORAGE_BUCKET', 'search-photos')
 
+# Les métadonnées photo vivent dans la table search_photos (une ligne par photo).
+# La vue search_photos_numbered calcule "number" côté base (plus de renumérotation).
+SEARCH_PHOTO_FIELDS = (
+    "search_id, filename, original_name, storage_path, url, section_id, is_profile, notes, uploaded_at, number, "
+    "taken_at, latitude, longitude, width, height"
+)
+# Métadonnées extraites une seule fois à l'upload (voir photo_processing.normalize_photo)
+SEARCH_PHOTO_METADATA = ("taken_at", "latitude", "longitude", "width", "height")
+
+def _format_search_photo(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Convertit une ligne search_photos au format historique du tableau searches.photos."""
+    photo = {
+        "filename": row.get("filename"),
+        "original_name": row.get("original_name"),
+        "storage_path": row.get("storage_path"),
+        "url": row.get("url"),
+        "section_id": row.get("section_id"),
+        "number": row.get("number"),
+        "uploaded_at": row.get("uploaded_at"),
+    }
+    if row.get("is_profile"):
+        photo["is_profile"] = True
+    if row.get("notes"):
+        photo["notes"] = row["notes"]
+    for key in SEARCH_PHOTO_METADATA:
+        if row.get(key) is not None:
+            photo[key] = row[key]
+    return photo
+
+def _photo_taken_label(photo: Dict[str, Any]) -> str:
+    """Libellé de la date de prise de vue pour les rapports (vide si inconnue)."""
+    try:
+        taken = datetime.fromisoformat(str(photo.get("taken_at")))
+    except (TypeError, ValueError):
+        return ""
+    return f"Prise le {taken.strftime('%d/%m/%Y à %H:%M')}"
+
+async def _ingest_search_photo(search_id: str, content: bytes, original_name: str, content_type: Optional[str]) -> Dict[str, Any]:
+    """Normalise une photo (rotation EXIF, suppression EXIF), l'envoie dans le Storage et retourne ses métadonnées."""
+    # Décodage/encodage hors de la boucle d'événements
+    normalized, normalized_type, metadata = await asyncio.to_thread(normalize_photo, content, content_type)
+    
+    # Générer un nom de fichier unique
+    file_extension = extension_for(normalized_type, Path(original_name or "").suffix)
+    unique_filename = f"{uuid.uuid4()}{file_extension}"
+    storage_path = f"{search_id}/{unique_filename}"
+    
+    # Upload vers Supabase Storage
+    supabase_service.storage.from_(STORAGE_BUCKET).upload(
+        path=storage_path,
+        file=normalized,
+        file_options={"content-type": normalized_type}
+    )
+    
+    # Générer l'URL publique signée (valide 1 an)
+    signed_url = supabase_service.storage.from_(STORAGE_BUCKET).create_signed_url(
+        path=storage_path,
+        expires_in=31536000  # 1 an
+    )
+    
+    # Métadonnées de la photo (le numéro est calculé par la base)
+    return {
+        "filename": unique_filename,
+        "original_name": original_name,
+        "storage_path": storage_path,
+        "url": signed_url.get('signedURL') if signed_url else None,
+        "uploaded_at": datetime.utcnow().isoformat(),
+        "content_type": normalized_type,
+        "size_bytes": len(normalized),
+        **metadata,
+    }
+
+def _list_search_photos(search_id: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Photos d'une recherche, dans l'ordre d'upload (filtres optionnels sur les métadonnées indexées)."""
+    filters = filters or {}
+    query = supabase_service.table("search_photos_numbered") \
+        .select(SEARCH_PHOTO_FIELDS) \
+        .eq("search_id", search_id)
+    if filters.get("section_id"):
+        query = query.eq("section_id", filters["section_id"])
+    if filters.get("taken_after"):
+        query = query.gte("taken_at", filters["taken_after"])
+    if filters.get("taken_before"):
+        query = query.lte("taken_at", filters["taken_before"])
+    if filters.get("has_gps") is True:
+        query = query.not_.is_("latitude", None)
+    elif filters.get("has_gps") is False:
+        query = query.is_("latitude", None)
+    res = query.order("position").execute()
+    return [_format_search_photo(r) for r in (res.data or [])]
+
+def _attach_search_photos(searches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Renseigne le champ "photos" de plusieurs recherches en une seule requête."""
+    ids = [s["id"] for s in searches if s.get("id")]
+    if not ids:
+        return searches
+    try:
+        res = supabase_service.table("search_photos_numbered") \
+            .select(SEARCH_PHOTO_FIELDS) \
+            .in_("search_id", ids) \
+            .order("position") \
+            .execute()
+    except Exception as e:
+        # Migration search_photos non appliquée: on garde l'ancienne colonne JSONB
+        logging.warning(f"⚠️ search_photos indisponible, fallback searches.photos: {e}")
+        return searches
+    by_search: Dict[str, List[Dict[str, Any]]] = {}
+    for row in res.data or []:
+        by_search.setdefault(row.get("search_id"), []).append(_format_search_photo(row))
+    for s in searches:
+        s["photos"] = by_search.get(s.get("id"), [])
+    return searches
+
 @api_router.get("/searches/{search_id}/photos")
 async def get_search_photos(
     search_id: str,
+    section_id: Optional[str] = Query(None),
+    taken_after: Optional[datetime] = Query(None, description="Prises de vue à partir de (EXIF)"),
+    taken_before: Optional[datetime] = Query(None, description="Prises de vue jusqu'à (EXIF)"),
+    has_gps: Optional[bool] = Query(None),
     user_data: dict = Depends(get_user_from_token)
 ):
-    """Récupérer toutes les photos d'une recherche"""
+    """Récupérer les photos d'une recherche (filtrables par section, date de prise de vue et GPS)"""
     try:
         # Vérifier que la recherche existe
         company_id = await get_user_company(user_data)
         response = supabase_service.table("searches") \
-            .select("id, photos, company_id") \
+            .select("id, company_id") \
             .eq("id", search_id) \
             .execute()
         
@@ -2993,8 +3442,13 @@ async def get_search_photos(
         if company_id and search.get("company_id") != company_id:
             raise HTTPException(status_code=403, detail="Accès refusé")
         
-        # Retourner les photos (tableau stocké dans la colonne photos)
-        return search.get("photos") or []
+        # Retourner les photos (une ligne par photo dans search_photos)
+        return _list_search_photos(search_id, {
+            "section_id": section_id,
+            "taken_after": taken_after.isoformat() if taken_after else None,
+            "taken_before": taken_before.isoformat() if taken_before else None,
+            "has_gps": has_gps,
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -3013,7 +3467,7 @@ async def upload_search_photos(
     try:
         # Vérifier que la recherche existe et appartient à l'utilisateur
         company_id = await get_user_company(user_data)
-        existing = supabase_service.table("searches").select("id, user_id, company_id, photos").eq("id", search_id).execute()
+        existing = supabase_service.table("searches").select("id, user_id, company_id").eq("id", search_id).execute()
         if not existing.data:
             raise HTTPException(status_code=404, detail="Recherche introuvable")
         
@@ -3021,63 +3475,31 @@ async def upload_search_photos(
         if company_id and search.get("company_id") != company_id:
             raise HTTPException(status_code=403, detail="Accès refusé")
         
-        # Récupérer les photos existantes
-        photos = search.get("photos") or []
-        
         # Uploader les nouvelles photos vers Supabase Storage
         uploaded_files = []
         for index, file in enumerate(files):
-            # Générer un nom de fichier unique
-            file_extension = Path(file.filename).suffix
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            storage_path = f"{search_id}/{unique_filename}"
-            
-            # Lire le contenu du fichier
+            # Normalisation EXIF + upload Storage (métadonnées extraites une seule fois ici)
             content = await file.read()
-            
-            # Upload vers Supabase Storage
-            supabase_service.storage.from_(STORAGE_BUCKET).upload(
-                path=storage_path,
-                file=content,
-                file_options={"content-type": file.content_type}
-            )
-            
-            # Générer l'URL publique signée (valide 1 an)
-            signed_url = supabase_service.storage.from_(STORAGE_BUCKET).create_signed_url(
-                path=storage_path,
-                expires_in=31536000  # 1 an
-            )
-            
-            # Ajouter à la liste des photos
-            photo_info = {
-                "filename": unique_filename,
-                "original_name": file.filename,
-                "storage_path": storage_path,
-                "url": signed_url.get('signedURL') if signed_url else None,
-                "section_id": section_id,  # Lier la photo à sa section
-                "number": len(photos) + len(uploaded_files) + 1,
-                "uploaded_at": datetime.utcnow().isoformat()
-            }
+            photo_info = await _ingest_search_photo(search_id, content, file.filename, file.content_type)
             
             # Marquer la première photo comme photo de profil si is_profile est 'true'
             if index == 0 and is_profile == 'true':
                 photo_info["is_profile"] = True
-                # Retirer le flag is_profile des autres photos existantes
-                for p in photos:
-                    if p.get("is_profile"):
-                        p["is_profile"] = False
             
             uploaded_files.append(photo_info)
         
-        # Éviter les doublons : retirer les anciennes photos de la même section avant d'ajouter les nouvelles
-        if section_id:
-            photos = [p for p in photos if p.get("section_id") != section_id]
-        
-        # Mettre à jour la base de données
-        photos.extend(uploaded_files)
-        supabase_service.table("searches").update({"photos": photos}).eq("id", search_id).execute()
+        # Insertion atomique: remplace les photos de la même section (évite les doublons)
+        # et retire l'ancien flag is_profile dans la même transaction
+        inserted = supabase_service.rpc("add_search_photos", {
+            "p_search_id": search_id,
+            "p_company_id": search.get("company_id"),
+            "p_section_id": section_id,
+            "p_photos": uploaded_files,
+            "p_is_profile": is_profile == 'true',
+        }).execute()
+        photos = [_format_search_photo(r) for r in (inserted.data or [])]
         
-        return {"message": f"{len(uploaded_files)} photo(s) uploadée(s)", "photos": uploaded_files}
+        return {"message": f"{len(photos)} photo(s) uploadée(s)", "photos": photos}
     except HTTPException:
         raise
     except Exception as e:
@@ -3090,7 +3512,7 @@ async def get_search_photo(search_id: str, filename: str, user_data: dict = Depe
     try:
         # Vérifier l'accès
         company_id = await get_user_company(user_data)
-        existing = supabase_service.table("searches").select("id, company_id, photos").eq("id", search_id).execute()
+        existing = supabase_service.table("searches").select("id, company_id").eq("id", search_id).execute()
         if not existing.data:
             raise HTTPException(status_code=404, detail="Recherche introuvable")
         
@@ -3099,8 +3521,13 @@ async def get_search_photo(search_id: str, filename: str, user_data: dict = Depe
             raise HTTPException(status_code=403, detail="Accès refusé")
         
         # Trouver la photo dans les métadonnées
-        photos = search.get("photos") or []
-        photo = next((p for p in photos if p.get("filename") == filename), None)
+        photo_res = supabase_service.table("search_photos") \
+            .select("filename, url") \
+            .eq("search_id", search_id) \
+            .eq("filename", filename) \
+            .limit(1) \
+            .execute()
+        photo = photo_res.data[0] if photo_res.data else None
         
         if not photo:
             raise HTTPException(status_code=404, detail="Photo introuvable")
@@ -3133,7 +3560,7 @@ async def delete_search_photo(search_id: str, filename: str, user_data: dict = D
     try:
         # Vérifier l'accès
         company_id = await get_user_company(user_data)
-        existing = supabase_service.table("searches").select("id, company_id, photos").eq("id", search_id).execute()
+        existing = supabase_service.table("searches").select("id, company_id").eq("id", search_id).execute()
         if not existing.data:
             raise HTTPException(status_code=404, detail="Recherche introuvable")
         
@@ -3148,22 +3575,186 @@ async def delete_search_photo(search_id: str, filename: str, user_data: dict = D
         except Exception as storage_error:
             logging.warning(f"Storage deletion failed (may not exist): {storage_error}")
         
-        # Mettre à jour la liste des photos dans la BDD
-        photos = search.get("photos") or []
-        photos = [p for p in photos if p.get("filename") != filename]
-        
-        # Renuméroter les photos restantes
-        for idx, photo in enumerate(photos):
-            photo["number"] = idx + 1
-        
-        supabase_service.table("searches").update({"photos": photos}).eq("id", search_id).execute()
+        # Suppression atomique de la ligne (la renumérotation est faite par la vue)
+        supabase_service.table("search_photos").delete().eq("search_id", search_id).eq("filename", filename).execute()
+        remaining = supabase_service.table("search_photos") \
+            .select("id", count="exact") \
+            .eq("search_id", search_id) \
+            .execute()
         
-        return {"message": "Photo supprimée", "remaining_photos": len(photos)}
+        return {"message": "Photo supprimée", "remaining_photos": remaining.count or 0}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur suppression photo: {str(e)}")
 
+# ============================================================================
+# UPLOADS REPRENABLES (réseau mobile instable)
+# ============================================================================
+# Protocole inspiré de tus.io:
+#   1. POST   /searches/{id}/uploads                      -> crée la session (upload_id, offset=0)
+#   2. PATCH  /searches/{id}/uploads/{upload_id}          -> envoie des octets, en-tête Upload-Offset
+#   3. HEAD   /searches/{id}/uploads/{upload_id}          -> offset reçu (reprise après coupure)
+#   4. POST   /searches/{id}/uploads/{upload_id}/finalize -> normalisation + Storage + search_photos
+#      (idempotent: rejouée, elle renvoie la même réponse sans créer de nouvelle photo)
+# Les octets déjà reçus sont conservés sur disque: une coupure ne coûte que la partie manquante.
+# Le répertoire est local à l'instance (tempdir par défaut): avec plusieurs instances, activer un
+# routage collant pour /searches/*/uploads ou pointer RESUMABLE_UPLOADS_DIR vers un volume partagé,
+# sinon une reprise ou une finalisation servie par une autre instance renvoie 404.
+
+RESUMABLE_UPLOADS_DIR = Path(os.environ.get("RESUMABLE_UPLOADS_DIR", Path(tempfile.gettempdir()) / "skyapp-resumable-uploads"))
+resumable_uploads = ResumableUploadStore(RESUMABLE_UPLOADS_DIR)
+
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    length: int = Field(..., gt=0, description="Taille totale du fichier en octets (Upload-Length)")
+    content_type: Optional[str] = None
+    section_id: Optional[str] = None
+    is_profile: bool = False
+
+def _upload_headers(session: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "Upload-Offset": str(session["offset"]),
+        "Upload-Length": str(session["length"]),
+        "Cache-Control": "no-store",
+    }
+
+async def _check_search_photo_access(search_id: str, user_data: dict) -> Dict[str, Any]:
+    """Vérifie que la recherche existe et appartient à l'entreprise de l'utilisateur."""
+    company_id = await get_user_company(user_data)
+    existing = supabase_service.table("searches").select("id, user_id, company_id").eq("id", search_id).execute()
+    if not existing.data:
+        raise HTTPException(status_code=404, detail="Recherche introuvable")
+    search = existing.data[0]
+    if company_id and search.get("company_id") != company_id:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    return search
+
+async def _get_upload_session(search_id: str, upload_id: str, user_data: dict) -> Dict[str, Any]:
+    """Session d'upload appartenant à cette recherche et à cet utilisateur."""
+    try:
+        session = await resumable_uploads.get(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    meta = session.get("metadata") or {}
+    if meta.get("search_id") != search_id or meta.get("user_id") != user_data.get("id"):
+        raise HTTPException(status_code=404, detail="Upload introuvable")
+    return session
+
+@api_router.post("/searches/{search_id}/uploads", status_code=201)
+async def create_resumable_upload(search_id: str, payload: ResumableUploadCreate, user_data: dict = Depends(get_user_from_token)):
+    """Ouvrir une session d'upload reprenable pour une photo"""
+    try:
+        search = await _check_search_photo_access(search_id, user_data)
+        session = await resumable_uploads.create(payload.length, {
+            "search_id": search_id,
+            "company_id": search.get("company_id"),
+            "user_id": user_data.get("id"),
+            "filename": payload.filename,
+            "content_type": payload.content_type,
+            "section_id": payload.section_id,
+            "is_profile": payload.is_profile,
+        })
+        location = f"/api/searches/{search_id}/uploads/{session['id']}"
+        return JSONResponse(
+            status_code=201,
+            content={"upload_id": session["id"], "offset": 0, "length": session["length"], "location": location},
+            headers={**_upload_headers(session), "Location": location},
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error creating resumable upload: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erreur création upload: {str(e)}")
+
+@api_router.head("/searches/{search_id}/uploads/{upload_id}")
+@api_router.get("/searches/{search_id}/uploads/{upload_id}")
+async def get_resumable_upload(search_id: str, upload_id: str, user_data: dict = Depends(get_user_from_token)):
+    """Offset déjà reçu pour une session (à appeler avant de reprendre)"""
+    session = await _get_upload_session(search_id, upload_id, user_data)
+    return JSONResponse(
+        content={"upload_id": upload_id, "offset": session["offset"], "length": session["length"]},
+        headers=_upload_headers(session),
+    )
+
+@api_router.patch("/searches/{search_id}/uploads/{upload_id}")
+async def patch_resumable_upload(search_id: str, upload_id: str, request: Request, user_data: dict = Depends(get_user_from_token)):
+    """Ajouter des octets à partir de Upload-Offset (corps brut, application/offset+octet-stream)"""
+    await _get_upload_session(search_id, upload_id, user_data)
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="En-tête Upload-Offset manquant ou invalide")
+    try:
+        # Corps lu en flux: les octets arrivés avant une coupure restent acquis
+        session = await resumable_uploads.append(upload_id, offset, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    return JSONResponse(
+        content={"upload_id": upload_id, "offset": session["offset"], "length": session["length"]},
+        headers=_upload_headers(session),
+    )
+
+@api_router.post("/searches/{search_id}/uploads/{upload_id}/finalize")
+async def finalize_resumable_upload(search_id: str, upload_id: str, user_data: dict = Depends(get_user_from_token)):
+    """Assembler l'upload et l'enregistrer comme photo de la recherche (même format que POST /photos)"""
+    try:
+        # Identifiant validé avant de créer un verrou (pas d'entrée pour un id inconnu)
+        upload_lock = resumable_uploads.lock(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    async with upload_lock:
+        # Finalisation rejouée (réponse perdue): même résultat, sans nouvelle photo
+        done = await resumable_uploads.finalized(upload_id)
+        if done is not None:
+            meta = done.get("metadata") or {}
+            if meta.get("search_id") != search_id or meta.get("user_id") != user_data.get("id"):
+                raise HTTPException(status_code=404, detail="Upload introuvable")
+            return done["response"]
+        
+        session = await _get_upload_session(search_id, upload_id, user_data)
+        meta = session.get("metadata") or {}
+        try:
+            content = await resumable_uploads.read_complete(upload_id)
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.message)
+        try:
+            await _check_search_photo_access(search_id, user_data)
+            
+            # Même chaîne que l'upload multipart: normalisation EXIF, Storage, métadonnées
+            photo_info = await _ingest_search_photo(search_id, content, meta.get("filename"), meta.get("content_type"))
+            photo_info["is_profile"] = bool(meta.get("is_profile"))
+            
+            # Insertion atomique d'une seule ligne (les autres photos de la section sont
+            # conservées), l'ancien flag is_profile retiré dans la même transaction
+            inserted = supabase_service.rpc("add_search_photos", {
+                "p_search_id": search_id,
+                "p_company_id": meta.get("company_id"),
+                "p_section_id": meta.get("section_id"),
+                "p_photos": [photo_info],
+                "p_is_profile": photo_info["is_profile"],
+                "p_replace_section": False,
+            }).execute()
+            
+            photos = [_format_search_photo(r) for r in (inserted.data or [])]
+            response = {"message": f"{len(photos)} photo(s) uploadée(s)", "photos": photos}
+            await resumable_uploads.complete(upload_id, {"metadata": meta, "response": response})
+            return response
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Error finalizing resumable upload: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Erreur finalisation upload: {str(e)}")
+
+@api_router.delete("/searches/{search_id}/uploads/{upload_id}")
+async def cancel_resumable_upload(search_id: str, upload_id: str, user_data: dict = Depends(get_user_from_token)):
+    """Abandonner une session d'upload"""
+    await _get_upload_session(search_id, upload_id, user_data)
+    resumable_uploads.discard(upload_id)
+    return {"message": "Upload annulé"}
+
 # ============================================================================
 # GÉNÉRATION PDF POUR RECHERCHES
 # ============================================================================
@@ -3192,7 +3783,7 @@ async def generate_search_pdf(
             logging.error(f"❌ [PDF] Recherche introuvable")
             raise HTTPException(status_code=404, detail="Recherche introuvable")
         
-        search = response.data[0]
+        search = _attach_search_photos([response.data[0]])[0]
         logging.info(f"✅ [PDF] Recherche: {search.get('location', 'N/A')}, photos: {len(search.get('photos', []))}")
         
         # Permissions
@@ -3420,6 +4011,11 @@ async def generate_search_pdf(
                                                              fontSize=7.5, textColor=colors.Color(0.4, 0.4, 0.4),
                                                              alignment=TA_CENTER, fontName='Helvetica-Oblique')
                                 
+                                # Date de prise de vue extraite à l'upload (pas de relecture EXIF)
+                                taken_label = _photo_taken_label(photo)
+                                if taken_label:
+                                    caption = f"{taken_label}<br/>{caption}" if caption else taken_label
+                                
                                 caption_para = Paragraph(f"📷 Photo {photo_counter}<br/>{caption}" if caption else f"📷 Photo {photo_counter}", caption_style)
                                 
                                 # Conteneur photo + légende
@@ -4035,6 +4631,7 @@ async def create_client(client_data: ClientCreate, user_data: dict = Depends(get
         }
         
         response = supabase_service.table("clients").insert(new_client).execute()
+        _directory_write("clients", response.data)
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création du client: {str(e)}")
@@ -4056,6 +4653,7 @@ async def update_client(client_id: str, client_data: ClientCreate, user_data: di
         response = supabase_service.table("clients").update(updated_client).eq("id", client_id).eq("company_id", company_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Client non trouvé ou vous n'avez pas accès à ce client")
+        _directory_write("clients", response.data, company_id)
         return response.data[0]
     except HTTPException:
         raise
@@ -4091,6 +4689,7 @@ async def delete_client(client_id: str, user_data: dict = Depends(get_user_from_
         response = supabase_service.table("clients").delete().eq("id", client_id).eq("company_id", company_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Client non trouvé ou vous n'avez pas accès à ce client")
+        _directory_write("clients", None, company_id, deleted_id=client_id)
         return {"message": "Client supprimé avec succès", "deleted_client": response.data[0]}
     except HTTPException:
         raise
@@ -4281,6 +4880,8 @@ async def create_quote(quote_data: dict, user_data: dict = Depends(get_user_from
         
         response = supabase_service.table("quotes").insert(new_quote).execute()
         logger.info(f"Devis créé avec succès: {response.data[0]}")
+        _ai_data_changed(company_id)
+        _quote_index_write(company_id, response.data[0])
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création du devis: {str(e)}")
@@ -4330,14 +4931,17 @@ async def update_quote(quote_id: str, quote_data: dict, user_data: dict = Depend
         
         # Mise à jour
         response = supabase_service.table("quotes").update(update_data).eq("id", quote_id).execute()
+        _ai_data_changed(company_id)
         
         # Vérifier que la réponse contient des données
         if response.data and len(response.data) > 0:
+            _quote_index_write(company_id, response.data[0])
             return response.data[0]
         else:
             # Si pas de données retournées, récupérer le devis mis à jour
             updated = supabase_service.table("quotes").select("*").eq("id", quote_id).execute()
             if updated.data and len(updated.data) > 0:
+                _quote_index_write(company_id, updated.data[0])
                 return updated.data[0]
             else:
                 raise HTTPException(status_code=500, detail="Erreur lors de la récupération du devis mis à jour")
@@ -4361,6 +4965,8 @@ async def delete_quote(quote_id: str, user_data: dict = Depends(get_user_from_to
         
         # Suppression
         supabase_service.table("quotes").delete().eq("id", quote_id).execute()
+        _ai_data_changed(company_id)
+        _quote_index_write(company_id, deleted_id=quote_id)
         return {"message": "Devis supprimé avec succès"}
     except HTTPException:
         raise
@@ -5536,6 +6142,8 @@ async def create_team_leader(leader_data: dict, user_data: dict = Depends(get_us
         
         # Insérer dans la base de données
         response = supabase_service.table("planning_team_leaders").insert(insert_data).execute()
+        _invalidate_team_leader_stats(company_id)
+        _directory_write("planning_team_leaders", response.data, company_id)
         
         return response.data[0] if response.data else {}
     except HTTPException:
@@ -5564,6 +6172,8 @@ async def delete_team_leader(team_leader_id: str, user_data: dict = Depends(get_
         
         # Supprimer le chef d'équipe
         supabase_service.table("planning_team_leaders").delete().eq("id", team_leader_id).execute()
+        _invalidate_team_leader_stats(company_id)
+        _directory_write("planning_team_leaders", None, company_id, deleted_id=team_leader_id)
         
         return {"message": "Chef d'équipe supprimé avec succès"}
     except HTTPException:
@@ -5782,6 +6392,7 @@ async def create_schedule_old_disabled(schedule_data: dict, user_data: dict):
         # Insérer dans la base de données
         response = supabase_service.table("schedules").insert(insert_data).execute()
         logger.info(f"✅ Schedule créé avec succès: {response.data}")
+        _invalidate_ics_feeds(*(response.data or []))
         
         # Recalculer le progress du chantier si un worksite_id est fourni
         if worksite_id:
@@ -5803,7 +6414,7 @@ async def create_schedule_old_disabled(schedule_data: dict, user_data: dict):
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création du planning: {str(e)}")
 
 @api_router.put("/schedules/{schedule_id}")
-async def update_schedule(schedule_id: str, schedule_data: dict, user_data: dict = Depends(get_user_from_token)):
+async def update_schedule(schedule_id: str, schedule_data: dict, background_tasks: BackgroundTasks, user_data: dict = Depends(get_user_from_token)):
     """Modifier un planning existant (ADMIN/BUREAU uniquement)"""
     try:
         # Vérifier que l'utilisateur est ADMIN ou BUREAU
@@ -5827,7 +6438,25 @@ async def update_schedule(schedule_id: str, schedule_data: dict, user_data: dict
             if field in schedule_data:
                 update_data[field] = schedule_data[field]
         
+        # Garder date / start_date / end_date cohérents (comme PATCH)
+        if update_data.get("date"):
+            update_data["start_date"] = update_data["end_date"] = update_data["date"]
+        
+        # Vérifier conflits si date/horaire/technicien/statut changent
+        if any(k in update_data for k in ("collaborator_id", "date", "time", "hours", "status")):
+            merged = {**existing.data[0], **update_data, "id": schedule_id}
+            if str(merged.get("status") or "").lower() not in INACTIVE_STATUSES and merged.get("collaborator_id"):
+                slot = ScheduleSlot.from_row(merged)
+                if slot is None:
+                    raise HTTPException(status_code=400, detail="Date ou horaire invalide")
+                conflicts = _schedule_conflicts(company_id, slot, exclude_id=schedule_id)
+                if conflicts:
+                    raise _schedule_conflict_error(conflicts)
+        
         response = supabase_service.table("schedules").update(update_data).eq("id", schedule_id).execute()
+        _invalidate_ics_feeds(existing.data[0], *(response.data or []))
+        _ai_data_changed(company_id)
+        background_tasks.add_task(_refresh_availability, company_id, existing.data[0], *(response.data or []))
         
         # Recalculer le progress du chantier si un worksite_id est présent
         worksite_id = update_data.get("worksite_id") or existing.data[0].get("worksite_id")
@@ -5846,7 +6475,7 @@ async def update_schedule(schedule_id: str, schedule_data: dict, user_data: dict
         raise HTTPException(status_code=500, detail=f"Erreur lors de la modification du planning: {str(e)}")
 
 @api_router.delete("/schedules/{schedule_id}")
-async def delete_schedule(schedule_id: str, user_data: dict = Depends(get_user_from_token)):
+async def delete_schedule(schedule_id: str, background_tasks: BackgroundTasks, user_data: dict = Depends(get_user_from_token)):
     """Supprimer un planning (ADMIN uniquement)"""
     try:
         # Vérifier que l'utilisateur est ADMIN
@@ -5866,6 +6495,9 @@ async def delete_schedule(schedule_id: str, user_data: dict = Depends(get_user_f
         
         # Supprimer
         supabase_service.table("schedules").delete().eq("id", schedule_id).execute()
+        _invalidate_ics_feeds(existing.data[0])
+        _ai_data_changed(company_id)
+        background_tasks.add_task(_refresh_availability, company_id, existing.data[0])
         
         # Recalculer le progress du chantier si un worksite_id était présent
         if worksite_id:
@@ -5882,11 +6514,96 @@ async def delete_schedule(schedule_id: str, user_data: dict = Depends(get_user_f
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du planning: {str(e)}")
 
+# Synchronisation incrémentale des missions (application mobile): curseur = version de
+# synchronisation du technicien (ordre des commits), tombstones et ETag -> mission_sync.py
+MISSION_SYNC_HEADERS = {"Cache-Control": "private, no-cache"}
+
+def _mission_sync_state(company_id: str, collaborator_id: str) -> Optional[Dict[str, int]]:
+    """Version de synchronisation du technicien (une lecture par clé primaire)"""
+    try:
+        res = supabase_service.table("schedule_sync_versions").select("version, purged_version") \
+            .eq("company_id", company_id).eq("collaborator_id", collaborator_id).limit(1).execute()
+    except Exception as e:
+        # Migration 2026-10-19_schedule_sync_versions.sql pas encore appliquée
+        logger.debug(f"schedule_sync_versions indisponible: {e}")
+        return None
+    row = res.data[0] if res.data else {}
+    return {"version": row.get("version") or 0, "purged_version": row.get("purged_version") or 0}
+
+def _mission_tombstones(company_id: str, collaborator_id: str, version: int) -> List[str]:
+    res = supabase_service.table("schedule_tombstones").select("schedule_id") \
+        .eq("company_id", company_id).eq("collaborator_id", collaborator_id) \
+        .gt("sync_version", version).execute()
+    return [row["schedule_id"] for row in res.data or []]
+
+def _mission_sync_response(request: Request, collaborator_id: str, company_id: str, window_key: str,
+                           updated_since: Optional[str], load, left_scope, format_rows, prepare=None) -> Response:
+    """
+    Réponse commune des endpoints de missions:
+    - If-None-Match identique -> 304 sans charger les missions
+    - sans curseur -> liste complète (format historique), curseur dans X-Sync-Cursor
+    - avec curseur -> {"missions": modifiées, "deleted": ids, "cursor", "full_sync"}
+    """
+    try:
+        cursor = parse_sync_cursor(updated_since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Paramètre updated_since invalide (valeur de X-Sync-Cursor attendue)")
+    source = MissionSyncSource(
+        state=lambda: _mission_sync_state(company_id, collaborator_id),
+        load=load,
+        tombstones=lambda version: _mission_tombstones(company_id, collaborator_id, version),
+        left_scope=left_scope,
+        prepare=prepare,
+    )
+    result = synchronize(source, collaborator_id, window_key, cursor,
+                         request.headers.get("if-none-match"), date.today())
+    headers = dict(MISSION_SYNC_HEADERS)
+    if result.etag:
+        headers["ETag"] = result.etag
+    if result.cursor:
+        headers["X-Sync-Cursor"] = result.cursor
+    if result.status_code == 304:
+        return Response(status_code=304, headers=headers)
+    if not result.incremental:
+        return JSONResponse(content=format_rows(result.rows), headers=headers)
+    return JSONResponse(content={
+        "missions": format_rows(result.rows),
+        "deleted": result.deleted,
+        "cursor": result.cursor,
+        "full_sync": result.full_sync,
+    }, headers=headers)
+
+def _format_my_mission(mission: Dict[str, Any]) -> Dict[str, Any]:
+    # Essayer plusieurs champs pour l'adresse
+    location = mission.get("client_address") or mission.get("location") or mission.get("description") or "Adresse non spécifiée"
+    return {
+        "id": mission.get("id"),
+        "title": mission.get("title") or f"{mission.get('intervention_category', 'Mission').capitalize()}",
+        "description": mission.get("description"),
+        "location": location,
+        "date": mission.get("date"),
+        "time": mission.get("time"),
+        "client_name": mission.get("client_name"),
+        "client_contact": mission.get("client_contact"),
+        "intervention_category": mission.get("intervention_category"),
+        "status": mission.get("status"),
+        "worksite_id": mission.get("worksite_id"),
+        "updated_at": mission.get("updated_at"),
+    }
+
 @api_router.get("/planning/my-missions")
-async def get_my_missions(user_data: dict = Depends(get_user_from_token)):
+async def get_my_missions(
+    request: Request,
+    updated_since: Optional[str] = Query(None, description="Curseur de synchronisation (valeur de X-Sync-Cursor)"),
+    user_data: dict = Depends(get_user_from_token),
+):
     """
     Obtenir les missions planifiées pour le technicien connecté
     Retourne les chantiers/RDV assignés au technicien
+    
+    Synchronisation incrémentale: passer `updated_since` (valeur de X-Sync-Cursor ou du champ
+    cursor) pour ne recevoir que les missions modifiées et les ids à retirer (supprimées,
+    réassignées ou sorties de la fenêtre de 30 jours); If-None-Match -> 304.
     """
     try:
         company_id = await get_user_company(user_data)
@@ -5895,48 +6612,101 @@ async def get_my_missions(user_data: dict = Depends(get_user_from_token)):
         
         user_id = user_data.get('id')
         
-        # Récupérer toutes les missions récentes assignées au technicien (30 derniers jours)
-        from datetime import datetime, timedelta
+        # Missions récentes assignées au technicien (30 derniers jours)
         thirty_days_ago = (datetime.now() - timedelta(days=30)).date().isoformat()
         
-        response = supabase_service.table("schedules").select("*")\
-            .eq("company_id", company_id)\
-            .eq("collaborator_id", user_id)\
-            .gte("start_date", thirty_days_ago)\
-            .order("start_date", desc=False)\
-            .execute()
-        
-        missions = response.data if response.data else []
-        
-        # Formater les missions pour le frontend
-        formatted_missions = []
-        for mission in missions:
-            # Essayer plusieurs champs pour l'adresse
-            location = mission.get("client_address") or mission.get("location") or mission.get("description") or "Adresse non spécifiée"
-            
-            formatted_missions.append({
-                "id": mission.get("id"),
-                "title": mission.get("title") or f"{mission.get('intervention_category', 'Mission').capitalize()}",
-                "description": mission.get("description"),
-                "location": location,
-                "date": mission.get("date"),
-                "time": mission.get("time"),
-                "client_name": mission.get("client_name"),
-                "client_contact": mission.get("client_contact"),
-                "intervention_category": mission.get("intervention_category"),
-                "status": mission.get("status"),
-                "worksite_id": mission.get("worksite_id")
-            })
+        def load(version: Optional[int]):
+            q = supabase_service.table("schedules").select("*") \
+                .eq("company_id", company_id).eq("collaborator_id", user_id).gte("start_date", thirty_days_ago)
+            if version is not None:
+                q = q.gt("sync_version", version)
+            return q.order("start_date", desc=False).execute().data or []
+        
+        def left_scope(cursor):
+            # Modifiées hors fenêtre depuis le curseur, ou sorties de la fenêtre glissante depuis son émission
+            window_then = (cursor.issued_on - timedelta(days=30)).isoformat()
+            res = supabase_service.table("schedules").select("id") \
+                .eq("company_id", company_id).eq("collaborator_id", user_id) \
+                .or_(f"and(sync_version.gt.{cursor.version},or(start_date.is.null,start_date.lt.{thirty_days_ago})),"
+                     f"and(start_date.gte.{window_then},start_date.lt.{thirty_days_ago})") \
+                .execute()
+            return [row["id"] for row in res.data or []]
         
-        return formatted_missions
+        return await asyncio.to_thread(
+            _mission_sync_response, request, user_id, company_id, f"my-missions|{thirty_days_ago}",
+            updated_since, load, left_scope, lambda rows: [_format_my_mission(m) for m in rows],
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"❌ Erreur get_my_missions: {str(e)}")
         return []
 
+# Photos des comptes-rendus: fichiers nommés par empreinte SHA-256 sous UPLOADS_DIR
+# (servis via /uploads/mission-reports/...), miniatures générées hors requête
+MISSION_REPORTS_DIR = UPLOADS_DIR / "mission-reports"
+MISSION_REPORT_THUMBS_DIR = MISSION_REPORTS_DIR / "thumbs"
+MISSION_REPORT_THUMB_SIZE = 400
+MISSION_REPORT_CHUNK_SIZE = 1024 * 1024  # lecture des photos reçues par blocs de 1 Mo
+
+async def _store_mission_report_photo(photo: UploadFile) -> Optional[str]:
+    """Enregistre une photo de compte-rendu (dédoublonnée par hash) et retourne son chemin relatif à /uploads."""
+    if not photo.filename:
+        return None
+    
+    # Photo reçue copiée sur disque par blocs, empreinte calculée au fil de l'eau
+    raw_path = MISSION_REPORTS_DIR / f".{uuid.uuid4().hex}.upload"
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(raw_path, "wb") as f:
+            while chunk := await photo.read(MISSION_REPORT_CHUNK_SIZE):
+                sha.update(chunk)
+                size += len(chunk)
+                await f.write(chunk)
+        if not size:
+            return None
+        
+        # Dédoublonnage avant tout traitement: même contenu => même fichier
+        digest = sha.hexdigest()
+        existing = next(MISSION_REPORTS_DIR.glob(f"{digest}.*"), None)
+        if existing is not None:
+            return f"mission-reports/{existing.name}"
+        
+        async with aiofiles.open(raw_path, "rb") as f:
+            content = await f.read()
+        normalized, content_type, _ = await asyncio.to_thread(normalize_photo, content, photo.content_type)
+        filename = f"{digest}{extension_for(content_type, Path(photo.filename).suffix.lower() or '.bin')}"
+        target = MISSION_REPORTS_DIR / filename
+        # Écriture non bloquante dans un fichier temporaire puis renommage atomique
+        tmp_path = MISSION_REPORTS_DIR / f".{filename}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(normalized)
+        os.replace(tmp_path, target)
+        return f"mission-reports/{filename}"
+    finally:
+        try:
+            raw_path.unlink()
+        except FileNotFoundError:
+            pass
+
+def _generate_mission_report_thumbnails(paths: List[str]):
+    """Tâche d'arrière-plan: miniatures JPEG des photos de compte-rendu (ignorées si déjà présentes)."""
+    for rel_path in paths:
+        try:
+            source = UPLOADS_DIR / rel_path
+            thumb_path = MISSION_REPORT_THUMBS_DIR / f"{source.stem}.jpg"
+            if thumb_path.exists():
+                continue
+            thumbnail = make_thumbnail(source.read_bytes(), MISSION_REPORT_THUMB_SIZE)
+            if thumbnail:
+                thumb_path.write_bytes(thumbnail)
+        except Exception as e:
+            logger.warning(f"⚠️ Miniature non générée pour {rel_path}: {e}")
+
 @api_router.post("/mission-reports")
 async def create_mission_report(
+    background_tasks: BackgroundTasks,
     mission_id: str = Form(...),
     works_performed: str = Form(...),
     materials_used: str = Form(default=""),
@@ -5957,28 +6727,13 @@ async def create_mission_report(
         
         user_id = user_data.get('id')
         
-        # Créer le dossier uploads si nécessaire
-        os.makedirs("uploads", exist_ok=True)
-        
-        # Uploader les photos avant
-        photos_before_urls = []
-        for photo in photos_before:
-            if photo.filename:
-                filename = f"{uuid.uuid4()}_{photo.filename}"
-                filepath = os.path.join("uploads", filename)
-                with open(filepath, "wb") as f:
-                    f.write(await photo.read())
-                photos_before_urls.append(filename)
-        
-        # Uploader les photos après
-        photos_after_urls = []
-        for photo in photos_after:
-            if photo.filename:
-                filename = f"{uuid.uuid4()}_{photo.filename}"
-                filepath = os.path.join("uploads", filename)
-                with open(filepath, "wb") as f:
-                    f.write(await photo.read())
-                photos_after_urls.append(filename)
+        # Enregistrer toutes les photos (avant + après) en parallèle
+        MISSION_REPORT_THUMBS_DIR.mkdir(parents=True, exist_ok=True)
+        stored = await asyncio.gather(*(
+            _store_mission_report_photo(photo) for photo in [*photos_before, *photos_after]
+        ))
+        photos_before_urls = [p for p in stored[:len(photos_before)] if p]
+        photos_after_urls = [p for p in stored[len(photos_before):] if p]
         
         # Préparer les données du compte-rendu
         report_data = {
@@ -5995,13 +6750,14 @@ async def create_mission_report(
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         
-        # Insérer dans la base de données
-        response = supabase_service.table("mission_reports").insert(report_data).execute()
+        # Insérer le compte-rendu et passer la mission à "completed" en un seul appel
+        response = supabase_service.rpc("create_mission_report", {"p_report": report_data}).execute()
+        report = response.data[0] if isinstance(response.data, list) and response.data else response.data
         
-        # Mettre à jour le statut de la mission à "completed"
-        supabase_service.table("schedules").update({"status": "completed"}).eq("id", mission_id).execute()
+        # Miniatures générées après l'envoi de la réponse
+        background_tasks.add_task(_generate_mission_report_thumbnails, photos_before_urls + photos_after_urls)
         
-        return {"success": True, "data": response.data[0] if response.data else {}}
+        return {"success": True, "data": report or {}}
     except HTTPException:
         raise
     except Exception as e:
@@ -7341,6 +8097,8 @@ class ScheduleCreate(BaseModel):
 
 class ScheduleUpdate(BaseModel):
     date: Optional[str] = None
+    period_start: Optional[str] = None
+    period_end: Optional[str] = None
     time: Optional[str] = None
     end_time: Optional[str] = None
     hours: Optional[int] = None
@@ -7349,9 +8107,134 @@ class ScheduleUpdate(BaseModel):
     description: Optional[str] = None
     status: Optional[str] = None
 
+class SchedulePeriod(BaseModel):
+    start: str  # "YYYY-MM-DD"
+    end: str  # "YYYY-MM-DD"
+
+class ScheduleBulkCreate(BaseModel):
+    """Création en lot: `items` explicites et/ou produit collaborator_ids × (dates + periods)
+    avec les champs communs ci-dessous."""
+    items: List[ScheduleCreate] = []
+    collaborator_ids: List[str] = []
+    dates: List[str] = []
+    periods: List[SchedulePeriod] = []
+    worksite_id: Optional[str] = None
+    team_leader_id: Optional[str] = None
+    time: Optional[str] = None
+    end_time: Optional[str] = None
+    hours: Optional[int] = 8
+    shift: Optional[str] = "day"
+    description: Optional[str] = ""
+    status: Optional[str] = "scheduled"
+    client_name: Optional[str] = None
+    client_address: Optional[str] = None
+    intervention_category: Optional[str] = "worksite"
+    skip_conflicts: bool = False  # True: créer les éléments sans conflit; False: tout ou rien
+
+SCHEDULE_BULK_MAX_ITEMS = 500
+
+class ScheduleConflictCheckItem(BaseModel):
+    collaborator_id: str
+    date: Optional[str] = None
+    period_start: Optional[str] = None
+    period_end: Optional[str] = None
+    time: str
+    end_time: Optional[str] = None
+    hours: Optional[int] = 8
+    schedule_id: Optional[str] = None  # Planning modifié (ignoré dans la détection)
+
+class ScheduleConflictCheck(BaseModel):
+    items: List[ScheduleConflictCheckItem]
+
 def _svc():
     return supabase_service or supabase_anon
 
+# Index de disponibilité (table technician_availability), mis à jour après chaque écriture de planning
+availability_index = AvailabilityIndex(supabase_service or supabase_anon)
+
+def _refresh_availability(company_id: str, *schedules: Optional[Dict[str, Any]]):
+    """Recalcule les jours touchés (tâche de fond: n'allonge pas la réponse de l'écriture)"""
+    try:
+        availability_index.refresh_for_schedules(company_id, [s for s in schedules if s])
+    except Exception as e:
+        logging.warning(f"⚠️ Mise à jour de l'index de disponibilité impossible: {e}")
+
+def _load_company_directory(company_id: str) -> Dict[str, list]:
+    """Utilisateurs, chefs d'équipe, clients et chantiers de l'entreprise en un aller-retour (RPC)"""
+    try:
+        res = _svc().rpc("get_company_directory", {"p_company_id": company_id}).execute()
+        if isinstance(res.data, dict):
+            return res.data
+    except Exception as e:
+        # Migration 2026-10-19_company_directory_rpc.sql pas encore appliquée: 4 requêtes
+        logging.warning(f"⚠️ RPC get_company_directory indisponible: {e}")
+    return {
+        "users": _svc().table("users").select("id, first_name, last_name, email").eq("company_id", company_id).execute().data or [],
+        "team_leaders": _svc().table("planning_team_leaders").select("id, first_name, last_name, user_id").eq("company_id", company_id).execute().data or [],
+        "clients": _svc().table("clients").select("*").eq("company_id", company_id).execute().data or [],
+        "worksites": _svc().table("worksites").select("id, title, client_id, status, address").eq("company_id", company_id).execute().data or [],
+    }
+
+def _company_directory_version(company_id: str) -> Optional[int]:
+    """Version de l'annuaire de l'entreprise (une lecture par clé primaire)"""
+    try:
+        res = _svc().table("company_directory_versions").select("version") \
+            .eq("company_id", company_id).limit(1).execute()
+    except Exception as e:
+        # Migration 2026-10-19_company_directory_versions.sql pas encore appliquée: TTL court
+        logging.debug(f"company_directory_versions indisponible: {e}")
+        return None
+    return (res.data[0].get("version") if res.data else None) or 0
+
+# Annuaire des noms (par entreprise, en mémoire): remplace les lectures users/clients ligne à ligne
+name_directory = NameDirectory(_load_company_directory, version=_company_directory_version)
+
+def _ai_data_changed(company_id: Optional[str]):
+    """Les réponses IA (caches exact et sémantique) et statistiques de période mises en cache avant cette écriture ne sont plus réutilisées"""
+    if not AI_SERVICE_AVAILABLE or not company_id:
+        return
+    try:
+        ai_service = get_ai_service()
+        ai_service.cache.data_changed(company_id)
+        ai_service.semantic_cache.data_changed(company_id)
+        ai_service.period_stats.invalidate(company_id)
+    except RuntimeError:
+        pass
+
+def _quote_index_write(company_id: Optional[str], quote: Optional[dict] = None, deleted_id: Optional[str] = None):
+    """Reporte une écriture de devis dans l'index BM25 des devis similaires"""
+    if not AI_SERVICE_AVAILABLE or not company_id:
+        return
+    try:
+        quote_index = get_ai_service().quote_index
+        if deleted_id:
+            quote_index.remove(company_id, deleted_id)
+        elif quote:
+            quote_index.upsert(company_id, quote)
+    except RuntimeError:
+        pass
+
+def _directory_write(table: str, rows, company_id: Optional[str] = None, deleted_id: Optional[str] = None):
+    """Reporte une écriture dans l'annuaire; en cas de doute l'entreprise est simplement rechargée"""
+    first = (rows[0] if isinstance(rows, list) and rows else rows) or {}
+    _ai_data_changed(company_id or first.get("company_id"))
+    try:
+        if deleted_id:
+            name_directory.remove(table, deleted_id, company_id)
+            return
+        for row in rows if isinstance(rows, list) else [rows]:
+            name_directory.upsert(table, row, company_id)
+    except Exception as e:
+        logging.warning(f"⚠️ Annuaire des noms non mis à jour ({table}): {e}")
+        name_directory.invalidate(company_id)
+
+# Flux iCalendar par technicien (URL signée), rendus en mémoire jusqu'au prochain changement
+ICS_FEED_SECRET = os.environ.get("ICS_FEED_SECRET") or os.environ.get("JWT_SECRET") or supabase_service_key or supabase_anon_key
+ics_feeds = ICSFeedCache(supabase_service or supabase_anon, name_directory)
+
+def _invalidate_ics_feeds(*schedules: Optional[Dict[str, Any]]):
+    ics_feeds.invalidate((s or {}).get("collaborator_id") for s in schedules)
+
 def _ensure_bureau_or_admin(user: Dict[str, Any]):
     """Vérifie que l'utilisateur a le rôle Bureau ou Admin"""
     role = (user or {}).get("role")
@@ -7359,80 +8242,252 @@ def _ensure_bureau_or_admin(user: Dict[str, Any]):
         return
     raise HTTPException(status_code=403, detail="Accès réservé au Bureau/Admin")
 
+SCHEDULE_CONFLICT_FIELDS = "id, collaborator_id, date, start_date, end_date, time, end_time, hours, status, worksite_title"
+
+def _load_conflict_engine(company_id: str, collaborator_ids: Iterable[str], first_day: date, last_day: date) -> ScheduleConflictEngine:
+    """Charge dans un index d'intervalles les plannings des collaborateurs qui touchent la fenêtre.
+    
+    Les plannings à date unique (ancien format: start_date NULL) et sur période sont chargés
+    en une seule requête; la fenêtre est élargie d'un jour pour les créneaux de nuit.
+    """
+    ids = sorted({str(c) for c in collaborator_ids if c})
+    if not ids:
+        return ScheduleConflictEngine()
+    res = _svc().table("schedules").select(SCHEDULE_CONFLICT_FIELDS) \
+        .eq("company_id", company_id) \
+        .in_("collaborator_id", ids) \
+        .or_(schedule_window_filter(first_day - timedelta(days=1), last_day + timedelta(days=1))) \
+        .execute()
+    return ScheduleConflictEngine.from_rows(res.data or [])
+
+def _schedule_index_version(company_id: str, collaborator_id: str) -> Optional[int]:
+    state = _mission_sync_state(company_id, collaborator_id)
+    return state["version"] if state else None
+
+def _schedule_index_rows(company_id: str, collaborator_id: str, horizon: date) -> List[Dict[str, Any]]:
+    res = _svc().table("schedules").select(SCHEDULE_CONFLICT_FIELDS) \
+        .eq("company_id", company_id).eq("collaborator_id", collaborator_id) \
+        .or_(schedule_window_filter(horizon, date.max)) \
+        .execute()
+    return res.data or []
+
+def _schedule_index_changes(company_id: str, collaborator_id: str, version: int) -> List[Dict[str, Any]]:
+    res = _svc().table("schedules").select(SCHEDULE_CONFLICT_FIELDS) \
+        .eq("company_id", company_id).eq("collaborator_id", collaborator_id) \
+        .gt("sync_version", version) \
+        .execute()
+    return res.data or []
+
+# Index de conflits par technicien gardés entre les requêtes, revalidés par schedule_sync_versions
+schedule_indexes = ScheduleIndexCache(ScheduleIndexSource(
+    version=_schedule_index_version,
+    load=_schedule_index_rows,
+    changed=_schedule_index_changes,
+    removed=_mission_tombstones,
+))
+
+def _schedule_conflicts(company_id: str, slot: ScheduleSlot, exclude_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Plannings existants du même technicien qui chevauchent le créneau (date unique ou période).
+    
+    Index persistant du technicien (revalidé par sa version de synchronisation); requête
+    directe pour un créneau passé ou si la migration des versions manque.
+    """
+    found = schedule_indexes.conflicts(company_id, slot, exclude_id=exclude_id)
+    if found is None:
+        engine = _load_conflict_engine(company_id, [slot.collaborator_id], slot.first_day, slot.last_day)
+        found = engine.conflicts(slot, exclude_id=exclude_id)
+    return [conflict_payload(other, minutes) for other, minutes in found]
+
 def _check_schedule_overlap(company_id: str, collaborator_id: str, date_val: date, 
                             time_start: str, time_end: str, exclude_id: Optional[str] = None) -> bool:
     """Détecte si un technicien a déjà un planning qui chevauche cette plage horaire"""
-    q = _svc().table("schedules").select("id,time,end_time").eq("company_id", company_id)\
-        .eq("collaborator_id", collaborator_id).eq("date", date_val.isoformat())
-    
-    res = q.execute()
-    for schedule in (res.data or []):
-        if exclude_id and schedule.get("id") == exclude_id:
-            continue
-        existing_start = schedule.get("time", "00:00")
-        existing_end = schedule.get("end_time") or schedule.get("time", "23:59")
-        # Overlap si: existing_start < time_end ET existing_end > time_start
-        if existing_start < time_end and existing_end > time_start:
-            return True
-    return False
+    slot = ScheduleSlot.from_values(collaborator_id, date_val, date_val, time_start, time_end)
+    return bool(slot and _schedule_conflicts(company_id, slot, exclude_id))
+
+def _schedule_conflict_error(conflicts: List[Dict[str, Any]]) -> HTTPException:
+    first = conflicts[0]
+    period = first["start_date"] if first["start_date"] == first["end_date"] else f"{first['start_date']} → {first['end_date']}"
+    return HTTPException(
+        status_code=409,
+        detail=f"Conflit de planning pour ce technicien ({period} {first['time']}-{first['end_time']})"
+    )
 
-@api_router.get("/schedules")
-async def list_schedules(
+def _schedule_end_time(payload: ScheduleCreate) -> str:
+    """Heure de fin: celle fournie, sinon début + nombre d'heures"""
+    if payload.end_time:
+        return payload.end_time
+    t = datetime.strptime(payload.time, "%H:%M")
+    return (t + timedelta(hours=payload.hours or 8)).strftime("%H:%M")
+
+def _schedule_slot_for(payload: ScheduleCreate, time_end: str, slot_id: Optional[str] = None) -> Optional[ScheduleSlot]:
+    return ScheduleSlot.from_values(
+        payload.collaborator_id,
+        payload.date or payload.period_start,
+        payload.date or payload.period_end,
+        payload.time,
+        time_end,
+        schedule_id=slot_id,
+    )
+
+def _resolve_schedule_references(collaborator_ids: Iterable[str], worksite_ids: Iterable[str]):
+    """Charge en une requête par table les collaborateurs et chantiers (avec client) référencés.
+    
+    Returns:
+        (collaborateurs par id, chantiers par id). Une erreur de lecture n'empêche pas la création.
+    """
+    collaborators: Dict[str, Dict[str, Any]] = {}
+    worksites: Dict[str, Dict[str, Any]] = {}
+    collaborator_ids = sorted({c for c in collaborator_ids if c})
+    worksite_ids = sorted({w for w in worksite_ids if w})
+    if collaborator_ids:
+        try:
+            res = _svc().table("users").select("id, first_name, last_name").in_("id", collaborator_ids).execute()
+            collaborators = {row["id"]: row for row in res.data or []}
+        except Exception as e:
+            logging.warning(f"⚠️ Impossible de récupérer les noms des collaborateurs: {e}")
+    if worksite_ids:
+        try:
+            res = _svc().table("worksites").select(
+                "id, title, address, client_id, clients:client_id(name, prenom, nom, adresse, email, telephone)"
+            ).in_("id", worksite_ids).execute()
+            worksites = {row["id"]: row for row in res.data or []}
+        except Exception as e:
+            logging.warning(f"⚠️ Impossible de récupérer les infos des chantiers: {e}")
+    return collaborators, worksites
+
+def _build_schedule_row(payload: ScheduleCreate, company_id: str, user: Dict[str, Any], time_end: str,
+                        collaborator: Optional[Dict[str, Any]], worksite: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ligne `schedules` à insérer, avec noms dénormalisés du collaborateur, du chantier et du client"""
+    resolved_client_name = payload.client_name
+    resolved_client_address = payload.client_address
+    worksite_title = None
+    if worksite:
+        worksite_title = worksite.get("title")
+        # Adresse du chantier si pas fournie
+        if not resolved_client_address and worksite.get("address"):
+            resolved_client_address = worksite["address"]
+        # Infos client depuis la relation
+        client_data = worksite.get("clients")
+        if client_data and not resolved_client_name:
+            if client_data.get("name"):
+                resolved_client_name = client_data["name"]
+            elif client_data.get("prenom") or client_data.get("nom"):
+                resolved_client_name = f"{client_data.get('prenom', '')} {client_data.get('nom', '')}".strip()
+            if not resolved_client_address and client_data.get("adresse"):
+                resolved_client_address = client_data["adresse"]
+
+    data = {
+        "company_id": company_id,
+        "worksite_id": payload.worksite_id,
+        "team_leader_id": payload.team_leader_id,
+        "collaborator_id": payload.collaborator_id,
+        "collaborator_first_name": collaborator.get("first_name", "") if collaborator else None,
+        "collaborator_last_name": collaborator.get("last_name", "") if collaborator else None,
+        "worksite_title": worksite_title,
+        "time": payload.time,
+        "end_time": time_end,
+        "hours": payload.hours or 8,
+        "shift": payload.shift or "day",
+        "description": payload.description or "",
+        "status": payload.status or "scheduled",
+        "created_by": user.get("id"),
+        "client_name": resolved_client_name,
+        "client_address": resolved_client_address,
+        "intervention_category": payload.intervention_category or "worksite",
+    }
+    
+    # Selon le mode: date unique ou période
+    if payload.date:
+        data["date"] = str(payload.date)
+        # Pour compatibilité, remplir aussi start_date/end_date
+        data["start_date"] = str(payload.date)
+        data["end_date"] = str(payload.date)
+    else:
+        # start_date/end_date pour compatibilité, period_start/period_end conservés
+        data["start_date"] = str(payload.period_start)
+        data["end_date"] = str(payload.period_end)
+        data["period_start"] = str(payload.period_start)
+        data["period_end"] = str(payload.period_end)
+    return data
+
+CALENDAR_MAX_DAYS = 93
+
+@api_router.get("/schedules/calendar")
+async def get_schedule_calendar(
+    request: Request,
     from_date: Optional[date] = Query(None, alias="from"),
     to_date: Optional[date] = Query(None, alias="to"),
     collaborator_id: Optional[str] = None,
     user=Depends(get_user_from_token),
 ):
-    """Liste les plannings (filtrable par dates et technicien). Bureau/Admin peuvent tout voir."""
+    """Calendrier semaine/mois prêt à afficher. Bureau/Admin uniquement.
+    
+    Les périodes sont développées en cellules jour par jour et les techniciens, chantiers et
+    chefs d'équipe sont dédupliqués dans des tables de correspondance (réponse en colonnes).
+    ETag calculé sur le max(updated_at) de la fenêtre: 304 si rien n'a changé.
+    """
     _ensure_bureau_or_admin(user)
     company_id = user.get("company_id")
-    q = _svc().table("schedules").select("""
-        *,
-        worksites:worksite_id(id, title, client_id, status, address),
-        users:collaborator_id(id, email, first_name, last_name),
-        planning_team_leaders:team_leader_id(id, first_name, last_name, user_id)
-    """).eq("company_id", company_id)
-    
-    if from_date:
-        q = q.gte("date", from_date.isoformat())
-    if to_date:
-        q = q.lte("date", to_date.isoformat())
-    if collaborator_id:
-        q = q.eq("collaborator_id", collaborator_id)
-    
-    res = q.order("date").order("time").execute()
-    
-    # Enrichir avec les noms des chefs d'équipe à jour depuis users
-    schedules = res.data or []
-    for schedule in schedules:
-        team_leader = schedule.get("planning_team_leaders")
-        if team_leader:
-            # Si le chef a un user_id, récupérer le nom à jour depuis users
-            user_id = team_leader.get("user_id")
-            if user_id:
-                try:
-                    user_res = _svc().table("users").select("first_name, last_name").eq("id", user_id).execute()
-                    if user_res.data:
-                        user_data = user_res.data[0]
-                        schedule["team_leader_name"] = f"{user_data.get('first_name', '')} {user_data.get('last_name', '')}".strip()
-                    else:
-                        # Fallback sur les données de planning_team_leaders
-                        schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-                except:
-                    schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-            else:
-                # Pas de user_id, utiliser les données de planning_team_leaders
-                schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-            
-            # Récupérer le nom du chantier
-            worksite = schedule.get("worksites")
-            if worksite:
-                schedule["worksite_name"] = worksite.get("title", "Chantier")
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
     
-    return schedules
+    # Par défaut: semaine courante (lundi -> dimanche)
+    first_day = from_date or (date.today() - timedelta(days=date.today().weekday()))
+    last_day = to_date or (first_day + timedelta(days=6))
+    if last_day < first_day:
+        raise HTTPException(status_code=400, detail="'to' doit être postérieur à 'from'")
+    if (last_day - first_day).days + 1 > CALENDAR_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Fenêtre limitée à {CALENDAR_MAX_DAYS} jours")
+    
+    window = schedule_window_filter(first_day, last_day)
+    
+    def _scoped(q):
+        q = q.eq("company_id", company_id).or_(window)
+        return q.eq("collaborator_id", collaborator_id) if collaborator_id else q
+    
+    try:
+        # Requête légère pour l'ETag avant de charger les plannings
+        head = _scoped(_svc().table("schedules").select("updated_at", count="exact")) \
+            .order("updated_at", desc=True).limit(1).execute()
+        max_updated_at = head.data[0].get("updated_at") if head.data else None
+        etag = calendar_etag(company_id, first_day, last_day, collaborator_id, max_updated_at, head.count)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        
+        res = _scoped(_svc().table("schedules").select("""
+            id, date, start_date, end_date, time, end_time, hours, status, shift, intervention_category,
+            client_name, client_address, description, collaborator_id, collaborator_first_name,
+            collaborator_last_name, worksite_id, worksite_title,
+            worksites:worksite_id(id, title, status, address, client_id),
+            users:collaborator_id(id, email, first_name, last_name),
+            planning_team_leaders:team_leader_id(id, first_name, last_name, user_id)
+        """)).execute()
+        rows = res.data or []
+        
+        # Noms à jour des chefs d'équipe liés à un compte: annuaire en mémoire
+        leader_user_ids = sorted({
+            (r.get("planning_team_leaders") or {}).get("user_id")
+            for r in rows if (r.get("planning_team_leaders") or {}).get("user_id")
+        })
+        users_by_id = {}
+        for user_id in leader_user_ids:
+            linked = name_directory.get(company_id, "users", user_id)
+            if linked:
+                users_by_id[user_id] = linked
+        
+        calendar = materialize_calendar(rows, first_day, last_day, users_by_id)
+    except Exception as e:
+        logging.error(f"❌ Erreur calendrier planning: {e}")
+        raise HTTPException(status_code=500, detail=f"Erreur chargement du calendrier: {str(e)}")
+    
+    return JSONResponse(
+        content={"from": first_day.isoformat(), "to": last_day.isoformat(), "updated_at": max_updated_at, **calendar},
+        headers=headers,
+    )
 
 @api_router.post("/schedules")
-async def create_schedule(payload: ScheduleCreate, user=Depends(get_user_from_token)):
+async def create_schedule(payload: ScheduleCreate, background_tasks: BackgroundTasks, user=Depends(get_user_from_token)):
     """Créer un planning. Bureau/Admin uniquement. Détecte les conflits."""
     try:
         logging.info(f"📅 Création schedule - User: {user.get('email')}, Company: {user.get('company_id')}")
@@ -7446,100 +8501,31 @@ async def create_schedule(payload: ScheduleCreate, user=Depends(get_user_from_to
         if not payload.date and not (payload.period_start and payload.period_end):
             raise HTTPException(status_code=400, detail="Spécifier 'date' ou 'period_start'+'period_end'")
         
-        # Calculer end_time si absent
-        time_start = payload.time
-        time_end = payload.end_time
-        if not time_end:
-            from datetime import datetime as dt, timedelta
-            t = dt.strptime(time_start, "%H:%M")
-            t_end = t + timedelta(hours=payload.hours or 8)
-            time_end = t_end.strftime("%H:%M")
-        
-        # Vérifier conflits (seulement pour date unique)
-        if payload.date and _check_schedule_overlap(company_id, payload.collaborator_id, payload.date, time_start, time_end):
-            raise HTTPException(status_code=409, detail="Conflit de planning pour ce technicien")
-        
-        # Récupérer le nom/prénom du collaborateur depuis la table users
-        collab_first_name = None
-        collab_last_name = None
-        try:
-            collab_res = _svc().table("users").select("first_name, last_name").eq("id", payload.collaborator_id).execute()
-            if collab_res.data:
-                collab_first_name = collab_res.data[0].get("first_name", "")
-                collab_last_name = collab_res.data[0].get("last_name", "")
-                logging.info(f"👤 Collaborateur: {collab_first_name} {collab_last_name}")
-        except Exception as e:
-            logging.warning(f"⚠️ Impossible de récupérer le nom du collaborateur: {e}")
-
-        # Récupérer les infos du chantier et du client si worksite_id fourni
-        worksite_title = None
-        resolved_client_name = payload.client_name
-        resolved_client_address = payload.client_address
-        if payload.worksite_id:
-            try:
-                ws_res = _svc().table("worksites").select(
-                    "title, address, client_id, clients:client_id(name, prenom, nom, adresse, email, telephone)"
-                ).eq("id", payload.worksite_id).execute()
-                if ws_res.data:
-                    ws = ws_res.data[0]
-                    worksite_title = ws.get("title")
-                    logging.info(f"🏗️ Chantier: {worksite_title}")
-                    # Récupérer adresse du chantier si pas fournie
-                    if not resolved_client_address and ws.get("address"):
-                        resolved_client_address = ws["address"]
-                    # Récupérer infos client depuis la relation
-                    client_data = ws.get("clients")
-                    if client_data and not resolved_client_name:
-                        if client_data.get("name"):
-                            resolved_client_name = client_data["name"]
-                        elif client_data.get("prenom") or client_data.get("nom"):
-                            resolved_client_name = f"{client_data.get('prenom', '')} {client_data.get('nom', '')}".strip()
-                        if not resolved_client_address and client_data.get("adresse"):
-                            resolved_client_address = client_data["adresse"]
-                        logging.info(f"👤 Client: {resolved_client_name} - {resolved_client_address}")
-            except Exception as e:
-                logging.warning(f"⚠️ Impossible de récupérer les infos du chantier: {e}")
-
-        data = {
-            "company_id": company_id,
-            "worksite_id": payload.worksite_id,
-            "team_leader_id": payload.team_leader_id,
-            "collaborator_id": payload.collaborator_id,
-            "collaborator_first_name": collab_first_name,
-            "collaborator_last_name": collab_last_name,
-            "worksite_title": worksite_title,
-            "time": time_start,
-            "end_time": time_end,
-            "hours": payload.hours or 8,
-            "shift": payload.shift or "day",
-            "description": payload.description or "",
-            "status": payload.status or "scheduled",
-            "created_by": user.get("id"),
-            "client_name": resolved_client_name,
-            "client_address": resolved_client_address,
-            "intervention_category": payload.intervention_category or "worksite",
-        }
+        time_end = _schedule_end_time(payload)
         
-        # Selon le mode: date unique ou période
-        if payload.date:
-            data["date"] = str(payload.date)
-            # Pour compatibilité, remplir aussi start_date/end_date
-            data["start_date"] = str(payload.date)
-            data["end_date"] = str(payload.date)
-        else:
-            # Utiliser start_date/end_date pour compatibilité (au lieu de period_start/period_end)
-            data["start_date"] = str(payload.period_start)
-            data["end_date"] = str(payload.period_end)
-            # Garder aussi period_start/period_end si les colonnes existent
-            try:
-                data["period_start"] = str(payload.period_start)
-                data["period_end"] = str(payload.period_end)
-            except:
-                pass
+        # Vérifier conflits (date unique ou période)
+        slot = _schedule_slot_for(payload, time_end)
+        if slot is None:
+            raise HTTPException(status_code=400, detail="Date ou horaire invalide")
+        conflicts = _schedule_conflicts(company_id, slot)
+        if conflicts:
+            raise _schedule_conflict_error(conflicts)
+        
+        # Nom du collaborateur et infos chantier/client
+        collaborators, worksites = _resolve_schedule_references(
+            [payload.collaborator_id], [payload.worksite_id] if payload.worksite_id else []
+        )
+        data = _build_schedule_row(
+            payload, company_id, user, time_end,
+            collaborators.get(payload.collaborator_id), worksites.get(payload.worksite_id)
+        )
         
         logging.info(f"📝 Insertion schedule: {data}")
         res = _svc().table("schedules").insert(data).execute()
         logging.info(f"✅ Schedule créé: {res.data}")
+        _invalidate_ics_feeds(res.data[0])
+        _ai_data_changed(company_id)
+        background_tasks.add_task(_refresh_availability, company_id, res.data[0])
         return res.data[0]
     except HTTPException:
         raise
@@ -7549,8 +8535,123 @@ async def create_schedule(payload: ScheduleCreate, user=Depends(get_user_from_to
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+def _expand_bulk_schedules(payload: ScheduleBulkCreate) -> List[ScheduleCreate]:
+    """Liste des plannings demandés: éléments explicites puis collaborateurs × dates/périodes"""
+    items = list(payload.items)
+    if payload.collaborator_ids:
+        if not payload.time:
+            raise HTTPException(status_code=400, detail="'time' requis avec 'collaborator_ids'")
+        common = payload.dict(include={
+            "worksite_id", "team_leader_id", "time", "end_time", "hours", "shift", "description",
+            "status", "client_name", "client_address", "intervention_category",
+        })
+        for collaborator_id in payload.collaborator_ids:
+            for day in payload.dates:
+                items.append(ScheduleCreate(**common, collaborator_id=collaborator_id, date=day))
+            for period in payload.periods:
+                items.append(ScheduleCreate(**common, collaborator_id=collaborator_id,
+                                            period_start=period.start, period_end=period.end))
+    return items
+
+@api_router.post("/schedules/bulk")
+async def create_schedules_bulk(payload: ScheduleBulkCreate, background_tasks: BackgroundTasks, user=Depends(get_user_from_token)):
+    """Créer plusieurs plannings en une fois. Bureau/Admin uniquement.
+    
+    Noms des collaborateurs et chantiers résolus une seule fois, conflits vérifiés en mémoire
+    (plannings existants + autres éléments du lot), puis une seule insertion.
+    """
+    _ensure_bureau_or_admin(user)
+    company_id = user.get("company_id")
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+    
+    items = _expand_bulk_schedules(payload)
+    if not items:
+        raise HTTPException(status_code=400, detail="Aucun planning à créer")
+    if len(items) > SCHEDULE_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Maximum {SCHEDULE_BULK_MAX_ITEMS} plannings par lot")
+    
+    prepared = []
+    for index, item in enumerate(items):
+        if not item.date and not (item.period_start and item.period_end):
+            raise HTTPException(status_code=400, detail=f"Élément {index}: spécifier 'date' ou 'period_start'+'period_end'")
+        try:
+            time_end = _schedule_end_time(item)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Élément {index}: horaire invalide")
+        slot = _schedule_slot_for(item, time_end, slot_id=f"batch:{index}")
+        if slot is None:
+            raise HTTPException(status_code=400, detail=f"Élément {index}: date ou horaire invalide")
+        prepared.append((item, time_end, slot))
+    
+    try:
+        engine = _load_conflict_engine(
+            company_id,
+            [item.collaborator_id for item in items],
+            min(slot.first_day for _, _, slot in prepared),
+            max(slot.last_day for _, _, slot in prepared),
+        )
+        collaborators, worksites = _resolve_schedule_references(
+            [item.collaborator_id for item in items],
+            [item.worksite_id for item in items],
+        )
+    except Exception as e:
+        logging.error(f"❌ Erreur préparation création en lot: {e}")
+        raise HTTPException(status_code=500, detail=f"Erreur création des plannings: {str(e)}")
+    
+    # Conflits: plannings existants puis éléments déjà acceptés du lot
+    report = []
+    rows = []
+    for index, (item, time_end, slot) in enumerate(prepared):
+        conflicts = [
+            {"index": int(other.id.split(":", 1)[1]) if str(other.id).startswith("batch:") else None,
+             **conflict_payload(other, minutes)}
+            for other, minutes in engine.conflicts(slot)
+        ]
+        entry = {"index": index, "collaborator_id": item.collaborator_id, "conflicts": conflicts}
+        if not conflicts:
+            engine.add(slot)
+            rows.append((index, _build_schedule_row(
+                item, company_id, user, time_end,
+                collaborators.get(item.collaborator_id), worksites.get(item.worksite_id)
+            )))
+        entry["status"] = "conflict" if conflicts else "ok"
+        report.append(entry)
+    
+    conflict_count = sum(1 for entry in report if entry["conflicts"])
+    if conflict_count and not payload.skip_conflicts:
+        raise HTTPException(status_code=409, detail={
+            "message": f"Conflit de planning sur {conflict_count} élément(s), aucun planning créé",
+            "items": report,
+            "conflict_count": conflict_count,
+        })
+    
+    created = []
+    if rows:
+        try:
+            res = _svc().table("schedules").insert([row for _, row in rows]).execute()
+            created = res.data or []
+        except Exception as e:
+            logging.error(f"❌ Erreur insertion plannings en lot: {e}")
+            raise HTTPException(status_code=500, detail=f"Erreur création des plannings: {str(e)}")
+        # PostgREST renvoie les lignes insérées dans l'ordre envoyé
+        for (index, _), row in zip(rows, created):
+            report[index]["status"] = "created"
+            report[index]["schedule_id"] = row.get("id")
+        _invalidate_ics_feeds(*created)
+        _ai_data_changed(company_id)
+        background_tasks.add_task(_refresh_availability, company_id, *created)
+    
+    logging.info(f"✅ {len(created)} planning(s) créé(s) en lot, {conflict_count} conflit(s)")
+    return {
+        "created": created,
+        "items": report,
+        "created_count": len(created),
+        "conflict_count": conflict_count,
+    }
+
 @api_router.patch("/schedules/{schedule_id}")
-async def update_schedule(schedule_id: str, payload: ScheduleUpdate, user=Depends(get_user_from_token)):
+async def update_schedule(schedule_id: str, payload: ScheduleUpdate, background_tasks: BackgroundTasks, user=Depends(get_user_from_token)):
     """Modifier un planning (dates, horaires, technicien). Bureau/Admin uniquement."""
     _ensure_bureau_or_admin(user)
     company_id = user.get("company_id")
@@ -7565,33 +8666,109 @@ async def update_schedule(schedule_id: str, payload: ScheduleUpdate, user=Depend
     # Préparer changements
     changes = {k: v for k, v in payload.dict().items() if v is not None}
     
-    # Vérifier conflits si date/horaire/technicien changent
-    if any(k in changes for k in ("date", "time", "end_time", "collaborator_id")):
-        date_val = changes.get("date") or date.fromisoformat(current["date"])
-        time_start = changes.get("time") or current["time"]
-        time_end = changes.get("end_time") or current.get("end_time") or current["time"]
-        collab_id = changes.get("collaborator_id") or current["collaborator_id"]
-        
-        if _check_schedule_overlap(company_id, collab_id, date_val, time_start, time_end, exclude_id=schedule_id):
-            raise HTTPException(status_code=409, detail="Conflit de planning pour ce technicien")
-    
+    # Garder date / start_date / end_date cohérents (date unique ou période)
     if "date" in changes:
-        changes["date"] = changes["date"].isoformat()
+        changes["start_date"] = changes["end_date"] = changes["date"]
+    elif "period_start" in changes or "period_end" in changes:
+        changes["start_date"] = changes.get("period_start") or current.get("start_date")
+        changes["end_date"] = changes.get("period_end") or current.get("end_date")
+        changes["period_start"], changes["period_end"] = changes["start_date"], changes["end_date"]
+        changes["date"] = None
+    
+    # Vérifier conflits si dates/horaire/technicien changent
+    if any(k in changes for k in ("date", "start_date", "time", "end_time", "collaborator_id")):
+        merged = {**current, **changes, "id": schedule_id}
+        slot = ScheduleSlot.from_row(merged)
+        if slot is None:
+            raise HTTPException(status_code=400, detail="Date ou horaire invalide")
+        conflicts = _schedule_conflicts(company_id, slot, exclude_id=schedule_id)
+        if conflicts:
+            raise _schedule_conflict_error(conflicts)
     
     changes["updated_at"] = datetime.utcnow().isoformat()
     
     res = _svc().table("schedules").update(changes).eq("id", schedule_id).execute()
+    _invalidate_ics_feeds(current, res.data[0])
+    _ai_data_changed(company_id)
+    background_tasks.add_task(_refresh_availability, company_id, current, res.data[0])
     return res.data[0]
 
+@api_router.post("/schedules/check-conflicts")
+async def check_schedule_conflicts(payload: ScheduleConflictCheck, user=Depends(get_user_from_token)):
+    """Vérifie un lot de créneaux (dates uniques ou périodes) sans les enregistrer.
+    
+    Une seule requête charge les plannings existants des techniciens concernés; chaque créneau
+    est comparé aux plannings existants puis aux créneaux précédents du même lot.
+    """
+    _ensure_bureau_or_admin(user)
+    company_id = user.get("company_id")
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+    
+    slots = []
+    for index, item in enumerate(payload.items):
+        slot = ScheduleSlot.from_values(
+            item.collaborator_id,
+            item.date or item.period_start,
+            item.date or item.period_end,
+            item.time,
+            item.end_time,
+            item.hours,
+            # Position dans le lot (deux éléments peuvent porter le même schedule_id)
+            schedule_id=f"batch:{index}",
+        )
+        if slot is None:
+            raise HTTPException(status_code=400, detail=f"Élément {index}: date ou horaire invalide")
+        slots.append(slot)
+    
+    if not slots:
+        return {"items": [], "conflict_count": 0}
+    
+    try:
+        engine = _load_conflict_engine(
+            company_id,
+            [slot.collaborator_id for slot in slots],
+            min(slot.first_day for slot in slots),
+            max(slot.last_day for slot in slots),
+        )
+    except Exception as e:
+        logging.error(f"❌ Erreur chargement plannings pour conflits: {e}")
+        raise HTTPException(status_code=500, detail=f"Erreur vérification des conflits: {str(e)}")
+    
+    # Les plannings modifiés dans le lot ne doivent pas entrer en conflit avec leur ancienne version
+    for item in payload.items:
+        if item.schedule_id:
+            engine.remove(item.schedule_id)
+    
+    results = []
+    batch = ScheduleConflictEngine()
+    for index, slot in enumerate(slots):
+        existing = [conflict_payload(other, minutes) for other, minutes in engine.conflicts(slot)]
+        in_batch = []
+        for other, minutes in batch.conflicts(slot):
+            other_index = int(other.id.split(":", 1)[1])
+            in_batch.append({**conflict_payload(other, minutes), "index": other_index,
+                             "schedule_id": payload.items[other_index].schedule_id})
+        batch.add(slot)
+        results.append({
+            "index": index,
+            "collaborator_id": slot.collaborator_id,
+            "has_conflict": bool(existing or in_batch),
+            "conflicts": existing,
+            "batch_conflicts": in_batch,
+        })
+    
+    return {"items": results, "conflict_count": sum(1 for r in results if r["has_conflict"])}
+
 @api_router.delete("/schedules/{schedule_id}")
-async def delete_schedule(schedule_id: str, user=Depends(get_user_from_token)):
+async def delete_schedule(schedule_id: str, background_tasks: BackgroundTasks, user=Depends(get_user_from_token)):
     """Supprimer un planning. Bureau/Admin uniquement."""
     _ensure_bureau_or_admin(user)
     company_id = user.get("company_id")
     
     logger.info(f"🗑️ [delete_schedule] Tentative suppression schedule_id={schedule_id}, company_id={company_id}")
     
-    existing = _svc().table("schedules").select("id, company_id").eq("id", schedule_id).execute()
+    existing = _svc().table("schedules").select("id, company_id, collaborator_id, date, start_date, end_date").eq("id", schedule_id).execute()
     logger.debug(f"🔍 [delete_schedule] Recherche schedule: {existing.data}")
     
     if not existing.data:
@@ -7605,100 +8782,206 @@ async def delete_schedule(schedule_id: str, user=Depends(get_user_from_token)):
     
     _svc().table("schedules").delete().eq("id", schedule_id).execute()
     logger.info(f"✅ [delete_schedule] Schedule {schedule_id} supprimé")
+    _invalidate_ics_feeds(existing.data[0])
+    _ai_data_changed(company_id)
+    background_tasks.add_task(_refresh_availability, company_id, existing.data[0])
     return {"deleted": True}
 
-@api_router.get("/technicians/{technician_id}/missions")
-async def list_missions_for_technician(
-    technician_id: str,
-    from_date: Optional[date] = Query(None, alias="from"),
-    to_date: Optional[date] = Query(None, alias="to"),
-    status: Optional[str] = None,
+AVAILABILITY_MAX_DAYS = 31
+
+@api_router.get("/planning/availability")
+async def get_technician_availability(
+    day: date = Query(..., alias="date", description="Jour (YYYY-MM-DD)"),
+    to_date: Optional[date] = Query(None, alias="to", description="Dernier jour (plage multi-jours)"),
+    start: str = Query("08:00", description="Début du créneau HH:MM"),
+    end: str = Query("18:00", description="Fin du créneau HH:MM"),
+    collaborator_ids: Optional[List[str]] = Query(None),
     user=Depends(get_user_from_token),
 ):
-    """Missions d'un technicien (lecture seule). Accessible au technicien lui-même ou Bureau/Admin."""
-    role = (user or {}).get("role")
-    if not (role in ("ADMIN", "BUREAU") or user.get("id") == technician_id):
-        raise HTTPException(status_code=403, detail="Accès refusé")
+    """Techniciens libres sur le créneau [start, end) chaque jour de la plage. Bureau/Admin uniquement.
     
+    Lu dans l'index de disponibilité précalculé; les jours hors horizon sont calculés à la volée.
+    """
+    _ensure_bureau_or_admin(user)
     company_id = user.get("company_id")
-    q = _svc().table("schedules").select("""
-        *,
-        worksites:worksite_id(id, title, client_id, status, address, start_date, end_date),
-        planning_team_leaders:team_leader_id(id, first_name, last_name, user_id)
-    """).eq("company_id", company_id).eq("collaborator_id", technician_id)
-    
-    # Filtrer uniquement les schedules avec start_date (exclure les anciens avec date NULL)
-    q = q.not_.is_("start_date", "null")
-    
-    if status:
-        q = q.eq("status", status)
-    if from_date:
-        # Filtrer les schedules dont la période chevauche la plage demandée
-        q = q.lte("start_date", to_date.isoformat() if to_date else "2099-12-31")
-    if to_date:
-        q = q.gte("end_date", from_date.isoformat() if from_date else "1900-01-01")
-    
-    res = q.order("start_date", desc=False).order("time").execute()
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
     
-    # 🔄 AUTO-UPDATE : Passer en 'completed' les missions dont la date de fin est dépassée
-    from datetime import datetime as dt_cls
-    today_date = date.today()
+    last_day = to_date or day
+    if last_day < day:
+        raise HTTPException(status_code=400, detail="'to' doit être postérieur à 'date'")
+    if (last_day - day).days + 1 > AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Plage limitée à {AVAILABILITY_MAX_DAYS} jours")
+    slot = ScheduleSlot.from_values(None, day, day, start, end)
+    if slot is None or slot.end_min > 24 * 60:
+        raise HTTPException(status_code=400, detail="Créneau invalide (HH:MM, fin après le début)")
     
-    schedules = res.data or []
-    for schedule in schedules:
-        sch_status = (schedule.get("status") or "").lower()
-        sch_end_date = schedule.get("end_date")
-        
-        if sch_end_date and sch_status in ["scheduled", "in_progress"]:
-            try:
-                end_dt = dt_cls.strptime(sch_end_date[:10], "%Y-%m-%d").date()
-                if end_dt < today_date:
-                    _svc().table("schedules").update({
-                        "status": "completed"
-                    }).eq("id", schedule["id"]).execute()
-                    schedule["status"] = "completed"
-            except Exception:
-                pass
+    try:
+        result = await asyncio.to_thread(
+            availability_index.available, company_id, day, last_day, slot.start_min, slot.end_min, collaborator_ids
+        )
+    except Exception as e:
+        logging.error(f"❌ Erreur disponibilités techniciens: {e}")
+        raise HTTPException(status_code=500, detail=f"Erreur calcul des disponibilités: {str(e)}")
     
-    # Enrichir avec les noms des chefs d'équipe à jour depuis users et les données clients
+    return {
+        "date": day.isoformat(),
+        "to": last_day.isoformat(),
+        "start": start,
+        "end": end,
+        **result,
+    }
+
+def _directory_team_leader_name(company_id: Optional[str], team_leader: Dict[str, Any]) -> str:
+    """Nom à jour du chef d'équipe (compte lié) via l'annuaire; repli sur la fiche si l'annuaire échoue"""
+    try:
+        return name_directory.team_leader_name(company_id, team_leader)
+    except Exception as e:
+        logging.warning(f"⚠️ Annuaire des noms indisponible: {e}")
+        return full_name(team_leader)
+
+def _enrich_technician_missions(schedules: List[Dict[str, Any]], company_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Ajoute team_leader_name, worksite_name et les données client aux missions (annuaire en mémoire)"""
     for schedule in schedules:
+        mission_company = company_id or schedule.get("company_id")
         team_leader = schedule.get("planning_team_leaders")
         if team_leader:
-            # Si le chef a un user_id, récupérer le nom à jour depuis users
-            user_id = team_leader.get("user_id")
-            if user_id:
-                try:
-                    user_res = _svc().table("users").select("first_name, last_name").eq("id", user_id).execute()
-                    if user_res.data:
-                        user_data = user_res.data[0]
-                        schedule["team_leader_name"] = f"{user_data.get('first_name', '')} {user_data.get('last_name', '')}".strip()
-                    else:
-                        schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-                except:
-                    schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-            else:
-                schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
+            schedule["team_leader_name"] = _directory_team_leader_name(mission_company, team_leader)
         
         # Récupérer le nom du chantier et les données du client
         worksite = schedule.get("worksites")
         if worksite:
             schedule["worksite_name"] = worksite.get("title", "Chantier")
             
-            # Récupérer les données du client si client_id existe
             client_id = worksite.get("client_id")
             if client_id:
                 try:
-                    client_res = _svc().table("clients").select("id, name, prenom, nom, adresse").eq("id", client_id).execute()
-                    if client_res.data:
+                    client = name_directory.get(mission_company, "clients", client_id)
+                    if client:
                         # Injecter les données du client dans worksites
-                        if "worksites" not in schedule:
-                            schedule["worksites"] = {}
-                        schedule["worksites"]["clients"] = client_res.data[0]
+                        schedule["worksites"]["clients"] = dict(client)
                 except Exception as e:
                     logging.warning(f"Impossible de récupérer le client {client_id}: {e}")
     
     return schedules
 
+@api_router.get("/technicians/{technician_id}/missions")
+async def list_missions_for_technician(
+    technician_id: str,
+    request: Request,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    status: Optional[str] = None,
+    updated_since: Optional[str] = Query(None, description="Curseur de synchronisation (valeur de X-Sync-Cursor)"),
+    user=Depends(get_user_from_token),
+):
+    """Missions d'un technicien (lecture seule). Accessible au technicien lui-même ou Bureau/Admin.
+    
+    Synchronisation incrémentale: `updated_since` -> missions modifiées + ids à retirer (supprimées,
+    réassignées ou sorties du filtre); If-None-Match -> 304.
+    """
+    role = (user or {}).get("role")
+    if not (role in ("ADMIN", "BUREAU") or user.get("id") == technician_id):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    
+    company_id = user.get("company_id")
+    
+    def prepare() -> bool:
+        # 🔄 AUTO-UPDATE : Passer en 'completed' les missions dont la date de fin est dépassée (une requête).
+        # Lancée après la vérification de l'ETag (qui inclut le jour): pas d'écriture sur un 304
+        try:
+            res = _svc().table("schedules").update({"status": "completed"}) \
+                .eq("company_id", company_id).eq("collaborator_id", technician_id) \
+                .in_("status", ["scheduled", "in_progress"]) \
+                .lt("end_date", date.today().isoformat()) \
+                .execute()
+            if not res.data:
+                return False
+            _invalidate_ics_feeds({"collaborator_id": technician_id})
+            return True
+        except Exception as e:
+            logging.warning(f"⚠️ Mise à jour des missions terminées impossible: {e}")
+            return False
+    
+    def scope(q):
+        # Filtrer uniquement les schedules avec start_date (exclure les anciens avec date NULL)
+        q = q.not_.is_("start_date", "null")
+        if status:
+            q = q.eq("status", status)
+        if from_date:
+            # Filtrer les schedules dont la période chevauche la plage demandée
+            q = q.lte("start_date", to_date.isoformat() if to_date else "2099-12-31")
+        if to_date:
+            q = q.gte("end_date", from_date.isoformat() if from_date else "1900-01-01")
+        return q
+    
+    def load(version: Optional[int]):
+        q = scope(_svc().table("schedules").select("""
+            *,
+            worksites:worksite_id(id, title, client_id, status, address, start_date, end_date),
+            planning_team_leaders:team_leader_id(id, first_name, last_name, user_id)
+        """).eq("company_id", company_id).eq("collaborator_id", technician_id))
+        if version is not None:
+            q = q.gt("sync_version", version)
+        return q.order("start_date", desc=False).order("time").execute().data or []
+    
+    def left_scope(cursor):
+        # Écrites depuis le curseur mais hors filtre (négation de scope)
+        outside = ["start_date.is.null"]
+        if status:
+            outside += [f'status.neq."{status.replace(chr(34), "")}"', "status.is.null"]
+        if from_date:
+            outside.append(f"start_date.gt.{to_date.isoformat() if to_date else '2099-12-31'}")
+        if to_date:
+            outside += [f"end_date.lt.{from_date.isoformat() if from_date else '1900-01-01'}", "end_date.is.null"]
+        res = _svc().table("schedules").select("id") \
+            .eq("company_id", company_id).eq("collaborator_id", technician_id) \
+            .gt("sync_version", cursor.version).or_(",".join(outside)).execute()
+        return [row["id"] for row in res.data or []]
+    
+    return await asyncio.to_thread(
+        _mission_sync_response, request, technician_id, company_id,
+        f"technician|{from_date}|{to_date}|{status}|{date.today()}", updated_since, load, left_scope,
+        lambda rows: _enrich_technician_missions(rows, company_id), prepare,
+    )
+
+@api_router.get("/technicians/{technician_id}/calendar-feed")
+async def get_technician_calendar_feed_url(technician_id: str, request: Request, user=Depends(get_user_from_token)):
+    """URL d'abonnement iCalendar du technicien (technicien lui-même ou Bureau/Admin de son entreprise)"""
+    role = (user or {}).get("role")
+    if user.get("id") != technician_id:
+        if role not in ("ADMIN", "BUREAU"):
+            raise HTTPException(status_code=403, detail="Accès refusé")
+        tech = _svc().table("users").select("id").eq("id", technician_id).eq("company_id", user.get("company_id")).execute()
+        if not tech.data:
+            raise HTTPException(status_code=404, detail="Technicien non trouvé")
+    
+    url = f"{str(request.base_url).rstrip('/')}/api/calendar/{feed_token(ICS_FEED_SECRET, technician_id)}.ics"
+    return {"url": url, "webcal_url": "webcal://" + url.split("://", 1)[1]}
+
+@api_router.get("/calendar/{token}.ics")
+async def get_technician_calendar_feed(token: str, request: Request):
+    """Flux ICS (sans authentification: l'URL signée fait office de jeton). ETag / Last-Modified -> 304"""
+    technician_id = parse_feed_token(ICS_FEED_SECRET, token)
+    if not technician_id:
+        raise HTTPException(status_code=404, detail="Calendrier introuvable")
+    try:
+        feed = await asyncio.to_thread(ics_feeds.get, technician_id)
+    except Exception as e:
+        logger.error(f"❌ Erreur flux ICS {technician_id}: {e}")
+        raise HTTPException(status_code=500, detail="Erreur lors de la génération du calendrier")
+    if feed is None:
+        raise HTTPException(status_code=404, detail="Calendrier introuvable")
+    
+    headers = {"ETag": feed.etag, "Last-Modified": feed.last_modified, "Cache-Control": "private, max-age=300"}
+    if request.headers.get("if-none-match"):
+        not_modified = etag_matches(request.headers.get("if-none-match"), feed.etag)
+    else:
+        not_modified = request.headers.get("if-modified-since") == feed.last_modified
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=feed.body, media_type="text/calendar; charset=utf-8", headers=headers)
+
 # =============================================================================
 # TEAM LEADER COLLABORATORS - Gestion des équipes (1-10 collaborateurs par chef)
 # =============================================================================
@@ -7772,6 +9055,7 @@ async def assign_collaborator_to_team_leader(assignment: TeamLeaderCollaboratorA
             "is_active": True
         }).execute()
     
+    _invalidate_team_leader_stats(company_id)
     return res.data[0]
 
 @api_router.delete("/team-leaders/{team_leader_id}/collaborators/{collaborator_id}")
@@ -7788,66 +9072,79 @@ async def remove_collaborator_from_team_leader(team_leader_id: str, collaborator
     if not res.data:
         raise HTTPException(status_code=404, detail="Assignation introuvable")
     
+    _invalidate_team_leader_stats(user.get("company_id"))
     return {"removed": True}
 
-@api_router.get("/team-leaders-stats")
-async def get_team_leaders_with_stats(user=Depends(get_user_from_token)):
-    """Liste des chefs d'équipe avec statistiques (nombre de collaborateurs)."""
-    _ensure_bureau_or_admin(user)
-    company_id = user.get("company_id")
-    
-    logger.info(f"🔍 [team-leaders-stats] Récupération pour company_id: {company_id}")
+# Statistiques des chefs d'équipe par entreprise. Cache par worker: l'invalidation aux
+# (dés)assignations ne touche que le worker qui écrit, le TTL court borne l'écart des autres
+# (et les renommages d'utilisateurs) tout en absorbant les appels groupés d'un chargement de page.
+_TEAM_LEADER_STATS_CACHE: Dict[str, Dict[str, Any]] = {}
+_TEAM_LEADER_STATS_TTL = float(os.getenv("TEAM_LEADER_STATS_TTL", "5"))  # secondes
+# Génération par entreprise: un chargement commencé avant une invalidation n'est pas mis en cache
+_TEAM_LEADER_STATS_GENERATION: Dict[str, int] = {}
+
+def _invalidate_team_leader_stats(company_id: Optional[str]):
+    if company_id:
+        _TEAM_LEADER_STATS_GENERATION[company_id] = _TEAM_LEADER_STATS_GENERATION.get(company_id, 0) + 1
+        _TEAM_LEADER_STATS_CACHE.pop(company_id, None)
+
+def _load_team_leader_stats(company_id: str) -> List[Dict[str, Any]]:
+    """Chefs d'équipe + nom à jour + collaborateurs actifs, en un aller-retour (RPC)"""
+    try:
+        res = _svc().rpc("get_team_leaders_with_stats", {"p_company_id": company_id}).execute()
+        return res.data or []
+    except Exception as e:
+        # Migration 2026-10-19_team_leader_stats_rpc.sql pas encore appliquée: 3 requêtes groupées
+        logger.warning(f"⚠️ RPC get_team_leaders_with_stats indisponible: {e}")
     
-    # Récupérer tous les chefs d'équipe
-    team_leaders = _svc().table("planning_team_leaders").select("*").eq("company_id", company_id).execute()
-    logger.info(f"👥 [team-leaders-stats] Chefs trouvés: {len(team_leaders.data or [])}")
+    leaders = _svc().table("planning_team_leaders").select("*").eq("company_id", company_id).execute().data or []
+    if not leaders:
+        return []
+    user_ids = sorted({tl["user_id"] for tl in leaders if tl.get("user_id")})
+    users = {}
+    if user_ids:
+        users_res = _svc().table("users").select("id, first_name, last_name, email").in_("id", user_ids).execute()
+        users = {u["id"]: u for u in users_res.data or []}
+    collabs_res = _svc().table("team_leader_collaborators").select("""
+        team_leader_id,
+        collaborator:collaborator_id(id, first_name, last_name, email)
+    """).in_("team_leader_id", [tl["id"] for tl in leaders]).eq("is_active", True).execute()
+    by_leader: Dict[str, List[Dict[str, Any]]] = {}
+    for row in collabs_res.data or []:
+        by_leader.setdefault(row["team_leader_id"], []).append(row.get("collaborator"))
     
     result = []
-    for tl in team_leaders.data or []:
-        logger.debug(f"\n📊 [team-leaders-stats] Traitement chef ID: {tl['id']}")
-        logger.debug(f"   user_id dans planning_team_leaders: {tl.get('user_id')}")
-        logger.debug(f"   Données planning_team_leaders: first_name={tl.get('first_name')}, last_name={tl.get('last_name')}")
-        
-        # Récupérer les infos à jour depuis users en utilisant user_id
-        user_info = None
-        user_id = tl.get("user_id")  # Utiliser user_id au lieu de id
-        if user_id:
-            try:
-                user_res = _svc().table("users").select("first_name, last_name, email").eq("id", user_id).execute()
-                if user_res.data:
-                    user_info = user_res.data[0]
-                    logger.debug(f"   ✅ Données users récupérées: first_name={user_info.get('first_name')}, last_name={user_info.get('last_name')}")
-                else:
-                    logger.debug(f"   ⚠️ Aucune donnée users trouvée pour user_id={user_id}")
-            except Exception as e:
-                logger.error(f"   ❌ Erreur récupération users: {e}")
-        else:
-            logger.debug(f"   ⚠️ Pas de user_id défini")
-        
-        # Compter collaborateurs actifs
-        count_res = _svc().table("team_leader_collaborators").select("id", count="exact").eq("team_leader_id", tl["id"]).eq("is_active", True).execute()
-        
-        # Récupérer liste collaborateurs
-        collabs_res = _svc().table("team_leader_collaborators").select("""
-            collaborator:collaborator_id(id, first_name, last_name, email)
-        """).eq("team_leader_id", tl["id"]).eq("is_active", True).execute()
-        
+    for tl in leaders:
         # Utiliser les données de users si disponibles (plus à jour), sinon garder celles de planning_team_leaders
-        final_first = user_info.get("first_name") if user_info else tl.get("first_name")
-        final_last = user_info.get("last_name") if user_info else tl.get("last_name")
-        logger.debug(f"   📤 Valeurs finales envoyées: first_name={final_first}, last_name={final_last}")
-        
+        user_info = users.get(tl.get("user_id"))
+        assigned = by_leader.get(tl["id"], [])
         result.append({
             **tl,
-            "first_name": final_first,
-            "last_name": final_last,
+            "first_name": user_info.get("first_name") if user_info else tl.get("first_name"),
+            "last_name": user_info.get("last_name") if user_info else tl.get("last_name"),
             "email": user_info.get("email") if user_info else tl.get("email"),
-            "collaborators_count": count_res.count,
-            "collaborators": [c["collaborator"] for c in (collabs_res.data or []) if c.get("collaborator")]
+            "collaborators_count": len(assigned),
+            "collaborators": [c for c in assigned if c],
         })
-    
     return result
+
+@api_router.get("/team-leaders-stats")
+async def get_team_leaders_with_stats(user=Depends(get_user_from_token)):
+    """Liste des chefs d'équipe avec statistiques (nombre de collaborateurs)."""
+    _ensure_bureau_or_admin(user)
+    company_id = user.get("company_id")
     
+    now_epoch = time.monotonic()
+    cached = _TEAM_LEADER_STATS_CACHE.get(company_id)
+    if cached and now_epoch - cached["ts"] < _TEAM_LEADER_STATS_TTL:
+        return cached["data"]
+    
+    generation = _TEAM_LEADER_STATS_GENERATION.get(company_id, 0)
+    result = await asyncio.to_thread(_load_team_leader_stats, company_id)
+    logger.info(f"👥 [team-leaders-stats] {len(result)} chef(s) pour company_id: {company_id}")
+    # Invalidation pendant le chargement: résultat possiblement périmé, renvoyé sans être gardé
+    if _TEAM_LEADER_STATS_GENERATION.get(company_id, 0) == generation:
+        _TEAM_LEADER_STATS_CACHE[company_id] = {"data": result, "ts": now_epoch}
     return result
 
 @api_router.get("/worksites/validated")
@@ -8189,13 +9486,28 @@ async def upload_company_logo(
         uploads_dir.mkdir(parents=True, exist_ok=True)
         file_path = uploads_dir / unique_filename
         
-        with open(file_path, "wb") as f:
-            content = await logo.read()
-            f.write(content)
+        content = await logo.read()
+        async with aiofiles.open(file_path, "wb") as f:
+            await f.write(content)
         
         logo_url = f"/uploads/logos/{unique_filename}"
         
-        return {"logo_url": logo_url}
+        # Variantes servies directement par /uploads (cache immuable, nom unique):
+        # versions redimensionnées pour les logos raster, version gzip pour les SVG
+        logo_variants = {}
+        stem = Path(unique_filename).stem
+        if logo.content_type == "image/svg+xml":
+            async with aiofiles.open(f"{file_path}.gz", "wb") as f:
+                await f.write(gzip.compress(content, compresslevel=9))
+        else:
+            variants = await asyncio.to_thread(make_logo_variants, content)
+            for width, data in variants.items():
+                variant_name = f"{stem}_w{width}.png"
+                async with aiofiles.open(uploads_dir / variant_name, "wb") as f:
+                    await f.write(data)
+                logo_variants[str(width)] = f"/uploads/logos/{variant_name}"
+        
+        return {"logo_url": logo_url, "logo_variants": logo_variants}
     except HTTPException:
         raise
     except Exception as e:
@@ -8483,7 +9795,8 @@ app.include_router(api_router)
 # Monter le répertoire uploads pour servir les fichiers statiques (logos, etc.)
 uploads_dir = ROOT_DIR / "uploads"
 uploads_dir.mkdir(exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
+# Cache-Control immuable pour les noms uniques, ETag fort, Range et variantes .gz
+app.mount("/uploads", UploadsStaticFiles(directory=str(uploads_dir)), name="uploads")
 
 # CORS déjà configuré en haut du fichier (juste après app = FastAPI(...))
 
@@ -0,0 +1,151 @@
+"""
+Service des fichiers statiques /uploads pour SkyApp
+Cache HTTP long pour les fichiers à nom unique (UUID / empreinte SHA-256), ETag fort,
+requêtes HTTP Range (reprise / lecture partielle) et variantes précompressées (.gz)
+"""
+
+import hashlib
+import os
+import re
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+# Noms générés par l'API: jamais réécrits, donc cachables indéfiniment
+CONTENT_ADDRESSED_RE = re.compile(
+    r"(?:^|[_.-])(?P<sha>[0-9a-f]{64})(?:[_.@-]|$)"
+    r"|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}",
+    re.IGNORECASE,
+)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+CHUNK_SIZE = 64 * 1024
+
+
+def is_content_addressed(filename: str) -> bool:
+    """True si le nom de fichier contient un UUID ou une empreinte SHA-256"""
+    return CONTENT_ADDRESSED_RE.search(filename) is not None
+
+
+def strong_etag(filename: str, stat_result: os.stat_result) -> str:
+    """ETag fort: l'empreinte du nom si disponible, sinon dérivé de l'inode, taille et mtime"""
+    match = CONTENT_ADDRESSED_RE.search(filename)
+    if match and match.group("sha"):
+        return f'"{match.group("sha").lower()}"'
+    base = f"{stat_result.st_ino}-{stat_result.st_size}-{stat_result.st_mtime_ns}"
+    return f'"{hashlib.sha1(base.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Analyse un en-tête Range "bytes=start-end" (une seule plage).
+
+    Returns:
+        (start, end) inclusifs, ou None si l'en-tête est absent/multiple (=> réponse complète).
+
+    Raises:
+        ValueError si la plage n'est pas satisfiable (=> 416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if start_s == "":
+            # Suffixe: les N derniers octets
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError("plage vide")
+            return max(size - length, 0), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        raise ValueError("plage invalide")
+    if start >= size or end < start:
+        raise ValueError("plage non satisfiable")
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    """Réponse 206 Partial Content qui lit uniquement la plage demandée"""
+
+    def __init__(self, path: str, start: int, end: int, size: int, headers: dict):
+        super().__init__(status_code=206, headers=headers)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method", "GET").upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class UploadsStaticFiles(StaticFiles):
+    """StaticFiles avec en-têtes de cache, ETag fort, Range et variantes .gz"""
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        filename = os.path.basename(str(full_path))
+        etag = strong_etag(filename, stat_result)
+        headers = {
+            "etag": etag,
+            "accept-ranges": "bytes",
+            "cache-control": IMMUTABLE_CACHE_CONTROL if is_content_addressed(filename) else REVALIDATE_CACHE_CONTROL,
+            "vary": "Accept-Encoding",
+        }
+
+        response: Response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+
+        # Variante précompressée générée à l'upload (ex: logo.svg.gz)
+        gz_path = f"{full_path}.gz"
+        range_header = request_headers.get("range")
+        if not range_header and "gzip" in request_headers.get("accept-encoding", "") and os.path.isfile(gz_path):
+            response = FileResponse(gz_path, status_code=status_code, stat_result=os.stat(gz_path),
+                                    media_type=response.media_type, headers={
+                                        **headers,
+                                        "etag": etag[:-1] + '-gz"',
+                                        "content-encoding": "gzip",
+                                    })
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        # Plage d'octets (sauf si If-Range ne correspond plus à la version actuelle)
+        if_range = request_headers.get("if-range")
+        if range_header and status_code == 200 and (not if_range or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, stat_result.st_size)
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat_result.st_size}"})
+            if byte_range is not None:
+                start, end = byte_range
+                return RangeFileResponse(str(full_path), start, end, stat_result.st_size, {
+                    **headers,
+                    "content-type": response.media_type or "application/octet-stream",
+                })
+        return response
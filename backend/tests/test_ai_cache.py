@@ -0,0 +1,64 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_cache import AIResponseCache  # noqa: E402
+
+
+def test_lru_bound_and_persistence(tmp_path):
+    path = str(tmp_path / "ai_cache.sqlite3")
+    cache = AIResponseCache(path, max_entries=2, ttl=60)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"success": True, "message": key}, "co1")
+    assert cache.stats()["memory_entries"] == 2 and cache.metrics["evictions"] == 1
+
+    # "a" a quitté la mémoire mais reste sur disque
+    assert cache.get("a") == {"success": True, "message": "a"}
+    assert cache.metrics["disk_hits"] == 1
+
+    # Nouveau worker / redémarrage: même fichier
+    restarted = AIResponseCache(path, max_entries=2, ttl=60)
+    assert restarted.get("c")["message"] == "c"
+    assert restarted.get("z") is None
+    assert restarted.stats()["hit_rate"] == "50.0%"
+
+    restarted.clear("co1")
+    assert restarted.get("c") is None
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = AIResponseCache(str(tmp_path / "ai_cache.sqlite3"), ttl=0)
+    cache.set("a", {"success": True})
+    assert cache.get("a") is None
+    assert cache.metrics["expired"] >= 1 and cache.metrics["misses"] == 1
+
+
+def test_data_generation_is_shared_by_workers(tmp_path):
+    path = str(tmp_path / "ai_cache.sqlite3")
+    worker1, worker2 = AIResponseCache(path, ttl=60), AIResponseCache(path, ttl=60)
+    assert worker1.generation("co1") == 0
+    # Écriture traitée par l'autre worker: la génération suit dans ce worker et après redémarrage
+    worker2.data_changed("co1")
+    assert worker1.generation("co1") == 1 and AIResponseCache(path).generation("co1") == 1
+    assert worker1.generation("co2") == 0
+
+    memory_only = AIResponseCache(path="")
+    memory_only.data_changed("co1")
+    assert memory_only.generation("co1") == 1
+
+
+def test_exact_answer_is_not_served_after_a_data_write(tmp_path):
+    import ai_service
+
+    service = ai_service.AIService(None, api_key="your-openai-api-key-here",
+                                   cache=AIResponseCache(str(tmp_path / "ai_cache.sqlite3")))
+    key = service._get_cache_key("co1", "combien de devis ?")
+    service._store_answer("co1", key, "combien de devis ?", None, {"success": True, "message": "3"}, 0)
+    assert service._cached_answer("co1", service._get_cache_key("co1", "combien de devis ?"),
+                                  "combien de devis ?", [{"role": "user", "content": "x"}])["message"] == "3"
+
+    service.cache.data_changed("co1")
+    assert service._cached_answer("co1", service._get_cache_key("co1", "combien de devis ?"),
+                                  "combien de devis ?", [{"role": "user", "content": "x"}]) is None
@@ -0,0 +1,62 @@
+import asyncio
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_history import HistoryCompactor, estimate_tokens, message_tokens  # noqa: E402
+
+
+def _conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}: montre les devis du chantier numéro {i} " * 5})
+        history.append({"role": "assistant", "content": f"Réponse {i}: voici les trois devis trouvés pour ce chantier " * 5})
+    return history
+
+
+def test_short_history_is_kept_verbatim():
+    compactor = HistoryCompactor()
+    history = _conversation(2) + [{"role": "function", "name": "x", "content": "{}"}]
+    messages, report = asyncio.run(compactor.compact("co1", history, 2000))
+    assert messages == history[:4] and report["tokens_saved"] == 0 and report["summary"] is None
+
+
+def test_long_history_fits_budget_with_rolling_summary():
+    calls = []
+
+    async def summarizer(company_id, previous, messages):
+        calls.append((previous, len(messages)))
+        return f"résumé de {len(messages)} messages" + (f" après [{previous}]" if previous else "")
+
+    compactor = HistoryCompactor(summarizer)
+    history = _conversation(20)
+    messages, report = asyncio.run(compactor.compact("co1", history, 1200))
+    assert sum(message_tokens(m) for m in messages) <= 1200
+    assert messages[0]["role"] == "system" and messages[-1] == history[-1]
+    assert report["summary"] == "generated" and report["summarized"] % 6 == 0
+    assert report["tokens_saved"] == report["tokens_in"] - report["tokens_sent"] > 0
+
+    # Tours suivants: le préfixe résumé est relu depuis le cache tant que la fenêtre le permet,
+    # puis seul le nouveau bloc est résumé, à partir du résumé précédent
+    origins = []
+    for _ in range(6):
+        history += _conversation(1)
+        messages, report = asyncio.run(compactor.compact("co1", history, 1200))
+        assert sum(message_tokens(m) for m in messages) <= 1200 and messages[-1] == history[-1]
+        origins.append(report["summary"])
+    assert "cached" in origins and len(calls) == 1 + origins.count("generated") <= 4
+    assert all(previous is not None and count <= 12 for previous, count in calls[1:])
+
+
+def test_summarizer_failure_falls_back_to_local_summary():
+    async def failing(company_id, previous, messages):
+        raise RuntimeError("quota")
+
+    compactor = HistoryCompactor(failing)
+    huge = [{"role": "user", "content": "mot " * 5000}]
+    messages, report = asyncio.run(compactor.compact("co1", _conversation(10) + huge, 800))
+    assert report["summary"] == "extractive" and "Utilisateur:" in messages[0]["content"]
+    assert sum(message_tokens(m) for m in messages) <= 800
+    assert estimate_tokens(messages[-1]["content"]) < 600
@@ -0,0 +1,52 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_limiter import OpenAILimiter, RateLimitExceeded  # noqa: E402
+
+
+def test_identical_inflight_calls_share_one_request():
+    limiter = OpenAILimiter(max_concurrency=2, company_rate=60, company_burst=10)
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "réponse"
+
+    async def run():
+        return await asyncio.gather(*(limiter.call("co1", "même-question", factory) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["réponse"] * 5
+    assert len(calls) == 1 and limiter.metrics["coalesced"] == 4
+
+
+def test_company_quota_and_global_cap_fail_fast():
+    limiter = OpenAILimiter(max_concurrency=1, max_queue=0, company_rate=60, company_burst=2)
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        first = asyncio.ensure_future(limiter.call("co1", "a", slow))
+        await asyncio.sleep(0)
+        # Plafond global atteint et file pleine: refus immédiat
+        with pytest.raises(RateLimitExceeded) as exc:
+            await limiter.call("co2", "b", slow)
+        assert exc.value.status_code == 429 and exc.value.scope == "global"
+        await first
+        # Rafale de l'entreprise épuisée (2 unités): 429 avec Retry-After
+        await limiter.call("co1", "c", slow)
+        with pytest.raises(RateLimitExceeded) as exc:
+            await limiter.call("co1", "d", slow)
+        assert exc.value.scope == "company" and exc.value.headers["Retry-After"] == "1"
+
+    asyncio.run(run())
+    stats = limiter.stats()
+    assert stats["rejected_global"] == 1 and stats["rejected_company"] == 1 and stats["calls"] == 2
@@ -0,0 +1,74 @@
+import asyncio
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_replay import FixtureMissing, RecordReplayTransport  # noqa: E402
+
+COMPLETION = {"id": "x", "choices": [{"message": {"role": "assistant", "content": "Bonjour"}}]}
+SSE = b'data: {"choices":[{"delta":{"content":"Bon"}}]}\n\ndata: {"choices":[{"delta":{"content":"jour"}}]}\n\ndata: [DONE]\n\n'
+
+
+def _upstream(request):
+    if json.loads(request.content).get("stream"):
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=SSE)
+    return httpx.Response(200, json=COMPLETION)
+
+
+async def _post(transport, body, stream=False):
+    async with httpx.AsyncClient(transport=transport, base_url="https://api.openai.com/v1") as client:
+        if not stream:
+            return (await client.post("/chat/completions", json=body)).json()
+        async with client.stream("POST", "/chat/completions", json=body) as response:
+            return [chunk async for chunk in response.aiter_bytes()]
+
+
+def test_record_then_replay(tmp_path):
+    recorder = RecordReplayTransport(tmp_path, "record", inner=httpx.MockTransport(_upstream))
+    body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Salut"}]}
+    assert asyncio.run(_post(recorder, body)) == COMPLETION
+    asyncio.run(_post(recorder, {**body, "stream": True}, stream=True))
+    assert recorder.stats["recorded"] == 2 and len(list(tmp_path.glob("*.json"))) == 2
+
+    player = RecordReplayTransport(tmp_path, "replay", latency=0.01)
+    assert asyncio.run(_post(player, body)) == COMPLETION
+    chunks = asyncio.run(_post(player, {**body, "stream": True}, stream=True))
+    assert b"".join(chunks) == SSE and len(chunks) == 3
+    assert player.stats["replayed"] == 2 and player.stats["model_wait_ms"] == pytest.approx(20)
+
+    with pytest.raises(FixtureMissing):
+        asyncio.run(_post(player, {**body, "temperature": 0}))
+
+
+def test_missing_exchange_is_synthesized_once(tmp_path):
+    calls = []
+
+    def responder(body):
+        calls.append(body)
+        return COMPLETION
+
+    player = RecordReplayTransport(tmp_path, "replay", latency=0, on_miss=responder)
+    body = {"model": "gpt-4o-mini", "messages": []}
+    assert asyncio.run(_post(player, body)) == asyncio.run(_post(player, body)) == COMPLETION
+    assert len(calls) == 1 and player.stats["synthesized"] == 1 and player.stats["replayed"] == 2
+
+
+def test_record_gzip_upstream(tmp_path):
+    def upstream(request):
+        return httpx.Response(200, content=gzip.compress(json.dumps(COMPLETION).encode()),
+                              headers={"content-type": "application/json", "content-encoding": "gzip"})
+
+    recorder = RecordReplayTransport(tmp_path, "record", inner=httpx.MockTransport(upstream))
+    body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "gzip"}]}
+    assert asyncio.run(_post(recorder, body)) == COMPLETION
+    # Fixture lisible (corps décodé) et rejouable
+    fixture = json.loads(next(tmp_path.glob("*.json")).read_text(encoding="utf-8"))
+    assert json.loads(fixture["response"]["body"]) == COMPLETION
+    assert asyncio.run(_post(RecordReplayTransport(tmp_path, "replay", latency=0), body)) == COMPLETION
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_semantic_cache import SemanticCache, normalize_query  # noqa: E402
+
+
+def test_near_duplicates_reuse_the_answer():
+    assert normalize_query("Les devis de Dupont ?") == normalize_query("devis Dupont")
+
+    cache = SemanticCache(threshold=0.9, max_age=60)
+    cache.store("co1", "Montre-moi les devis de Dupont", {"success": True, "message": "3 devis"},
+                tokens_used=900, cost=0.0004)
+    hit = cache.lookup("co1", "les devis Dupont ?")
+    assert hit is not None and hit[0]["message"] == "3 devis" and hit[1] > 0.99
+
+    # Autre client, autre montant, autre entreprise: pas de réutilisation
+    assert cache.lookup("co1", "devis de Martin") is None
+    assert cache.lookup("co2", "devis de Dupont") is None
+    cache.store("co1", "devis de plus de 5000 euros", {"success": True})
+    assert cache.lookup("co1", "devis de plus de 8000 euros") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["tokens_saved"] == 900 and stats["cost_saved"] == 0.0004
+
+
+def test_data_changes_make_answers_stale():
+    cache = SemanticCache(threshold=0.9, max_age=60)
+    cache.store("co1", "devis de Dupont", {"success": True})
+    cache.data_changed("co1")
+    assert cache.lookup("co1", "devis Dupont") is None
+    assert cache.metrics["stale"] == 1
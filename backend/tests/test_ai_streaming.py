@@ -0,0 +1,36 @@
+import asyncio
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import ai_service  # noqa: E402
+from ai_cache import AIResponseCache  # noqa: E402
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_simulation_streams_tokens_then_full_answer(monkeypatch):
+    monkeypatch.setattr(ai_service, "SIMULATION_TOKEN_DELAY", 0)
+    service = ai_service.AIService(None, api_key="your-openai-api-key-here", cache=AIResponseCache(path=""))
+
+    events = asyncio.run(_collect(service.universal_query_stream("co1", "statistiques du mois", "ADMIN")))
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "meta" and kinds[-1] == "done" and kinds.count("token") > 5
+    done = events[-1][1]
+    assert "".join(data["delta"] for kind, data in events if kind == "token") == done["message"]
+    assert done == service._simulate_response("statistiques du mois")
+
+
+def test_cached_answer_is_replayed():
+    service = ai_service.AIService(None, api_key="your-openai-api-key-here", cache=AIResponseCache(path=""))
+    answer = {"success": True, "message": "3 devis trouvés", "tokens_used": 120}
+    service.cache.set(service._get_cache_key("co1", "devis Dupont"), answer, "co1")
+
+    events = asyncio.run(_collect(service.universal_query_stream("co1", "devis Dupont", "ADMIN")))
+    assert events[0] == ("meta", {"stage": "cache", "cached": "exact"})
+    assert [data["delta"] for kind, data in events if kind == "token"] == ["3 ", "devis ", "trouvés"]
+    assert events[-1] == ("done", answer)
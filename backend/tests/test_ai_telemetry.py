@@ -0,0 +1,98 @@
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import ai_service  # noqa: E402
+from ai_cache import AIResponseCache  # noqa: E402
+from ai_telemetry import AITelemetry, percentile, summarize  # noqa: E402
+
+
+class FakeTable:
+    def __init__(self, client):
+        self.client = client
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        if self.client.failures:
+            self.client.failures -= 1
+            raise ConnectionError("base injoignable")
+        self.client.batches.append(self.rows)
+
+
+class FakeClient:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def table(self, name):
+        assert name == "ai_usage_events"
+        return FakeTable(self)
+
+
+def test_events_are_written_in_batches_and_retried():
+    client = FakeClient(failures=1)
+    telemetry = AITelemetry(client, batch_size=2)
+    for i in range(5):
+        telemetry.record("co1", "universal_query", "gpt-4o-mini", 100, 20, 0.001, latency_ms=100 * (i + 1))
+
+    assert asyncio.run(telemetry.flush()) == 0 and telemetry.stats()["buffered"] == 5
+    assert asyncio.run(telemetry.flush()) == 5
+    assert [len(batch) for batch in client.batches] == [2, 2, 1]
+    assert telemetry.stats()["flush_errors"] == 1 and telemetry.stats()["buffered"] == 0
+
+
+def test_local_rollup_percentiles_and_daily_cost():
+    assert percentile([100, 200, 300, 400, 500], 0.5) == 300
+    assert percentile([100, 200, 300, 400, 500], 0.95) == 480
+
+    telemetry = AITelemetry()
+    for latency in (100, 200, 300):
+        telemetry.record("co1", "universal_query", "gpt-4o-mini", 100, 20, 0.5, latency_ms=latency)
+    telemetry.record("co1", "universal_query", cache="semantic", latency_ms=2)
+    telemetry.record("co2", "improve_text", "gpt-4o-mini", 10, 10, 0.25, latency_ms=50, success=False)
+
+    rollup = asyncio.run(telemetry.rollup("co1"))
+    assert rollup["source"] == "local" and rollup["totals"]["requests"] == 4
+    function = rollup["by_function"][0]
+    assert function["cache_hits"] == 1 and function["latency_ms_p50"] == 200  # hors réponses du cache
+    assert rollup["by_company_day"][0]["cost"] == 1.5
+
+    overall = summarize(telemetry._recent)
+    assert overall["totals"]["errors"] == 1 and len(overall["by_company_day"]) == 2
+
+
+def test_query_and_its_tool_calls_make_one_event():
+    telemetry = AITelemetry()
+    service = ai_service.AIService(None, api_key="sk-test", cache=AIResponseCache(path=""), telemetry=telemetry)
+    usage = SimpleNamespace(total_tokens=120, prompt_tokens=100, completion_tokens=20)
+    call = SimpleNamespace(id="c1", function=SimpleNamespace(name="predict_delays", arguments="{}"))
+    replies = [SimpleNamespace(content=None, tool_calls=[call]),
+               SimpleNamespace(content='{"at_risk": 0}', tool_calls=None),
+               SimpleNamespace(content="Aucun retard prévu", tool_calls=None)]
+
+    async def create(**params):
+        return SimpleNamespace(choices=[SimpleNamespace(message=replies.pop(0))], usage=usage)
+
+    async def execute(query):
+        return SimpleNamespace(data=[])
+
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    service._execute = execute
+    service.supabase = SimpleNamespace(table=lambda name: SimpleNamespace(
+        select=lambda *a: SimpleNamespace(eq=lambda *a: SimpleNamespace(in_=lambda *a: None))))
+
+    result = asyncio.run(service.universal_query("co1", "retards prévus ?", "ADMIN"))
+    assert result["message"] == "Aucun retard prévu"
+    assert asyncio.run(service.universal_query("co1", "retards prévus ?", "ADMIN")) == result
+
+    first, second = telemetry._recent
+    assert first["function"] == "universal_query" and first["prompt_tokens"] == 300  # 3 appels, dont predict_delays
+    assert first["cache"] == "miss" and first["model"] == "gpt-4o-mini" and first["success"]
+    assert second["cache"] == "exact" and second["prompt_tokens"] == 0
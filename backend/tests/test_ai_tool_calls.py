@@ -0,0 +1,74 @@
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import ai_service  # noqa: E402
+from ai_cache import AIResponseCache  # noqa: E402
+
+
+def _completion(message):
+    usage = SimpleNamespace(total_tokens=10, prompt_tokens=8, completion_tokens=2)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def _tool_call(call_id, name, arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.requests = []
+
+    async def create(self, **params):
+        self.requests.append(params)
+        if len(self.requests) == 1:
+            return _completion(SimpleNamespace(content=None, tool_calls=[
+                _tool_call("c1", "search_clients", {"name": "Dupont"}),
+                _tool_call("c2", "search_devis", {"status": "SENT"}),
+                _tool_call("c3", "get_statistics", {"period": "month"}),
+            ]))
+        return _completion(SimpleNamespace(content="Synthèse", tool_calls=None))
+
+
+def test_tool_calls_run_concurrently_with_timeout_and_partial_failure():
+    service = ai_service.AIService(None, api_key="sk-test", cache=AIResponseCache(path=""))
+    completions = FakeCompletions()
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    service.tool_timeout = 0.5
+
+    async def search_clients(company_id, filters):
+        await asyncio.sleep(0.3)
+        return [{"id": "c1", "nom": filters["name"]}]
+
+    async def search_devis(company_id, filters):
+        await asyncio.sleep(5)
+
+    async def get_statistics(company_id, period="month"):
+        raise RuntimeError("base indisponible")
+
+    service.functions.update(search_clients=search_clients, search_devis=search_devis, get_statistics=get_statistics)
+
+    started = time.perf_counter()
+    result = asyncio.run(service.universal_query("co1", "Dupont et ses devis envoyés", "ADMIN"))
+    assert time.perf_counter() - started < 1.5  # 0.3 s + délai de 0.5 s, pas 5.8 s en série
+
+    assert result["success"] and result["message"] == "Synthèse"
+    assert result["functions_called"] == ["search_clients", "search_devis", "get_statistics"]
+    assert result["data"][0] == {"function": "search_clients", "result": [{"id": "c1", "nom": "Dupont"}]}
+    assert {f["function"]: f["status"] for f in result["failed_functions"]} == {
+        "search_devis": "timeout", "get_statistics": "error"}
+    assert [t["status"] for t in result["latency"]["tools"]] == ["ok", "timeout", "error"]
+    assert result["latency"]["tools_ms"] < 1000 and result["latency"]["total_ms"] >= result["latency"]["tools_ms"]
+
+    # Tour final: un message assistant avec les 3 appels puis un message "tool" par appel
+    final_messages = completions.requests[1]["messages"]
+    assert [m["role"] for m in final_messages[-4:]] == ["assistant", "tool", "tool", "tool"]
+    assert json.loads(final_messages[-1]["content"]) == {"error": "base indisponible"}
+    # Échec partiel: rien en cache
+    assert service.cache.stats()["writes"] == 0
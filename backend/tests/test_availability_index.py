@@ -0,0 +1,111 @@
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from availability_index import AvailabilityIndex  # noqa: E402
+
+DAY = date.today() + timedelta(days=3)
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db, self.table, self.filters = db, table, []
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in set(values))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) >= value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) <= value)
+        return self
+
+    def or_(self, *args):
+        # Fenêtre de dates: les plannings du test sont tous dans la fenêtre
+        return self
+
+    def execute(self):
+        rows = self.db.availability.values() if self.table == "technician_availability" else self.db.tables[self.table]
+        return SimpleNamespace(data=[dict(r) for r in rows if all(f(r) for f in self.filters)])
+
+
+class FakeClient:
+    """Tables en mémoire + RPC refresh_technician_availability (upsert conditionné par la version)"""
+
+    def __init__(self, schedules, versions=None):
+        self.tables = {
+            "schedules": schedules,
+            "schedule_sync_versions": [{"company_id": "co", "collaborator_id": c, "version": v}
+                                       for c, v in (versions or {}).items()],
+            "users": [{"id": "t1", "company_id": "co", "role": "TECHNICIEN", "first_name": "Ana"},
+                      {"id": "t2", "company_id": "co", "role": "TECHNICIEN", "first_name": "Bob"}],
+        }
+        self.availability, self.rpc_calls = {}, []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        self.rpc_calls.append(params)
+        for row in params["p_rows"]:
+            key = (row["collaborator_id"], row["day"])
+            current = self.availability.get(key)
+            if current is None or current["sync_version"] <= row["sync_version"]:
+                self.availability[key] = {**row, "company_id": params["p_company_id"]}
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=len(params["p_rows"])))
+
+
+def _schedule(collaborator_id, day, time="08:00", end_time="12:00", **extra):
+    return {"id": f"s-{collaborator_id}-{day}", "company_id": "co", "collaborator_id": collaborator_id,
+            "start_date": day.isoformat(), "end_date": day.isoformat(), "time": time, "end_time": end_time, **extra}
+
+
+def test_refresh_for_schedules_covers_old_and_new_days():
+    moved = _schedule("t1", DAY + timedelta(days=2))
+    client = FakeClient([moved], versions={"t1": 4})
+    old = {**moved, "start_date": DAY.isoformat(), "end_date": DAY.isoformat()}
+    count = AvailabilityIndex(client).refresh_for_schedules("co", [old, moved])
+    # Ancien jour -> nouveau jour + lendemain (créneaux de nuit)
+    assert count == 4 and len(client.rpc_calls) == 1
+    assert client.rpc_calls[0]["p_first_day"] == DAY.isoformat()
+    assert client.availability[("t1", DAY.isoformat())]["free_intervals"] == [[0, 1440]]
+    moved_day = client.availability[("t1", (DAY + timedelta(days=2)).isoformat())]
+    assert moved_day["free_intervals"] == [[0, 480], [720, 1440]] and moved_day["busy_minutes"] == 240
+    assert moved_day["sync_version"] == 4
+
+
+def test_stale_refresh_does_not_overwrite_newer_rows():
+    client = FakeClient([_schedule("t1", DAY)], versions={"t1": 5})
+    index = AvailabilityIndex(client)
+    index.refresh("co", ["t1"], DAY, DAY)
+    # Tâche de fond plus ancienne (version 3) qui se termine après: ignorée
+    client.tables["schedules"] = []
+    client.tables["schedule_sync_versions"][0]["version"] = 3
+    index.refresh("co", ["t1"], DAY, DAY)
+    assert client.availability[("t1", DAY.isoformat())]["busy_minutes"] == 240
+
+
+def test_available_uses_index_and_computes_missing_days():
+    client = FakeClient([_schedule("t2", DAY, "09:00", "17:00"), _schedule("t2", DAY + timedelta(days=1))])
+    index = AvailabilityIndex(client)
+    index.refresh("co", ["t1"], DAY, DAY + timedelta(days=1))
+    result = index.available("co", DAY, DAY + timedelta(days=1), 10 * 60, 11 * 60)
+    # t1 indexé (2 jours), t2 absent de l'index: calculé à la volée
+    assert result["indexed_days"] == 2 and result["computed_days"] == 2
+    assert [e["collaborator_id"] for e in result["available"]] == ["t1"]
+    assert result["unavailable"] == [{"collaborator_id": "t2", "name": "Bob"}]
+    assert result["available"][0]["free_intervals"][DAY.isoformat()] == [["00:00", "24:00"]]
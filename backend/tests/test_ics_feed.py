@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ics_feed import _fold, feed_token, parse_feed_token, render_event  # noqa: E402
+
+
+def test_feed_token_is_signed():
+    token = feed_token("secret", "tech-1")
+    assert parse_feed_token("secret", token) == "tech-1"
+    assert parse_feed_token("other", token) is None
+    assert parse_feed_token("secret", "tech-2." + token.split(".")[1]) is None
+
+
+def test_single_date_and_period_events():
+    night = render_event({"id": "s1", "date": "2026-03-02", "time": "22:00", "end_time": "06:00",
+                          "client_name": "Dupont, SA", "updated_at": "2026-03-01T10:00:00+00:00"})
+    assert "DTSTART;TZID=Europe/Paris:20260302T220000" in night
+    assert "DTEND;TZID=Europe/Paris:20260303T060000" in night
+    assert "SUMMARY:Dupont\\, SA" in night and "RRULE" not in night
+
+    period = render_event({"id": "s2", "start_date": "2026-03-02", "end_date": "2026-03-06", "time": "08:00",
+                           "hours": 8, "status": "cancelled"}, worksite={"title": "Chantier A", "address": "Lyon"})
+    assert "RRULE:FREQ=DAILY;COUNT=5" in period
+    assert "DTEND;TZID=Europe/Paris:20260302T160000" in period
+    assert "LOCATION:Lyon" in period and "STATUS:CANCELLED" in period
+
+    all_day = render_event({"id": "s3", "start_date": "2026-03-02", "end_date": "2026-03-03"})
+    assert "DTEND;VALUE=DATE:20260304" in all_day
+
+
+def test_long_lines_are_folded_on_octets():
+    folded = _fold("DESCRIPTION:" + "é" * 80)
+    assert all(len(part.encode("utf-8")) <= 75 for part in folded.split("\r\n"))
+    assert folded.replace("\r\n ", "") == "DESCRIPTION:" + "é" * 80
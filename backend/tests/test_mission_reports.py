@@ -0,0 +1,80 @@
+import hashlib
+import io
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server_supabase  # noqa: E402
+
+USER = {"id": "tech-1", "email": "t@t.com", "role": "TECHNICIEN", "company_id": "comp-1"}
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.rpc_calls = []
+
+    def rpc(self, name, params):
+        self.rpc_calls.append((name, params))
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=[{"id": "r1", **params["p_report"]}]))
+
+
+def _jpeg(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    supabase = FakeSupabase()
+    thumbnails = []
+
+    async def company(user_data):
+        return "comp-1"
+
+    reports_dir = tmp_path / "mission-reports"
+    monkeypatch.setattr(server_supabase, "supabase_service", supabase)
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+    monkeypatch.setattr(server_supabase, "MISSION_REPORTS_DIR", reports_dir)
+    monkeypatch.setattr(server_supabase, "MISSION_REPORT_THUMBS_DIR", reports_dir / "thumbs")
+    # Petits blocs: la photo est lue en plusieurs morceaux
+    monkeypatch.setattr(server_supabase, "MISSION_REPORT_CHUNK_SIZE", 64)
+    monkeypatch.setattr(server_supabase, "_generate_mission_report_thumbnails", thumbnails.extend)
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = lambda: USER
+    yield SimpleNamespace(client=TestClient(server_supabase.app), supabase=supabase,
+                          thumbnails=thumbnails, dir=reports_dir)
+    server_supabase.app.dependency_overrides.clear()
+
+
+def test_photos_named_by_sha256_and_report_created_by_rpc(api):
+    red, blue = _jpeg("red"), _jpeg("blue")
+    response = api.client.post("/api/mission-reports", data={
+        "mission_id": "m1", "works_performed": "Pose", "duration_hours": "2.5",
+    }, files=[
+        ("photos_before", ("avant.jpg", red, "image/jpeg")),
+        ("photos_after", ("apres.jpg", blue, "image/jpeg")),
+        ("photos_after", ("copie.jpg", red, "image/jpeg")),  # même contenu qu'une photo avant
+    ])
+    assert response.status_code == 200 and response.json()["data"]["id"] == "r1"
+
+    red_path = f"mission-reports/{hashlib.sha256(red).hexdigest()}.jpg"
+    blue_path = f"mission-reports/{hashlib.sha256(blue).hexdigest()}.jpg"
+    name, params = api.supabase.rpc_calls[0]
+    report = params["p_report"]
+    assert name == "create_mission_report" and len(api.supabase.rpc_calls) == 1
+    assert report["mission_id"] == "m1" and report["technician_id"] == "tech-1"
+    assert report["company_id"] == "comp-1" and report["duration_hours"] == 2.5
+    assert report["photos_before"] == [red_path]
+    assert sorted(report["photos_after"]) == sorted([blue_path, red_path])
+
+    # Un seul fichier par contenu, aucun fichier temporaire laissé sur disque
+    files = sorted(p.name for p in api.dir.iterdir() if p.is_file())
+    assert files == sorted(Path(p).name for p in (red_path, blue_path))
+    assert sorted(api.thumbnails) == sorted([red_path, blue_path, red_path])
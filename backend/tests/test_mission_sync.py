@@ -0,0 +1,151 @@
+import sys
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server_supabase  # noqa: E402
+from mission_sync import LEGACY_VERSION, MissionSyncSource, SyncCursor, parse_sync_cursor, synchronize  # noqa: E402
+
+TODAY = date(2026, 10, 19)
+
+
+class Source:
+    """Données d'un technicien: missions (id -> version d'écriture), tombstones, sorties de fenêtre"""
+
+    def __init__(self, version=7, purged_version=0):
+        self.versions = {"version": version, "purged_version": purged_version}
+        self.rows = {"m1": 3, "m2": 6, "m3": 7}
+        self.tombs = {"m9": 5, "m8": 2}
+        self.outside = {"m2": 6, "m4": 6}
+        self.calls = []
+
+    def source(self, prepare=None):
+        return MissionSyncSource(
+            state=lambda: dict(self.versions),
+            load=self.load,
+            tombstones=lambda v: [i for i, w in self.tombs.items() if w > v],
+            left_scope=lambda cursor: [i for i, w in self.outside.items() if w > cursor.version],
+            prepare=prepare,
+        )
+
+    def load(self, version):
+        self.calls.append(version)
+        # Écriture validée pendant la lecture: elle aura la version 8, après le curseur renvoyé
+        self.versions["version"] = 8
+        return [{"id": i} for i, w in self.rows.items() if version is None or w > version]
+
+
+def test_cursor_format_and_legacy_timestamps():
+    assert str(SyncCursor(12, TODAY)) == "12:2026-10-19"
+    assert parse_sync_cursor("12:2026-10-19") == SyncCursor(12, TODAY)
+    assert parse_sync_cursor("2026-10-18T08:00:00Z").version == LEGACY_VERSION
+    assert parse_sync_cursor(None) is None
+    with pytest.raises(ValueError):
+        parse_sync_cursor("demain")
+
+
+def test_incremental_sync_returns_changes_and_removed_ids():
+    data = Source()
+    result = synchronize(data.source(), "tech", "w", SyncCursor(4, TODAY), None, TODAY)
+    assert [row["id"] for row in result.rows] == ["m2", "m3"] and data.calls == [4]
+    # tombstones + sorties de fenêtre, sans les missions renvoyées
+    assert result.deleted == ["m4", "m9"] and not result.full_sync
+    # Curseur = version lue avant les missions: l'écriture concurrente (8) sera relue
+    assert result.cursor == "7:2026-10-19"
+
+
+def test_not_modified_skips_loading_and_prepare():
+    data = Source()
+    first = synchronize(data.source(), "tech", "w", None, None, TODAY)
+    assert [row["id"] for row in first.rows] == ["m1", "m2", "m3"] and first.deleted is None
+
+    data.versions["version"] = 7
+    prepared = []
+    result = synchronize(data.source(lambda: prepared.append(1)), "tech", "w", SyncCursor(7, TODAY),
+                         f'"x", {first.etag}', TODAY)
+    assert result.status_code == 304 and data.calls == [None] and not prepared
+    # Autre fenêtre (ou autre jour): ETag différent
+    assert synchronize(data.source(), "tech", "w2", None, first.etag, TODAY).status_code == 200
+
+
+def test_prepare_writes_refresh_the_etag():
+    data = Source()
+
+    def prepare():
+        data.versions["version"] += 1
+        return True
+
+    # Nouveau jour (clé de fenêtre différente): l'auto-complétion écrit, l'ETag suit la nouvelle version
+    stale = synchronize(Source().source(), "tech", "w|2026-10-19", None, None, TODAY)
+    result = synchronize(data.source(prepare), "tech", "w|2026-10-19", SyncCursor(7, TODAY), None, TODAY)
+    assert result.etag != stale.etag and result.cursor == "8:2026-10-19"
+
+
+@pytest.mark.parametrize("cursor,purged", [
+    (SyncCursor(LEGACY_VERSION, TODAY), 0),  # ancien curseur horodaté
+    (SyncCursor(3, TODAY), 4),  # tombstones purgées après le curseur
+    (SyncCursor(99, TODAY), 0),  # curseur d'un autre compteur
+])
+def test_full_sync_when_cursor_cannot_be_trusted(cursor, purged):
+    data = Source(purged_version=purged)
+    result = synchronize(data.source(), "tech", "w", cursor, None, TODAY)
+    assert result.full_sync and result.deleted == [] and data.calls == [None] and len(result.rows) == 3
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db, self.table, self.action = db, table, "select"
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def update(self, values):
+        self.action = "update"
+        return self
+
+    @property
+    def not_(self):
+        return self
+
+    def execute(self):
+        self.db.calls.append((self.table, self.action))
+        if self.table == "schedule_sync_versions":
+            return SimpleNamespace(data=[{"version": 4, "purged_version": 0}])
+        return SimpleNamespace(data=[])
+
+
+@pytest.fixture
+def api(monkeypatch):
+    db = SimpleNamespace(calls=[], table=None)
+    db.table = lambda name: FakeQuery(db, name)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = \
+        lambda: {"id": "tech-1", "role": "TECHNICIEN", "company_id": "comp-1"}
+    yield SimpleNamespace(client=TestClient(server_supabase.app), db=db)
+    server_supabase.app.dependency_overrides.clear()
+
+
+def test_auto_complete_without_changes_keeps_ics_feed(api, monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(server_supabase.ics_feeds, "invalidate", lambda ids: invalidated.append(list(ids)))
+    assert api.client.get("/api/technicians/tech-1/missions").status_code == 200
+    assert ("schedules", "update") in api.db.calls and invalidated == []
+
+
+def test_technician_poll_is_304_without_auto_complete(api):
+    url = "/api/technicians/tech-1/missions"
+    first = api.client.get(url)
+    assert first.status_code == 200 and first.headers["X-Sync-Cursor"].startswith("4:")
+    assert ("schedules", "update") in api.db.calls
+
+    api.db.calls.clear()
+    again = api.client.get(url, params={"updated_since": first.headers["X-Sync-Cursor"]},
+                           headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert api.db.calls == [("schedule_sync_versions", "select")]
@@ -0,0 +1,78 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from name_directory import NameDirectory  # noqa: E402
+
+
+def test_directory_is_warmed_once_and_follows_writes():
+    calls = []
+
+    def loader(company_id):
+        calls.append(company_id)
+        return {
+            "users": [{"id": "u1", "first_name": "Paul", "last_name": "Durand", "company_id": company_id}],
+            "team_leaders": [{"id": "l1", "first_name": "Old", "last_name": "Name", "user_id": "u1"}],
+            "clients": [{"id": "c1", "nom": "Dupont", "adresse": "Lyon"}],
+        }
+
+    directory = NameDirectory(loader)
+    leader = {"id": "l1", "first_name": "Old", "last_name": "Name", "user_id": "u1"}
+    assert directory.team_leader_name("co1", leader) == "Paul Durand"
+    assert directory.get("co1", "clients", "c1")["nom"] == "Dupont"
+    assert directory.team_leader_name("co1", {"first_name": "Sans", "last_name": "Compte"}) == "Sans Compte"
+    assert calls == ["co1"]
+
+    # Écritures de l'API: pas de rechargement
+    directory.upsert("users", {"id": "u1", "first_name": "Paula", "company_id": "co1"})
+    assert directory.user_name("co1", "u1") == "Paula Durand"
+    directory.remove("clients", "c1", "co1")
+    assert "c1" not in directory._companies["co1"]["clients"]
+
+    # Id inconnu: un seul rechargement, puis limité dans le temps
+    assert directory.get("co1", "clients", "c2") is None
+    assert directory.get("co1", "clients", "c3") is None
+    assert calls == ["co1", "co1"]
+
+
+def test_directory_reloads_when_another_worker_wrote(monkeypatch):
+    import name_directory
+
+    clock = [1000.0]
+    monkeypatch.setattr(name_directory.time, "time", lambda: clock[0])
+    names, versions, calls = {"first_name": "Paul"}, {"co1": 3}, []
+
+    def loader(company_id):
+        calls.append(company_id)
+        return {"users": [{"id": "u1", "last_name": "Durand", **names}]}
+
+    directory = NameDirectory(loader, version=versions.get, revalidate_interval=5)
+    assert directory.user_name("co1", "u1") == "Paul Durand"
+
+    # Renommage par l'autre worker: visible à la revalidation suivante, pas avant
+    names["first_name"], versions["co1"] = "Pierre", 4
+    clock[0] += 2
+    assert directory.user_name("co1", "u1") == "Paul Durand"
+    clock[0] += 4
+    assert directory.user_name("co1", "u1") == "Pierre Durand"
+    # Version inchangée: pas de rechargement, même après l'ancien TTL
+    clock[0] += 700
+    assert directory.user_name("co1", "u1") == "Pierre Durand" and calls == ["co1", "co1"]
+
+
+def test_directory_without_version_counter_uses_short_ttl(monkeypatch):
+    import name_directory
+
+    clock = [1000.0]
+    monkeypatch.setattr(name_directory.time, "time", lambda: clock[0])
+    calls = []
+    directory = NameDirectory(lambda c: calls.append(c) or {"users": [{"id": "u1"}]}, version=lambda c: None)
+    directory.warm("co1")
+    clock[0] += name_directory.DIRECTORY_TTL - 1
+    directory.user_name("co1", "u1")
+    assert len(calls) == 1
+    clock[0] += 2
+    directory.user_name("co1", "u1")
+    assert len(calls) == 2
@@ -0,0 +1,138 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from period_stats import PeriodStatistics, bucket_start  # noqa: E402
+
+RPC_RESULT = {
+    "bucket": "week",
+    "quotes": [
+        {"status": "ACCEPTED", "period": "2026-10-05", "count": 2, "amount": 1500},
+        {"status": "SENT", "period": "2026-10-05", "count": 1, "amount": 300.5},
+        {"status": "ACCEPTED", "period": "2026-10-12", "count": 1, "amount": 200},
+    ],
+    "searches": [{"status": "PROCESSED", "period": "2026-10-12", "count": 3}],
+    "clients": 12,
+}
+
+
+class FakeQuery:
+    def __init__(self, client, name, data=None):
+        self.client, self.name, self.data = client, name, data
+        self.head, self.bounds = False, None
+
+    def select(self, columns, count=None, head=False):
+        self.client.selects.append((self.name, columns))
+        self.head = head
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def gte(self, *args):
+        return self
+
+    def order(self, *args):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        self.client.ranges.append((self.name, start, end))
+        return self
+
+    def execute(self):
+        if self.name == "get_period_statistics":
+            if self.client.rpc_error:
+                raise RuntimeError("function get_period_statistics does not exist")
+            return SimpleNamespace(data=RPC_RESULT)
+        rows = self.client.tables[self.name]
+        if self.head:
+            return SimpleNamespace(data=[], count=len(rows))
+        # max-rows PostgREST: jamais plus de 1000 lignes par réponse
+        start, end = self.bounds or (0, len(rows) - 1)
+        return SimpleNamespace(data=rows[start:min(end + 1, start + 1000)], count=None)
+
+
+class FakeClient:
+    def __init__(self, rpc_error=False, tables=None):
+        self.rpc_error, self.tables = rpc_error, tables or {}
+        self.calls, self.selects, self.ranges = [], [], []
+
+    def rpc(self, name, params):
+        self.calls.append(params)
+        return FakeQuery(self, name)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+def test_rpc_groups_are_summarized_and_cached():
+    client = FakeClient()
+    stats = PeriodStatistics(client, ttl=60)
+    result = asyncio.run(stats.get("co1", "month"))
+    assert client.calls[0]["p_bucket"] == "week"
+    assert result["quotes"]["total"] == 4 and result["quotes"]["amount"] == 2000.5
+    assert result["quotes"]["accepted"] == 3 and result["quotes"]["pending"] == 1
+    assert result["quotes"]["by_period"] == [{"period": "2026-10-05", "count": 3, "amount": 1800.5},
+                                             {"period": "2026-10-12", "count": 1, "amount": 200.0}]
+    assert result["clients"]["total"] == 12 and result["searches"]["processed"] == 3
+
+    assert asyncio.run(stats.get("co1", "month")) is result and len(client.calls) == 1
+    stats.invalidate("co1")
+    asyncio.run(stats.get("co1", "month"))
+    assert len(client.calls) == 2 and stats.stats()["hits"] == 1
+
+
+def test_fallback_reads_only_needed_columns():
+    now = datetime.now(timezone.utc)
+    client = FakeClient(rpc_error=True, tables={
+        "quotes": [{"status": "SENT", "amount": 100, "created_at": now.isoformat()},
+                   {"status": "SENT", "amount": None, "created_at": (now - timedelta(days=3)).isoformat()}],
+        "searches": [{"status": "DRAFT", "created_at": now.isoformat()}],
+        "clients": [{"id": "c1"}, {"id": "c2"}],
+    })
+    result = asyncio.run(PeriodStatistics(client).get("co1", "week"))
+    assert result["quotes"]["pending"] == 2 and result["quotes"]["amount"] == 100
+    assert len(result["quotes"]["by_period"]) == 2 and result["clients"]["total"] == 2
+    assert ("quotes", "status, amount, created_at") in client.selects
+    assert all(columns != "*" for _, columns in client.selects)
+
+
+def test_fallback_pages_past_the_row_cap(monkeypatch):
+    import period_stats
+
+    monkeypatch.setattr(period_stats, "FALLBACK_PAGE_SIZE", 2)
+    now = datetime.now(timezone.utc).isoformat()
+    client = FakeClient(rpc_error=True, tables={
+        "quotes": [{"status": "ACCEPTED", "amount": 10, "created_at": now}] * 5,
+        "searches": [{"status": "DRAFT", "created_at": now}] * 4,
+        "clients": [{"id": f"c{i}"} for i in range(3)],
+    })
+    result = asyncio.run(PeriodStatistics(client).get("co1", "week"))
+    assert result["quotes"]["total"] == 5 and result["quotes"]["amount"] == 50
+    assert result["searches"]["total"] == 4 and result["clients"]["total"] == 3
+    assert [r[1:] for r in client.ranges if r[0] == "quotes"] == [(0, 1), (2, 3), (4, 5)]
+    # 4 lignes = 2 pages pleines: une page vide clôt la lecture
+    assert [r[1] for r in client.ranges if r[0] == "searches"] == [0, 2, 4]
+
+
+def test_bucket_start_uses_paris_time():
+    assert bucket_start("2026-10-14T23:30:00+00:00", "day") == "2026-10-15"
+    assert bucket_start("2026-10-14T10:00:00Z", "week") == "2026-10-12"
+    assert bucket_start("2026-10-31T23:30:00+00:00", "month") == "2026-11-01"
+
+
+def test_fallback_on_benchmark_memory_client():
+    from benchmarks.bench_ai_pipeline import COMPANY_ID, MemorySupabase, generate_dataset
+
+    data = generate_dataset(40)
+    result = asyncio.run(PeriodStatistics(MemorySupabase(data)).get(COMPANY_ID, "year"))
+    since = datetime.now(timezone.utc) - timedelta(days=365)
+    recent = [q for q in data["quotes"] if datetime.fromisoformat(q["created_at"]) >= since]
+    assert result["clients"]["total"] == len(data["clients"]) == 200
+    assert result["quotes"]["total"] == len(recent) > 0
@@ -0,0 +1,51 @@
+import io
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from photo_processing import normalize_photo  # noqa: E402
+
+
+def _jpeg_with_exif():
+    img = Image.new("RGB", (40, 20), "red")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotation 90°
+    exif.get_ifd(0x8769)[0x9003] = "2026:03:12 14:02:11"
+    gps = exif.get_ifd(0x8825)
+    gps[1], gps[2] = "N", (48.0, 51.0, 24.0)
+    gps[3], gps[4] = "W", (2.0, 21.0, 0.0)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", exif=exif)
+    return buf.getvalue()
+
+
+def test_normalize_photo_rotates_and_strips_exif():
+    content, content_type, meta = normalize_photo(_jpeg_with_exif(), "image/jpeg")
+    assert content_type == "image/jpeg"
+    assert meta["taken_at"] == "2026-03-12T14:02:11"
+    assert meta["latitude"] == 48.8566667
+    assert meta["longitude"] == -2.35
+    assert (meta["width"], meta["height"]) == (20, 40)
+
+    out = Image.open(io.BytesIO(content))
+    assert out.size == (20, 40)
+    assert not dict(out.getexif())
+
+
+def test_normalize_photo_keeps_unreadable_files():
+    content, content_type, meta = normalize_photo(b"%PDF-1.4", "application/pdf")
+    assert content == b"%PDF-1.4"
+    assert content_type == "application/pdf"
+    assert meta["width"] is None
+
+
+def test_normalize_photo_keeps_decompression_bombs_unchanged(monkeypatch):
+    buf = io.BytesIO()
+    Image.new("RGB", (100, 100), "blue").save(buf, "PNG")
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)  # 100x100 > 2x la limite
+    content, content_type, meta = normalize_photo(buf.getvalue(), "image/png")
+    assert content == buf.getvalue() and content_type == "image/png" and meta["width"] is None
@@ -0,0 +1,45 @@
+import sys
+from datetime import date
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from planning_optimizer import PlanningJob, PlanningOptimizer, PlanningTechnician, normalize_skills  # noqa: E402
+
+DAY = date(2026, 3, 2)
+
+
+def _optimizer(busy=None):
+    jobs = [
+        PlanningJob("lyon-1", 120, 45.76, 4.84),
+        PlanningJob("paris-1", 120, 48.86, 2.35),
+        PlanningJob("lyon-2", 120, 45.75, 4.85, skills=normalize_skills("Électricien")),
+        PlanningJob("paris-2", 120, 48.85, 2.34),
+    ]
+    techs = [
+        PlanningTechnician("t-lyon", skills=normalize_skills("plombier, électricien"), latitude=45.76, longitude=4.83),
+        PlanningTechnician("t-paris", latitude=48.85, longitude=2.35),
+    ]
+    return PlanningOptimizer(jobs, techs, [DAY], busy)
+
+
+def test_jobs_go_to_nearest_qualified_technician():
+    result = _optimizer().solve(time_budget_ms=500)
+    by_job = {a["job_id"]: a["collaborator_id"] for a in result.assignments}
+    assert by_job == {"lyon-1": "t-lyon", "lyon-2": "t-lyon", "paris-1": "t-paris", "paris-2": "t-paris"}
+    assert not result.unassigned
+    assert result.total_km < 20
+
+
+def test_existing_schedules_are_avoided_and_suggestions_ranked():
+    busy = {("t-lyon", DAY): [(8 * 60, 12 * 60)]}
+    optimizer = _optimizer(busy)
+    result = optimizer.solve(time_budget_ms=500)
+    lyon = [a for a in result.assignments if a["collaborator_id"] == "t-lyon"]
+    assert sorted(a["job_id"] for a in lyon) == ["lyon-1", "lyon-2"]
+    assert min(a["time"] for a in lyon) == "12:00"
+
+    slots = optimizer.suggest_slots(0)
+    # Paris -> Lyon (~390 km) ne tient pas dans la journée: seul le technicien lyonnais est proposé
+    assert [(s["collaborator_id"], s["time"]) for s in slots] == [("t-lyon", "12:00")]
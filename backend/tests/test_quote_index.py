@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from quote_index import BM25Index, QuoteSearchIndex, _CompanyState, tokenize  # noqa: E402
+
+
+def test_tokenize_folds_accents_and_stems():
+    assert tokenize("Peintures des murs") == tokenize("peinture mur")
+    assert tokenize("Rénovation électrique") == tokenize("renovations electriques")
+    assert "de" not in tokenize("Pose de carrelage")
+
+
+def test_bm25_ranks_titles_and_items_and_follows_updates():
+    index = BM25Index()
+    index.add({"id": "q1", "title": "Peinture salon", "description": "Murs et plafond",
+               "items": [{"name": "Peinture acrylique blanche", "quantity": 40, "price": 12}]})
+    index.add({"id": "q2", "title": "Carrelage cuisine", "description": "Dépose ancien carrelage",
+               "items": [{"name": "Carreaux grès cérame", "quantity": 20}]})
+    index.add({"id": "q3", "title": "Salle de bain", "items": [{"name": "Faïence murale"}, "ligne invalide"]})
+
+    assert [doc["id"] for _, doc in index.search("peintures murs", 5)] == ["q1"]
+    assert index.search("carrelage", 5)[0][1]["id"] == "q2"
+    assert index.search("gres", 5)[0][1]["id"] == "q2"
+    assert index.search("inconnu", 5) == []
+
+    index.add({"id": "q2", "title": "Plomberie", "items": []})
+    assert index.search("carrelage", 5) == []
+    index.remove("q1")
+    assert index.search("peinture", 5) == [] and len(index) == 2
+    assert "peintur" not in index.postings
+
+
+def test_registry_only_updates_built_companies():
+    registry = QuoteSearchIndex(client=None)
+    registry.upsert("co1", {"id": "q1", "title": "Peinture"})
+    assert registry.stats()["companies"] == 0
+
+    state = _CompanyState()
+    state.built_at = state.synced_at = float("inf")  # pas d'accès base dans le test
+    registry._companies["co1"] = state
+    registry.upsert("co1", {"id": "q1", "title": "Peinture façade", "amount": 1200, "updated_at": "2026-01-02"})
+    results = registry.search("co1", "facade")
+    assert results[0]["id"] == "q1" and results[0]["amount"] == 1200 and results[0]["similarity_score"] > 0
+    assert state.last_updated_at == "2026-01-02"
+    registry.remove("co1", "q1")
+    assert registry.search("co1", "facade") == []
@@ -0,0 +1,114 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server_supabase  # noqa: E402
+from resumable_uploads import ResumableUploadStore  # noqa: E402
+
+USER = {"id": "user-1", "email": "t@t.com", "role": "TECHNICIEN", "company_id": "comp-1"}
+BASE = "/api/searches/s1/uploads"
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.rpc_calls = []
+
+    def table(self, name):
+        row = {"id": "s1", "user_id": "user-1", "company_id": "comp-1"}
+        query = SimpleNamespace(execute=lambda: SimpleNamespace(data=[row]))
+        query.select = lambda *a, **k: query
+        query.eq = lambda *a: query
+        return query
+
+    def rpc(self, name, params):
+        self.rpc_calls.append((name, params))
+        rows = [{**photo, "number": 3, "section_id": params["p_section_id"]} for photo in params["p_photos"]]
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=rows))
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    supabase = FakeSupabase()
+    ingested = []
+
+    async def company(user_data):
+        return "comp-1"
+
+    async def ingest(search_id, content, original_name, content_type):
+        ingested.append(content)
+        return {"filename": "f.jpg", "original_name": original_name, "storage_path": f"{search_id}/f.jpg"}
+
+    monkeypatch.setattr(server_supabase, "supabase_service", supabase)
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+    monkeypatch.setattr(server_supabase, "_ingest_search_photo", ingest)
+    monkeypatch.setattr(server_supabase, "resumable_uploads", ResumableUploadStore(tmp_path))
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = lambda: USER
+    yield SimpleNamespace(client=TestClient(server_supabase.app), supabase=supabase, ingested=ingested)
+    server_supabase.app.dependency_overrides.clear()
+
+
+def _create(client, length=10):
+    response = client.post(BASE, json={"filename": "photo.jpg", "length": length, "section_id": "facade",
+                                       "is_profile": True})
+    assert response.status_code == 201 and response.headers["Upload-Offset"] == "0"
+    return f"{BASE}/{response.json()['upload_id']}"
+
+
+def _patch(client, url, offset, body):
+    return client.patch(url, content=body, headers={"Upload-Offset": str(offset),
+                                                    "Content-Type": "application/offset+octet-stream"})
+
+
+def test_chunks_resume_from_server_offset(api):
+    url = _create(api.client)
+    assert _patch(api.client, url, 0, b"0123").json()["offset"] == 4
+
+    # Morceau rejoué après une coupure: l'offset ne correspond plus
+    response = _patch(api.client, url, 0, b"0123")
+    assert response.status_code == 409 and "4" in response.json()["detail"]
+    assert api.client.head(url).headers["Upload-Offset"] == "4"
+
+    # Dernier morceau plus court que les précédents
+    assert _patch(api.client, url, 4, b"456789").json()["offset"] == 10
+    assert _patch(api.client, url, 10, b"x").status_code == 413
+
+
+def test_finalize_is_atomic_and_idempotent(api):
+    url = _create(api.client)
+    assert api.client.post(f"{url}/finalize").status_code == 409  # incomplet
+    _patch(api.client, url, 0, b"0123456789")
+
+    first = api.client.post(f"{url}/finalize")
+    assert first.status_code == 200 and first.json()["photos"][0]["number"] == 3
+    name, params = api.supabase.rpc_calls[0]
+    assert name == "add_search_photos" and params["p_is_profile"] and not params["p_replace_section"]
+    assert params["p_section_id"] == "facade" and api.ingested == [b"0123456789"]
+
+    # Réponse perdue, finalisation rejouée: même résultat, aucune nouvelle photo
+    again = api.client.post(f"{url}/finalize")
+    assert again.status_code == 200 and again.json() == first.json()
+    assert len(api.supabase.rpc_calls) == 1 and len(api.ingested) == 1
+    assert api.client.post("/api/searches/s2/uploads/" + url.rsplit("/", 1)[1] + "/finalize").status_code == 404
+    assert api.client.head(url).status_code == 404
+
+
+def test_locks_only_for_known_sessions(api):
+    store = server_supabase.resumable_uploads
+    # Identifiants inconnus ou mal formés: 404 sans créer de verrou
+    assert api.client.post(f"{BASE}/deadbeef/finalize").status_code == 404
+    assert api.client.post(f"{BASE}/..%2Fx/finalize").status_code == 404
+    assert store._locks == {}
+
+    url = _create(api.client)
+    _patch(api.client, url, 0, b"0123456789")
+    assert len(store._locks) == 1
+    assert api.client.post(f"{url}/finalize").status_code == 200
+    # Session finalisée: verrou libéré, la finalisation rejouée reste servie
+    assert store._locks == {}
+    assert api.client.post(f"{url}/finalize").status_code == 200
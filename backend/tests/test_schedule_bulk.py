@@ -0,0 +1,111 @@
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server_supabase  # noqa: E402
+
+D1 = (date.today() + timedelta(days=10)).isoformat()
+D2 = (date.today() + timedelta(days=11)).isoformat()
+BUSY = {"id": "busy", "collaborator_id": "t1", "date": D1, "start_date": D1, "end_date": D1,
+        "time": "09:00", "end_time": "12:00", "status": "scheduled", "worksite_title": "Chantier A"}
+
+
+class Query:
+    def __init__(self, db, table):
+        self.db, self.table, self.ids, self.rows = db, table, None, None
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def in_(self, column, values):
+        self.ids = set(values)
+        return self
+
+    def insert(self, rows):
+        self.rows = [{**row, "id": f"new-{len(self.db.inserted) + i}"} for i, row in enumerate(rows)]
+        self.db.inserted.extend(self.rows)
+        return self
+
+    def execute(self):
+        if self.rows is not None:
+            return SimpleNamespace(data=self.rows)
+        if self.table == "schedules":
+            return SimpleNamespace(data=[r for r in self.db.existing if r["collaborator_id"] in (self.ids or ())])
+        if self.table == "users":
+            return SimpleNamespace(data=[{"id": i, "first_name": i.upper(), "last_name": ""} for i in self.ids or ()])
+        return SimpleNamespace(data=[])
+
+
+@pytest.fixture
+def api(monkeypatch):
+    db = SimpleNamespace(existing=[BUSY], inserted=[])
+    db.table = lambda name: Query(db, name)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    monkeypatch.setattr(server_supabase, "_ai_data_changed", lambda company_id: None)
+    monkeypatch.setattr(server_supabase, "_refresh_availability", lambda *args: None)
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = \
+        lambda: {"id": "u1", "role": "BUREAU", "company_id": "co"}
+    yield SimpleNamespace(client=TestClient(server_supabase.app), db=db)
+    server_supabase.app.dependency_overrides.clear()
+
+
+def test_expansion_collaborators_times_dates_and_periods():
+    payload = server_supabase.ScheduleBulkCreate(
+        items=[server_supabase.ScheduleCreate(collaborator_id="t9", date=D1, time="07:00")],
+        collaborator_ids=["t1", "t2"], dates=[D1, D2], periods=[{"start": D1, "end": D2}], time="08:00",
+        description="Pose")
+    items = server_supabase._expand_bulk_schedules(payload)
+    assert [(i.collaborator_id, i.date, i.period_start) for i in items] == [
+        ("t9", D1, None),
+        ("t1", D1, None), ("t1", D2, None), ("t1", None, D1),
+        ("t2", D1, None), ("t2", D2, None), ("t2", None, D1),
+    ]
+    assert all(i.time == "08:00" and i.description == "Pose" for i in items[1:])
+
+    with pytest.raises(HTTPException) as error:
+        server_supabase._expand_bulk_schedules(server_supabase.ScheduleBulkCreate(collaborator_ids=["t1"], dates=[D1]))
+    assert error.value.status_code == 400
+
+
+def test_conflicts_reject_the_whole_batch(api):
+    res = api.client.post("/api/schedules/bulk", json={
+        "collaborator_ids": ["t1", "t2"], "dates": [D1], "time": "08:00", "end_time": "10:00"})
+    assert res.status_code == 409 and api.db.inserted == []
+    detail = res.json()["detail"]
+    assert detail["conflict_count"] == 1
+    assert [(i["index"], i["status"]) for i in detail["items"]] == [(0, "conflict"), (1, "ok")]
+    # Conflit avec un planning existant: pas d'index de lot
+    conflict = detail["items"][0]["conflicts"][0]
+    assert conflict["index"] is None and conflict["schedule_id"] == "busy" and conflict["overlap_minutes"] == 60
+
+
+def test_conflicts_inside_the_batch_point_at_the_other_item(api):
+    res = api.client.post("/api/schedules/bulk", json={"items": [
+        {"collaborator_id": "t2", "date": D2, "time": "08:00", "end_time": "12:00"},
+        {"collaborator_id": "t2", "date": D2, "time": "13:00", "end_time": "15:00"},
+        {"collaborator_id": "t2", "date": D2, "time": "11:00", "end_time": "14:00"},
+    ]})
+    assert res.status_code == 409
+    conflicts = res.json()["detail"]["items"][2]["conflicts"]
+    assert sorted(c["index"] for c in conflicts) == [0, 1]
+
+
+def test_skip_conflicts_creates_the_rest_and_maps_ids_back(api):
+    res = api.client.post("/api/schedules/bulk", json={
+        "collaborator_ids": ["t1", "t2"], "dates": [D1, D2], "time": "08:00", "end_time": "10:00",
+        "skip_conflicts": True})
+    assert res.status_code == 200
+    body = res.json()
+    assert body["created_count"] == 3 and body["conflict_count"] == 1
+    # t1/D1 en conflit; les autres reçoivent l'id de la ligne insérée à leur position
+    assert [(i["index"], i["status"], i.get("schedule_id")) for i in body["items"]] == [
+        (0, "conflict", None), (1, "created", "new-0"), (2, "created", "new-1"), (3, "created", "new-2")]
+    assert [(r["collaborator_id"], r["date"]) for r in api.db.inserted] == [("t1", D2), ("t2", D1), ("t2", D2)]
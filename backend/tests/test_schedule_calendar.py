@@ -0,0 +1,32 @@
+import sys
+from datetime import date
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from schedule_calendar import materialize_calendar  # noqa: E402
+
+
+def test_periods_are_expanded_and_entities_deduplicated():
+    tech = {"id": "t1", "first_name": "Léa", "last_name": "Martin", "email": "lea@example.com"}
+    site = {"id": "w1", "title": "Chantier A", "status": "active", "address": "Lyon", "client_id": "c1"}
+    rows = [
+        {"id": "s1", "start_date": "2026-03-01", "end_date": "2026-03-04", "time": "08:00",
+         "collaborator_id": "t1", "users": tech, "worksite_id": "w1", "worksites": site},
+        {"id": "s2", "date": "2026-03-03", "time": "07:00", "collaborator_id": "t1", "users": tech,
+         "planning_team_leaders": {"id": "l1", "first_name": "Old", "last_name": "Name", "user_id": "u9"}},
+        {"id": "s3", "date": "2026-03-09", "time": "07:00", "collaborator_id": "t1", "users": tech},
+    ]
+    cal = materialize_calendar(rows, date(2026, 3, 2), date(2026, 3, 8),
+                               {"u9": {"first_name": "Paul", "last_name": "Durand"}})
+
+    assert cal["days"][0] == "2026-03-02" and len(cal["days"]) == 7
+    assert cal["schedules"]["id"] == ["s1", "s2"]
+    assert cal["schedules"]["collaborator"] == [0, 0]
+    assert cal["collaborators"] == [tech]
+    assert cal["worksites"] == [site]
+    assert cal["schedules"]["worksite"] == [0, None]
+    assert cal["team_leaders"] == [{"id": "l1", "name": "Paul Durand"}]
+    # s1 coupé à la fenêtre (2 -> 4 mars), s2 avant s1 le 3 mars (07:00)
+    assert list(zip(cal["cells"]["day"], cal["cells"]["schedule"])) == [(0, 0), (1, 1), (1, 0), (2, 0)]
@@ -0,0 +1,230 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from schedule_conflicts import ScheduleConflictEngine, ScheduleSlot  # noqa: E402
+
+
+def _rows():
+    return [
+        {"id": "day", "collaborator_id": "t1", "date": "2026-03-10", "time": "08:00", "end_time": "12:00"},
+        {"id": "period", "collaborator_id": "t1", "start_date": "2026-03-02", "end_date": "2026-03-06",
+         "time": "09:00", "end_time": "17:00"},
+        {"id": "night", "collaborator_id": "t2", "start_date": "2026-03-02", "end_date": "2026-03-02",
+         "time": "22:00", "end_time": "06:00"},
+        {"id": "cancelled", "collaborator_id": "t1", "date": "2026-03-11", "time": "08:00",
+         "end_time": "18:00", "status": "cancelled"},
+    ]
+
+
+def test_period_conflicts_with_single_day_inside():
+    engine = ScheduleConflictEngine.from_rows(_rows())
+    slot = ScheduleSlot.from_values("t1", "2026-03-04", "2026-03-04", "16:00", "18:00")
+    assert [(s.id, minutes) for s, minutes in engine.conflicts(slot)] == [("period", 60)]
+    # Même plage horaire mais en dehors de la période
+    slot = ScheduleSlot.from_values("t1", "2026-03-07", "2026-03-09", "09:00", "17:00")
+    assert not engine.has_conflict(slot)
+
+
+def test_night_shift_and_exclusions():
+    engine = ScheduleConflictEngine.from_rows(_rows())
+    morning = ScheduleSlot.from_values("t2", "2026-03-03", "2026-03-03", "05:00", "07:00")
+    assert [(s.id, minutes) for s, minutes in engine.conflicts(morning)] == [("night", 60)]
+    # Un planning annulé n'occupe plus le technicien
+    slot = ScheduleSlot.from_values("t1", "2026-03-11", None, "09:00", hours=2)
+    assert not engine.has_conflict(slot)
+    # Un planning modifié ne rentre pas en conflit avec lui-même
+    moved = ScheduleSlot.from_values("t1", "2026-03-10", None, "10:00", "11:00", schedule_id="day")
+    assert not engine.has_conflict(moved, exclude_id="day")
+    assert engine.remove("day") and not engine.has_conflict(moved)
+
+
+def test_sweep_reports_real_overlaps_only():
+    from schedule_conflicts import sweep_conflicts
+
+    slots = [ScheduleSlot.from_row(r) for r in _rows()[:3]] + [
+        # Même jour que "day" mais l'après-midi: pas de conflit
+        ScheduleSlot.from_values("t1", "2026-03-10", None, "13:00", "17:00", schedule_id="afternoon"),
+        # Chevauche la période deux jours de suite
+        ScheduleSlot.from_values("t1", "2026-03-05", "2026-03-06", "16:00", "18:00", schedule_id="late"),
+    ]
+    pairs = sweep_conflicts(slots)
+    assert [(p["schedule1"].id, p["schedule2"].id) for p in pairs] == [("period", "late")]
+    assert pairs[0]["days"] == ["2026-03-05", "2026-03-06"]
+    assert pairs[0]["overlap_minutes"] == 60
+    assert pairs[0]["total_overlap_minutes"] == 120
+
+
+def test_free_intervals_from_busy_slots():
+    from availability_index import busy_minutes, free_intervals
+    from schedule_conflicts import busy_from_slots
+
+    slots = [ScheduleSlot.from_row(r) for r in _rows()]
+    days = [ScheduleSlot.from_values(None, "2026-03-03", None, "00:00").first_day]
+    busy = busy_from_slots(slots, days)
+    # t2: fin du créneau de nuit de la veille (-> 06:00)
+    assert free_intervals(busy[("t2", days[0])]) == [[360, 1440]]
+    # t1: période 09:00-17:00
+    assert free_intervals(busy[("t1", days[0])]) == [[0, 540], [1020, 1440]]
+    assert busy_minutes([(60, 120), (90, 180), (200, 210)]) == 130
+
+
+class IndexData:
+    """Plannings d'un technicien avec leur version d'écriture, tombstones et compteur"""
+
+    def __init__(self):
+        self.version = 2
+        self.rows = {"day": ({**_rows()[0]}, 1), "period": ({**_rows()[1]}, 2)}
+        self.tombs = {}
+        self.calls = []
+
+    def source(self):
+        from schedule_conflicts import ScheduleIndexSource
+
+        return ScheduleIndexSource(
+            version=lambda company, collab: self.version,
+            load=self.load,
+            changed=self.changed,
+            removed=lambda company, collab, v: [i for i, w in self.tombs.items() if w > v],
+        )
+
+    def load(self, company, collab, horizon):
+        self.calls.append(("load", horizon))
+        return [row for row, _ in self.rows.values()]
+
+    def changed(self, company, collab, version):
+        self.calls.append(("changed", version))
+        return [row for row, w in self.rows.values() if w > version]
+
+    def write(self, row):
+        self.version += 1
+        self.rows[row["id"]] = (row, self.version)
+
+
+def test_index_cache_replays_only_new_writes():
+    from datetime import date
+
+    from schedule_conflicts import ScheduleIndexCache
+
+    data = IndexData()
+    cache = ScheduleIndexCache(data.source(), today=lambda: date(2026, 3, 1))
+    slot = ScheduleSlot.from_values("t1", "2026-03-10", None, "11:00", "13:00")
+    assert [s.id for s, _ in cache.conflicts("co", slot)] == ["day"]
+    assert [s.id for s, _ in cache.conflicts("co", slot)] == ["day"]
+    assert data.calls == [("load", date(2026, 2, 22))] and cache.stats()["hits"] == 1
+
+    # Autre worker: "day" déplacé l'après-midi, nouveau planning, "period" supprimé
+    data.write({**_rows()[0], "time": "14:00", "end_time": "18:00"})
+    data.write({"id": "new", "collaborator_id": "t1", "date": "2026-03-10", "time": "12:00", "end_time": "13:00"})
+    data.version += 1
+    data.tombs["period"] = data.version
+    assert [s.id for s, _ in cache.conflicts("co", slot)] == ["new"]
+    assert data.calls[1:] == [("changed", 2)]
+    assert cache.conflicts("co", ScheduleSlot.from_values("t1", "2026-03-04", None, "10:00", "11:00")) == []
+
+    # Annulation rejouée comme un retrait
+    data.write({**_rows()[0], "id": "new", "status": "cancelled"})
+    assert cache.conflicts("co", slot) == []
+
+
+def test_index_cache_bypasses_past_slots_and_missing_counter():
+    from datetime import date
+
+    from schedule_conflicts import ScheduleIndexCache
+
+    data = IndexData()
+    cache = ScheduleIndexCache(data.source(), today=lambda: date(2026, 3, 20))
+    assert cache.conflicts("co", ScheduleSlot.from_values("t1", "2026-03-10", None, "11:00")) is None
+    data.version = None
+    assert cache.conflicts("co", ScheduleSlot.from_values("t1", "2026-03-30", None, "11:00")) is None
+    assert data.calls == [] and cache.stats()["bypass"] == 2
+
+
+def test_put_schedule_rejects_overlaps(monkeypatch):
+    from datetime import date, timedelta
+    from types import SimpleNamespace
+
+    from fastapi.testclient import TestClient
+
+    import server_supabase
+
+    day = (date.today() + timedelta(days=10)).isoformat()
+    existing = {"id": "s1", "company_id": "co", "collaborator_id": "t2", "date": day, "start_date": day,
+                "end_date": day, "time": "08:00", "end_time": "10:00", "status": "scheduled"}
+    busy = {"id": "s2", "collaborator_id": "t1", "date": day, "start_date": day, "end_date": day,
+            "time": "09:00", "end_time": "12:00", "status": "scheduled"}
+    updates = []
+
+    class Query:
+        def __init__(self, table):
+            self.table, self.filters = table, {}
+
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: self
+
+        def eq(self, column, value):
+            self.filters[column] = value
+            return self
+
+        def update(self, values):
+            updates.append(values)
+            return self
+
+        def execute(self):
+            if self.table == "schedule_sync_versions":
+                return SimpleNamespace(data=[{"version": 3, "purged_version": 0}])
+            if "id" in self.filters:
+                return SimpleNamespace(data=[existing])
+            return SimpleNamespace(data=[busy] if self.filters.get("collaborator_id") == "t1" else [])
+
+    async def company(user):
+        return "co"
+
+    monkeypatch.setattr(server_supabase, "supabase_service", SimpleNamespace(table=Query))
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+    server_supabase.schedule_indexes.invalidate()
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = \
+        lambda: {"id": "u1", "role": "BUREAU", "company_id": "co"}
+    try:
+        client = TestClient(server_supabase.app)
+        res = client.put("/api/schedules/s1", json={"collaborator_id": "t1"})
+        assert res.status_code == 409 and updates == []
+        # Même créneau, technicien libre
+        res = client.put("/api/schedules/s1", json={"collaborator_id": "t3", "date": day})
+        assert res.status_code == 200
+        assert updates == [{"collaborator_id": "t3", "date": day, "start_date": day, "end_date": day}]
+    finally:
+        server_supabase.app.dependency_overrides.clear()
+        server_supabase.schedule_indexes.invalidate()
+
+
+def test_check_conflicts_indexes_batch_items_by_position(monkeypatch):
+    from datetime import date, timedelta
+    from types import SimpleNamespace
+
+    from fastapi.testclient import TestClient
+
+    import server_supabase
+
+    day = (date.today() + timedelta(days=10)).isoformat()
+    query = SimpleNamespace(execute=lambda: SimpleNamespace(data=[]))
+    query.select = query.eq = query.in_ = query.or_ = lambda *args, **kwargs: query
+    monkeypatch.setattr(server_supabase, "supabase_service", SimpleNamespace(table=lambda name: query))
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = \
+        lambda: {"id": "u1", "role": "BUREAU", "company_id": "co"}
+    try:
+        items = [
+            {"collaborator_id": "t1", "date": day, "time": "08:00", "end_time": "10:00", "schedule_id": "s1"},
+            {"collaborator_id": "t1", "date": day, "time": "14:00", "end_time": "16:00", "schedule_id": "s1"},
+            {"collaborator_id": "t1", "date": day, "time": "09:00", "end_time": "15:00"},
+        ]
+        res = TestClient(server_supabase.app).post("/api/schedules/check-conflicts", json={"items": items})
+        assert res.status_code == 200
+        batch = res.json()["items"][2]["batch_conflicts"]
+        # Même schedule_id sur deux éléments: chacun garde sa position
+        assert sorted((c["index"], c["schedule_id"], c["time"]) for c in batch) == [
+            (0, "s1", "08:00"), (1, "s1", "14:00")]
+    finally:
+        server_supabase.app.dependency_overrides.clear()
@@ -57,3 +57,128 @@ def test_list_drafts():
     data = res.json()
     assert isinstance(data, list)
     assert any(item.get('status') == 'DRAFT' for item in data)
+
+
+class RecordingQuery:
+    """Requête Supabase factice: enregistre l'action et renvoie les lignes fournies"""
+
+    def __init__(self, db, table):
+        self.db, self.table, self.action = db, table, "select"
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def _act(self, action, *args, **kwargs):
+        self.action = action
+        self.db.writes.append((self.table, action) + args)
+        return self
+
+    def insert(self, *args):
+        return self._act("insert", *args)
+
+    def update(self, *args):
+        return self._act("update", *args)
+
+    def delete(self):
+        return self._act("delete")
+
+    def execute(self):
+        rows = self.db.rows.get((self.table, self.action), self.db.rows.get(self.table, []))
+        return type('Res', (), {"data": rows, "count": len(rows)})
+
+
+@pytest.fixture
+def api(monkeypatch):
+    from types import SimpleNamespace
+
+    db = SimpleNamespace(rows={}, writes=[], changed=[])
+    db.table = lambda name: RecordingQuery(db, name)
+
+    async def company(user):
+        return "comp-1"
+
+    monkeypatch.setattr(server_supabase, 'supabase_service', db)
+    monkeypatch.setattr(server_supabase, 'get_user_company', company)
+    monkeypatch.setattr(server_supabase, '_ai_data_changed', db.changed.append)
+    app.dependency_overrides[server_supabase.get_user_from_token] = \
+        lambda: {"id": "user-1", "email": "t@t.com", "role": "TECHNICIEN", "company_id": "comp-1"}
+    yield db
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("status,action", [("DRAFT", "delete"), ("ARCHIVED", "delete"), ("ACTIVE", "update")])
+def test_search_writes_refresh_ai_data(api, status, action):
+    api.rows["searches"] = [{"id": "s1", "status": status, "company_id": "comp-1", "user_id": "user-1"}]
+    assert client.delete('/api/searches/s1').status_code == 200
+    assert api.writes[-1][:2] == ("searches", action) and api.changed == ["comp-1"]
+
+
+def test_search_draft_and_update_refresh_ai_data(api):
+    api.rows["searches"] = [{"id": "s1", "status": "DRAFT", "company_id": "comp-1", "user_id": "user-1"}]
+    assert client.post('/api/searches/draft').status_code == 200
+    assert client.patch('/api/searches/s1', json={"status": "ACTIVE"}).status_code == 200
+    assert [w[:2] for w in api.writes] == [("searches", "insert"), ("searches", "update")]
+    assert api.changed == ["comp-1", "comp-1"]
+
+
+def test_upload_photos_inserts_through_rpc(api, monkeypatch):
+    rpc_calls = []
+
+    async def ingest(search_id, content, original_name, content_type):
+        return {"filename": f"{original_name}.jpg", "original_name": original_name,
+                "storage_path": f"{search_id}/{original_name}.jpg", "taken_at": "2026-10-19T08:00:00"}
+
+    def rpc(name, params):
+        rpc_calls.append((name, params))
+        rows = [{**photo, "search_id": params["p_search_id"], "section_id": params["p_section_id"],
+                 "number": index + 1} for index, photo in enumerate(params["p_photos"])]
+        return type('Q', (), {"execute": lambda self: type('Res', (), {"data": rows})})()
+
+    api.rows["searches"] = [{"id": "s1", "company_id": "comp-1", "user_id": "user-1"}]
+    api.rpc = rpc
+    monkeypatch.setattr(server_supabase, '_ingest_search_photo', ingest)
+    res = client.post('/api/searches/s1/photos', data={"section_id": "facade", "is_profile": "true"},
+                      files=[("files", ("a", b"1", "image/jpeg")), ("files", ("b", b"2", "image/jpeg"))])
+    assert res.status_code == 200
+
+    # Un seul appel: insertion + remplacement de la section + flag de profil dans la même transaction
+    name, params = rpc_calls[0]
+    assert name == "add_search_photos" and len(rpc_calls) == 1
+    assert params["p_search_id"] == "s1" and params["p_company_id"] == "comp-1"
+    assert params["p_section_id"] == "facade" and params["p_is_profile"] is True
+    assert [p["filename"] for p in params["p_photos"]] == ["a.jpg", "b.jpg"]
+    assert params["p_photos"][0]["is_profile"] and "is_profile" not in params["p_photos"][1]
+    photos = res.json()["photos"]
+    assert [p["number"] for p in photos] == [1, 2] and photos[0]["taken_at"] == "2026-10-19T08:00:00"
+
+
+def test_attach_photos_numbered_by_view(api):
+    # La vue renvoie les lignes triées par position, number calculé par la base
+    api.rows["search_photos_numbered"] = [
+        {"search_id": "s1", "filename": "a.jpg", "number": 1, "section_id": "facade", "is_profile": True},
+        {"search_id": "s2", "filename": "c.jpg", "number": 1},
+        {"search_id": "s1", "filename": "b.jpg", "number": 2, "section_id": "toit"},
+    ]
+    searches = server_supabase._attach_search_photos([
+        {"id": "s1", "photos": [{"filename": "old.jpg"}]}, {"id": "s2"}, {"id": "s3"},
+    ])
+    s1, s2, s3 = searches
+    assert [(p["filename"], p["number"]) for p in s1["photos"]] == [("a.jpg", 1), ("b.jpg", 2)]
+    assert s1["photos"][0]["is_profile"] and "is_profile" not in s1["photos"][1]
+    assert [p["filename"] for p in s2["photos"]] == ["c.jpg"] and s3["photos"] == []
+
+
+def test_attach_photos_falls_back_to_jsonb_column(api):
+    table = api.table
+
+    def without_view(name):
+        if name == "search_photos_numbered":
+            raise Exception('relation "search_photos_numbered" does not exist')
+        return table(name)
+
+    # Migration search_photos non appliquée: le tableau JSONB searches.photos est conservé
+    api.table = without_view
+    searches = [{"id": "s1", "photos": [{"filename": "old.jpg", "number": 1}]}, {"id": "s2"}]
+    assert server_supabase._attach_search_photos(searches) == [
+        {"id": "s1", "photos": [{"filename": "old.jpg", "number": 1}]}, {"id": "s2"},
+    ]
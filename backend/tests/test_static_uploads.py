@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from static_uploads import IMMUTABLE_CACHE_CONTROL, UploadsStaticFiles, parse_range  # noqa: E402
+
+NAME = "photo_0f8fad5b-d9cb-469f-a165-70867728950e.bin"
+CONTENT = bytes(range(256)) * 4  # 1024 octets
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / NAME).write_bytes(CONTENT)
+    app = Starlette(routes=[Mount("/uploads", UploadsStaticFiles(directory=str(tmp_path)))])
+    return TestClient(app)
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1024) == (0, 99)
+    assert parse_range("bytes=1000-", 1024) == (1000, 1023)
+    assert parse_range("bytes=-24", 1024) == (1000, 1023)
+    assert parse_range("bytes=-5000", 1024) == (0, 1023)
+    assert parse_range("bytes=0-5000", 1024) == (0, 1023)
+    assert parse_range("bytes=0-1,5-6", 1024) is None and parse_range("items=0-1", 1024) is None
+    for header in ("bytes=1024-", "bytes=5-2", "bytes=-0", "bytes=a-b"):
+        with pytest.raises(ValueError):
+            parse_range(header, 1024)
+
+
+def test_single_and_suffix_ranges(client):
+    response = client.get(f"/uploads/{NAME}", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206 and response.content == CONTENT[10:20]
+    assert response.headers["content-range"] == "bytes 10-19/1024" and response.headers["content-length"] == "10"
+
+    response = client.get(f"/uploads/{NAME}", headers={"Range": "bytes=-100"})
+    assert response.status_code == 206 and response.content == CONTENT[-100:]
+    assert response.headers["content-range"] == "bytes 924-1023/1024"
+
+
+def test_unsatisfiable_range(client):
+    response = client.get(f"/uploads/{NAME}", headers={"Range": "bytes=2000-"})
+    assert response.status_code == 416 and response.headers["content-range"] == "bytes */1024"
+
+
+def test_etag_revalidation_and_cache_headers(client):
+    response = client.get(f"/uploads/{NAME}")
+    assert response.status_code == 200 and response.content == CONTENT
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    etag = response.headers["etag"]
+    response = client.get(f"/uploads/{NAME}", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+
+    # If-Range périmé: fichier complet
+    response = client.get(f"/uploads/{NAME}", headers={"Range": "bytes=0-9", "If-Range": '"autre"'})
+    assert response.status_code == 200 and len(response.content) == 1024
+
+
+def test_head_requests(client):
+    response = client.head(f"/uploads/{NAME}")
+    assert response.status_code == 200 and response.headers["content-length"] == "1024"
+    assert response.content == b""
+    response = client.head(f"/uploads/{NAME}", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206 and response.headers["content-length"] == "10"
+    assert response.content == b""
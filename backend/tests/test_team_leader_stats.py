@@ -0,0 +1,93 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server_supabase  # noqa: E402
+
+LEADERS = [
+    {"id": "tl1", "company_id": "co", "user_id": "u1", "first_name": "Ancien", "last_name": "Nom", "email": "old@x"},
+    {"id": "tl2", "company_id": "co", "user_id": None, "first_name": "Sans", "last_name": "Compte", "email": "s@x"},
+]
+TABLES = {
+    "planning_team_leaders": LEADERS,
+    "users": [{"id": "u1", "first_name": "Marie", "last_name": "Durand", "email": "marie@x"}],
+    "team_leader_collaborators": [
+        {"team_leader_id": "tl1", "collaborator": {"id": "c1", "first_name": "Paul", "last_name": "A", "email": "p@x"}},
+        {"team_leader_id": "tl1", "collaborator": None},
+    ],
+}
+
+
+class FakeDB:
+    def __init__(self, rpc_error=False):
+        self.rpc_error, self.calls = rpc_error, []
+        self.on_load = None
+
+    def rpc(self, name, params):
+        self.calls.append(name)
+        if self.on_load:
+            self.on_load()
+        if self.rpc_error:
+            raise RuntimeError("function get_team_leaders_with_stats does not exist")
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=[{"id": "tl1", "collaborators_count": 1}]))
+
+    def table(self, name):
+        self.calls.append(name)
+        query = SimpleNamespace(execute=lambda: SimpleNamespace(data=TABLES[name]))
+        query.select = query.eq = query.in_ = lambda *args, **kwargs: query
+        return query
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server_supabase._TEAM_LEADER_STATS_CACHE.clear()
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = \
+        lambda: {"id": "admin", "role": "ADMIN", "company_id": "co"}
+
+    def use(db):
+        monkeypatch.setattr(server_supabase, "supabase_service", db)
+        return db
+
+    yield SimpleNamespace(client=TestClient(server_supabase.app), use=use)
+    server_supabase.app.dependency_overrides.clear()
+    server_supabase._TEAM_LEADER_STATS_CACHE.clear()
+
+
+def test_rpc_result_is_cached_until_invalidated(api):
+    db = api.use(FakeDB())
+    first = api.client.get("/api/team-leaders-stats").json()
+    assert first == [{"id": "tl1", "collaborators_count": 1}]
+    assert api.client.get("/api/team-leaders-stats").json() == first and db.calls == ["get_team_leaders_with_stats"]
+
+    server_supabase._invalidate_team_leader_stats("co")
+    api.client.get("/api/team-leaders-stats")
+    assert db.calls == ["get_team_leaders_with_stats"] * 2
+
+
+def test_fallback_merges_user_names_and_active_collaborators(api):
+    db = api.use(FakeDB(rpc_error=True))
+    result = {tl["id"]: tl for tl in api.client.get("/api/team-leaders-stats").json()}
+    assert (result["tl1"]["first_name"], result["tl1"]["email"]) == ("Marie", "marie@x")
+    assert result["tl1"]["collaborators_count"] == 2 and [c["id"] for c in result["tl1"]["collaborators"]] == ["c1"]
+    assert (result["tl2"]["last_name"], result["tl2"]["collaborators_count"], result["tl2"]["collaborators"]) == \
+        ("Compte", 0, [])
+    assert db.calls.count("users") == 1 and db.calls.count("team_leader_collaborators") == 1
+
+
+def test_invalidation_during_load_is_not_overwritten(api):
+    db = api.use(FakeDB())
+    # Une (dés)assignation arrive pendant la lecture: le résultat n'est pas gardé
+    db.on_load = lambda: server_supabase._invalidate_team_leader_stats("co")
+    api.client.get("/api/team-leaders-stats")
+    assert "co" not in server_supabase._TEAM_LEADER_STATS_CACHE
+
+    db.on_load = None
+    api.client.get("/api/team-leaders-stats")
+    api.client.get("/api/team-leaders-stats")
+    assert db.calls.count("get_team_leaders_with_stats") == 2
@@ -45,11 +45,13 @@ EXPECTED_TABLES = {
     "invoices_received": ["id", "company_id", "supplier_name", "invoice_number", "amount_ttc"],
     "e_reporting_declarations": ["id", "company_id", "declaration_type", "period_start", "period_end"],
     "archives_legal": ["id", "company_id", "document_type", "title", "file_url"],
+    "search_photos": ["id", "search_id", "filename", "section_id", "position"],
 }
 
 EXPECTED_VIEWS = [
     "clients_with_company",
     "quotes_with_client_name",
+    "search_photos_numbered",
 ]
 
 def check_table_exists(table_name: str) -> bool:
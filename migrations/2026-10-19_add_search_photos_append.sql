@@ -0,0 +1,66 @@
+-- Migration: Ajout d'une photo sans remplacer sa section (uploads reprenables)
+-- Date: 2026-10-19
+-- Description: add_search_photos gagne p_replace_section (true par défaut, comportement de
+-- POST /photos). La finalisation d'un upload reprenable l'appelle avec false: la photo est
+-- ajoutée à la section et l'ancien flag is_profile est retiré dans la même transaction.
+-- Prérequis: 2026-10-19_search_photos_metadata.sql
+
+drop function if exists add_search_photos(uuid, uuid, text, jsonb, boolean);
+
+create or replace function add_search_photos(
+    p_search_id uuid,
+    p_company_id uuid,
+    p_section_id text,
+    p_photos jsonb,
+    p_is_profile boolean default false,
+    p_replace_section boolean default true
+)
+returns setof search_photos_numbered as $$
+declare
+    v_ids uuid[];
+begin
+    if p_section_id is not null and p_replace_section then
+        delete from search_photos
+        where search_id = p_search_id and section_id = p_section_id;
+    end if;
+
+    if p_is_profile then
+        update search_photos set is_profile = false
+        where search_id = p_search_id and is_profile;
+    end if;
+
+    with inserted as (
+        insert into search_photos (search_id, company_id, filename, original_name, storage_path,
+                                   url, section_id, is_profile, notes, uploaded_at,
+                                   taken_at, latitude, longitude, width, height,
+                                   content_type, size_bytes)
+        select
+            p_search_id,
+            p_company_id,
+            p->>'filename',
+            p->>'original_name',
+            p->>'storage_path',
+            p->>'url',
+            p_section_id,
+            coalesce((p->>'is_profile')::boolean, false),
+            p->>'notes',
+            coalesce((p->>'uploaded_at')::timestamptz, now()),
+            (p->>'taken_at')::timestamp,
+            (p->>'latitude')::double precision,
+            (p->>'longitude')::double precision,
+            (p->>'width')::integer,
+            (p->>'height')::integer,
+            p->>'content_type',
+            (p->>'size_bytes')::integer
+        from jsonb_array_elements(p_photos) with ordinality as t(p, ord)
+        order by ord
+        returning id
+    )
+    select array_agg(id) into v_ids from inserted;
+
+    return query
+        select * from search_photos_numbered
+        where search_id = p_search_id and id = any(v_ids)
+        order by position;
+end;
+$$ language plpgsql;
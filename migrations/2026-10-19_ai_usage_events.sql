@@ -0,0 +1,96 @@
+-- Migration: Télémétrie d'utilisation de l'IA
+-- Date: 2026-10-19
+-- Description: Un événement par requête IA (entreprise, fonction, modèle, tokens, latence,
+-- résultat du cache), écrit par lots par chaque worker (ai_telemetry.py). /api/ai/stats lit
+-- les agrégats (latence p50/p95, coût par entreprise et par jour) via get_ai_usage_rollup,
+-- tous workers confondus.
+
+create table if not exists ai_usage_events (
+    id bigserial primary key,
+    company_id uuid references companies(id) on delete cascade,
+    function text not null,
+    model text,
+    prompt_tokens integer not null default 0,
+    completion_tokens integer not null default 0,
+    cost numeric(12, 6) not null default 0,
+    latency_ms real not null default 0,
+    -- 'miss' (appel OpenAI), 'exact', 'semantic', 'simulation'
+    cache text not null default 'miss',
+    success boolean not null default true,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists idx_ai_usage_events_company_created
+    on ai_usage_events(company_id, created_at);
+create index if not exists idx_ai_usage_events_created
+    on ai_usage_events(created_at);
+
+-- Agrégats sur p_days jours (toutes entreprises si p_company_id est null)
+create or replace function get_ai_usage_rollup(p_company_id uuid default null, p_days integer default 30)
+returns jsonb as $$
+    with events as (
+        select *
+        from ai_usage_events
+        where created_at >= now() - make_interval(days => p_days)
+          and (p_company_id is null or company_id = p_company_id)
+    )
+    select jsonb_build_object(
+        'days', p_days,
+        'totals', (
+            select jsonb_build_object(
+                'requests', count(*),
+                'prompt_tokens', coalesce(sum(prompt_tokens), 0),
+                'completion_tokens', coalesce(sum(completion_tokens), 0),
+                'cost', coalesce(round(sum(cost), 6), 0),
+                'cache_hits', count(*) filter (where cache in ('exact', 'semantic')),
+                'errors', count(*) filter (where not success),
+                'latency_ms_p50', round(coalesce(percentile_cont(0.5) within group (order by latency_ms), 0)::numeric, 1),
+                'latency_ms_p95', round(coalesce(percentile_cont(0.95) within group (order by latency_ms), 0)::numeric, 1)
+            )
+            from events
+        ),
+        'by_function', coalesce((
+            select jsonb_agg(f order by f->>'function')
+            from (
+                select jsonb_build_object(
+                    'function', function,
+                    'requests', count(*),
+                    'cache_hits', count(*) filter (where cache in ('exact', 'semantic')),
+                    'tokens', sum(prompt_tokens + completion_tokens),
+                    'cost', round(sum(cost), 6),
+                    -- latence des appels réellement envoyés à OpenAI
+                    'latency_ms_p50', round(coalesce(percentile_cont(0.5) within group (order by latency_ms) filter (where cache = 'miss'), 0)::numeric, 1),
+                    'latency_ms_p95', round(coalesce(percentile_cont(0.95) within group (order by latency_ms) filter (where cache = 'miss'), 0)::numeric, 1)
+                ) as f
+                from events
+                group by function
+            ) per_function
+        ), '[]'::jsonb),
+        'by_company_day', coalesce((
+            select jsonb_agg(d order by d->>'day' desc, d->>'company_id')
+            from (
+                select jsonb_build_object(
+                    'company_id', company_id,
+                    'day', (created_at at time zone 'Europe/Paris')::date,
+                    'requests', count(*),
+                    'tokens', sum(prompt_tokens + completion_tokens),
+                    'cost', round(sum(cost), 6)
+                ) as d
+                from events
+                group by company_id, (created_at at time zone 'Europe/Paris')::date
+            ) per_day
+        ), '[]'::jsonb)
+    );
+$$ language sql stable;
+
+-- Rétention, depuis une tâche planifiée: select purge_ai_usage_events(180);
+create or replace function purge_ai_usage_events(p_keep_days integer default 180)
+returns integer as $$
+declare
+    v_count integer;
+begin
+    delete from ai_usage_events where created_at < now() - make_interval(days => p_keep_days);
+    get diagnostics v_count = row_count;
+    return v_count;
+end;
+$$ language plpgsql;
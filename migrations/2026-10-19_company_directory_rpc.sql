@@ -0,0 +1,37 @@
+-- Migration: Annuaire des noms d'une entreprise en une requête
+-- Date: 2026-10-19
+-- Description: /schedules et les missions techniciens faisaient une requête users par chef
+-- d'équipe et une requête clients par chantier. L'API garde en mémoire un annuaire par
+-- entreprise (name_directory.py), chargé en un seul aller-retour par cette fonction.
+
+create or replace function get_company_directory(p_company_id uuid)
+returns jsonb as $$
+    select jsonb_build_object(
+        'users', coalesce((
+            select jsonb_agg(jsonb_build_object(
+                'id', u.id, 'first_name', u.first_name, 'last_name', u.last_name, 'email', u.email
+            ))
+            from users u where u.company_id = p_company_id
+        ), '[]'::jsonb),
+        'team_leaders', coalesce((
+            select jsonb_agg(jsonb_build_object(
+                'id', tl.id, 'first_name', tl.first_name, 'last_name', tl.last_name, 'user_id', tl.user_id
+            ))
+            from planning_team_leaders tl where tl.company_id = p_company_id
+        ), '[]'::jsonb),
+        'clients', coalesce((
+            select jsonb_agg(jsonb_build_object(
+                -- name / prenom n'existent pas sur toutes les bases: lus via to_jsonb
+                'id', c.id, 'name', to_jsonb(c)->'name', 'prenom', to_jsonb(c)->'prenom',
+                'nom', c.nom, 'adresse', c.adresse
+            ))
+            from clients c where c.company_id = p_company_id
+        ), '[]'::jsonb),
+        'worksites', coalesce((
+            select jsonb_agg(jsonb_build_object(
+                'id', w.id, 'title', w.title, 'client_id', w.client_id, 'status', w.status, 'address', w.address
+            ))
+            from worksites w where w.company_id = p_company_id
+        ), '[]'::jsonb)
+    );
+$$ language sql stable;
@@ -0,0 +1,57 @@
+-- Migration: Version de l'annuaire des noms par entreprise
+-- Date: 2026-10-19
+-- Description: chaque worker de l'API garde son propre annuaire en mémoire (name_directory.py);
+-- une écriture faite par un autre worker (ou hors de l'API) n'y était visible qu'à l'expiration
+-- du TTL. Un compteur par entreprise est incrémenté par trigger dès qu'un champ affiché change
+-- dans users, planning_team_leaders, clients ou worksites: les workers le relisent (clé
+-- primaire) toutes les quelques secondes et ne rechargent l'annuaire que s'il a bougé.
+-- Prérequis: 2026-10-19_company_directory_rpc.sql
+
+create table if not exists company_directory_versions (
+    company_id uuid primary key,
+    version bigint not null default 0
+);
+
+create or replace function bump_company_directory_version()
+returns trigger as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') and old.company_id is not null then
+        insert into company_directory_versions (company_id, version)
+        values (old.company_id, 1)
+        on conflict (company_id)
+        do update set version = company_directory_versions.version + 1;
+    end if;
+    -- Insertion ou changement d'entreprise: la nouvelle entreprise est aussi concernée
+    if tg_op = 'INSERT' or (tg_op = 'UPDATE' and new.company_id is distinct from old.company_id) then
+        if new.company_id is not null then
+            insert into company_directory_versions (company_id, version)
+            values (new.company_id, 1)
+            on conflict (company_id)
+            do update set version = company_directory_versions.version + 1;
+        end if;
+    end if;
+    return null;
+end;
+$$ language plpgsql;
+
+-- Seules les colonnes de l'annuaire déclenchent un rechargement (pas last_login, etc.)
+drop trigger if exists trigger_users_directory_version on users;
+create trigger trigger_users_directory_version
+    after insert or delete or update of first_name, last_name, email, company_id on users
+    for each row execute function bump_company_directory_version();
+
+drop trigger if exists trigger_planning_team_leaders_directory_version on planning_team_leaders;
+create trigger trigger_planning_team_leaders_directory_version
+    after insert or delete or update of first_name, last_name, user_id, company_id on planning_team_leaders
+    for each row execute function bump_company_directory_version();
+
+-- Colonnes de nom variables selon les fiches (nom/prenom ou name): toute modification
+drop trigger if exists trigger_clients_directory_version on clients;
+create trigger trigger_clients_directory_version
+    after insert or delete or update on clients
+    for each row execute function bump_company_directory_version();
+
+drop trigger if exists trigger_worksites_directory_version on worksites;
+create trigger trigger_worksites_directory_version
+    after insert or delete or update of title, client_id, status, address, company_id on worksites
+    for each row execute function bump_company_directory_version();
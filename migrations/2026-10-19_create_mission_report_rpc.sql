@@ -0,0 +1,39 @@
+-- Migration: Création d'un compte-rendu de mission en un seul aller-retour
+-- Date: 2026-10-19
+-- Description: Insère le compte-rendu et passe la mission (schedules) en "completed"
+-- dans la même transaction, au lieu de deux requêtes séquentielles depuis l'API.
+-- Prérequis: create_mission_reports_table.sql
+
+create or replace function create_mission_report(p_report jsonb)
+returns mission_reports as $$
+declare
+    v_report mission_reports;
+begin
+    insert into mission_reports (
+        company_id, mission_id, technician_id, works_performed, materials_used,
+        duration_hours, observations, issues_encountered, photos_before, photos_after, created_at
+    )
+    values (
+        (p_report->>'company_id')::uuid,
+        (p_report->>'mission_id')::uuid,
+        (p_report->>'technician_id')::uuid,
+        p_report->>'works_performed',
+        p_report->>'materials_used',
+        (p_report->>'duration_hours')::decimal,
+        p_report->>'observations',
+        p_report->>'issues_encountered',
+        array(select jsonb_array_elements_text(coalesce(p_report->'photos_before', '[]'::jsonb))),
+        array(select jsonb_array_elements_text(coalesce(p_report->'photos_after', '[]'::jsonb))),
+        coalesce((p_report->>'created_at')::timestamptz, now())
+    )
+    returning * into v_report;
+
+    update schedules
+    set status = 'completed'
+    where id = v_report.mission_id and company_id = v_report.company_id;
+
+    return v_report;
+end;
+$$ language plpgsql;
+
+comment on function create_mission_report(jsonb) is 'Insère un compte-rendu et clôture la mission associée (transaction unique)';
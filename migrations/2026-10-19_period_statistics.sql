@@ -0,0 +1,49 @@
+-- Migration: Statistiques de période agrégées en SQL
+-- Date: 2026-10-19
+-- Description: get_period_statistics renvoie en un aller-retour les devis (nombre, montant) et
+-- les recherches terrain (nombre) groupés par statut et par période (jour / semaine / mois,
+-- heure de Paris), plus le nombre de clients. Utilisée par la function IA get_statistics et
+-- /api/ai/stats à la place du téléchargement de toutes les lignes de la période.
+
+create index if not exists idx_quotes_company_created
+    on quotes(company_id, created_at);
+create index if not exists idx_searches_company_created
+    on searches(company_id, created_at);
+
+-- p_bucket: 'day', 'week' ou 'month' (date_trunc)
+create or replace function get_period_statistics(p_company_id uuid, p_since timestamptz, p_bucket text default 'week')
+returns jsonb as $$
+    select jsonb_build_object(
+        'bucket', p_bucket,
+        'quotes', coalesce((
+            select jsonb_agg(jsonb_build_object(
+                'status', status, 'period', period, 'count', total, 'amount', amount
+            ) order by period, status)
+            from (
+                select status,
+                       date_trunc(p_bucket, created_at at time zone 'Europe/Paris')::date as period,
+                       count(*) as total,
+                       coalesce(sum(amount), 0) as amount
+                from quotes
+                where company_id = p_company_id
+                  and created_at >= p_since
+                group by 1, 2
+            ) per_quote_group
+        ), '[]'::jsonb),
+        'searches', coalesce((
+            select jsonb_agg(jsonb_build_object(
+                'status', status, 'period', period, 'count', total
+            ) order by period, status)
+            from (
+                select status,
+                       date_trunc(p_bucket, created_at at time zone 'Europe/Paris')::date as period,
+                       count(*) as total
+                from searches
+                where company_id = p_company_id
+                  and created_at >= p_since
+                group by 1, 2
+            ) per_search_group
+        ), '[]'::jsonb),
+        'clients', (select count(*) from clients where company_id = p_company_id)
+    );
+$$ language sql stable;
@@ -0,0 +1,19 @@
+-- Migration: Coordonnées et compétences pour l'optimiseur de planning
+-- Date: 2026-10-19
+-- Description: L'optimiseur local (/ai/planning optimize | suggest_slots) calcule les distances
+-- entre chantiers et points de départ des techniciens, et filtre par compétences
+-- (users.skills, voir add_skills_column.sql). Toutes les colonnes sont optionnelles:
+-- un chantier sans coordonnées reçoit une distance moyenne.
+
+alter table worksites
+    add column if not exists latitude double precision,
+    add column if not exists longitude double precision,
+    add column if not exists required_skills text;
+
+alter table users
+    add column if not exists base_latitude double precision,
+    add column if not exists base_longitude double precision;
+
+comment on column worksites.required_skills is 'Compétences requises (ex: électricien, plombier), comparées à users.skills';
+comment on column users.base_latitude is 'Latitude du point de départ habituel du technicien (domicile / dépôt)';
+comment on column users.base_longitude is 'Longitude du point de départ habituel du technicien (domicile / dépôt)';
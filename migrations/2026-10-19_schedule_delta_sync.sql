@@ -0,0 +1,69 @@
+-- Migration: Synchronisation incrémentale des missions (updated_at + tombstones)
+-- Date: 2026-10-19
+-- Description: L'application mobile interroge /planning/my-missions et
+-- /technicians/{id}/missions avec un curseur updated_since: seules les missions modifiées
+-- depuis le curseur sont renvoyées, et les suppressions sont signalées par des tombstones.
+-- Les triggers couvrent toutes les écritures (API, scripts, cascades).
+
+alter table schedules add column if not exists updated_at timestamptz not null default now();
+
+create index if not exists idx_schedules_collaborator_updated_at
+    on schedules(company_id, collaborator_id, updated_at);
+
+-- Plannings supprimés (ou réassignés à un autre technicien) pour chaque technicien concerné
+create table if not exists schedule_tombstones (
+    schedule_id uuid not null,
+    company_id uuid not null,
+    collaborator_id uuid not null,
+    deleted_at timestamptz not null default now(),
+    primary key (schedule_id, collaborator_id)
+);
+
+create index if not exists idx_schedule_tombstones_collaborator
+    on schedule_tombstones(company_id, collaborator_id, deleted_at);
+
+create or replace function schedules_touch_updated_at()
+returns trigger as $$
+begin
+    new.updated_at = now();
+    -- Réassignation: la mission disparaît pour l'ancien technicien
+    if old.collaborator_id is not null and new.collaborator_id is distinct from old.collaborator_id then
+        insert into schedule_tombstones (schedule_id, company_id, collaborator_id, deleted_at)
+        values (old.id, old.company_id, old.collaborator_id, now())
+        on conflict (schedule_id, collaborator_id) do update set deleted_at = excluded.deleted_at;
+    end if;
+    -- Retour chez un technicien: la tombstone n'a plus lieu d'être
+    if new.collaborator_id is not null then
+        delete from schedule_tombstones
+        where schedule_id = new.id and collaborator_id = new.collaborator_id;
+    end if;
+    return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists trigger_schedules_touch_updated_at on schedules;
+create trigger trigger_schedules_touch_updated_at
+    before update on schedules
+    for each row execute function schedules_touch_updated_at();
+
+create or replace function schedules_record_tombstone()
+returns trigger as $$
+begin
+    if old.collaborator_id is not null then
+        insert into schedule_tombstones (schedule_id, company_id, collaborator_id, deleted_at)
+        values (old.id, old.company_id, old.collaborator_id, now())
+        on conflict (schedule_id, collaborator_id) do update set deleted_at = excluded.deleted_at;
+    end if;
+    -- Rétention: au-delà, les clients refont une synchronisation complète
+    delete from schedule_tombstones
+    where company_id = old.company_id and deleted_at < now() - interval '30 days';
+    return old;
+end;
+$$ language plpgsql;
+
+drop trigger if exists trigger_schedules_record_tombstone on schedules;
+create trigger trigger_schedules_record_tombstone
+    after delete on schedules
+    for each row execute function schedules_record_tombstone();
+
+comment on table schedule_tombstones is 'Plannings supprimés ou réassignés, par technicien (synchronisation incrémentale, 30 jours)';
@@ -0,0 +1,96 @@
+-- Migration: Curseur de synchronisation des missions dans l'ordre des commits
+-- Date: 2026-10-19
+-- Description: updated_at (now() = début de transaction) ne convient pas comme curseur: une
+-- écriture validée après un sondage mais horodatée plus tôt était perdue. Chaque technicien
+-- a désormais un compteur (schedule_sync_versions) incrémenté par trigger à chaque écriture
+-- de ses plannings; la ligne du compteur reste verrouillée jusqu'au commit, donc les versions
+-- sont attribuées dans l'ordre des commits. schedules.sync_version et
+-- schedule_tombstones.sync_version reçoivent la version de l'écriture: "tout ce qui a une
+-- version > N" ne manque aucune écriture validée. La version sert aussi d'ETag (304) et de
+-- clé de revalidation des index de conflits en mémoire.
+-- Prérequis: 2026-10-19_schedule_delta_sync.sql
+
+create table if not exists schedule_sync_versions (
+    company_id uuid not null,
+    collaborator_id uuid not null,
+    version bigint not null default 0,
+    -- plus haute version des tombstones purgées: un curseur plus ancien impose une resynchronisation complète
+    purged_version bigint not null default 0,
+    primary key (company_id, collaborator_id)
+);
+
+alter table schedules add column if not exists sync_version bigint not null default 0;
+alter table schedule_tombstones add column if not exists sync_version bigint not null default 0;
+
+create index if not exists idx_schedules_collaborator_sync_version
+    on schedules(company_id, collaborator_id, sync_version);
+create index if not exists idx_schedule_tombstones_collaborator_sync_version
+    on schedule_tombstones(company_id, collaborator_id, sync_version);
+
+-- Incrémente (et verrouille jusqu'au commit) le compteur du technicien
+create or replace function bump_schedule_sync_version(p_company_id uuid, p_collaborator_id uuid)
+returns bigint as $$
+    insert into schedule_sync_versions (company_id, collaborator_id, version)
+    values (p_company_id, p_collaborator_id, 1)
+    on conflict (company_id, collaborator_id)
+    do update set version = schedule_sync_versions.version + 1
+    returning version;
+$$ language sql;
+
+create or replace function schedules_touch_updated_at()
+returns trigger as $$
+begin
+    new.updated_at = now();
+    if tg_op = 'UPDATE' then
+        -- Réassignation: la mission disparaît pour l'ancien technicien
+        if old.collaborator_id is not null and new.collaborator_id is distinct from old.collaborator_id then
+            insert into schedule_tombstones (schedule_id, company_id, collaborator_id, deleted_at, sync_version)
+            values (old.id, old.company_id, old.collaborator_id, now(),
+                    bump_schedule_sync_version(old.company_id, old.collaborator_id))
+            on conflict (schedule_id, collaborator_id)
+            do update set deleted_at = excluded.deleted_at, sync_version = excluded.sync_version;
+        end if;
+    end if;
+    if new.collaborator_id is not null then
+        new.sync_version = bump_schedule_sync_version(new.company_id, new.collaborator_id);
+        -- Retour chez un technicien: la tombstone n'a plus lieu d'être
+        delete from schedule_tombstones
+        where schedule_id = new.id and collaborator_id = new.collaborator_id;
+    end if;
+    return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists trigger_schedules_touch_updated_at on schedules;
+create trigger trigger_schedules_touch_updated_at
+    before insert or update on schedules
+    for each row execute function schedules_touch_updated_at();
+
+create or replace function schedules_record_tombstone()
+returns trigger as $$
+begin
+    if old.collaborator_id is not null then
+        insert into schedule_tombstones (schedule_id, company_id, collaborator_id, deleted_at, sync_version)
+        values (old.id, old.company_id, old.collaborator_id, now(),
+                bump_schedule_sync_version(old.company_id, old.collaborator_id))
+        on conflict (schedule_id, collaborator_id)
+        do update set deleted_at = excluded.deleted_at, sync_version = excluded.sync_version;
+
+        -- Rétention (compteur de ce technicien déjà verrouillé ci-dessus): au-delà, les
+        -- curseurs antérieurs à purged_version refont une synchronisation complète
+        with purged as (
+            delete from schedule_tombstones
+            where company_id = old.company_id
+              and collaborator_id = old.collaborator_id
+              and deleted_at < now() - interval '30 days'
+            returning sync_version
+        )
+        update schedule_sync_versions
+        set purged_version = greatest(purged_version, (select max(sync_version) from purged))
+        where company_id = old.company_id
+          and collaborator_id = old.collaborator_id
+          and exists (select 1 from purged);
+    end if;
+    return old;
+end;
+$$ language plpgsql;
@@ -0,0 +1,114 @@
+-- Migration: Table dédiée search_photos (une ligne par photo)
+-- Date: 2026-10-19
+-- Description: Remplace le tableau JSONB searches.photos, réécrit en entier à chaque
+-- upload/suppression (read-modify-write). Les ajouts et suppressions deviennent des
+-- INSERT/DELETE atomiques d'une seule ligne et la numérotation est calculée par la base.
+
+-- Table des photos
+create table if not exists search_photos (
+    id uuid default gen_random_uuid() primary key,
+    search_id uuid not null references searches(id) on delete cascade,
+    company_id uuid,
+    filename text not null,
+    original_name text,
+    storage_path text,
+    url text,
+    section_id text,
+    is_profile boolean not null default false,
+    notes text,
+    -- Ordre d'insertion global: sert de base à la numérotation (number)
+    position bigint generated always as identity,
+    uploaded_at timestamp with time zone default now(),
+    created_at timestamp with time zone default now(),
+
+    constraint unique_search_photo_filename unique(search_id, filename)
+);
+
+-- Index pour performance
+create index if not exists idx_search_photos_search_section on search_photos(search_id, section_id);
+create index if not exists idx_search_photos_search_position on search_photos(search_id, position);
+create index if not exists idx_search_photos_company on search_photos(company_id);
+
+-- Vue avec numérotation calculée par la base (remplace la renumérotation en Python)
+create or replace view search_photos_numbered as
+select
+    sp.*,
+    row_number() over (partition by sp.search_id order by sp.position) as number
+from search_photos sp;
+
+-- Ajout atomique de photos à une recherche.
+-- Dans une seule transaction: remplace les photos de la section (si fournie),
+-- retire l'ancien flag is_profile si besoin, puis insère les nouvelles lignes.
+create or replace function add_search_photos(
+    p_search_id uuid,
+    p_company_id uuid,
+    p_section_id text,
+    p_photos jsonb,
+    p_is_profile boolean default false
+)
+returns setof search_photos_numbered as $$
+declare
+    v_ids uuid[];
+begin
+    if p_section_id is not null then
+        delete from search_photos
+        where search_id = p_search_id and section_id = p_section_id;
+    end if;
+
+    if p_is_profile then
+        update search_photos set is_profile = false
+        where search_id = p_search_id and is_profile;
+    end if;
+
+    with inserted as (
+        insert into search_photos (search_id, company_id, filename, original_name, storage_path,
+                                   url, section_id, is_profile, notes, uploaded_at)
+        select
+            p_search_id,
+            p_company_id,
+            p->>'filename',
+            p->>'original_name',
+            p->>'storage_path',
+            p->>'url',
+            p_section_id,
+            coalesce((p->>'is_profile')::boolean, false),
+            p->>'notes',
+            coalesce((p->>'uploaded_at')::timestamptz, now())
+        from jsonb_array_elements(p_photos) with ordinality as t(p, ord)
+        order by ord
+        returning id
+    )
+    select array_agg(id) into v_ids from inserted;
+
+    return query
+        select * from search_photos_numbered
+        where search_id = p_search_id and id = any(v_ids)
+        order by position;
+end;
+$$ language plpgsql;
+
+-- Backfill depuis l'ancienne colonne JSONB (idempotent grâce à la contrainte d'unicité)
+insert into search_photos (search_id, company_id, filename, original_name, storage_path,
+                           url, section_id, is_profile, notes, uploaded_at)
+select
+    s.id,
+    s.company_id,
+    p->>'filename',
+    p->>'original_name',
+    coalesce(p->>'storage_path', s.id::text || '/' || (p->>'filename')),
+    p->>'url',
+    p->>'section_id',
+    coalesce((p->>'is_profile')::boolean, false),
+    p->>'notes',
+    coalesce((p->>'uploaded_at')::timestamptz, s.created_at, now())
+from searches s
+cross join lateral jsonb_array_elements(
+    case when jsonb_typeof(s.photos) = 'array' then s.photos else '[]'::jsonb end
+) with ordinality as t(p, ord)
+where p->>'filename' is not null
+order by s.id, ord
+on conflict (search_id, filename) do nothing;
+
+comment on table search_photos is 'Photos des recherches terrain (une ligne par photo, remplace searches.photos)';
+comment on column search_photos.position is 'Ordre d''insertion; number est calculé dans la vue search_photos_numbered';
+comment on column searches.photos is 'OBSOLÈTE: remplacé par la table search_photos (conservé pour rollback)';
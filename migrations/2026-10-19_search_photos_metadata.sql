@@ -0,0 +1,92 @@
+-- Migration: Métadonnées extraites à l'upload des photos (EXIF)
+-- Date: 2026-10-19
+-- Description: Les photos sont normalisées une seule fois à l'upload (rotation EXIF appliquée,
+-- EXIF supprimé). La date de prise de vue, la position GPS et les dimensions sont conservées
+-- ici pour filtrer et construire les rapports sans redécoder les images.
+-- Prérequis: 2026-10-19_search_photos.sql
+
+alter table search_photos
+    add column if not exists taken_at timestamp without time zone,
+    add column if not exists latitude double precision,
+    add column if not exists longitude double precision,
+    add column if not exists width integer,
+    add column if not exists height integer,
+    add column if not exists content_type text,
+    add column if not exists size_bytes integer;
+
+-- Index pour les filtres par date de prise de vue et par position
+create index if not exists idx_search_photos_search_taken_at on search_photos(search_id, taken_at);
+create index if not exists idx_search_photos_company_taken_at on search_photos(company_id, taken_at);
+create index if not exists idx_search_photos_geo on search_photos(latitude, longitude)
+    where latitude is not null and longitude is not null;
+
+-- La vue et la fonction dépendent des colonnes de la table: on les recrée
+drop function if exists add_search_photos(uuid, uuid, text, jsonb, boolean);
+drop view if exists search_photos_numbered;
+
+create view search_photos_numbered as
+select
+    sp.*,
+    row_number() over (partition by sp.search_id order by sp.position) as number
+from search_photos sp;
+
+create or replace function add_search_photos(
+    p_search_id uuid,
+    p_company_id uuid,
+    p_section_id text,
+    p_photos jsonb,
+    p_is_profile boolean default false
+)
+returns setof search_photos_numbered as $$
+declare
+    v_ids uuid[];
+begin
+    if p_section_id is not null then
+        delete from search_photos
+        where search_id = p_search_id and section_id = p_section_id;
+    end if;
+
+    if p_is_profile then
+        update search_photos set is_profile = false
+        where search_id = p_search_id and is_profile;
+    end if;
+
+    with inserted as (
+        insert into search_photos (search_id, company_id, filename, original_name, storage_path,
+                                   url, section_id, is_profile, notes, uploaded_at,
+                                   taken_at, latitude, longitude, width, height,
+                                   content_type, size_bytes)
+        select
+            p_search_id,
+            p_company_id,
+            p->>'filename',
+            p->>'original_name',
+            p->>'storage_path',
+            p->>'url',
+            p_section_id,
+            coalesce((p->>'is_profile')::boolean, false),
+            p->>'notes',
+            coalesce((p->>'uploaded_at')::timestamptz, now()),
+            (p->>'taken_at')::timestamp,
+            (p->>'latitude')::double precision,
+            (p->>'longitude')::double precision,
+            (p->>'width')::integer,
+            (p->>'height')::integer,
+            p->>'content_type',
+            (p->>'size_bytes')::integer
+        from jsonb_array_elements(p_photos) with ordinality as t(p, ord)
+        order by ord
+        returning id
+    )
+    select array_agg(id) into v_ids from inserted;
+
+    return query
+        select * from search_photos_numbered
+        where search_id = p_search_id and id = any(v_ids)
+        order by position;
+end;
+$$ language plpgsql;
+
+comment on column search_photos.taken_at is 'Date de prise de vue (EXIF DateTimeOriginal, heure locale de l''appareil)';
+comment on column search_photos.latitude is 'Latitude GPS extraite de l''EXIF à l''upload';
+comment on column search_photos.longitude is 'Longitude GPS extraite de l''EXIF à l''upload';
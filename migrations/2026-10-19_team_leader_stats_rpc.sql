@@ -0,0 +1,40 @@
+-- Migration: Statistiques des chefs d'équipe en une requête
+-- Date: 2026-10-19
+-- Description: /team-leaders-stats faisait 3 requêtes par chef (nom à jour dans users,
+-- comptage et liste des collaborateurs actifs). Cette fonction renvoie le même résultat
+-- (un objet JSON par chef) en un seul aller-retour.
+
+create index if not exists idx_team_leader_collaborators_active
+    on team_leader_collaborators(team_leader_id) where is_active;
+
+create or replace function get_team_leaders_with_stats(p_company_id uuid)
+returns jsonb as $$
+    select coalesce(jsonb_agg(stats order by stats->>'created_at', stats->>'id'), '[]'::jsonb)
+    from (
+        select
+            to_jsonb(tl) || jsonb_build_object(
+                -- Nom à jour depuis users si le chef est lié à un compte
+                'first_name', case when u.id is not null then u.first_name else tl.first_name end,
+                'last_name', case when u.id is not null then u.last_name else tl.last_name end,
+                'email', case when u.id is not null then u.email else to_jsonb(tl)->>'email' end,
+                'collaborators_count', coalesce(c.collaborators_count, 0),
+                'collaborators', coalesce(c.collaborators, '[]'::jsonb)
+            ) as stats
+        from planning_team_leaders tl
+        left join users u on u.id = tl.user_id
+        left join lateral (
+            select
+                count(*) as collaborators_count,
+                jsonb_agg(jsonb_build_object(
+                    'id', cu.id,
+                    'first_name', cu.first_name,
+                    'last_name', cu.last_name,
+                    'email', cu.email
+                ) order by cu.last_name, cu.first_name) filter (where cu.id is not null) as collaborators
+            from team_leader_collaborators tlc
+            left join users cu on cu.id = tlc.collaborator_id
+            where tlc.team_leader_id = tl.id and tlc.is_active
+        ) c on true
+        where tl.company_id = p_company_id
+    ) s;
+$$ language sql stable;
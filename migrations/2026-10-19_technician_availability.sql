@@ -0,0 +1,62 @@
+-- Migration: Index de disponibilité des techniciens
+-- Date: 2026-10-19
+-- Description: Créneaux libres précalculés par technicien et par jour sur un horizon glissant
+-- (AVAILABILITY_HORIZON_WEEKS semaines). Mis à jour à chaque création / modification /
+-- suppression de planning; reconstruction complète: python availability_index.py rebuild
+
+create table if not exists technician_availability (
+    company_id uuid not null references companies(id) on delete cascade,
+    collaborator_id uuid not null references users(id) on delete cascade,
+    day date not null,
+    -- [[début, fin], ...] en minutes depuis minuit, triés, fin exclusive
+    free_intervals jsonb not null default '[]'::jsonb,
+    busy_minutes integer not null default 0,
+    updated_at timestamptz not null default now(),
+    primary key (collaborator_id, day)
+);
+
+create index if not exists idx_technician_availability_company_day
+    on technician_availability(company_id, day);
+
+-- Remplace atomiquement les jours recalculés de plusieurs techniciens
+create or replace function refresh_technician_availability(
+    p_company_id uuid,
+    p_collaborator_ids uuid[],
+    p_first_day date,
+    p_last_day date,
+    p_rows jsonb
+)
+returns integer as $$
+declare
+    v_count integer;
+begin
+    delete from technician_availability
+    where company_id = p_company_id
+      and collaborator_id = any(p_collaborator_ids)
+      and day between p_first_day and p_last_day;
+
+    insert into technician_availability (company_id, collaborator_id, day, free_intervals, busy_minutes, updated_at)
+    select
+        p_company_id,
+        (r->>'collaborator_id')::uuid,
+        (r->>'day')::date,
+        coalesce(r->'free_intervals', '[]'::jsonb),
+        coalesce((r->>'busy_minutes')::integer, 0),
+        now()
+    from jsonb_array_elements(p_rows) as r
+    on conflict (collaborator_id, day) do update
+        set free_intervals = excluded.free_intervals,
+            busy_minutes = excluded.busy_minutes,
+            updated_at = excluded.updated_at;
+
+    get diagnostics v_count = row_count;
+
+    -- Les jours passés sortent de l'horizon glissant
+    delete from technician_availability
+    where company_id = p_company_id and day < current_date;
+
+    return v_count;
+end;
+$$ language plpgsql;
+
+comment on table technician_availability is 'Créneaux libres précalculés par technicien et par jour (index de disponibilité)';
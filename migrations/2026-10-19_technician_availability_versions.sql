@@ -0,0 +1,52 @@
+-- Migration: Index de disponibilité dans l'ordre des écritures
+-- Date: 2026-10-19
+-- Description: les mises à jour de technician_availability sont des tâches de fond non
+-- ordonnées ("lecture des plannings -> calcul -> RPC"): deux écritures rapprochées pour un même
+-- technicien pouvaient se terminer dans le désordre et laisser le résultat le plus ancien.
+-- Chaque ligne porte désormais la version de synchronisation du technicien lue avant le calcul
+-- (schedule_sync_versions); la RPC ne remplace jamais une ligne de version plus récente.
+-- Prérequis: 2026-10-19_technician_availability.sql, 2026-10-19_schedule_sync_versions.sql
+
+alter table technician_availability add column if not exists sync_version bigint not null default 0;
+
+-- p_rows couvre chaque (technicien, jour) de la plage: un upsert conditionnel suffit
+create or replace function refresh_technician_availability(
+    p_company_id uuid,
+    p_collaborator_ids uuid[],
+    p_first_day date,
+    p_last_day date,
+    p_rows jsonb
+)
+returns integer as $$
+declare
+    v_count integer;
+begin
+    insert into technician_availability (company_id, collaborator_id, day, free_intervals, busy_minutes,
+                                         sync_version, updated_at)
+    select
+        p_company_id,
+        (r->>'collaborator_id')::uuid,
+        (r->>'day')::date,
+        coalesce(r->'free_intervals', '[]'::jsonb),
+        coalesce((r->>'busy_minutes')::integer, 0),
+        coalesce((r->>'sync_version')::bigint, 0),
+        now()
+    from jsonb_array_elements(p_rows) as r
+    where (r->>'collaborator_id')::uuid = any(p_collaborator_ids)
+      and (r->>'day')::date between p_first_day and p_last_day
+    on conflict (collaborator_id, day) do update
+        set free_intervals = excluded.free_intervals,
+            busy_minutes = excluded.busy_minutes,
+            sync_version = excluded.sync_version,
+            updated_at = excluded.updated_at
+        where technician_availability.sync_version <= excluded.sync_version;
+
+    get diagnostics v_count = row_count;
+
+    -- Les jours passés sortent de l'horizon glissant
+    delete from technician_availability
+    where company_id = p_company_id and day < current_date;
+
+    return v_count;
+end;
+$$ language plpgsql;